@@ -36,7 +36,11 @@ setup(
     name='snr',
     version='1.14',
     packages=['snr', 'snr.app', 'snr.cli', 'snr.log', 'snr.save', 'snr.database', 'snr.retention', 'snr.yamlhelper',
-              'snr.compression', 'snr.units'],
+              'snr.compression', 'snr.units', 'snr.journal',
+              'snr.config', 'snr.tiering', 'snr.storage', 'snr.encryption',
+              'snr.throttle', 'snr.metrics', 'snr.tracing',
+              'snr.profiler', 'snr.benchmark', 'snr.stats', 'snr.progress',
+              'snr.control', 'snr.worker', 'snr.ingest'],
     url='https://github.com/jonathan-besanceney/snr',
     long_description=long_description,
     license='LGPLv3',
@@ -44,6 +48,7 @@ setup(
     author_email='jonathan.besanceney@gmail.com',
     description='Save and Restore utility',
     install_requires=['PyYAML', 'schedule'],
+    extras_require={'sftp': ['paramiko'], 'encryption': ['cryptography']},
     entry_points={
         'console_scripts': [
             'snr = snr.cli.cli:main',
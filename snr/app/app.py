@@ -34,12 +34,22 @@ import logging
 import os
 from string import Template
 import functools
-from threading import Thread
+from queue import Queue, Empty
+from threading import Thread, Lock
 
 from snr.app.saveatom import SaveAtom, AppSaveStatusEnum
-from snr.yamlhelper.yamlhelper import YAMLHelper
+from snr.config.config import Config
 from snr.database.database import Database
 from snr.compression.compression import Compression
+from snr.journal.journal import Journal
+from snr.progress import Progress
+from snr.storage import Storage
+from snr.throttle.rusage import ResourceUsage
+from snr.units.units import Units
+from snr.tracing import Tracer
+from snr.worker import Coordinator
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import AppConf, AppDatabaseConf
 
 logger = logging.getLogger(__name__)
 
@@ -109,6 +119,7 @@ apps:
         hostPath: /data/restore/gitlab
     """
 
+    cache = dict()
     C_APPS = 'apps'
     C_NAME = 'name'
     C_DBS = 'databases'
@@ -131,7 +142,7 @@ apps:
 
     C_ALL = ('All', )
 
-    def __init__(self, name, databases, files, compression):
+    def __init__(self, name, databases, files, compression, journal=None):
         """
         :param name: app name
         :type name: str
@@ -141,11 +152,18 @@ apps:
         :type files: dict
         :param compression: Compression helper
         :type compression: Compression
+        :param journal: Optional. Run journal used to record and schedule save parts
+        :type journal: Union[Journal|None]
         """
         self._name = name
         self._databases = databases
         self._files = files
         self._compression = compression
+        self._journal = journal if journal else Journal()
+        self._fingerprint = None
+        self._parts_lock = Lock()
+        self._running_parts = 0
+        self._jobs = None
 
         db_names = list()
         for db in self._databases:
@@ -161,45 +179,81 @@ apps:
     def name(self):
         return self._name
 
-    @staticmethod
-    def get_instances(conf):
-        try:
-            data = YAMLHelper.load(conf)
+    @property
+    def running_parts(self):
+        """
+        :return: number of save parts being processed
+        :rtype: int
+        """
+        return self._running_parts
 
-            db_instances = Database.get_instances(conf)
-            if db_instances is None:
-                raise TypeError("Error getting databases.")
-            compression = Compression.get_instance(conf)
-            if compression is None:
-                raise TypeError("Error getting compression object.")
+    @property
+    def queued_parts(self):
+        """
+        :return: number of save parts waiting for a worker
+        :rtype: int
+        """
+        jobs = self._jobs
+        return jobs.qsize() if jobs is not None else 0
 
-            apps = dict()
-            for app in data[App.C_APPS]:
+    @property
+    def fingerprint(self):
+        """
+        :return: configuration fingerprint of this instance, including databases and compression
+        :rtype: str
+        """
+        return self._fingerprint
+
+    @property
+    def journal(self):
+        """
+        :rtype: Journal
+        """
+        return self._journal
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate apps section, along with app databases credentials files. Databases must be compiled first.
+        :param config: configuration being compiled
+        :type config: Config
+        :return: AppConf by app name
+        :rtype: dict
+        :raise: TypeError on configuration error
+        """
+        apps = dict()
+        name = None
+        try:
+            for app in Config.get_section(config.data, App.C_APPS):
                 # an app may not contain database or file
                 YAMLHelper.analyse_keys(App.C_APPS, app, optional_key_set=App.C_APP_KEYS)
+                name = app.get(App.C_NAME)
 
                 databases = list()
                 # Do we have DB(s) to save
                 if App.C_DBS in app and app[App.C_DBS]:
                     for db in app[App.C_DBS]:
                         YAMLHelper.analyse_keys(App.C_DBS, db, App.C_DB_KEYS, App.C_DB_OPTIONAL_KEYS)
+                        if db[App.C_DB_INSTANCE] not in config.databases:
+                            raise TypeError(
+                                "Unknown database instance {}. Should be one of {}".format(
+                                    db[App.C_DB_INSTANCE], set(config.databases)
+                                )
+                            )
 
-                        db_prefix = ""
-                        if App.C_DATABASE_PREFIX in db.keys():
-                            db_prefix = db[App.C_DATABASE_PREFIX]
                         credentials = ""
                         if Database.D_CREDS in db.keys():
-                            credentials = YAMLHelper.load(db[Database.D_CREDS])
+                            credentials = config.load_yaml(db[Database.D_CREDS])
                             YAMLHelper.analyse_keys(db[Database.D_CREDS], credentials, Database.C_KEYS)
 
                         databases.append(
-                            {
-                                App.C_DATABASE_PREFIX: db_prefix,
-                                App.C_DB_NAME: db[App.C_DB_NAME],
-                                App.C_DATABASE_NAME: db[App.C_DATABASE_NAME],
-                                App.C_DB_INSTANCE: db_instances[db[App.C_DB_INSTANCE]],
-                                Database.D_CREDS: credentials
-                            }
+                            AppDatabaseConf(
+                                db[App.C_DB_NAME],
+                                db[App.C_DATABASE_NAME],
+                                db.get(App.C_DATABASE_PREFIX, ""),
+                                db[App.C_DB_INSTANCE],
+                                credentials
+                            )
                         )
 
                 files = dict()
@@ -209,16 +263,66 @@ apps:
                         YAMLHelper.analyse_keys(App.C_FILES, dirs, App.C_FILE_KEYS)
                         files[dirs[App.C_FILE_NAME]] = dirs[App.C_FILE_PATH]
 
-                apps[app[App.C_NAME]] = App(
-                    app[App.C_NAME],
+                app_conf = AppConf(app[App.C_NAME], databases, files)
+                apps[app_conf.name] = app_conf
+        except TypeError as e:
+            raise TypeError("Cannot initialize {} app : {}".format(name, e))
+        return apps
+
+    @staticmethod
+    def get_instances(conf):
+        """
+        App class Factory. Instances are cached by 'conf' parameter and app name, and are only rebuilt when their
+        configuration or the configuration of the databases and compression they rely on change.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :return: dict of App instances
+        :rtype: dict
+        """
+        try:
+            config = Config.get_instance(conf)
+
+            db_instances = Database.get_instances(conf)
+            if db_instances is None:
+                raise TypeError("Error getting databases.")
+            compression = Compression.get_instance(conf)
+            if compression is None:
+                raise TypeError("Error getting compression object.")
+            journal = Journal.get_instance(conf)
+
+            apps = dict()
+            for name, app in config.apps.items():
+                fingerprint = config.get_fingerprint(Config.F_APP, name)
+                cached = App.cache.get(conf, dict()).get(name)
+                if cached is not None and cached.fingerprint == fingerprint:
+                    apps[name] = cached
+                    continue
+
+                databases = list()
+                for db in app.databases:
+                    databases.append(
+                        {
+                            App.C_DATABASE_PREFIX: db.prefix,
+                            App.C_DB_NAME: db.name,
+                            App.C_DATABASE_NAME: db.database_name,
+                            App.C_DB_INSTANCE: db_instances[db.instance],
+                            Database.D_CREDS: db.credentials
+                        }
+                    )
+
+                apps[name] = App(
+                    name,
                     databases,
-                    files,
-                    compression
+                    dict(app.files),
+                    compression,
+                    journal
                 )
+                apps[name]._fingerprint = fingerprint
 
+            App.cache[conf] = apps
             return apps
         except TypeError as e:
-            logger.error("Cannot initialize {} app : {}".format(app['name'], e))
+            logger.error("Cannot initialize apps : {}".format(e))
         except IOError as e:
             logger.error("{} does not exist".format(conf))
 
@@ -254,89 +358,492 @@ apps:
         else:
             return
 
-    def save(self, destination, save_atom=None):
+    @staticmethod
+    def get_datetime(file_date):
+        """
+        Convert a date string as returned by get_file_creation_date() to datetime.
+        Avoids datetime.strptime() on this hot path since C_DATE_REGEX already validated the layout.
+        :param file_date: date string in App.C_DATE_FORMAT
+        :type file_date: str
+        :rtype: datetime
+        """
+        try:
+            return datetime(*map(int, file_date.split('-')))
+        except (TypeError, ValueError):
+            return datetime.strptime(file_date, App.C_DATE_FORMAT)
+
+    def _get_save_jobs(self, destination, save_atom, storage=None, throttle=None):
+        """
+        Fill save_atom with destination files and prepare corresponding save jobs
+        :param destination: destination folder containing /$app/$type/$name/$name-$date wilcards
+        :type destination: str
+        :param save_atom: SaveAtom being processed
+        :type save_atom: SaveAtom
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
+        :return: list of (part type, part name, callable) tuples
+        :rtype: list
+        """
+        jobs = list()
+        # file save
+        for file in self._files:
+            if file in save_atom.files:
+                save_path = self._format_destination(destination, App.C_FILES, file, file, save_atom.date)
+                save_atom.set_file(file, self._compression.get_file_with_compressed_extension(save_path))
+                compress = functools.partial(
+                    self._compression.compress, self._files[file], save_path, save_atom, file, storage,
+                    None if throttle is None else throttle.part(file)
+                )
+                jobs.append((SaveAtom.FILE, file, compress))
+        # db save
+        for db in self._databases:
+            if db[App.C_DB_NAME] in save_atom.databases:
+                save_path = self._format_destination(
+                    destination, App.C_DBS, db[App.C_DB_NAME], db[App.C_DATABASE_NAME], save_atom.date
+                )
+                save_atom.set_database(
+                    db[App.C_DB_NAME],
+                    self._compression.get_file_with_compressed_from_pipe_ext(save_path)
+                )
+                save = functools.partial(
+                    db[App.C_DB_INSTANCE].save,
+                    db[App.C_DATABASE_NAME],
+                    save_path,
+                    save_atom,
+                    self._get_database_attr(db, App.C_DATABASE_PREFIX),
+                    storage,
+                    None if throttle is None else throttle.part(db[App.C_DB_NAME])
+                )
+                jobs.append((SaveAtom.DATABASE, db[App.C_DB_NAME], save))
+        return jobs
+
+    def project_save(self, destination, save_atom=None):
+        """
+        Fill a copy of save_atom with destination files a save would write, without saving anything
+        :param destination: destination folder containing /$app/$type/$name/$name-$date wilcards
+        :type destination: str
+        :param save_atom: Optional. Parts to save, all parts per default
+        :type save_atom: Union[SaveAtom|None]
+        :return: projected save_atom, estimated sizes in bytes by destination file (0 if unknown)
+        :rtype: tuple
+        """
+        projected = self._save_atom.clone() if save_atom is None else save_atom.clone()
+        projected.date = save_atom.date if save_atom is not None and save_atom.date else \
+            datetime.today().strftime(App.C_DATE_FORMAT)
+        sizes = dict()
+        for part_type, name, _ in self._get_save_jobs(destination, projected):
+            if part_type == SaveAtom.DATABASE:
+                path = projected.get_database(name)
+            else:
+                path = projected.get_file(name)
+            sizes[path] = self._journal.estimate_size(self._name, part_type, name) or 0
+        return projected, sizes
+
+    def estimate_part(self, part_type, name):
+        """
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :return: estimated part duration in seconds from journal, None if unknown
+        :rtype: Union[float|None]
+        """
+        return self._journal.estimate_duration(self._name, part_type, name)
+
+    def _sort_jobs(self, jobs):
+        """
+        Sort jobs longest first (LPT) according to journal history.
+        Parts without history are started first as they may be the longest ones.
+        :param jobs: list of (part type, part name, callable) tuples
+        :type jobs: list
+        :rtype: list
+        """
+        def lpt_key(job):
+            estimate = self.estimate_part(job[0], job[1])
+            return estimate is not None, -(estimate or 0)
+
+        return sorted(jobs, key=lpt_key)
+
+    def estimate_save(self, save_atom=None, max_parallel=None):
+        """
+        Estimate save duration from journal history, assuming parts are started longest first.
+        :param save_atom: Optional. Parts to save, all parts per default
+        :type save_atom: Union[SaveAtom|None]
+        :param max_parallel: Optional. Number of parts saved in parallel. Unlimited per default
+        :type max_parallel: Union[int|None]
+        :return: estimated duration in seconds, None if no part has history
+        :rtype: Union[float|None]
+        """
+        if save_atom is None:
+            save_atom = self._save_atom
+        durations = list()
+        for part_type, names in ((SaveAtom.DATABASE, save_atom.databases), (SaveAtom.FILE, save_atom.files)):
+            for name in names:
+                estimate = self.estimate_part(part_type, name)
+                if estimate is not None:
+                    durations.append(estimate)
+        if len(durations) == 0:
+            return None
+        return Journal.schedule_makespan(durations, max_parallel)
+
+    @Tracer.traced('app.record_part')
+    def _record_part(self, save_atom, part_type, name, duration, storage, usage=None):
+        """
+        Check save file presence, remove it from save_atom if missing and record part run in journal
+        :param usage: Optional. Resource usage of part processes, see Throttle.release() and ResourceUsage.as_dict()
+        :type usage: Union[dict|None]
+        """
+        usage = usage or dict()
+        if len(usage) > 0:
+            logger.info("{}.save(): {} {} {}".format(
+                save_atom.app_log_prefix(), part_type, name, App._format_usage(usage)
+            ))
+        if part_type == SaveAtom.DATABASE:
+            path = save_atom.get_database(name)
+        else:
+            path = save_atom.get_file(name)
+        try:
+            size = storage.size(path) if path is not None else None
+        except IOError as e:
+            logger.error("{}.save(): Cannot check {} : {}".format(save_atom.app_log_prefix(), path, e))
+            size = None
+        status = size is not None
+        stats = dict()
+        if status:
+            stats = save_atom.get_stats(path)
+            stats.update(duration=duration, bytes=size, **usage)
+            save_atom.set_stats(path, **stats)
+        elif part_type == SaveAtom.DATABASE:
+            save_atom.set_database(name, None)
+        else:
+            save_atom.set_file(name, None)
+        Tracer.annotate(bytes=size, original_bytes=stats.get('original_bytes'), **usage)
+        if not status:
+            Tracer.set_error("{} {} save file is missing".format(part_type, name))
+        self._journal.record_part(
+            self._name, part_type, name, save_atom.date, duration, size, stats.get('original_bytes'), status, **usage
+        )
+
+    @staticmethod
+    def _format_usage(usage):
+        """
+        :param usage: resource usage, see snr.throttle.Cgroup.get_usage()
+        :type usage: dict
+        :return: human readable resource usage
+        :rtype: str
+        """
+        messages = list()
+        if any(not key.startswith(ResourceUsage.C_PREFIX) for key in usage):
+            messages.append("used {}s CPU (throttled {}s), {} memory peak, read {}, written {}".format(
+                usage.get('cpu_seconds', '?'), usage.get('cpu_throttled_seconds', '?'),
+                Units.convert_bytes(usage['memory_peak_bytes']) or '0B' if 'memory_peak_bytes' in usage else '?',
+                Units.convert_bytes(usage['io_read_bytes']) or '0B' if 'io_read_bytes' in usage else '?',
+                Units.convert_bytes(usage['io_write_bytes']) or '0B' if 'io_write_bytes' in usage else '?'
+            ))
+        if ResourceUsage.C_PROCESSES in usage:
+            messages.append(
+                "{} process(es) used {}s user and {}s system CPU, {} max RSS, read {} and wrote {} on block "
+                "devices".format(
+                    usage[ResourceUsage.C_PROCESSES], usage[ResourceUsage.C_USER_SECONDS],
+                    usage[ResourceUsage.C_SYSTEM_SECONDS],
+                    Units.convert_bytes(usage[ResourceUsage.C_MAX_RSS_BYTES]) or '0B',
+                    Units.convert_bytes(usage[ResourceUsage.C_BLOCK_READ_BYTES]) or '0B',
+                    Units.convert_bytes(usage[ResourceUsage.C_BLOCK_WRITE_BYTES]) or '0B'
+                )
+            )
+        return ", ".join(messages)
+
+    @staticmethod
+    def get_usage(save_atom):
+        """
+        :param save_atom: saved SaveAtom
+        :type save_atom: SaveAtom
+        :return: resource usage of all save_atom parts, see ResourceUsage.rollup()
+        :rtype: dict
+        """
+        paths = [save_atom.get_database(db) for db in save_atom.databases]
+        paths += [save_atom.get_file(file) for file in save_atom.files]
+        return ResourceUsage.rollup(save_atom.get_stats(path) for path in paths if path is not None)
+
+    def _get_source_size(self, part_type, name):
+        """
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :return: expected source size in bytes from journal. None without history: source trees are not walked
+        before being compressed, progress then has no ETA until the first save of the part is recorded.
+        :rtype: Union[int|None]
+        """
+        return self._journal.estimate_original_size(self._name, part_type, name)
+
+    @staticmethod
+    def _get_part_path(save_atom, part_type, name):
+        """
+        :return: save file of a part, None if not set
+        :rtype: Union[str|None]
+        """
+        return save_atom.get_database(name) if part_type == SaveAtom.DATABASE else save_atom.get_file(name)
+
+    def _discard_part(self, save_atom, part_type, name, storage, reason='cancelled'):
+        """
+        Delete save file of a cancelled or failed part, which is then recorded as missing
+        :param reason: Optional. why part is discarded, as logged
+        :type reason: str
+        """
+        path = App._get_part_path(save_atom, part_type, name)
+        logger.warning("{}.save(): {} {} {}, deleting {}".format(
+            save_atom.app_log_prefix(), part_type, name, reason, path
+        ))
+        try:
+            if path is not None and storage.size(path) is not None:
+                storage.delete([path])
+        except (IOError, OSError) as e:
+            logger.error("{}.save(): Cannot delete {} : {}".format(save_atom.app_log_prefix(), path, e))
+        if part_type == SaveAtom.DATABASE:
+            save_atom.set_database(name, None)
+        else:
+            save_atom.set_file(name, None)
+
+    def _run_job(self, save_atom, part_type, name, job, storage, throttle=None, coordinator=None):
+        """
+        Run a save job, or send it to a worker if coordinator has registered ones, tracking its progress and resource
+        usage. Save file of a cancelled part is deleted.
+        :param save_atom: SaveAtom being processed
+        :type save_atom: SaveAtom
+        :param job: save job
+        :type job: callable
+        :param storage: storage save files are written to
+        :type storage: Storage
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
+        :param coordinator: Optional. Coordinator of workers, job is run locally per default
+        :type coordinator: Union[snr.worker.Coordinator|None]
+        :return: duration in seconds, resource usage of part processes
+        :rtype: tuple
+        """
+        start = time.time()
+        path = App._get_part_path(save_atom, part_type, name)
+        remote = None
+        with self._parts_lock:
+            self._running_parts += 1
+        try:
+            with ResourceUsage.collect() as process_usage, Progress.track(
+                    self._name, part_type, name, self._get_source_size(part_type, name),
+                    self.estimate_part(part_type, name)
+            ) as progress:
+                if coordinator is not None:
+                    try:
+                        remote = coordinator.run(self._name, self._fingerprint, save_atom.date, part_type, name, path)
+                    except IOError as e:
+                        logger.error("{}.save(): {}".format(save_atom.app_log_prefix(), e))
+                        remote = dict()
+                if remote is None:
+                    job()
+        finally:
+            with self._parts_lock:
+                self._running_parts -= 1
+            # part cgroup is released whatever the job outcome
+            usage = throttle.release(name) if throttle is not None else dict()
+        if progress.cancelled:
+            self._discard_part(save_atom, part_type, name, storage)
+        usage.update(process_usage.as_dict())
+        if remote:
+            save_atom.set_stats(path, **remote['stats'])
+            usage.update(remote['usage'])
+        return time.time() - start, usage
+
+    def _save_worker(self, jobs, save_atom, storage, throttle=None):
+        """
+        Run save jobs until queue is empty. A failed job is recorded as missing part, and next jobs still run
+        :param jobs: queue of (part type, part name, callable) tuples
+        :type jobs: Queue
+        :param save_atom: SaveAtom being processed
+        :type save_atom: SaveAtom
+        :param storage: storage save files are written to
+        :type storage: Storage
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
+        """
+        while True:
+            try:
+                part_type, name, job = jobs.get_nowait()
+            except Empty:
+                return
+            start = time.time()
+            duration, usage = None, None
+            with Tracer.span('app.part', type=part_type, part=name):
+                try:
+                    duration, usage = self._run_job(
+                        save_atom, part_type, name, job, storage, throttle, Coordinator.instance
+                    )
+                except Exception as e:
+                    logger.exception("{}.save(): {} {} failed : {}".format(
+                        save_atom.app_log_prefix(), part_type, name, e
+                    ))
+                    self._discard_part(save_atom, part_type, name, storage, 'failed')
+                finally:
+                    self._record_part(
+                        save_atom, part_type, name, time.time() - start if duration is None else duration, storage,
+                        usage
+                    )
+
+    def save_part(self, destination, date, part_type, name, storage=None, throttle=None):
+        """
+        Save a single part of a save run by a coordinator daemon, see snr.worker.Worker. Part is not recorded in
+        journal, coordinator does.
+        :param destination: destination folder containing /$app/$type/$name/$name-$date wilcards
+        :type destination: str
+        :param date: save date
+        :type date: str
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
+        :return: save file path, its statistics, resource usage of part processes and duration in seconds
+        :rtype: dict
+        :raise ValueError: if name is not a part of this app
+        """
+        if storage is None:
+            storage = Storage.get_local()
+        save_atom = SaveAtom(
+            self._name,
+            [name] if part_type == SaveAtom.DATABASE else None,
+            [name] if part_type == SaveAtom.FILE else None
+        )
+        save_atom.date = date
+        jobs = self._get_save_jobs(destination, save_atom, storage, throttle)
+        if len(jobs) != 1:
+            raise ValueError("{} {} is not a part of {}".format(part_type, name, self._name))
+        duration, usage = self._run_job(save_atom, part_type, name, jobs[0][2], storage, throttle)
+        if len(usage) > 0:
+            logger.info("{}.save(): {} {} {}".format(
+                save_atom.app_log_prefix(), part_type, name, App._format_usage(usage)
+            ))
+        path = App._get_part_path(save_atom, part_type, name)
+        return {'path': path, 'stats': save_atom.get_stats(path), 'usage': usage, 'duration': duration}
+
+    def ingest_part(self, save_atom, part_type, name, duration, storage, stats=None, usage=None):
+        """
+        Record a part saved by an agent and stored by an ingestion server, see snr.ingest.Ingest
+        :param save_atom: SaveAtom being processed
+        :type save_atom: SaveAtom
+        :param duration: part duration in seconds, on agent
+        :type duration: float
+        :param storage: storage save files are written to
+        :type storage: Storage
+        :param stats: Optional. save file statistics from agent, see SaveAtom.get_stats()
+        :type stats: Union[dict|None]
+        :param usage: Optional. resource usage of agent part processes
+        :type usage: Union[dict|None]
+        """
+        path = App._get_part_path(save_atom, part_type, name)
+        if path is not None and stats:
+            save_atom.set_stats(path, **stats)
+        self._record_part(save_atom, part_type, name, duration, storage, usage)
+
+    @Tracer.traced('app.save')
+    def save(self, destination, save_atom=None, max_parallel=None, storage=None, throttle=None):
         """
 
         :param destination: destination folder containing /$app/$type/$name/$name-$date wilcards
         :type destination: str
         :param save_atom: Optional, provide an alternate SaveAtom object to allow partial save process.
         :type save_atom: Union[SaveAtom|None]
+        :param max_parallel: Optional. Number of parts saved in parallel. Unlimited per default
+        :type max_parallel: Union[int|None]
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
         :return: SaveAtom instance filed with save files
         """
 
         if save_atom is None:
             save_atom = self.save_atom
+        if storage is None:
+            storage = Storage.get_local()
 
         try:
             start = time.time()
 
             logger.info("{}.save(): Starting save {}".format(save_atom.app_log_prefix(), save_atom.date))
 
-            # file save
-            file_threads = list()
-            for file in self._files:
-                if file in save_atom.files:
-                    save_path = self._format_destination(destination, App.C_FILES, file, file, save_atom.date)
-                    save_atom.set_file(file, self._compression.get_file_with_compressed_extension(save_path))
-                    compress = functools.partial(
-                        self._compression.compress, self._files[file], save_path, save_atom, file
-                    )
-                    t = Thread(target=compress, name=file)
-                    t.start()
-                    file_threads.append(t)
-            # db save
-            db_threads = list()
-            for db in self._databases:
-                if db[App.C_DB_NAME] in save_atom.databases:
-                    save_path = self._format_destination(
-                        destination, App.C_DBS, db[App.C_DB_NAME], db[App.C_DATABASE_NAME], save_atom.date
-                    )
-                    save_atom.set_database(
-                        db[App.C_DB_NAME],
-                        self._compression.get_file_with_compressed_from_pipe_ext(save_path)
-                    )
-                    save = functools.partial(
-                        db[App.C_DB_INSTANCE].save,
-                        db[App.C_DATABASE_NAME],
-                        save_path,
-                        save_atom,
-                        self._get_database_attr(db, App.C_DATABASE_PREFIX)
-                    )
-                    t = Thread(target=save, name=db[App.C_DB_NAME])
-                    t.start()
-                    db_threads.append(t)
-            if len(db_threads) + len(file_threads) == 0:
+            jobs = self._get_save_jobs(destination, save_atom, storage, throttle)
+            if len(jobs) == 0:
                 logger.warning("{}.save(): Nothing to do !".format(save_atom.app_log_prefix()))
                 return
 
+            # longest parts first
+            queue = Queue()
+            for job in self._sort_jobs(jobs):
+                estimate = self.estimate_part(job[0], job[1])
+                logger.info(
+                    "{}.save(): Queuing {} {}, estimated duration: {}".format(
+                        save_atom.app_log_prefix(),
+                        job[0],
+                        job[1],
+                        "unknown" if estimate is None else Units.convert_seconds(round(estimate))
+                    )
+                )
+                queue.put(job)
+            self._jobs = queue
+
+            workers = len(jobs)
+            if max_parallel:
+                workers = min(max_parallel, workers)
+            threads = list()
+            for i in range(workers):
+                t = Thread(
+                    target=Tracer.wrap(self._save_worker), args=(queue, save_atom, storage, throttle),
+                    name="{}-{}".format(self._name, i)
+                )
+                t.start()
+                threads.append(t)
+
             # wait for them
-            for t in db_threads:
+            for t in threads:
                 t.join()
-                # If save file does not exist, remove it from save_atom
-                if not os.path.exists(save_atom.get_database(t.name)):
-                    save_atom.set_database(t.name, None)
-                elif save_atom.date is None:
-                    save_atom.date = App.get_file_creation_date(save_atom.get_database(t.name))
-            for t in file_threads:
-                t.join()
-                # If save file does not exist, remove it from save_atom
-                if not os.path.exists(save_atom.get_file(t.name)):
-                    save_atom.set_file(t.name, None)
+
+            if save_atom.date is None:
+                for db in save_atom.databases:
+                    if save_atom.get_database(db):
+                        save_atom.date = App.get_file_creation_date(save_atom.get_database(db))
+                        break
 
         except KeyboardInterrupt:
             logger.warning(
                 "{}.save(): User interruption, trying to kill remaining processes".format(save_atom.app_log_prefix())
             )
             raise
+        finally:
+            self._jobs = None
 
         logger.info("{}.save(): Finished save in {}s".format(save_atom.app_log_prefix(), time.time()-start))
+        usage = App.get_usage(save_atom)
+        if len(usage) > 0:
+            logger.info("{}.save(): All parts {}".format(save_atom.app_log_prefix(), App._format_usage(usage)))
         return save_atom
 
-    def _update_save_atoms(self, source, save_type, name, save_atoms):
+    def _update_save_atoms(self, source, save_type, name, save_atoms, storage):
+        from snr.tiering import Tiering
         path = os.path.split(self._format_destination(source, save_type, name, name))[0]
-        if os.path.exists(path):
-            for f in os.listdir(path):
-                full_path = os.path.join(path, f)
+        # saves may have been moved to second storage tier
+        folders = (path, Tiering.get_mirror(self._compression.tiering, path)) if storage.is_local else (path,)
+        for folder in folders:
+            if folder is None:
+                continue
+            for f in storage.listdir(folder):
+                # skip saves being moved
+                if f.endswith(Tiering.C_TMP_SUFFIX):
+                    continue
+                full_path = os.path.join(folder, f)
                 file_date = App.get_file_creation_date(full_path)
                 if file_date:
                     if file_date not in save_atoms.keys():
@@ -351,22 +858,26 @@ apps:
 
         return save_atoms
 
-    def get_saves(self, source):
+    def get_saves(self, source, storage=None):
         """
         List all saves for this app from source path. Returns a dictionary organized by date (in str).
         See C_DATE_FORMAT for dictionary keys generation.
         :param source: source path with wilcards, as used in save()
         :type source: str
+        :param storage: Optional. Storage to list, local filesystem per default
+        :type storage: Union[Storage|None]
         :return: SaveAtom dictionary.
         :rtype: dict
         """
         save_atoms = dict()
+        if storage is None:
+            storage = Storage.get_local()
 
         for db in self._databases:
-            save_atoms = self._update_save_atoms(source, App.C_DBS, db[App.C_DB_NAME], save_atoms)
+            save_atoms = self._update_save_atoms(source, App.C_DBS, db[App.C_DB_NAME], save_atoms, storage)
 
         for file in self._files:
-            save_atoms = self._update_save_atoms(source, App.C_FILES, file, save_atoms)
+            save_atoms = self._update_save_atoms(source, App.C_FILES, file, save_atoms, storage)
 
         return save_atoms
 
@@ -430,7 +941,8 @@ apps:
 
         return db_attr
 
-    def restore(self, save_atom, allow_status=AppSaveStatusEnum.FULL):
+    @Tracer.traced('app.restore')
+    def restore(self, save_atom, allow_status=AppSaveStatusEnum.FULL, storage=None, throttle=None):
         """
 
         :param save_atom: SaveAtom instance containing save files path
@@ -438,6 +950,10 @@ apps:
         :param allow_status: Optional. Default FULL. If set to AppSaveStatusEnum.PARTIAL, allows restoration from
         a partial save.
         :type allow_status: AppSaveStatusEnum
+        :param storage: Optional. Storage holding save files, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
         :return:
         """
         logger.info("{}.restore(): Starting restore".format(save_atom.app_log_prefix()))
@@ -469,9 +985,11 @@ apps:
                     save_atom.get_file(f),
                     self._files[f],
                     save_atom,
-                    f
+                    f,
+                    storage,
+                    None if throttle is None else throttle.part(f)
                 )
-                t = Thread(target=decompress, name=f)
+                t = Thread(target=Tracer.wrap(decompress, 'app.part', type=SaveAtom.FILE, part=f), name=f)
                 t.start()
                 threads.append(t)
 
@@ -484,9 +1002,11 @@ apps:
                 save_atom.get_database(d),
                 save_atom,
                 self._get_database_attr(d, App.C_DATABASE_PREFIX),
-                self._get_database_attr(d, Database.D_CREDS)
+                self._get_database_attr(d, Database.D_CREDS),
+                storage,
+                None if throttle is None else throttle.part(d)
             )
-            t = Thread(target=restore, name=d)
+            t = Thread(target=Tracer.wrap(restore, 'app.part', type=SaveAtom.DATABASE, part=d), name=d)
             t.start()
             threads.append(t)
 
@@ -497,6 +1017,12 @@ apps:
                 # wait for them
                 for t in threads:
                     t.join()
+                    # restore threads are named after their part
+                    usage = throttle.release(t.name) if throttle is not None else dict()
+                    if len(usage) > 0:
+                        logger.info("{}.restore(): {} {}".format(
+                            save_atom.app_log_prefix(), t.name, App._format_usage(usage)
+                        ))
                 logger.info(
                     "{}.restore(): Finished restore in {}s".format(save_atom.app_log_prefix(), time.time() - start)
                 )
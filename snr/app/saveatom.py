@@ -65,6 +65,7 @@ class SaveAtom:
         self._log_prefix_dbs = dict()
         self._log_prefix_files = dict()
         self._status = AppSaveStatusEnum.UNDEFINED
+        self._stats = dict()
 
     def clone(self):
         cloned = SaveAtom(appname=self._appname)
@@ -151,6 +152,26 @@ class SaveAtom:
         if name in self._files.keys():
             del self._files[name]
 
+    def set_stats(self, path, **stats):
+        """
+        Attach statistics to a save file
+        :param path: save file path
+        :type path: str
+        :param stats: statistics to add or update (duration, bytes, original_bytes...)
+        """
+        if path not in self._stats:
+            self._stats[path] = dict()
+        self._stats[path].update(stats)
+
+    def get_stats(self, path):
+        """
+        :param path: save file path
+        :type path: str
+        :return: statistics attached to a save file
+        :rtype: dict
+        """
+        return dict(self._stats.get(path, dict()))
+
     def part_exists(self, part, name):
         if part in SaveAtom.PART_TYPES:
             names = list()
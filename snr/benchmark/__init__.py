@@ -0,0 +1,34 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        __init__.py
+# Purpose:     
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+from snr.benchmark.generator import Generator
+from snr.benchmark.benchmark import Benchmark
+from snr.benchmark.micro import MicroBenchmark
+
+__all__ = ["Generator", "Benchmark", "MicroBenchmark"]
@@ -0,0 +1,449 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        benchmark
+# Purpose:     End to end save and restore benchmark
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+from datetime import datetime
+from statistics import median
+
+from snr.benchmark.generator import Generator
+from snr.compression import Compression
+from snr.app.saveatom import SaveAtom
+from snr.config import Config
+from snr.database import Database
+from snr.encryption import Encryption
+from snr.journal import Journal
+from snr.save import Save
+from snr.storage import Storage
+from snr.units import Units
+from snr.yamlhelper import YAMLHelper
+
+logger = logging.getLogger(__name__)
+
+
+class Benchmark:
+    """
+    End to end save and restore benchmark. A synthetic app made of a generated file tree and SQLite databases is
+    saved, its saves are kept by retention and it is restored, through the same Save.save() and Save.restore() paths
+    as production runs. Compression, encryption and storages are taken from the given configuration, so that its
+    settings are measured.
+    Results are written as a JSON report. Thresholds and a baseline report make a run fail on regression.
+    """
+
+    C_APP = 'benchmark'
+    C_RETENTION = 'benchmark'
+    C_DB_INSTANCE = 'benchmark'
+    C_DB_TYPE = 'sqlite'
+    C_DB_EXTENSION = 'db'
+    C_FILES_PART = 'data'
+    # copied from benchmarked configuration
+    C_SECTIONS = (Compression.C_HELPERS, Encryption.C_ENCRYPTION, Storage.C_STORAGES, Database.HELPERS)
+    C_SQLITE_HELPER = {
+        Database.H_DUMP: ['sqlite3', '$host/$dbname.db', '.dump'],
+        Database.H_RESTORE: ['sqlite3', '$host/$dbname.db'],
+        Database.H_LIST_DB: [
+            '/bin/sh', '-c', 'for db in "$1"/*.db; do [ -e "$db" ] && basename "$db" .db; done', 'sh', '$host'
+        ],
+        Database.H_CREATE_DB: ['touch', '$host/$dbname.db'],
+        Database.H_CREATE_USER: ['true']
+    }
+
+    C_MIN = 'min'
+    C_MAX = 'max'
+    # absolute slack of durations compared to baseline, so that very short stages don't fail on noise
+    C_SLACK_SECONDS = 0.05
+    # metric -> True if higher is better
+    C_METRICS = {
+        'save_seconds': False,
+        'save_throughput_bytes_per_second': True,
+        'retention_seconds': False,
+        'restore_seconds': False,
+        'restore_throughput_bytes_per_second': True,
+        'compression_ratio': False
+    }
+
+    def __init__(
+            self, conf, workdir=None, size=100 * 1024 ** 2, files=100, compressibility=0.5, databases=1,
+            database_size=10 * 1024 ** 2, iterations=3, old_saves=100, storage=None, max_parallel=None, seed=0
+    ):
+        """
+        :param conf: benchmarked configuration file, see C_SECTIONS
+        :type conf: str
+        :param workdir: Optional. Work directory, a temporary directory removed after run per default
+        :type workdir: Union[str|None]
+        :param size: total size of generated files in bytes
+        :type size: int
+        :param files: number of generated files
+        :type files: int
+        :param compressibility: share of compressible content, from 0 (random) to 1 (text only)
+        :type compressibility: float
+        :param databases: number of generated SQLite databases
+        :type databases: int
+        :param database_size: size of each database in bytes
+        :type database_size: int
+        :param iterations: number of save, retention and restore runs
+        :type iterations: int
+        :param old_saves: number of aged saves per part generated for retention to delete, on local storage only
+        :type old_saves: int
+        :param storage: Optional. storage name as per config, local filesystem per default
+        :type storage: Union[str|None]
+        :param max_parallel: Optional. Number of parts saved in parallel. Unlimited per default
+        :type max_parallel: Union[int|None]
+        :param seed: Optional. random seed of generated content
+        :type seed: int
+        """
+        self._source_conf = conf
+        self._temporary = workdir is None
+        self._workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix='snr-benchmark-'))
+        self._conf = os.path.join(self._workdir, 'benchmark.yaml')
+        self._size = size
+        self._files = files
+        self._compressibility = compressibility
+        self._databases = databases
+        self._database_size = database_size
+        self._iterations = iterations
+        self._old_saves = old_saves
+        self._storage = storage
+        self._max_parallel = max_parallel
+        self._seed = seed
+        self._source_bytes = 0
+        self._checksums = dict()
+
+    @property
+    def parameters(self):
+        return {
+            'conf': self._source_conf,
+            'size': self._size,
+            'files': self._files,
+            'compressibility': self._compressibility,
+            'databases': self._databases,
+            'database_size': self._database_size,
+            'iterations': self._iterations,
+            'old_saves': self._old_saves,
+            'storage': self._storage,
+            'max_parallel': self._max_parallel,
+            'seed': self._seed
+        }
+
+    def _path(self, *parts):
+        return os.path.join(self._workdir, *parts)
+
+    def _database_names(self):
+        return ["db{}".format(i) for i in range(self._databases)]
+
+    def _write_conf(self):
+        """
+        Write benchmark configuration, based on benchmarked configuration sections
+        """
+        source = YAMLHelper.load(self._source_conf)
+        data = dict((section, source[section]) for section in Benchmark.C_SECTIONS if source.get(section))
+        data.setdefault(Database.HELPERS, dict())[Benchmark.C_DB_TYPE] = Benchmark.C_SQLITE_HELPER
+        credentials = self._path('credentials')
+        with open(credentials, 'w') as f:
+            f.write(YAMLHelper.dump({Database.C_USER: Benchmark.C_APP, Database.C_PASS: Benchmark.C_APP}))
+        os.chmod(credentials, 0o600)
+        data[Database.DBS] = [{
+            Database.D_INSTANCE: Benchmark.C_DB_INSTANCE,
+            Database.D_TYPE: Benchmark.C_DB_TYPE,
+            Database.D_HOST: self._path('src', 'databases'),
+            Database.D_PORT: 0,
+            Database.D_CREDS: credentials
+        }]
+        data['apps'] = [{
+            'name': Benchmark.C_APP,
+            'databases': [
+                {'name': name, 'databaseName': name, 'instance': Benchmark.C_DB_INSTANCE}
+                for name in self._database_names()
+            ],
+            'files': [{'name': Benchmark.C_FILES_PART, 'hostPath': self._path('src', 'files')}]
+        }]
+        save = {
+            'app_name': Benchmark.C_APP,
+            'destination': self._path('saves', '$app', '$type', '$name', '$name-$date'),
+            'retention': {'databases': Benchmark.C_RETENTION, 'files': Benchmark.C_RETENTION}
+        }
+        if self._storage:
+            save['storage'] = self._storage
+        if self._max_parallel:
+            save['max_parallel_parts'] = self._max_parallel
+        data['saves'] = [save]
+        data['retention'] = [
+            {'name': Benchmark.C_RETENTION, 'days': 1, 'week': 0, 'month': 0, 'quarter': 0, 'year': 0}
+        ]
+        data['daemon'] = {'run_path': self._path('run')}
+        data['journal'] = {'path': self._path('journal.jsonl')}
+        with open(self._conf, 'w') as f:
+            f.write(YAMLHelper.dump(data))
+
+    def prepare(self):
+        """
+        Generate synthetic app and benchmark configuration
+        """
+        logger.info("Preparing benchmark in {}".format(self._workdir))
+        for folder in ('src', 'saves', 'run'):
+            if os.path.exists(self._path(folder)):
+                shutil.rmtree(self._path(folder))
+        if os.path.exists(self._path('journal.jsonl')):
+            os.remove(self._path('journal.jsonl'))
+        generator = Generator(self._seed)
+        self._source_bytes = generator.generate_files(
+            self._path('src', 'files'), self._size, self._files, self._compressibility
+        )
+        self._checksums[Benchmark.C_FILES_PART] = Generator.checksum_files(self._path('src', 'files'))
+        os.makedirs(self._path('src', 'databases'))
+        for name in self._database_names():
+            file = self._path('src', 'databases', "{}.{}".format(name, Benchmark.C_DB_EXTENSION))
+            self._source_bytes += generator.generate_database(file, self._database_size, self._compressibility)
+            self._checksums[name] = Generator.checksum_database(file)
+        self._write_conf()
+
+    def _generate_old_saves(self):
+        if self._storage or self._old_saves == 0:
+            return
+        compression = Compression.get_instance(self._conf)
+        Generator.generate_old_saves(
+            self._path('saves', Benchmark.C_APP, 'files', Benchmark.C_FILES_PART), Benchmark.C_FILES_PART,
+            compression.get_file_with_compressed_extension('')[1:], self._old_saves
+        )
+        for name in self._database_names():
+            Generator.generate_old_saves(
+                self._path('saves', Benchmark.C_APP, 'databases', name), name,
+                compression.get_file_with_compressed_from_pipe_ext('')[1:], self._old_saves
+            )
+
+    def _clear_source(self):
+        shutil.rmtree(self._path('src', 'files'))
+        for name in self._database_names():
+            os.remove(self._path('src', 'databases', "{}.{}".format(name, Benchmark.C_DB_EXTENSION)))
+
+    def _verify(self):
+        """
+        :return: names of parts whose restored content differs from generated content
+        :rtype: list
+        """
+        failed = list()
+        if Generator.checksum_files(self._path('src', 'files')) != self._checksums[Benchmark.C_FILES_PART]:
+            failed.append(Benchmark.C_FILES_PART)
+        for name in self._database_names():
+            file = self._path('src', 'databases', "{}.{}".format(name, Benchmark.C_DB_EXTENSION))
+            if Generator.checksum_database(file) != self._checksums[name]:
+                failed.append(name)
+        return failed
+
+    def _iteration(self, save):
+        """
+        Save, retention and restore run
+        :param save: benchmark save
+        :type save: Save
+        :return: iteration results
+        :rtype: dict
+        """
+        journal = Journal.get_instance(self._conf)
+        self._generate_old_saves()
+        start = time.time()
+        save_atom = save.save()
+        save_seconds = time.time() - start
+        if save_atom is None:
+            raise RuntimeError("Benchmark save failed")
+
+        parts = dict()
+        save_bytes = 0
+        for part_type, names in ((SaveAtom.FILE, save_atom.files), (SaveAtom.DATABASE, save_atom.databases)):
+            for name in names:
+                record = journal.get_part_history(Benchmark.C_APP, part_type, name)[-1]
+                parts["{}:{}".format(part_type, name)] = dict(
+                    (key, record.get(key)) for key in (
+                        Journal.R_DURATION, Journal.R_BYTES, Journal.R_ORIGINAL_BYTES, Journal.R_THROUGHPUT,
+                        Journal.R_STATUS
+                    )
+                )
+                save_bytes += record.get(Journal.R_BYTES) or 0
+        # retention runs within save when not in daemon mode
+        retention_seconds = 0
+        deleted = 0
+        for record in Journal.read(journal.path):
+            if record.get(Journal.E_EVENT) == Journal.E_RETENTION and record[Journal.R_TIME] >= start:
+                retention_seconds += record.get(Journal.R_DURATION) or 0
+                deleted += record.get(Journal.R_FILES) or 0
+
+        self._clear_source()
+        start = time.time()
+        save.restore(save_atom)
+        restore_seconds = time.time() - start
+        failed = self._verify()
+        if len(failed) > 0:
+            logger.error("Benchmark restore differs from generated content for {}".format(failed))
+
+        return {
+            'date': save_atom.date,
+            'status': save_atom.status.value,
+            'save_seconds': save_seconds - retention_seconds,
+            'save_throughput_bytes_per_second': self._source_bytes / max(save_seconds - retention_seconds, 1e-6),
+            'retention_seconds': retention_seconds,
+            'retention_deleted_files': deleted,
+            'restore_seconds': restore_seconds,
+            'restore_throughput_bytes_per_second': self._source_bytes / max(restore_seconds, 1e-6),
+            'source_bytes': self._source_bytes,
+            'save_bytes': save_bytes,
+            'compression_ratio': save_bytes / self._source_bytes if self._source_bytes else None,
+            'verified': len(failed) == 0,
+            'parts': parts
+        }
+
+    def run(self):
+        """
+        Prepare and run benchmark iterations
+        :return: iteration results
+        :rtype: list
+        """
+        self.prepare()
+        try:
+            save = Save.get_instances(self._conf)[Benchmark.C_APP]
+            results = list()
+            for i in range(self._iterations):
+                logger.info("Benchmark iteration {}/{}".format(i + 1, self._iterations))
+                results.append(self._iteration(save))
+                logger.info(
+                    "Benchmark iteration {}/{}: save {}s ({}/s), retention {}s, restore {}s ({}/s)".format(
+                        i + 1, self._iterations, round(results[-1]['save_seconds'], 3),
+                        Units.convert_bytes(results[-1]['save_throughput_bytes_per_second']),
+                        round(results[-1]['retention_seconds'], 3), round(results[-1]['restore_seconds'], 3),
+                        Units.convert_bytes(results[-1]['restore_throughput_bytes_per_second'])
+                    )
+                )
+            return results
+        finally:
+            if self._temporary:
+                shutil.rmtree(self._workdir, ignore_errors=True)
+            Config.cache.pop(self._conf, None)
+
+    @staticmethod
+    def check(metrics, thresholds=None, baseline=None, tolerance=0.1):
+        """
+        Check metrics against thresholds and baseline metrics
+        :param metrics: measured metrics, see C_METRICS
+        :type metrics: dict
+        :param thresholds: Optional. {metric: {min: value, max: value}}
+        :type thresholds: Union[dict|None]
+        :param baseline: Optional. metrics of a previous report
+        :type baseline: Union[dict|None]
+        :param tolerance: allowed regression against baseline, 0.1 for 10%
+        :type tolerance: float
+        :return: list of checks
+        :rtype: list
+        :raise: TypeError on unknown metric or threshold
+        """
+        checks = list()
+        for metric, limits in (thresholds or dict()).items():
+            if metric not in Benchmark.C_METRICS:
+                raise TypeError("Unknown metric {}. Should be one of {}".format(metric, set(Benchmark.C_METRICS)))
+            YAMLHelper.analyse_keys(metric, limits, optional_key_set={Benchmark.C_MIN, Benchmark.C_MAX})
+            for bound, limit in limits.items():
+                value = metrics[metric]
+                passed = value >= limit if bound == Benchmark.C_MIN else value <= limit
+                checks.append({'metric': metric, 'value': value, bound: limit, 'passed': passed})
+        for metric, higher_is_better in Benchmark.C_METRICS.items():
+            if baseline is None or baseline.get(metric) is None or metrics.get(metric) is None:
+                continue
+            if higher_is_better:
+                limit = baseline[metric] * (1 - tolerance)
+                checks.append({
+                    'metric': metric, 'value': metrics[metric], Benchmark.C_MIN: limit, 'baseline': baseline[metric],
+                    'passed': metrics[metric] >= limit
+                })
+            else:
+                limit = baseline[metric] * (1 + tolerance)
+                if metric.endswith('_seconds'):
+                    limit += Benchmark.C_SLACK_SECONDS
+                checks.append({
+                    'metric': metric, 'value': metrics[metric], Benchmark.C_MAX: limit, 'baseline': baseline[metric],
+                    'passed': metrics[metric] <= limit
+                })
+        return checks
+
+    def report(self, results, thresholds=None, baseline=None, tolerance=0.1):
+        """
+        :param results: iteration results, see run()
+        :type results: list
+        :param thresholds: Optional. {metric: {min: value, max: value}}
+        :type thresholds: Union[dict|None]
+        :param baseline: Optional. previous report
+        :type baseline: Union[dict|None]
+        :param tolerance: allowed regression against baseline, 0.1 for 10%
+        :type tolerance: float
+        :return: report
+        :rtype: dict
+        """
+        metrics = dict(
+            (metric, median(result[metric] for result in results))
+            for metric in Benchmark.C_METRICS if all(result[metric] is not None for result in results)
+        )
+        checks = Benchmark.check(metrics, thresholds, baseline.get('metrics') if baseline else None, tolerance)
+        verified = all(result['verified'] for result in results)
+        return {
+            'date': datetime.today().isoformat(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'parameters': self.parameters,
+            'iterations': results,
+            'metrics': metrics,
+            'checks': checks,
+            'verified': verified,
+            'passed': verified and all(check['passed'] for check in checks)
+        }
+
+    @staticmethod
+    def write_report(report, path):
+        """
+        :param report: see report()
+        :type report: dict
+        :param path: JSON report file
+        :type path: str
+        """
+        folder = os.path.split(path)[0]
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load_report(path):
+        """
+        :param path: JSON report file
+        :type path: str
+        :rtype: dict
+        """
+        with open(path) as f:
+            return json.load(f)
@@ -0,0 +1,196 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        generator
+# Purpose:     Synthetic app generator
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import random
+import datetime
+import sqlite3
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Generator:
+    """
+    Generates synthetic app content: file trees of chosen size, file count and compressibility, and SQLite databases.
+    Content is reproducible for a given seed, so that benchmark runs can be compared.
+    """
+
+    C_BLOCK_SIZE = 64 * 1024
+    C_FILES_PER_FOLDER = 100
+    C_WORDS = (
+        'save', 'restore', 'retention', 'database', 'compression', 'archive', 'schedule', 'daemon', 'journal',
+        'storage', 'period', 'quarter', 'snapshot', 'backup', 'restore', 'partial', 'full', 'tier'
+    )
+
+    def __init__(self, seed=0):
+        """
+        :param seed: Optional. random seed
+        :type seed: int
+        """
+        self._random = random.Random(seed)
+
+    def _block(self, size, compressibility):
+        """
+        :return: size bytes, of which a compressibility share is repeated text and the rest random bytes
+        :rtype: bytes
+        """
+        compressible = int(size * compressibility)
+        text = ' '.join(self._random.choice(Generator.C_WORDS) for _ in range(64)).encode()
+        repeated = (text * (compressible // len(text) + 1))[:compressible]
+        if compressible == size:
+            return repeated
+        return repeated + self._random.getrandbits(8 * (size - compressible)).to_bytes(size - compressible, 'little')
+
+    def generate_files(self, path, size, count, compressibility=0.5):
+        """
+        Generate a file tree, C_FILES_PER_FOLDER files per folder
+        :param path: tree root, created if needed
+        :type path: str
+        :param size: total size in bytes
+        :type size: int
+        :param count: number of files
+        :type count: int
+        :param compressibility: share of compressible content, from 0 (random) to 1 (text only)
+        :type compressibility: float
+        :return: generated bytes
+        :rtype: int
+        """
+        count = max(1, count)
+        total = 0
+        for i in range(count):
+            folder = os.path.join(path, "dir{:05d}".format(i // Generator.C_FILES_PER_FOLDER))
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            remaining = size // count + (1 if i < size % count else 0)
+            with open(os.path.join(folder, "file{:07d}.bin".format(i)), 'wb') as f:
+                while remaining > 0:
+                    block = self._block(min(remaining, Generator.C_BLOCK_SIZE), compressibility)
+                    f.write(block)
+                    remaining -= len(block)
+                    total += len(block)
+        logger.info("Generated {} files, {} bytes in {}".format(count, total, path))
+        return total
+
+    def generate_database(self, file, size, compressibility=0.5):
+        """
+        Generate a SQLite database
+        :param file: database file, replaced if exists
+        :type file: str
+        :param size: approximative size of stored rows in bytes
+        :type size: int
+        :param compressibility: share of compressible content, from 0 (random) to 1 (text only)
+        :type compressibility: float
+        :return: stored row bytes
+        :rtype: int
+        """
+        folder = os.path.split(file)[0]
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        if os.path.exists(file):
+            os.remove(file)
+        row_size = 1024
+        total = 0
+        with sqlite3.connect(file) as db:
+            db.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT, payload TEXT)")
+            rows = list()
+            while total < size:
+                # random part is stored hex encoded
+                payload = self._block(row_size, compressibility)
+                text = payload[:int(row_size * compressibility)].decode()
+                rows.append((self._random.choice(Generator.C_WORDS), text + payload[len(text):].hex()))
+                total += row_size
+                if len(rows) == 1000:
+                    db.executemany("INSERT INTO item (name, payload) VALUES (?, ?)", rows)
+                    rows = list()
+            db.executemany("INSERT INTO item (name, payload) VALUES (?, ?)", rows)
+        logger.info("Generated database {}, {} bytes".format(file, os.path.getsize(file)))
+        return os.path.getsize(file)
+
+    @staticmethod
+    def checksum_files(path):
+        """
+        :param path: tree root
+        :type path: str
+        :return: checksum of file names and contents
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        for root, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                file = os.path.join(root, name)
+                digest.update(os.path.relpath(file, path).encode())
+                with open(file, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def checksum_database(file):
+        """
+        :param file: SQLite database
+        :type file: str
+        :return: checksum of database SQL dump, None if database does not exist
+        :rtype: Union[str|None]
+        """
+        if not os.path.exists(file):
+            return None
+        digest = hashlib.sha256()
+        db = sqlite3.connect(file)
+        try:
+            for line in db.iterdump():
+                digest.update(line.encode())
+        finally:
+            db.close()
+        return digest.hexdigest()
+
+    @staticmethod
+    def generate_old_saves(path, name, extension, count, size=1024):
+        """
+        Generate aged save files, so that retention has files to delete
+        :param path: save folder
+        :type path: str
+        :param name: part name
+        :type name: str
+        :param extension: save file extension
+        :type extension: str
+        :param count: number of files, one per day before 2000-01-01
+        :type count: int
+        :param size: Optional. size of each file
+        :type size: int
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        day = datetime.datetime(2000, 1, 1)
+        for i in range(count):
+            date = (day - datetime.timedelta(days=i)).strftime('%Y-%m-%d-%H-%M')
+            with open(os.path.join(path, "{}-{}.{}".format(name, date, extension)), 'wb') as f:
+                f.write(b'\0' * size)
@@ -0,0 +1,334 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        micro
+# Purpose:     Micro benchmarks of pure python hot paths
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import io
+import os
+import gc
+import time
+import logging
+import platform
+import tracemalloc
+from datetime import datetime, timedelta
+
+from snr.app import App
+from snr.benchmark.benchmark import Benchmark
+from snr.compression import Compression
+from snr.config import Config
+from snr.database import Database
+from snr.retention import Retention
+from snr.retention.index import SaveIndex
+from snr.retention.retention import RetentionTypeEnum
+from snr.save import Save
+from snr.yamlhelper import YAMLHelper
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBenchmark:
+    """
+    Micro benchmarks of pure python hot paths: save listing, retention indexes and periods, save atoms, restore
+    listing and configuration validation. They run on a generated save tree of an app made of C_PARTS parts, and on a
+    generated configuration of one app per C_SAVES_PER_APP saves.
+    Each operation is timed, best of several runs, then run once more under tracemalloc to record its peak memory.
+    """
+
+    C_APP = 'micro'
+    C_RETENTION = 'micro'
+    C_PARTS = {App.C_FILES: ('data', 'config'), App.C_DBS: ('db0', 'db1')}
+    C_SAVES_PER_APP = 100
+    C_SAVE_INTERVAL = timedelta(hours=1)
+    C_MARKER = '.saves'
+    # restore listing lists saves once per listed save
+    C_LIMITS = {'cli.print_restoreable_apps': 500}
+
+    C_OPERATIONS = (
+        'config.compile', 'yaml.analyse_keys', 'app.get_saves', 'save_atom.clone', 'save_atom.status',
+        'index.scan', 'index.scan_cached', 'retention.matching_files', 'retention.unwanted_files',
+        'cli.print_restoreable_apps'
+    )
+
+    def __init__(self, conf, workdir, saves=(10000, 100000), operations=None, repeat=3):
+        """
+        :param conf: configuration file compression and database helpers sections are taken from
+        :type conf: str
+        :param workdir: work directory. Generated save trees are kept there and reused by following runs
+        :type workdir: str
+        :param saves: numbers of saves operations are run with
+        :type saves: Union[tuple|list]
+        :param operations: Optional. operations to run, see C_OPERATIONS. All per default
+        :type operations: Union[list|None]
+        :param repeat: number of timed runs of each operation
+        :type repeat: int
+        """
+        self._source_conf = conf
+        self._workdir = os.path.abspath(workdir)
+        self._saves = saves
+        self._operations = operations or MicroBenchmark.C_OPERATIONS
+        self._repeat = repeat
+        for operation in self._operations:
+            if operation not in MicroBenchmark.C_OPERATIONS:
+                raise TypeError("Unknown operation {}. Should be one of {}".format(
+                    operation, set(MicroBenchmark.C_OPERATIONS)
+                ))
+
+    @property
+    def parameters(self):
+        return {
+            'conf': self._source_conf,
+            'saves': list(self._saves),
+            'operations': list(self._operations),
+            'repeat': self._repeat
+        }
+
+    def _root(self, saves):
+        return os.path.join(self._workdir, str(saves))
+
+    def _write_conf(self, saves):
+        """
+        Write configuration of one app per C_SAVES_PER_APP saves, first one owning generated save tree
+        :return: configuration path
+        :rtype: str
+        """
+        root = self._root(saves)
+        source = YAMLHelper.load(self._source_conf)
+        data = dict((section, source[section]) for section in Benchmark.C_SECTIONS if source.get(section))
+        data.setdefault(Database.HELPERS, dict())[Benchmark.C_DB_TYPE] = Benchmark.C_SQLITE_HELPER
+        credentials = os.path.join(root, 'credentials')
+        with open(credentials, 'w') as f:
+            f.write(YAMLHelper.dump({Database.C_USER: MicroBenchmark.C_APP, Database.C_PASS: MicroBenchmark.C_APP}))
+        data[Database.DBS] = [{
+            Database.D_INSTANCE: MicroBenchmark.C_APP, Database.D_TYPE: Benchmark.C_DB_TYPE,
+            Database.D_HOST: os.path.join(root, 'databases'), Database.D_PORT: 0, Database.D_CREDS: credentials
+        }]
+        data[App.C_APPS] = list()
+        data[Save.C_SAVES] = list()
+        for i in range(max(1, saves // MicroBenchmark.C_SAVES_PER_APP)):
+            name = MicroBenchmark.C_APP if i == 0 else "{}{}".format(MicroBenchmark.C_APP, i)
+            data[App.C_APPS].append({
+                App.C_NAME: name,
+                App.C_DBS: [
+                    {App.C_DB_NAME: db, App.C_DATABASE_NAME: db, App.C_DB_INSTANCE: MicroBenchmark.C_APP}
+                    for db in MicroBenchmark.C_PARTS[App.C_DBS]
+                ],
+                App.C_FILES: [
+                    {App.C_FILE_NAME: file, App.C_FILE_PATH: os.path.join(root, 'src', name, file)}
+                    for file in MicroBenchmark.C_PARTS[App.C_FILES]
+                ]
+            })
+            data[Save.C_SAVES].append({
+                Save.C_SAVE_APP_NAME: name,
+                Save.C_SAVE_DEST: os.path.join(root, 'saves', '$app', '$type', '$name', '$name-$date'),
+                Save.C_SAVE_RETENTION: {
+                    RetentionTypeEnum.DBS.value: MicroBenchmark.C_RETENTION,
+                    RetentionTypeEnum.FILES.value: MicroBenchmark.C_RETENTION
+                }
+            })
+        data[Retention.C_RETENTION] = [{
+            Retention.C_RETENTION_NAME: MicroBenchmark.C_RETENTION, Retention.C_RETENTION_DAYS: 7,
+            Retention.C_RETENTION_WEEKS: 4, Retention.C_RETENTION_MONTHS: 12, Retention.C_RETENTION_QUARTERS: 4,
+            Retention.C_RETENTION_YEARS: 2
+        }]
+        data[Save.C_DAEMON] = {Save.C_DAEMON_RUN_PATH: os.path.join(root, 'run')}
+        data['journal'] = {'path': os.path.join(root, 'journal.jsonl')}
+        conf = os.path.join(root, 'micro.yaml')
+        with open(conf, 'w') as f:
+            f.write(YAMLHelper.dump(data))
+        return conf
+
+    def prepare(self, saves):
+        """
+        Generate save tree of saves empty files, spread over app parts, one save per C_SAVE_INTERVAL, unless already
+        generated, and configuration
+        :param saves: number of save files
+        :type saves: int
+        :return: configuration path
+        :rtype: str
+        """
+        root = self._root(saves)
+        marker = os.path.join(root, MicroBenchmark.C_MARKER)
+        if not os.path.exists(root):
+            os.makedirs(root)
+        conf = self._write_conf(saves)
+        if os.path.exists(marker):
+            return conf
+        logger.info("Generating {} saves in {}".format(saves, root))
+        compression = Compression.get_instance(conf)
+        parts = [
+            (save_type, name) for save_type, names in sorted(MicroBenchmark.C_PARTS.items()) for name in names
+        ]
+        now = datetime.today().replace(second=0, microsecond=0)
+        for i, (save_type, name) in enumerate(parts):
+            folder = os.path.join(root, 'saves', MicroBenchmark.C_APP, save_type, name)
+            os.makedirs(folder, exist_ok=True)
+            for n in range(saves // len(parts) + (1 if i < saves % len(parts) else 0)):
+                file = os.path.join(folder, "{}-{}".format(
+                    name, (now - n * MicroBenchmark.C_SAVE_INTERVAL).strftime(App.C_DATE_FORMAT)
+                ))
+                if save_type == App.C_DBS:
+                    file = compression.get_file_with_compressed_from_pipe_ext(file)
+                else:
+                    file = compression.get_file_with_compressed_extension(file)
+                os.close(os.open(file, os.O_CREAT | os.O_WRONLY, 0o644))
+        with open(marker, 'w') as f:
+            f.write(str(saves))
+        return conf
+
+    def _measure(self, operation, saves, function, setup=None):
+        """
+        :param operation: operation name
+        :type operation: str
+        :param saves: number of saves
+        :type saves: int
+        :param function: operation
+        :type function: callable
+        :param setup: Optional. Called before each run, not measured
+        :type setup: Union[callable|None]
+        :return: operation result
+        :rtype: dict
+        """
+        times = list()
+        for _ in range(self._repeat):
+            if setup is not None:
+                setup()
+            gc.collect()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        if setup is not None:
+            setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {
+            'operation': operation,
+            'saves': saves,
+            'repeat': self._repeat,
+            'seconds': min(times),
+            'mean_seconds': sum(times) / len(times),
+            'peak_memory_bytes': peak
+        }
+        logger.info("{} on {} saves: {}s, {} bytes peak".format(operation, saves, round(result['seconds'], 6), peak))
+        return result
+
+    def _run(self, saves):
+        """
+        :param saves: number of saves
+        :type saves: int
+        :return: operation results
+        :rtype: list
+        """
+        conf = self.prepare(saves)
+        config = Config.compile(conf)
+        app_saves = Save.get_instances(conf)
+        save = app_saves[MicroBenchmark.C_APP]
+        app = save.app
+        destination = save._destination
+        storage = save._storage
+        retention = Retention.get_instance(conf, MicroBenchmark.C_RETENTION, RetentionTypeEnum.FILES)
+        path = os.path.join(self._root(saves), 'saves', MicroBenchmark.C_APP, App.C_FILES)
+        save_atoms = list(app.get_saves(destination, storage).values())
+
+        def analyse_keys():
+            for app_data in config.data[App.C_APPS]:
+                YAMLHelper.analyse_keys(App.C_APPS, app_data, optional_key_set=App.C_APP_KEYS)
+                for db in app_data[App.C_DBS]:
+                    YAMLHelper.analyse_keys(App.C_DBS, db, App.C_DB_KEYS, App.C_DB_OPTIONAL_KEYS)
+                for file in app_data[App.C_FILES]:
+                    YAMLHelper.analyse_keys(App.C_FILES, file, App.C_FILE_KEYS)
+            for save_data in config.data[Save.C_SAVES]:
+                YAMLHelper.analyse_keys(Save.C_SAVES, save_data, Save.C_SAVE_KEYS, Save.C_SAVE_OPT_KEYS)
+
+        def clear_indexes():
+            with SaveIndex.cache_lock:
+                SaveIndex.cache.clear()
+
+        def print_restoreable_apps():
+            from snr.cli.cliview import CLIView
+            CLIView.print_restoreable_apps({MicroBenchmark.C_APP: save}, io.StringIO())
+
+        operations = {
+            'config.compile': (lambda: Config.compile(conf), None),
+            'yaml.analyse_keys': (analyse_keys, None),
+            'app.get_saves': (lambda: app.get_saves(destination, storage), None),
+            'save_atom.clone': (lambda: [save_atom.clone() for save_atom in save_atoms], None),
+            'save_atom.status': (lambda: [save_atom.status for save_atom in save_atoms], None),
+            'index.scan': (lambda: retention._scan(path), clear_indexes),
+            'index.scan_cached': (lambda: retention._scan(path), None),
+            'retention.matching_files': (lambda: retention._get_matching_files(retention._scan(path)), None),
+            'retention.unwanted_files': (lambda: retention.get_unwanted_files(path), None),
+            'cli.print_restoreable_apps': (print_restoreable_apps, None)
+        }
+        results = list()
+        for operation in self._operations:
+            limit = MicroBenchmark.C_LIMITS.get(operation)
+            if limit is not None and saves > limit:
+                logger.warning("Skipping {} on {} saves, above {} saves".format(operation, saves, limit))
+                continue
+            function, setup = operations[operation]
+            results.append(self._measure(operation, saves, function, setup))
+        return results
+
+    def run(self):
+        """
+        :return: operation results for each number of saves
+        :rtype: list
+        """
+        results = list()
+        for saves in self._saves:
+            results.extend(self._run(saves))
+        return results
+
+    def report(self, results, baseline=None):
+        """
+        :param results: operation results, see run()
+        :type results: list
+        :param baseline: Optional. previous report. Speedups against it are added to results
+        :type baseline: Union[dict|None]
+        :return: report
+        :rtype: dict
+        """
+        if baseline is not None:
+            previous = dict(((r['operation'], r['saves']), r) for r in baseline.get('results', list()))
+            for result in results:
+                before = previous.get((result['operation'], result['saves']))
+                if before is not None and result['seconds'] > 0:
+                    result['speedup'] = before['seconds'] / result['seconds']
+                    result['memory_ratio'] = result['peak_memory_bytes'] / max(before['peak_memory_bytes'], 1)
+        return {
+            'date': datetime.today().isoformat(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'parameters': self.parameters,
+            'results': results
+        }
@@ -29,11 +29,15 @@
 # ------------------------------------------------------------------------------
 import argparse
 import os
+import sys
 import logging.config
 
 from snr.log.logger import Logger
 from snr.yamlhelper.yamlhelper import YAMLHelper
+from snr.config import Config
 from snr.cli.clicontroller import CLIController
+from snr.profiler import Profiler
+from snr.benchmark import MicroBenchmark
 
 C_YAML_LOG_BASIC = """
 version: 1
@@ -64,6 +68,86 @@ class CLI:
         'func': CLIController.daemonize,
         'opts': []
     }
+    C_WORKER = {
+        'arg': 'worker',        'help': 'Start snr as a worker saving parts sent by a snr daemon. See workers '
+                                        'section of configuration file',
+        'func': CLIController.worker,
+        'opts': [
+            {
+                'args': ('--coordinator',),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Daemon to connect to, as host:port. Address and port of workers section per default'
+                }
+            },
+            {
+                'args': ('-s', '--slots'),
+                'flags': {
+                    'type': int,
+                    'default': 1,
+                    'help': 'Number of parts saved at the same time. Default to 1'
+                }
+            },
+            {
+                'args': ('-n', '--name'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Worker name, as logged by daemon. Host name per default'
+                }
+            }
+        ]
+    }
+    C_SERVE = {
+        'arg': 'serve',         'help': 'Start snr as an ingestion server writing saves pushed by snr agents. See '
+                                        'ingest section of configuration file',
+        'func': CLIController.serve,
+        'opts': []
+    }
+    C_AGENT = {
+        'arg': 'agent',         'help': 'Save specified application next to its data and push it to a snr ingestion '
+                                        'server',
+        'func': CLIController.agent,
+        'opts': [
+            {
+                'args': ('-a', '--app'),
+                'flags': {
+                    'type': str,
+                    'required': True,
+                    'help': 'Application to save'
+                }
+            },
+            {
+                'args': ('--server',),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Ingestion server url, as http://host:port. url of ingest section per default'
+                }
+            },
+            {
+                'args': ('-x', '--exclude'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'nargs': argparse.REMAINDER,
+                    'help': 'Application parts to exclude from saving. Space separated list.'
+                            ' Example: --exclude database:bd_name0 file:file0. No exclusion per default'
+                }
+            }
+        ]
+    }
+    C_RELOAD = {
+        'arg': 'reload',        'help': 'Ask running snr daemon to reload its configuration',
+        'func': CLIController.reload,
+        'opts': []
+    }
+    C_PROFILE = {
+        'arg': 'profile',       'help': 'Start or stop profiling of running snr daemon',
+        'func': CLIController.profile,
+        'opts': []
+    }
     C_SAVE = {
         'arg': 'save',         'help': 'Save specified application. '
                                        'If not followed by --app, gives the list of app available for save',
@@ -77,6 +161,13 @@ class CLI:
                     'help': "Application to save. If not given display registered/save-able application list"
                 }
             },
+            {
+                'args': ('-p', '--progress'),
+                'flags': {
+                    'action': 'store_true',
+                    'help': 'Display live progress of each part : bytes read and written, rate and ETA'
+                }
+            },
             {
                 'args': ('-x', '--exclude'),
                 'flags': {
@@ -129,6 +220,277 @@ class CLI:
             }
         ]
     }
+    C_PROGRESS = {
+        'arg': 'progress',    'help': 'Print progress of parts being saved by running snr daemon',
+        'func': CLIController.progress,
+        'opts': [
+            {
+                'args': ('--json',),
+                'flags': {
+                    'action': 'store_true',
+                    'help': 'Print progress as JSON'
+                }
+            }
+        ]
+    }
+    C_CANCEL = {
+        'arg': 'cancel',    'help': 'Cancel parts being saved by running snr daemon. Their save files are deleted',
+        'func': CLIController.cancel,
+        'opts': [
+            {
+                'args': ('-a', '--app'),
+                'flags': {
+                    'type': str,
+                    'required': True,
+                    'help': 'Application whose parts are cancelled'
+                }
+            },
+            {
+                'args': ('-p', '--part'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Part to cancel, as database:name or file:name. All running parts of app per default'
+                }
+            }
+        ]
+    }
+    C_STATS = {
+        'arg': 'stats',    'help': 'Print per app and per part throughput, size, ratio and duration statistics from '
+                                   'run journal, flagging parts whose throughput dropped or size grew',
+        'func': CLIController.stats,
+        'opts': [
+            {
+                'args': ('-a', '--app'),
+                'flags': {
+                    'type': str,
+                    'nargs': '+',
+                    'default': None,
+                    'help': 'Apps to analyse. All per default'
+                }
+            },
+            {
+                'args': ('-d', '--days'),
+                'flags': {
+                    'type': int,
+                    'default': None,
+                    'help': 'Number of days of history to analyse. Whole journal per default'
+                }
+            },
+            {
+                'args': ('-w', '--window'),
+                'flags': {
+                    'type': int,
+                    'default': 10,
+                    'help': 'Number of previous runs last run is compared to. Defaults to 10'
+                }
+            },
+            {
+                'args': ('--throughput-drop',),
+                'flags': {
+                    'type': float,
+                    'default': 30,
+                    'help': 'Throughput drop against baseline flagged, in percent. Defaults to 30'
+                }
+            },
+            {
+                'args': ('--size-growth',),
+                'flags': {
+                    'type': float,
+                    'default': 30,
+                    'help': 'Size growth against baseline flagged, in percent. Defaults to 30'
+                }
+            },
+            {
+                'args': ('--json',),
+                'flags': {
+                    'action': 'store_true',
+                    'help': 'Print statistics and time series as JSON'
+                }
+            }
+        ]
+    }
+    C_BENCHMARK = {
+        'arg': 'benchmark',    'help': 'Save, apply retention and restore a generated app with configured compression, '
+                                       'encryption and storage, and write a JSON report',
+        'func': CLIController.benchmark,
+        'opts': [
+            {
+                'args': ('-w', '--workdir'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Work directory holding generated app and its saves. Temporary directory removed after '
+                            'run per default'
+                }
+            },
+            {
+                'args': ('-s', '--size'),
+                'flags': {
+                    'type': str,
+                    'default': '100MB',
+                    'help': 'Total size of generated files. Defaults to 100MB'
+                }
+            },
+            {
+                'args': ('-f', '--files'),
+                'flags': {
+                    'type': int,
+                    'default': 100,
+                    'help': 'Number of generated files. Defaults to 100'
+                }
+            },
+            {
+                'args': ('--compressibility',),
+                'flags': {
+                    'type': float,
+                    'default': 0.5,
+                    'help': 'Share of compressible content, from 0 (random) to 1 (text only). Defaults to 0.5'
+                }
+            },
+            {
+                'args': ('-d', '--databases'),
+                'flags': {
+                    'type': int,
+                    'default': 1,
+                    'help': 'Number of generated SQLite databases. Defaults to 1'
+                }
+            },
+            {
+                'args': ('--database-size',),
+                'flags': {
+                    'type': str,
+                    'default': '10MB',
+                    'help': 'Size of each generated database. Defaults to 10MB'
+                }
+            },
+            {
+                'args': ('-i', '--iterations'),
+                'flags': {
+                    'type': int,
+                    'default': 3,
+                    'help': 'Number of save, retention and restore runs. Median is reported. Defaults to 3'
+                }
+            },
+            {
+                'args': ('--old-saves',),
+                'flags': {
+                    'type': int,
+                    'default': 100,
+                    'help': 'Number of aged saves per part generated for retention to delete. Defaults to 100'
+                }
+            },
+            {
+                'args': ('--storage',),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Storage to save to, as per storages section. Local filesystem per default'
+                }
+            },
+            {
+                'args': ('--max-parallel-parts',),
+                'flags': {
+                    'type': int,
+                    'default': None,
+                    'help': 'Number of parts saved at the same time. Unlimited per default'
+                }
+            },
+            {
+                'args': ('-r', '--report'),
+                'flags': {
+                    'type': str,
+                    'default': 'snr-benchmark.json',
+                    'help': 'JSON report file. Defaults to snr-benchmark.json'
+                }
+            },
+            {
+                'args': ('-t', '--thresholds'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'YAML or JSON file of {metric: {min: value, max: value}}. Run fails if a metric is out '
+                            'of bounds'
+                }
+            },
+            {
+                'args': ('-b', '--baseline'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Previous JSON report. Run fails if a metric regressed by more than --tolerance'
+                }
+            },
+            {
+                'args': ('--tolerance',),
+                'flags': {
+                    'type': float,
+                    'default': 10,
+                    'help': 'Allowed regression against baseline, in percent. Defaults to 10'
+                }
+            }
+        ]
+    }
+    C_MICROBENCHMARK = {
+        'arg': 'microbenchmark',    'help': 'Time and measure peak memory of save listing, retention, restore listing '
+                                            'and configuration hot paths on generated save trees',
+        'func': CLIController.microbenchmark,
+        'opts': [
+            {
+                'args': ('--saves',),
+                'flags': {
+                    'type': int,
+                    'nargs': '+',
+                    'default': [10000, 100000],
+                    'help': 'Numbers of generated saves. Defaults to 10000 100000'
+                }
+            },
+            {
+                'args': ('--operations',),
+                'flags': {
+                    'type': str,
+                    'nargs': '+',
+                    'default': None,
+                    'help': 'Operations to run, among {}. All per default'.format(', '.join(
+                        MicroBenchmark.C_OPERATIONS
+                    ))
+                }
+            },
+            {
+                'args': ('--repeat',),
+                'flags': {
+                    'type': int,
+                    'default': 3,
+                    'help': 'Number of timed runs per operation. Best is reported. Defaults to 3'
+                }
+            },
+            {
+                'args': ('-w', '--workdir'),
+                'flags': {
+                    'type': str,
+                    'default': 'snr-microbenchmark',
+                    'help': 'Work directory holding generated save trees, reused by following runs. Defaults to '
+                            'snr-microbenchmark'
+                }
+            },
+            {
+                'args': ('-r', '--report'),
+                'flags': {
+                    'type': str,
+                    'default': 'snr-microbenchmark.json',
+                    'help': 'JSON report file. Defaults to snr-microbenchmark.json'
+                }
+            },
+            {
+                'args': ('-b', '--baseline'),
+                'flags': {
+                    'type': str,
+                    'default': None,
+                    'help': 'Previous JSON report to compute speedups against'
+                }
+            }
+        ]
+    }
     C_GEN_CONFIG = {
         'arg': 'genconf',      'help': 'Generate sample configuration and exit',
         'func': CLIController.genconf,
@@ -139,7 +501,10 @@ class CLI:
         'func': CLIController.create_systemd_service,
         'opts': []
     }
-    C_ACTIONS = [C_DAEMON, C_SAVE, C_RESTORE, C_GEN_CONFIG, C_GEN_SYSTEMD]
+    C_ACTIONS = [
+        C_DAEMON, C_WORKER, C_SERVE, C_AGENT, C_RELOAD, C_PROFILE, C_PROGRESS, C_CANCEL, C_SAVE, C_RESTORE,
+        C_STATS, C_BENCHMARK, C_MICROBENCHMARK, C_GEN_CONFIG, C_GEN_SYSTEMD
+    ]
 
     @staticmethod
     def get_parser():
@@ -150,6 +515,24 @@ class CLI:
             type=str,
             help='Specify configuration file. Defaults to {}'.format(CLI.C_CONF_PATH)
         )
+        parser.add_argument(
+            '--no-daemon',
+            action='store_true',
+            help='Run save and restore commands in this process even when a snr daemon is running. Running daemon '
+                 'is used through its control socket per default'
+        )
+        parser.add_argument(
+            '--profile',
+            nargs='?',
+            const='',
+            default=None,
+            type=str,
+            metavar='FILE',
+            help='Profile run with cProfile. Writes a pstats dump in FILE and a per thread wall-clock summary in '
+                 'FILE{}. FILE defaults to snr-<date>-<pid>{} in current directory'.format(
+                Profiler.C_SUMMARY_EXTENSION, Profiler.C_EXTENSION
+            )
+        )
 
         subparsers = parser.add_subparsers(prog="snr")
 
@@ -170,12 +553,25 @@ __all__ = ['main']
 def main():
     parser = CLI.get_parser()
     args = parser.parse_args()
-    if os.path.exists(args.conf):
-        logger = Logger(YAMLHelper.load(args.conf), __name__).get()
-    if hasattr(args, 'func'):
-        args.func(args)  # call the default function
-    else:
-        parser.print_help()
+    profiler = None
+    if args.profile is not None:
+        # configuration loading is profiled too
+        profiler = Profiler(args.profile or Profiler.get_default_path()).start()
+    try:
+        if os.path.exists(args.conf):
+            try:
+                logger = Logger(Config.get_instance(args.conf).data, __name__).get()
+            except (TypeError, IOError) as e:
+                # sections are compiled up front, credentials files included
+                logging.getLogger(__name__).error("Configuration error : {}. Terminating.".format(e))
+                sys.exit(1)
+        if hasattr(args, 'func'):
+            args.func(args)  # call the default function
+        else:
+            parser.print_help()
+    finally:
+        if profiler is not None:
+            profiler.stop()
 
 
 if __name__ == '__main__':
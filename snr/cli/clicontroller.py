@@ -29,10 +29,14 @@
 # ------------------------------------------------------------------------------
 import os
 import sys
+import json
+import time
+import signal
 import logging
 
 from snr.app import SaveAtom, AppSaveStatusEnum
 from snr.cli.cliview import CLIView
+from snr.control import Control, ControlClient
 from snr.save import Save
 
 logger = logging.getLogger(__name__)
@@ -110,6 +114,8 @@ logging:
 
     [Service]
     ExecStart=/usr/bin/snr daemon
+    ExecReload=/bin/kill -HUP $MAINPID
+    Delegate=cpu io memory
     Restart=always
     StartLimitInterval=0
     RestartSec=10
@@ -124,6 +130,160 @@ logging:
         logger.info("Starting SnR as daemon")
         Save.run_as_daemon(args.conf)
 
+    @staticmethod
+    @check_conf
+    def worker(args):
+        from snr.worker import Worker
+        try:
+            worker = Worker.get_instance(args.conf, args.coordinator, args.slots, args.name)
+        except TypeError as e:
+            logger.error("Cannot start worker : {}".format(e))
+            sys.exit(1)
+        worker.run()
+
+    @staticmethod
+    @check_conf
+    def serve(args):
+        from snr.ingest import Ingest
+        try:
+            ingest = Ingest.get_instance(args.conf)
+        except (TypeError, OSError) as e:
+            logger.error("Cannot start ingestion server : {}".format(e))
+            sys.exit(1)
+        ingest.serve()
+
+    @staticmethod
+    @check_conf
+    def agent(args):
+        from snr.ingest import Agent
+        try:
+            result = Agent.get_instance(args.conf, args.server).save(args.app, args.exclude)
+        except (TypeError, ValueError, IOError) as e:
+            logger.error("Cannot push {} save : {}".format(args.app, e))
+            sys.exit(1)
+        if result['status'] != AppSaveStatusEnum.FULL.value:
+            sys.exit(1)
+
+    @staticmethod
+    @check_conf
+    def reload(args):
+        pid = Save.get_daemon_pid(args.conf)
+        if pid is None:
+            logger.error("No running snr daemon found. Is {} the daemon configuration ?".format(args.conf))
+            sys.exit(1)
+        os.kill(pid, signal.SIGHUP)
+        logger.info("Configuration reload requested to snr daemon {}".format(pid))
+
+    @staticmethod
+    @check_conf
+    def profile(args):
+        pid = Save.get_daemon_pid(args.conf)
+        if pid is None:
+            logger.error("No running snr daemon found. Is {} the daemon configuration ?".format(args.conf))
+            sys.exit(1)
+        os.kill(pid, Save.C_DAEMON_PROFILE_SIGNAL)
+        logger.info(
+            "Profiling toggled on snr daemon {}. Profiles are written in {}".format(pid, Save.get_run_path(args.conf))
+        )
+
+    @staticmethod
+    @check_conf
+    def progress(args):
+        from snr.progress import Progress, ProgressState
+        pid = Save.get_daemon_pid(args.conf)
+        if pid is None:
+            logger.error("No running snr daemon found. Is {} the daemon configuration ?".format(args.conf))
+            sys.exit(1)
+        client = CLIController._connect(args)
+        try:
+            if client is not None:
+                state = {'time': time.time(), 'pid': pid, 'parts': client.request(Control.C_PROGRESS)}
+                client.close()
+            else:
+                state = ProgressState.read(os.path.join(Save.get_run_path(args.conf), Save.C_DAEMON_PROGRESS))
+        except (OSError, ValueError) as e:
+            logger.error("Cannot read progress of snr daemon {} : {}".format(pid, e))
+            sys.exit(1)
+        if args.json:
+            print(json.dumps(state, indent=2, sort_keys=True))
+        elif len(state['parts']) == 0:
+            print("No part being saved")
+        else:
+            for snapshot in state['parts']:
+                print(Progress.format(snapshot))
+
+    @staticmethod
+    @check_conf
+    def cancel(args):
+        client = CLIController._connect(args)
+        if client is None:
+            logger.error("No running snr daemon found. Is {} the daemon configuration ?".format(args.conf))
+            sys.exit(1)
+        part_type, name = args.part.split(':') if args.part else (None, None)
+        try:
+            cancelled = client.request(Control.C_CANCEL, app=args.app, type=part_type, name=name)
+        except IOError as e:
+            logger.error("Cannot cancel {} : {}".format(args.app, e))
+            sys.exit(1)
+        finally:
+            client.close()
+        if len(cancelled) == 0:
+            logger.warning("No running part of {} to cancel".format(args.app))
+        for part_type, name in cancelled:
+            logger.info("Cancelled {} {} {}".format(args.app, part_type, name))
+
+    @staticmethod
+    @check_conf
+    def stats(args):
+        from snr.stats import Stats
+        stats = Stats.get_instance(args.conf, args.window, args.throughput_drop / 100, args.size_growth / 100)
+        report = stats.analyse(args.app, args.days)
+        if args.json:
+            print(json.dumps(report, indent=2, sort_keys=True))
+        else:
+            CLIView.print_stats(report)
+
+    @staticmethod
+    @check_conf
+    def benchmark(args):
+        from snr.benchmark import Benchmark
+        from snr.units import Units
+        from snr.yamlhelper import YAMLHelper
+        benchmark = Benchmark(
+            args.conf, args.workdir, Units.parse_size(args.size), args.files, args.compressibility, args.databases,
+            Units.parse_size(args.database_size), args.iterations, args.old_saves, args.storage,
+            args.max_parallel_parts
+        )
+        thresholds = YAMLHelper.load(args.thresholds) if args.thresholds else None
+        baseline = Benchmark.load_report(args.baseline) if args.baseline else None
+        report = benchmark.report(benchmark.run(), thresholds, baseline, args.tolerance / 100)
+        Benchmark.write_report(report, args.report)
+        for metric, value in sorted(report['metrics'].items()):
+            logger.info("Benchmark {}: {}".format(metric, round(value, 3)))
+        for check in report['checks']:
+            if not check['passed']:
+                logger.error("Benchmark regression: {}".format(check))
+        logger.info("Benchmark report written in {}".format(args.report))
+        if not report['passed']:
+            logger.error("Benchmark failed")
+            sys.exit(1)
+
+    @staticmethod
+    @check_conf
+    def microbenchmark(args):
+        from snr.benchmark import Benchmark, MicroBenchmark
+        micro = MicroBenchmark(args.conf, args.workdir, args.saves, args.operations, args.repeat)
+        baseline = Benchmark.load_report(args.baseline) if args.baseline else None
+        report = micro.report(micro.run(), baseline)
+        Benchmark.write_report(report, args.report)
+        for result in report['results']:
+            if 'speedup' in result:
+                logger.info("Micro benchmark {} on {} saves: x{} speedup, x{} peak memory".format(
+                    result['operation'], result['saves'], round(result['speedup'], 2),
+                    round(result['memory_ratio'], 2)
+                ))
+        logger.info("Micro benchmark report written in {}".format(args.report))
+
     @staticmethod
     def exclude(save_atom, excludes):
         """
@@ -152,9 +312,82 @@ logging:
             sys.exit(1)
         return save_atom
 
+    @staticmethod
+    def _connect(args):
+        """
+        :return: client of running daemon control socket, None if no daemon is running or --no-daemon is given
+        :rtype: Union[snr.control.ControlClient|None]
+        """
+        if getattr(args, 'no_daemon', False):
+            return None
+        return ControlClient.connect(args.conf)
+
+    @staticmethod
+    def _run_in_daemon(client, args, command, **params):
+        """
+        Run a save or restore in running daemon and wait for it. Its parts are cancelled on KeyboardInterrupt.
+        :return: command result
+        :rtype: dict
+        """
+        display = None
+        if getattr(args, 'progress', False):
+            from snr.progress import ProgressDisplay
+            progress_client = ControlClient.connect(args.conf)
+            if progress_client is not None:
+                display = ProgressDisplay(sys.stderr, source=lambda: [
+                    snapshot for snapshot in progress_client.request(Control.C_PROGRESS)
+                    if snapshot['app'] == args.app
+                ])
+                display.start()
+        try:
+            return client.request(command, app=args.app, **params)
+        except IOError as e:
+            logger.error("snr daemon {} of {} failed : {}".format(command, args.app, e))
+            sys.exit(1)
+        except KeyboardInterrupt:
+            cancel_client = ControlClient.connect(args.conf)
+            if cancel_client is not None:
+                cancel_client.request(Control.C_CANCEL, app=args.app)
+                cancel_client.close()
+            raise
+        finally:
+            if display is not None:
+                display.stop()
+                progress_client.close()
+            client.close()
+
+    @staticmethod
+    def _list_in_daemon(client, view):
+        """
+        Print apps as listed by running snr daemon
+        :param client: connected control client, closed once done
+        :type client: ControlClient
+        :param view: Control.C_VIEW_SAVE or Control.C_VIEW_RESTORE
+        :type view: str
+        """
+        try:
+            print(client.request(Control.C_APPS, view=view)['output'], end='')
+        except IOError as e:
+            logger.error("snr daemon {} failed : {}".format(Control.C_APPS, e))
+            sys.exit(1)
+        finally:
+            client.close()
+
     @staticmethod
     @check_conf
     def save(args):
+        client = CLIController._connect(args)
+        if client is not None:
+            if args.app == "list":
+                CLIController._list_in_daemon(client, Control.C_VIEW_SAVE)
+                return
+            logging.info("Start saving {} in snr daemon...".format(args.app))
+            result = CLIController._run_in_daemon(client, args, Control.C_SAVE, exclude=args.exclude)
+            if result['status'] is None:
+                logging.error("{} save did not run, see snr daemon logs".format(args.app))
+                sys.exit(1)
+            logging.info("Finished {} save {} of {}".format(result['status'], result['date'], args.app))
+            return
         saves = Save.get_instances(args.conf)
         if args.app == "list":
             CLIView.print_saveable_apps(saves)
@@ -168,11 +401,31 @@ logging:
                 if args.exclude:
                     save_atom = CLIController.exclude(save_atom, args.exclude)
                 logging.info("Start saving {}...".format(args.app))
-                save.save(save_atom)
+                display = None
+                if args.progress:
+                    from snr.progress import ProgressDisplay
+                    display = ProgressDisplay(sys.stderr)
+                    display.start()
+                try:
+                    save.save(save_atom)
+                finally:
+                    if display is not None:
+                        display.stop()
 
     @staticmethod
     @check_conf
     def restore(args):
+        client = CLIController._connect(args)
+        if client is not None:
+            if args.app == "list":
+                CLIController._list_in_daemon(client, Control.C_VIEW_RESTORE)
+                return
+            logging.info("Start restoring {} in snr daemon...".format(args.app))
+            result = CLIController._run_in_daemon(
+                client, args, Control.C_RESTORE, date=args.date, exclude=args.exclude, allow_partial=args.allow_partial
+            )
+            logging.info("Finished restore {} of {}".format(result['date'], args.app))
+            return
         saves = Save.get_instances(args.conf)
         if args.app == "list":
             CLIView.print_restoreable_apps(saves)
@@ -219,14 +472,41 @@ logging:
                 from snr.compression import Compression
                 f.write(Compression.C_YAML)
                 # retention
-                from snr.retention import Retention
+                from snr.retention import Retention, RetentionSweeper
                 f.write(Retention.C_YAML)
+                f.write(RetentionSweeper.C_YAML)
+                # daemon metrics
+                from snr.metrics import Metrics
+                f.write(Metrics.C_YAML)
+                # distributed saves
+                from snr.worker import Coordinator
+                f.write(Coordinator.C_YAML)
+                # push ingestion
+                from snr.ingest import Ingest
+                f.write(Ingest.C_YAML)
+                from snr.retention.capacity import Capacity
+                f.write(Capacity.C_YAML)
+                # storage tiering
+                from snr.tiering import Tiering
+                f.write(Tiering.C_YAML)
+                # storage backends
+                from snr.storage import Storage
+                f.write(Storage.C_YAML)
+                # encryption
+                from snr.encryption import Encryption
+                f.write(Encryption.C_YAML)
                 # app
                 from snr.app import App
                 f.write(App.C_YAML)
                 # save
                 from snr.save import Save
                 f.write(Save.C_YAML)
+                # journal
+                from snr.journal import Journal
+                f.write(Journal.C_YAML)
+                # tracing
+                from snr.tracing import Tracer
+                f.write(Tracer.C_YAML)
                 # logger
                 f.write(CLIController.C_LOGGER_YAML)
             logging.info("Sample configuration written in {}. You should edit it !".format(args.conf))
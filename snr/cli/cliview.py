@@ -28,6 +28,7 @@
 #    along with snr.  If not, see <http://www.gnu.org/licenses/>.
 # ------------------------------------------------------------------------------
 from snr.app import SaveAtom
+from snr.units import Units
 
 
 class CLIView:
@@ -37,12 +38,21 @@ class CLIView:
     C_HEADER_FILES = "Files"
     C_HEADER_DB = "Databases"
     C_HEADER_COMMENTS = "Potential exclusions"
-    C_SAVE_COLUMNS = [C_HEADER_APPS, C_HEADER_FILES, C_HEADER_DB, C_HEADER_COMMENTS]
-    C_SAVE_HEADER = '{0:^{name_width}}\t{1:^{file_width}}\t{2:^{db_width}}\t{3:^{comment_width}}'
-    C_SAVE_LINE = '{0:<{name_width}}\t{1:<{file_width}}\t{2:<{db_width}}\t{3:<{comment_width}}'
+    C_HEADER_ESTIMATE = "Estimated duration"
+    C_ESTIMATE_UNKNOWN = "unknown"
+    C_SAVE_COLUMNS = [C_HEADER_APPS, C_HEADER_FILES, C_HEADER_DB, C_HEADER_ESTIMATE, C_HEADER_COMMENTS]
+    C_SAVE_HEADER = '{0:^{name_width}}\t{1:^{file_width}}\t{2:^{db_width}}\t{3:^{estimate_width}}\t{4:^{comment_width}}'
+    C_SAVE_LINE = '{0:<{name_width}}\t{1:<{file_width}}\t{2:<{db_width}}\t{3:<{estimate_width}}\t{4:<{comment_width}}'
     C_RESTORE_COLUMNS = [C_HEADER_APPS, C_HEADER_DATE, C_HEADER_STATUS, C_HEADER_FILES, C_HEADER_DB, C_HEADER_COMMENTS]
     C_RESTORE_HEADER = '{0:^{name_width}}\t{1:^{date_width}}\t{2:^{status_width}}\t{3:^{file_width}}\t{4:^{db_width}}\t{5:^{comment_width}}'
     C_RESTORE_LINE = '{0:<{name_width}}\t{1:<{date_width}}\t{2:<{status_width}}\t{3:<{file_width}}\t{4:<{db_width}}\t{5:<{comment_width}}'
+    C_STAT_UNKNOWN = "-"
+    C_STATS_PERCENTILES = ('p50', 'p90', 'p99')
+    C_STATS_APP_COLUMNS = [C_HEADER_APPS, "Saves", "Size", "Growth", "Duration p50 / p90 / p99", "Alerts"]
+    C_STATS_PART_COLUMNS = [
+        C_HEADER_APPS, "Part", "Runs", "Size", "Growth", "Ratio", "Last throughput (vs baseline)",
+        "Throughput p50 / p90 / p99", "Duration p50 / p90 / p99", "Alerts"
+    ]
 
     @staticmethod
     def comment_width(saves, app_list):
@@ -70,9 +80,28 @@ class CLIView:
         return atom_list
 
     @staticmethod
-    def print_saveable_apps(saves):
+    def estimate(save):
+        """
+        :param save: Save instance
+        :type save: snr.save.Save
+        :return: human readable estimated save duration
+        :rtype: str
+        """
+        estimate = save.estimated_duration
+        if estimate is None:
+            return CLIView.C_ESTIMATE_UNKNOWN
+        return Units.convert_seconds(round(estimate))
+
+    @staticmethod
+    def print_saveable_apps(saves, stream=None):
+        """
+        :param saves: Save instances by app name
+        :type saves: dict
+        :param stream: Optional. text stream to print to, standard output per default
+        :type stream: Union[io.TextIOBase|None]
+        """
         app_list = [x for x in saves.keys() if saves[x].saveable]
-        print("Apps available for save: {}\n".format(', '.join(app_list)))
+        print("Apps available for save: {}\n".format(', '.join(app_list)), file=stream)
 
         atom_list = CLIView.atom_list(saves, app_list)
 
@@ -81,10 +110,12 @@ class CLIView:
         width['name_width'] = max(max([len(x) for x in app_list]), len(CLIView.C_HEADER_APPS))
         width['file_width'] = max(max([len(', '.join(x.files)) for x in atom_list]), len(CLIView.C_HEADER_FILES))
         width['db_width'] = max(max([len(', '.join(x.databases)) for x in atom_list]), len(CLIView.C_HEADER_DB))
+        estimates = dict((x, CLIView.estimate(saves[x])) for x in app_list)
+        width['estimate_width'] = max(max([len(x) for x in estimates.values()]), len(CLIView.C_HEADER_ESTIMATE))
         width['comment_width'] = CLIView.comment_width(saves, app_list)
 
         # header
-        print(CLIView.C_SAVE_HEADER.format(*CLIView.C_SAVE_COLUMNS, **width))
+        print(CLIView.C_SAVE_HEADER.format(*CLIView.C_SAVE_COLUMNS, **width), file=stream)
         # lines
         for name in app_list:
             save_atom = saves[name].save_atom
@@ -95,13 +126,21 @@ class CLIView:
                     name,
                     ', '.join(save_atom.files),
                     ', '.join(save_atom.databases),
+                    estimates[name],
                     comment,
                     **width
-                )
+                ),
+                file=stream
             )
 
     @staticmethod
-    def print_restoreable_apps(saves):
+    def print_restoreable_apps(saves, stream=None):
+        """
+        :param saves: Save instances by app name
+        :type saves: dict
+        :param stream: Optional. text stream to print to, standard output per default
+        :type stream: Union[io.TextIOBase|None]
+        """
         app_list = [x for x in saves.keys() if saves[x].restoreable]
         atom_list = CLIView.atom_list(saves, app_list)
 
@@ -114,8 +153,8 @@ class CLIView:
         width['db_width'] = max(max([len(x.print_databases()) for x in atom_list]), len(CLIView.C_HEADER_DB))
         width['comment_width'] = CLIView.comment_width(saves, app_list)
         # header
-        print("Apps available for restore: {}\n".format(', '.join(app_list)))
-        print(CLIView.C_RESTORE_HEADER.format(*CLIView.C_RESTORE_COLUMNS, **width))
+        print("Apps available for restore: {}\n".format(', '.join(app_list)), file=stream)
+        print(CLIView.C_RESTORE_HEADER.format(*CLIView.C_RESTORE_COLUMNS, **width), file=stream)
         # lines
         for name in app_list:
             save_atoms = saves[name].save_atoms
@@ -134,5 +173,70 @@ class CLIView:
                         save_atoms[atom].print_databases(),
                         comment,
                         **width
-                    )
+                    ),
+                    file=stream
                 )
+
+    @staticmethod
+    def print_table(columns, rows):
+        """
+        :param columns: column headers
+        :type columns: list
+        :param rows: lines of str values, one per column
+        :type rows: list
+        """
+        widths = [max([len(column)] + [len(row[i]) for row in rows]) for i, column in enumerate(columns)]
+        print('\t'.join('{0:^{1}}'.format(column, width) for column, width in zip(columns, widths)))
+        for row in rows:
+            print('\t'.join('{0:<{1}}'.format(value, width) for value, width in zip(row, widths)))
+
+    @staticmethod
+    def _stat(value, fmt):
+        if value is None:
+            return CLIView.C_STAT_UNKNOWN
+        if fmt == 'bytes':
+            return Units.convert_bytes(value) or '0B'
+        if fmt == 'rate':
+            return (Units.convert_bytes(value) or '0B') + '/s'
+        if fmt == 'seconds':
+            return '{}s'.format(round(value, 1))
+        if fmt == 'change':
+            return '{:+.0%}'.format(value)
+        return '{:.2f}'.format(value)
+
+    @staticmethod
+    def print_stats(report):
+        """
+        :param report: statistics report, see snr.stats.Stats.analyse()
+        :type report: dict
+        """
+        if len(report['apps']) == 0:
+            print("No save recorded in {}".format(report['journal']))
+            return
+        CLIView.print_table(CLIView.C_STATS_APP_COLUMNS, [
+            [
+                app['app'], str(app['runs']), CLIView._stat(app['bytes'], 'bytes'),
+                CLIView._stat(app['size_growth'], 'change'),
+                ' / '.join(CLIView._stat(app['duration'][p], 'seconds') for p in CLIView.C_STATS_PERCENTILES),
+                ', '.join(app['alerts'])
+            ]
+            for app in report['apps']
+        ])
+        print()
+        rows = list()
+        for part in report['parts']:
+            last = part.get('last', dict())
+            rows.append([
+                part['app'], "{}:{}".format(part['type'], part['name']),
+                str(part['runs']) if part['failures'] == 0 else "{} ({} failed)".format(part['runs'], part['failures']),
+                CLIView._stat(last.get('bytes'), 'bytes'), CLIView._stat(part.get('size_growth'), 'change'),
+                CLIView._stat(part['ratio']['p50'], 'ratio'),
+                "{} ({})".format(
+                    CLIView._stat(last.get('throughput'), 'rate'),
+                    CLIView._stat(part.get('throughput_change'), 'change')
+                ),
+                ' / '.join(CLIView._stat(part['throughput'][p], 'rate') for p in CLIView.C_STATS_PERCENTILES),
+                ' / '.join(CLIView._stat(part['duration'][p], 'seconds') for p in CLIView.C_STATS_PERCENTILES),
+                ', '.join(part['alerts'])
+            ])
+        CLIView.print_table(CLIView.C_STATS_PART_COLUMNS, rows)
@@ -36,7 +36,14 @@ from string import Template
 from pathlib import Path
 
 from snr.units import Units
+from snr.config import Config
+from snr.storage import Storage
+from snr.encryption import Encryption
+from snr.throttle import Throttle
+from snr.tracing import Tracer
+from snr.progress import Progress
 from snr.yamlhelper import YAMLHelper
+from snr.config.model import CompressionConf
 
 logger = logging.getLogger(__name__)
 
@@ -94,6 +101,16 @@ compression_helpers:
     'xaf',
     '$file'
   ]
+  # extract archive from stdin, when restoring from a remote storage. tar can't guess compression of a stream.
+  # Optional, decompress_command with '-' as $file per default
+  decompress_from_pipe: [
+    '/bin/tar',
+    '--extract',
+    #'--xz',
+    '--lzop',
+    '--file',
+    '-'
+  ]
   decompress_to_pipe: [
     '/usr/bin/xzcat',
     #'/usr/bin/lzop',
@@ -110,6 +127,7 @@ compression_helpers:
         'compress_from_pipe', 'decompress_to_pipe',
         'compress_from_pipe_info', 'compress_from_pipe_info_output'
     }
+    C_HELPER_OPT_KEYS = {'decompress_from_pipe'}
 
     def __init__(
             self,
@@ -121,7 +139,8 @@ compression_helpers:
             compress_from_pipe=None,
             decompress_to_pipe=None,
             compress_from_pipe_info=None,
-            compress_from_pipe_info_output=None
+            compress_from_pipe_info_output=None,
+            decompress_from_pipe=None
     ):
         """
         Should not be used directly
@@ -135,14 +154,37 @@ compression_helpers:
         self._decompress_to_pipe = decompress_to_pipe
         self._compress_from_pipe_info = compress_from_pipe_info
         self._compress_from_pipe_info_output = compress_from_pipe_info_output
+        self._decompress_from_pipe = decompress_from_pipe
+        self._tiering = None
+        self._encryption = None
+        self._fingerprint = None
 
     @property
     def extensions(self):
         """
-        :return: Set of compressed file extensions
+        :return: Set of compressed file extensions, including extensions of saves recompressed by tiering
         :rtype: set
         """
-        return {self._compressed_extention, self._compressed_from_pipe_ext}
+        extensions = {self._compressed_extention, self._compressed_from_pipe_ext}
+        if self._tiering is not None:
+            extensions.update({self._tiering.compressed_extention, self._tiering.compressed_from_pipe_ext})
+        return extensions
+
+    @property
+    def tiering(self):
+        """
+        :return: storage tiering configuration, None if tiering is disabled
+        :rtype: Union[snr.config.model.TieringConf|None]
+        """
+        return self._tiering
+
+    @property
+    def encryption(self):
+        """
+        :return: encryption of saves, None if encryption is disabled
+        :rtype: Union[snr.encryption.Encryption|None]
+        """
+        return self._encryption
 
     def get_file_with_compressed_extension(self, file):
         return "{}.{}".format(file, self._compressed_extention)
@@ -150,28 +192,57 @@ compression_helpers:
     def get_file_with_compressed_from_pipe_ext(self, file):
         return "{}.{}".format(file, self._compressed_from_pipe_ext)
 
+    @property
+    def fingerprint(self):
+        """
+        :return: configuration fingerprint of this instance
+        :rtype: str
+        """
+        return self._fingerprint
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate compression helpers section
+        :param config: configuration being compiled
+        :type config: Config
+        :rtype: CompressionConf
+        :raise: TypeError on configuration error
+        """
+        try:
+            helpers = Config.get_section(config.data, Compression.C_HELPERS)
+            YAMLHelper.analyse_keys(
+                Compression.C_HELPERS, helpers, Compression.C_HELPER_KEYS, Compression.C_HELPER_OPT_KEYS
+            )
+        except TypeError as e:
+            raise TypeError("Compression configuration error : {}".format(e))
+        return CompressionConf(**helpers)
+
     @staticmethod
     def get_instance(conf):
         """
-        Compression class Factory. Instances are cached by 'conf' parameter.
+        Compression class Factory. Instances are cached by 'conf' parameter and rebuilt when configuration changes.
         :param conf: path to Yaml configuration
         :return: instance of Compression
         :rtype: Compression
         """
-        # Is conf unknown in cache ?
-        if conf not in Compression.cache.keys():
-            try:
-                data = YAMLHelper.load(conf)
-                # Validate configuration keys
-                YAMLHelper.analyse_keys(Compression.C_HELPERS, data[Compression.C_HELPERS], Compression.C_HELPER_KEYS)
+        try:
+            config = Config.get_instance(conf)
+            fingerprint = config.get_fingerprint(Config.F_COMPRESSION)
+            # Is conf unknown in cache or changed ?
+            if conf not in Compression.cache.keys() or Compression.cache[conf].fingerprint != fingerprint:
                 # Instanciate and cache
-                Compression.cache[conf] = Compression(**data[Compression.C_HELPERS])
-            except TypeError as e:
-                logger.error("Compression configuration error : {}".format(e))
-            except IOError:
-                logger.error("{} does not exist".format(conf))
+                compression = Compression(**config.compression._asdict())
+                compression._tiering = config.tiering
+                compression._encryption = Encryption.get_instance(conf)
+                compression._fingerprint = fingerprint
+                Compression.cache[conf] = compression
+        except TypeError as e:
+            logger.error("Compression configuration error : {}".format(e))
+        except IOError:
+            logger.error("{} does not exist".format(conf))
         # return cached instance
-        return Compression.cache[conf]
+        return Compression.cache.get(conf)
 
     def is_compressed(self, file):
         """
@@ -184,6 +255,52 @@ compression_helpers:
             return True
         return False
 
+    def is_streamed(self, storage=None):
+        """
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[Storage|None]
+        :return: True if compressed stream goes through current process instead of being written by compression
+        command, which is the case when it is encrypted or uploaded
+        :rtype: bool
+        """
+        return self._encryption is not None or (storage is not None and not storage.is_local)
+
+    def open_write(self, destination, storage):
+        """
+        :param destination: destination file
+        :type destination: str
+        :param storage: Storage to write to
+        :type storage: Storage
+        :return: writer of destination, encrypting if encryption is enabled
+        :rtype: Union[snr.storage.StorageWriter|snr.storage.local.LocalWriter|snr.encryption.EncryptingWriter]
+        """
+        writer = storage.open_write(destination)
+        if self._encryption is not None:
+            return self._encryption.open_write(writer)
+        return writer
+
+    def open_stream(self, file, storage=None):
+        """
+        :param file: compressed file
+        :type file: str
+        :param storage: Optional. Storage holding file, local filesystem per default
+        :type storage: Union[Storage|None]
+        :return: readable stream of compressed file, decrypted if needed. None for plain local files, which are read
+        by decompression commands themselves.
+        :rtype: Union[snr.storage.StorageReader|snr.encryption.DecryptingReader|io.BufferedReader|None]
+        :raise: IOError if file can't be read or decrypted
+        """
+        if storage is None:
+            storage = Storage.get_local()
+        if storage.is_local and not Encryption.is_encrypted(file):
+            return None
+        if self._encryption is None and storage.is_local:
+            raise IOError("{} is encrypted, but encryption is not configured".format(file))
+        stream = storage.open_stream(file)
+        if self._encryption is not None:
+            return self._encryption.open_read(stream)
+        return stream
+
     @staticmethod
     def _create_folder(destination, is_dir=False):
         """
@@ -201,10 +318,12 @@ compression_helpers:
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
 
-    def compress_from_pipe(self, pipe, destination, save_atom, db_prefix, dbname):
+    @Tracer.traced('compression.compress_from_pipe')
+    def compress_from_pipe(self, pipe, destination, save_atom, db_prefix, dbname, storage=None, throttle=None):
         """
         Compress stream from pipe to destination.
         Compression extension will be added to destination file.
+        Compressed stream is uploaded while being produced when storage is not local.
         :param pipe: will be used as stdin for the compression process.
         :type pipe: subprocess.PIPE
         :param destination: destination file without extension
@@ -215,16 +334,21 @@ compression_helpers:
         :type db_prefix: str
         :param dbname: DB name as per config
         :type dbname: str
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of started processes, unlimited per default
+        :type throttle: Union[snr.throttle.PartThrottle|None]
         :return: compressed file name, None on error
         :rtype: Union[str|None]
         """
+        if storage is None:
+            storage = Storage.get_local()
         if pipe is None:
             logger.error("{}: Pipe is None, aborting compress_from_pipe()".format(
                 save_atom.db_log_prefix(db_prefix, dbname))
             )
             return None
 
-        self._create_folder(destination)
         destination = "{}.{}".format(destination, self._compressed_from_pipe_ext)
 
         for env in self._compress_env.keys():
@@ -233,23 +357,45 @@ compression_helpers:
         logger.info(
             "{}: Pipe database dump to {}".format(save_atom.db_log_prefix(db_prefix, dbname), self._compress_from_pipe)
         )
-        with open(destination, 'wb') as f:
-            p = subprocess.Popen(self._compress_from_pipe, stdin=pipe, stdout=f)
-
-        # start process and wait until it finishes
-        p.communicate()
+        writer = self.open_write(destination, storage)
+        p = None
+        try:
+            with Tracer.span('compression.process', command=self._compress_from_pipe[0]):
+                p = Throttle.popen(self._compress_from_pipe, throttle, stdin=pipe, stdout=writer)
+                Progress.set_destination(writer)
+
+                # start process and wait until it finishes
+                p.communicate()
+        except BaseException:
+            # partial stream is discarded on any error, compression command included
+            if p is not None and p.poll() is None:
+                p.terminate()
+            self._discard(p, writer, destination)
+            raise
 
         if p.returncode == 0:
+            try:
+                with Tracer.span('compression.close', destination=destination):
+                    size = writer.close()
+            except IOError as e:
+                logger.error("{}: {}".format(save_atom.db_log_prefix(db_prefix, dbname), e))
+                return None
+            if self.is_streamed(storage):
+                save_atom.set_stats(destination, bytes=size)
             return destination
 
+        writer.abort()
         logger.error("{}: {}".format(save_atom.db_log_prefix(db_prefix, dbname), p))
         return None
 
-    def compress(self, source, destination, save_atom, filename):
+    @Tracer.traced('compression.compress')
+    def compress(self, source, destination, save_atom, filename, storage=None, throttle=None):
         """
         Compress source directory to destination file. Compress extension will be appended to destination file.
         Abort and delete partial file on any error.
         Strips all directories in source.
+        When storage is not local or encryption is enabled, compression command writes to stdout, which is encrypted
+        and uploaded while being produced.
         :param source: source directory to compress
         :type source: str
         :param destination: destination file without extension
@@ -258,9 +404,15 @@ compression_helpers:
         :type save_atom: SaveAtom
         :param filename: filename name as per config
         :type filename: str
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of started processes, unlimited per default
+        :type throttle: Union[snr.throttle.PartThrottle|None]
         :return: destination or None if error
         :rtype: Union[str|None]
         """
+        if storage is None:
+            storage = Storage.get_local()
         if not os.path.exists(source):
             logger.error(
                 "{}: {} does not exist. Aborting compress()".format(
@@ -278,35 +430,49 @@ compression_helpers:
         for arg in self._compress_command:
             cmd.append(Template(arg).safe_substitute(
                 file='.',
-                destination=destination
+                destination='-' if self.is_streamed(storage) else destination
             ))
         p = None
+        writer = None
         try:
             start = time.time()
-            Compression._create_folder(destination)
+            if self.is_streamed(storage):
+                writer = self.open_write(destination, storage)
+            else:
+                Compression._create_folder(destination)
             logger.info("{}: Compress {} to {} with {}".format(
                 save_atom.file_log_prefix(filename), source, destination, cmd
             ))
 
-            p = subprocess.Popen(cmd, stderr=subprocess.PIPE, cwd=source)
-            err_count = 0
-            with p.stderr as err:
-                for msg in err:
-                    # avoid stopping tar when issuing 'Removing leading `/' from member names'
-                    if err_count > 0:
-                        msg = msg.decode().replace('\n', '')
-                        logger.error(
-                            "{}: Compression {} to {} : {}".format(
-                                save_atom.file_log_prefix(filename), source, destination, msg
+            with Tracer.span('compression.process', command=cmd[0]):
+                p = Throttle.popen(
+                    cmd, throttle, read_limit=True, stderr=subprocess.PIPE, cwd=source, stdout=writer
+                )
+                Progress.add_source(p, Progress.C_READ)
+                Progress.set_destination(destination if writer is None else writer)
+                err_count = 0
+                with p.stderr as err:
+                    for msg in err:
+                        # avoid stopping tar when issuing 'Removing leading `/' from member names'
+                        if err_count > 0:
+                            msg = msg.decode().replace('\n', '')
+                            logger.error(
+                                "{}: Compression {} to {} : {}".format(
+                                    save_atom.file_log_prefix(filename), source, destination, msg
+                                )
                             )
-                        )
-                        raise ChildProcessError(msg)
-                    err_count += 1
+                            raise ChildProcessError(msg)
+                        err_count += 1
 
-            p.wait()
+                p.wait()
             if p.returncode == 0:
                 seconds = time.time() - start
                 original_size = self.get_folder_size(source)
+                with Tracer.span('compression.close', destination=destination):
+                    compressed_size = os.stat(destination).st_size if writer is None else writer.close()
+                save_atom.set_stats(
+                    destination, duration=seconds, original_bytes=original_size, bytes=compressed_size
+                )
                 if original_size == 0:
                     logger.warning(
                         "{}: {} folder content is 0 byte. Please check your configuration: "
@@ -318,11 +484,15 @@ compression_helpers:
                     logger.info(
                         "{}: {}".format(
                             save_atom.file_log_prefix(filename),
-                            Compression.get_statistics(original_size, destination, seconds, CMode.COMPRESS)
+                            Compression.get_statistics(
+                                original_size, destination, seconds, CMode.COMPRESS, compressed_size
+                            )
                         )
                     )
                 return destination
             logger.error(p)
+            if writer is not None:
+                writer.abort()
             return None
         except KeyboardInterrupt:
             if p:
@@ -333,18 +503,46 @@ compression_helpers:
                 )
                 p.terminate()
                 logger.warning("{}: Deleting partial file {}".format(save_atom.file_log_prefix(filename), destination))
-                Compression.delete(destination)
+                self._discard(p, writer, destination)
                 return None
         except ChildProcessError:
             p.terminate()
             logger.warning("{}: Deleting partial file {}".format(save_atom.file_log_prefix(filename), destination))
-            Compression.delete(destination)
+            self._discard(p, writer, destination)
             return None
         except PermissionError as e:
             logger.error(
                 "{}: Cannot create directory {} : {}".format(save_atom.file_log_prefix(filename), destination, e)
             )
             return None
+        except IOError as e:
+            # compression command, upload or encryption error
+            logger.error("{}: {}".format(save_atom.file_log_prefix(filename), e))
+            return None
+        finally:
+            # partial stream is discarded on any error. Does nothing once writer is closed
+            if writer is not None:
+                if p is not None and p.poll() is None:
+                    p.terminate()
+                self._discard(p, writer, destination)
+
+    @staticmethod
+    def _discard(process, writer, destination):
+        """
+        Discard partial file once compression process is terminated
+        :param process: terminated compression process, None if it could not be started
+        :type process: Union[subprocess.Popen|None]
+        :param writer: storage writer, None when compression process writes destination itself
+        :type writer: Union[snr.storage.StorageWriter|snr.encryption.EncryptingWriter|None]
+        :param destination: destination file
+        :type destination: str
+        """
+        if writer is None:
+            Compression.delete(destination)
+        else:
+            if process is not None:
+                process.wait()
+            writer.abort()
 
     @staticmethod
     def delete(file):
@@ -357,7 +555,8 @@ compression_helpers:
             logger.info("Deleting {}".format(file))
             os.remove(file)
 
-    def decompress_to_pipe(self, file, save_atom, db_prefix, dbname):
+    @Tracer.traced('compression.decompress_to_pipe')
+    def decompress_to_pipe(self, file, save_atom, db_prefix, dbname, stream=None, throttle=None):
         """
         Decompress a file and return stream (stdout)
         :param file: file to decompress
@@ -368,23 +567,35 @@ compression_helpers:
         :type db_prefix: str
         :param dbname: database name as per config
         :type dbname: str
+        :param stream: Optional. file content read from a remote storage or decrypted, see open_stream(). file is read
+        from local filesystem per default
+        :type stream: Union[snr.storage.StorageReader|snr.encryption.DecryptingReader|None]
+        :param throttle: Optional. Limits of started processes, unlimited per default
+        :type throttle: Union[snr.throttle.PartThrottle|None]
         :return: decompressed stream
         :rtype: subprocess.PIPE
         """
-        if not os.path.exists(file):
+        if stream is None and not os.path.exists(file):
             logger.error("{}: {} does not exists. Aborting decompress_to_pipe().".format(
                 save_atom.db_log_prefix(db_prefix, dbname), file
             ))
             return None
+        decompress_to_pipe = self._decompress_to_pipe
+        # saves moved to another storage tier may have been recompressed with another codec
+        if self._tiering is not None and not file.endswith(self._compressed_from_pipe_ext):
+            decompress_to_pipe = self._tiering.decompress_to_pipe.get(file.split('.')[-1], decompress_to_pipe)
         cmd = list()
-        for arg in self._decompress_to_pipe:
-            cmd.append(Template(arg).safe_substitute(file=file))
+        for arg in decompress_to_pipe:
+            cmd.append(Template(arg).safe_substitute(file=file if stream is None else '-'))
         logger.info("{}: Extract dump with {}".format(save_atom.db_log_prefix(db_prefix, dbname), cmd))
-        return subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        return Throttle.popen(cmd, throttle, stdin=stream, stdout=subprocess.PIPE)
 
-    def decompress(self, file, destination, save_atom, filename):
+    @Tracer.traced('compression.decompress')
+    def decompress(self, file, destination, save_atom, filename, storage=None, throttle=None):
         """
-        Decompress file in destination folder
+        Decompress file in destination folder.
+        Files of remote storages are read ahead in parallel and piped into decompression, without local copy.
+        Encrypted files are decrypted while being piped into decompression.
         :param file: file to decompress
         :type file: str
         :param destination: destination folder
@@ -393,11 +604,24 @@ compression_helpers:
         :type save_atom: SaveAtom
         :param filename: file name as per config
         :type filename: str
+        :param storage: Optional. Storage holding file, local filesystem per default
+        :type storage: Union[Storage|None]
+        :param throttle: Optional. Limits of started processes, unlimited per default
+        :type throttle: Union[snr.throttle.PartThrottle|None]
         :return: destination folder, None on error
         :rtype: Union[str|None]
         """
         start = time.time()
-        if not os.path.exists(file):
+        if storage is None:
+            storage = Storage.get_local()
+        try:
+            compressed_size = storage.size(file)
+        except IOError as e:
+            logger.error("{}: Cannot check {} : {}. Aborting decompress().".format(
+                save_atom.file_log_prefix(filename), file, e
+            ))
+            return None
+        if compressed_size is None:
             logger.error(
                 "{}: Source {} does not exists. Aborting decompress().".format(
                     save_atom.file_log_prefix(filename), file
@@ -415,22 +639,32 @@ compression_helpers:
                 )
                 return None
 
-        cmd = list()
-        for arg in self._decompress_command:
-            cmd.append(Template(arg).safe_substitute(file=file))
-        logger.info(
-            "{}: Decompress {} to {} with {}".format(save_atom.file_log_prefix(filename), file, destination, cmd)
-        )
-
         try:
-            p = subprocess.run(cmd, cwd=destination)
+            stream = self.open_stream(file, storage)
+            decompress_command = self._decompress_command
+            if stream is not None and self._decompress_from_pipe is not None:
+                decompress_command = self._decompress_from_pipe
+            cmd = list()
+            for arg in decompress_command:
+                cmd.append(Template(arg).safe_substitute(file=file if stream is None else '-'))
+            logger.info(
+                "{}: Decompress {} to {} with {}".format(save_atom.file_log_prefix(filename), file, destination, cmd)
+            )
+            with Tracer.span('compression.process', command=cmd[0]):
+                if stream is None:
+                    p = Throttle.popen(cmd, throttle, cwd=destination)
+                    p.wait()
+                else:
+                    with stream:
+                        p = Throttle.popen(cmd, throttle, cwd=destination, stdin=stream)
+                        p.wait()
             if p.returncode == 0:
                 seconds = time.time() - start
                 original_size = self.get_folder_size(destination)
                 logger.info(
                     "{}: {}".format(
                         save_atom.file_log_prefix(filename),
-                        Compression.get_statistics(original_size, file, seconds, CMode.DECOMPRESS)
+                        Compression.get_statistics(original_size, file, seconds, CMode.DECOMPRESS, compressed_size)
                     )
                 )
                 return destination
@@ -448,8 +682,13 @@ compression_helpers:
         except FileNotFoundError as e:
             logger.error("{}: Cannot decompress in {} : {}".format(save_atom.file_log_prefix(filename), destination, e))
             return None
+        except IOError as e:
+            # read error from remote storage or decryption error
+            logger.error("{}: {}".format(save_atom.file_log_prefix(filename), e))
+            return None
 
     @staticmethod
+    @Tracer.traced('compression.folder_size')
     def get_folder_size(folder):
         """
         Returns folder size
@@ -461,6 +700,7 @@ compression_helpers:
         root_directory = Path(folder)
         return sum(f.stat().st_size for f in root_directory.glob('**/*') if f.is_file())
 
+    @Tracer.traced('compression.pipe_statistics')
     def get_pipe_statistics(self, file, seconds, mode, save_atom, db_prefix, dbname):
         """
         :param file: compressed file path
@@ -509,13 +749,17 @@ compression_helpers:
         ratio = data_line[output['ratio_index']]
         time_spent = seconds
         bitrate = Units.get_bitrate(original_size_bytes, seconds)
+        if mode == CMode.DUMP:
+            save_atom.set_stats(
+                file, duration=seconds, original_bytes=original_size_bytes, bytes=compressed_size_bytes
+            )
 
         return Compression._print_stats(
             file, compressed_size, time_spent, bitrate, original_size, ratio, mode
         )
 
     @staticmethod
-    def get_statistics(original_size_bytes, compressed_file, seconds, mode):
+    def get_statistics(original_size_bytes, compressed_file, seconds, mode, compressed_size_bytes=None):
         """
         Gives statistics about file compression/decompression.
         :param original_size_bytes: uncompressed size in bytes
@@ -526,6 +770,8 @@ compression_helpers:
         :type seconds: float
         :param mode: Display stats for COMPRESSION or DECOMPRESSION
         :type mode: CMode
+        :param compressed_size_bytes: Optional. compressed size, read from compressed_file per default
+        :type compressed_size_bytes: Union[int|None]
         :return: statistics
         :rtype: str
         """
@@ -534,7 +780,8 @@ compression_helpers:
             return "Please verify integrity of {}".format(compressed_file)
         else:
             original_size = Units.convert_bytes(original_size_bytes)
-            compressed_size_bytes = os.stat(compressed_file).st_size
+            if compressed_size_bytes is None:
+                compressed_size_bytes = os.stat(compressed_file).st_size
             compressed_size = Units.convert_bytes(compressed_size_bytes)
             ratio = round(compressed_size_bytes / original_size_bytes, ndigits=2)
             time_spent = seconds
@@ -0,0 +1,257 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        config
+# Purpose:     Compiled and cached configuration
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import logging
+
+from snr.yamlhelper import YAMLHelper
+
+logger = logging.getLogger(__name__)
+
+
+class Config:
+    """
+    Compiled configuration. YAML configuration and credentials files are validated once and compiled into typed
+    objects (see snr.config.model), by the class owning each section (see compile_conf() methods). Compiled
+    configuration is cached in memory until configuration or credentials files change. It is never written to disk, as
+    it holds credentials.
+    Per object fingerprints allow factories to rebuild only objects whose configuration changed.
+    """
+
+    cache = dict()
+
+    F_COMPRESSION = 'compression'
+    F_DATABASE = 'database'
+    F_APP = 'app'
+    F_SAVE = 'save'
+    F_STORAGE = 'storage'
+    F_ENCRYPTION = 'encryption'
+
+    def __init__(self, conf, data):
+        """
+        Should not be used directly. See get_instance().
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :param data: raw configuration
+        :type data: dict
+        """
+        self.conf = conf
+        self.data = data
+        self.files = list()
+        self.compression = None
+        self.databases = dict()
+        self.apps = dict()
+        self.saves = dict()
+        self.retentions = dict()
+        self.journal = None
+        self.daemon = None
+        self.sweeper = None
+        self.metrics = None
+        self.workers = None
+        self.ingest = None
+        self.tracing = None
+        self.capacity = list()
+        self.tiering = None
+        self.encryption = None
+        self.storages = dict()
+        self.fingerprints = dict()
+
+    @staticmethod
+    def get_instance(conf, reload=False):
+        """
+        Config class Factory. Instances are cached by 'conf' parameter.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :param reload: Optional. Compile configuration again if configuration or credentials files changed
+        :type reload: bool
+        :return: compiled configuration
+        :rtype: Config
+        :raise: TypeError on configuration error, IOError if a file can't be read
+        """
+        if conf in Config.cache.keys() and (not reload or Config.cache[conf].is_fresh()):
+            return Config.cache[conf]
+
+        config = Config.compile(conf)
+        Config.cache[conf] = config
+        return config
+
+    def get_fingerprint(self, kind, name=None):
+        """
+        :param kind: one of F_COMPRESSION, F_DATABASE, F_APP, F_SAVE, F_STORAGE, F_ENCRYPTION
+        :type kind: str
+        :param name: object name, unless kind is F_COMPRESSION or F_ENCRYPTION
+        :type name: Union[str|None]
+        :return: configuration fingerprint of an object, including its dependencies
+        :rtype: str
+        """
+        return self.fingerprints.get((kind, name))
+
+    @staticmethod
+    def _signature(path):
+        """
+        :param path: file path
+        :type path: str
+        :return: file path along with its modification time and size
+        :rtype: tuple
+        """
+        try:
+            st = os.stat(path)
+            return path, st.st_mtime_ns, st.st_size
+        except OSError:
+            return path, None, None
+
+    def is_fresh(self):
+        """
+        :return: True if configuration and credentials files did not change since compilation
+        :rtype: bool
+        """
+        for signature in self.files:
+            if Config._signature(signature[0]) != signature:
+                return False
+        return True
+
+    def _watch(self, path):
+        # signature taken before reading to catch changes made while compiling
+        signature = Config._signature(path)
+        if signature not in self.files:
+            self.files.append(signature)
+
+    def load_yaml(self, path):
+        """
+        Load a YAML file and watch it for changes
+        :param path: YAML file path
+        :type path: str
+        :rtype: dict
+        """
+        self._watch(path)
+        return YAMLHelper.load(path, reload=True)
+
+    def load_secret(self, section, data, key, key_file):
+        """
+        Load a secret given either inline or in a file, which is watched for changes
+        :param section: section name, as logged
+        :type section: str
+        :param data: section
+        :type data: dict
+        :param key: key of inline secret
+        :type key: str
+        :param key_file: key of file holding secret
+        :type key_file: str
+        :return: secret, stripped
+        :rtype: str
+        :raise: TypeError if none or both keys are given, or if secret is empty
+        """
+        if (key in data.keys()) == (key_file in data.keys()):
+            raise TypeError("Either {} or {} is expected".format(key, key_file))
+        if key_file in data.keys():
+            self._watch(data[key_file])
+            with open(data[key_file]) as f:
+                secret = f.read().strip()
+        else:
+            secret = str(data[key]).strip()
+        if len(secret) == 0:
+            raise TypeError("{} {} is empty".format(section, key))
+        return secret
+
+    @staticmethod
+    def get_section(data, section):
+        """
+        :return: mandatory section
+        :raise: TypeError if section is missing
+        """
+        if section not in data.keys() or data[section] is None:
+            raise TypeError("Missing {} section".format(section))
+        return data[section]
+
+    @staticmethod
+    def compile(conf):
+        """
+        Validate and compile configuration
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :return: compiled configuration
+        :rtype: Config
+        :raise: TypeError on configuration error, IOError if a file can't be read
+        """
+        from snr.compression.compression import Compression
+        from snr.tiering.tiering import Tiering
+        from snr.encryption.encryption import Encryption
+        from snr.database.database import Database
+        from snr.app.app import App
+        from snr.retention.retention import Retention
+        from snr.retention.capacity import Capacity
+        from snr.journal.journal import Journal
+        from snr.save.save import Save
+        from snr.retention.sweeper import RetentionSweeper
+        from snr.metrics.metrics import Metrics
+        from snr.worker.worker import Coordinator
+        from snr.ingest.ingest import Ingest
+        from snr.tracing.tracing import Tracer
+        from snr.storage.storage import Storage
+        config = Config(conf, None)
+        config.data = config.load_yaml(conf)
+        config.compression = Compression.compile_conf(config)
+        config.tiering = Tiering.compile_conf(config)
+        config.encryption = Encryption.compile_conf(config)
+        config.databases = Database.compile_conf(config)
+        config.apps = App.compile_conf(config)
+        config.retentions = Retention.compile_conf(config)
+        config.capacity = Capacity.compile_conf(config)
+        config.journal = Journal.compile_conf(config)
+        config.daemon = Save.compile_daemon_conf(config)
+        config.sweeper = RetentionSweeper.compile_conf(config)
+        config.metrics = Metrics.compile_conf(config)
+        config.workers = Coordinator.compile_conf(config)
+        config.ingest = Ingest.compile_conf(config)
+        config.tracing = Tracer.compile_conf(config)
+        config.storages = Storage.compile_conf(config)
+        config.saves = Save.compile_conf(config)
+        config._compute_fingerprints()
+        return config
+
+    def _compute_fingerprints(self):
+        # tiered saves are decompressed with tiering commands, and encrypted or decrypted along with compression
+        compression = YAMLHelper.fingerprint(self.compression, self.tiering, self.encryption)
+        self.fingerprints[(Config.F_COMPRESSION, None)] = compression
+        if self.encryption is not None:
+            self.fingerprints[(Config.F_ENCRYPTION, None)] = YAMLHelper.fingerprint(self.encryption)
+        for name, database in self.databases.items():
+            self.fingerprints[(Config.F_DATABASE, name)] = YAMLHelper.fingerprint(database, compression)
+        for name, app in self.apps.items():
+            self.fingerprints[(Config.F_APP, name)] = YAMLHelper.fingerprint(
+                app, [self.get_fingerprint(Config.F_DATABASE, db.instance) for db in app.databases], compression
+            )
+        for name, storage in self.storages.items():
+            self.fingerprints[(Config.F_STORAGE, name)] = YAMLHelper.fingerprint(storage)
+        for name, save in self.saves.items():
+            # limits are applied in place to running saves, see Throttle.get_instance()
+            self.fingerprints[(Config.F_SAVE, name)] = YAMLHelper.fingerprint(
+                save._replace(throttle=None), self.daemon, self.get_fingerprint(Config.F_APP, name),
+                self.get_fingerprint(Config.F_STORAGE, save.storage)
+            )
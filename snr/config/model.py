@@ -0,0 +1,193 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        model
+# Purpose:     Typed configuration model
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+from typing import NamedTuple, Optional, Union
+
+
+class CompressionConf(NamedTuple):
+    compressed_extention: str
+    compressed_from_pipe_ext: str
+    compress_env: dict
+    compress_command: list
+    decompress_command: list
+    compress_from_pipe: list
+    decompress_to_pipe: list
+    compress_from_pipe_info: list
+    compress_from_pipe_info_output: dict
+    decompress_from_pipe: Optional[list] = None
+
+
+class DatabaseConf(NamedTuple):
+    instance: str
+    type: str
+    host: str
+    port: Union[int, str]
+    credentials: str
+    username: str
+    password: str
+    dump_command: list
+    restore_command: list
+    list_databases_command: list
+    create_database_command: list
+    create_user_and_assign_command: list
+    env: Optional[dict]
+
+
+class AppDatabaseConf(NamedTuple):
+    name: str
+    database_name: str
+    prefix: str
+    instance: str
+    credentials: Union[dict, str]
+
+
+class AppConf(NamedTuple):
+    name: str
+    databases: list
+    files: dict
+
+
+class ScheduleConf(NamedTuple):
+    every: int
+    interval: str
+    at: Optional[str]
+
+
+class SaveConf(NamedTuple):
+    app_name: str
+    destination: Optional[str]
+    retentions: dict
+    schedules: list
+    allowed_actions: Union[list, set]
+    max_parallel: Optional[int]
+    overlap: str
+    storage: Optional[str]
+    throttle: Optional['ThrottleConf']
+
+
+class ThrottleConf(NamedTuple):
+    nice: Optional[int]
+    ionice_class: Optional[str]
+    ionice_level: Optional[int]
+    read_rate: Optional[int]
+    threads: Optional[int]
+    cpu_max: Optional[float]
+    io_max: Optional[dict]
+    memory_max: Optional[int]
+    parts: dict
+
+
+class RetentionConf(NamedTuple):
+    name: str
+    days: int
+    week: int
+    month: int
+    quarter: int
+    year: int
+    max_size: Union[int, str, None]
+
+
+class JournalConf(NamedTuple):
+    path: Optional[str]
+    history: int
+
+
+class DaemonConf(NamedTuple):
+    run_path: str
+
+
+class TracingConf(NamedTuple):
+    path: str
+    keep: int
+
+
+class MetricsConf(NamedTuple):
+    address: str
+    port: int
+
+
+class WorkersConf(NamedTuple):
+    address: str
+    port: int
+    token: str
+    timeout: int
+
+
+class IngestConf(NamedTuple):
+    address: str
+    port: int
+    url: Optional[str]
+    staging_path: str
+    chunk_size: int
+    token: str
+
+
+class SweeperConf(NamedTuple):
+    workers: int
+    max_deletes_per_second: Optional[float]
+    batch_delay: int
+
+
+class CapacityConf(NamedTuple):
+    path: str
+    max_size: Union[int, str]
+
+
+class TieringConf(NamedTuple):
+    source: str
+    destination: str
+    min_age: int
+    idle_time: int
+    compressed_extention: str
+    compressed_from_pipe_ext: str
+    compress_to_pipe: list
+    decompress_to_pipe: dict
+
+
+class StorageConf(NamedTuple):
+    name: str
+    type: str
+    endpoint: Optional[str]
+    region: Optional[str]
+    bucket: Optional[str]
+    host: Optional[str]
+    port: Optional[int]
+    username: Optional[str]
+    password: Optional[str]
+    key_file: Optional[str]
+    part_size: int
+    max_concurrency: int
+
+
+class EncryptionConf(NamedTuple):
+    algorithm: str
+    key: bytes
+    chunk_size: int
+    workers: int
+    executor: str
@@ -0,0 +1,389 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        control
+# Purpose:     Daemon control socket
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import io
+import os
+import json
+import socket
+import logging
+from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+from threading import Thread, Lock, current_thread
+
+from snr.progress import Progress
+
+logger = logging.getLogger(__name__)
+
+
+class ControlServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlHandler(StreamRequestHandler):
+    """
+    JSON lines protocol : one request object per line, answered by one response object per line
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode())
+                response = {Control.R_RESULT: self.server.control.dispatch(request)}
+            except (ValueError, TypeError, KeyError) as e:
+                response = {Control.R_ERROR: str(e)}
+            except Exception as e:
+                logger.error("Control request {} failed : {}".format(line, e))
+                response = {Control.R_ERROR: "{}: {}".format(type(e).__name__, e)}
+            try:
+                self.wfile.write((json.dumps(response, sort_keys=True) + '\n').encode())
+                self.wfile.flush()
+            except BrokenPipeError:
+                logger.warning(
+                    "Control client left before response to {}".format(line.decode(errors='replace').strip())
+                )
+                return
+
+
+class Control:
+    """
+    Local control socket of the daemon, in its run path. It lists apps and saves, runs saves and restores, cancels
+    running parts and reports their progress with the state the daemon already holds, see C_COMMANDS.
+    The socket is only accessible to the user running the daemon.
+    """
+
+    instance = None
+
+    C_SOCKET = 'snr.sock'
+    R_COMMAND = 'command'
+    R_RESULT = 'result'
+    R_ERROR = 'error'
+
+    C_PING = 'ping'
+    C_APPS = 'apps'
+    C_SAVE = 'save'
+    C_RESTORE = 'restore'
+    C_CANCEL = 'cancel'
+    C_PROGRESS = 'progress'
+    C_COMMANDS = {C_PING, C_APPS, C_SAVE, C_RESTORE, C_CANCEL, C_PROGRESS}
+
+    # seconds to wait for the answer of a daemon already listening to socket
+    C_PING_TIMEOUT = 5
+
+    C_VIEW_SAVE = 'save'
+    C_VIEW_RESTORE = 'restore'
+
+    def __init__(self, conf, path):
+        """
+        Should not be used directly. See start_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param path: socket path
+        :type path: str
+        :raise OSError: if socket can't be created or another daemon listens to it
+        """
+        self._conf = conf
+        self._path = path
+        if os.path.exists(path):
+            owner = Control._get_owner(path)
+            if owner is not None:
+                raise OSError("snr daemon {} already listens to it".format(owner))
+            # left over by a daemon which did not stop cleanly
+            os.remove(path)
+        umask = os.umask(0o177)
+        try:
+            self._server = ControlServer(path, ControlHandler)
+        finally:
+            os.umask(umask)
+        self._server.control = self
+        # threads running saves and restores, waited for on stop
+        self._lock = Lock()
+        self._running = set()
+        self._thread = Thread(target=self._server.serve_forever, name="control", daemon=True)
+
+    @staticmethod
+    def get_path(conf):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :return: control socket path
+        :rtype: str
+        """
+        from snr.save import Save
+        return os.path.join(Save.get_run_path(conf), Control.C_SOCKET)
+
+    @staticmethod
+    def _get_owner(path):
+        """
+        :param path: socket path
+        :type path: str
+        :return: pid of the daemon listening to socket, '?' if it does not answer. None if no daemon listens to it
+        :rtype: Union[int|str|None]
+        """
+        try:
+            client = ControlClient(path)
+        except OSError:
+            return None
+        try:
+            client.settimeout(Control.C_PING_TIMEOUT)
+            return client.request(Control.C_PING)['pid']
+        except (OSError, ValueError, KeyError):
+            return '?'
+        finally:
+            client.close()
+
+    @staticmethod
+    def start_instance(conf):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :return: started instance, None if socket can't be created
+        :rtype: Union[Control|None]
+        """
+        path = Control.get_path(conf)
+        try:
+            folder = os.path.dirname(path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            Control.instance = Control(conf, path)
+        except OSError as e:
+            logger.error("Cannot create control socket {} : {}".format(path, e))
+            return None
+        Control.instance._thread.start()
+        logger.info("Listening to control requests on {}".format(path))
+        return Control.instance
+
+    @staticmethod
+    def stop_instance():
+        """
+        Stop listening to control requests and wait for saves and restores they started
+        """
+        if Control.instance is not None:
+            control = Control.instance
+            Control.instance = None
+            control._server.shutdown()
+            control._server.server_close()
+            if os.path.exists(control._path):
+                os.remove(control._path)
+            with control._lock:
+                running = list(control._running)
+            for thread in running:
+                logger.info("Waiting for {} control request to finish".format(thread.name))
+                thread.join()
+
+    def _get_save(self, app):
+        """
+        :param app: app name
+        :type app: str
+        :rtype: snr.save.Save
+        """
+        from snr.save import Save
+        saves = Save.cache.get(self._conf, dict())
+        if app not in saves:
+            raise ValueError("{} is not a registered app. Should be one of {}".format(app, ', '.join(sorted(saves))))
+        return saves[app]
+
+    @staticmethod
+    def _exclude(save_atom, excludes):
+        """
+        :param save_atom: SaveAtom to remove parts from
+        :type save_atom: snr.app.SaveAtom
+        :param excludes: parts to exclude, as part:name strings
+        :type excludes: list
+        :rtype: snr.app.SaveAtom
+        """
+        for exclude in excludes or list():
+            part, name = exclude.split(':')
+            if not save_atom.part_exists(part, name):
+                raise ValueError("Unrecognized {}".format(exclude))
+            save_atom.del_part(part, name)
+        return save_atom
+
+    def dispatch(self, request):
+        """
+        :param request: request, with command key and command parameters
+        :type request: dict
+        :return: command result
+        """
+        command = request.get(Control.R_COMMAND)
+        if command not in Control.C_COMMANDS:
+            raise ValueError("Unknown command {}. Should be one of {}".format(command, Control.C_COMMANDS))
+        if command not in (Control.C_SAVE, Control.C_RESTORE):
+            return getattr(self, '_' + command)(request)
+        with self._lock:
+            if Control.instance is not self:
+                raise ValueError("snr daemon is stopping")
+            self._running.add(current_thread())
+        try:
+            return getattr(self, '_' + command)(request)
+        finally:
+            with self._lock:
+                self._running.discard(current_thread())
+
+    def _ping(self, request):
+        return {'pid': os.getpid(), 'conf': self._conf}
+
+    def _apps(self, request):
+        """
+        :return: apps, with their parts, and for restore view their saves. Listing as printed by CLIView is
+        given as output.
+        """
+        from snr.save import Save
+        from snr.cli.cliview import CLIView
+        saves = dict(Save.cache.get(self._conf, dict()))
+        view = request.get('view', Control.C_VIEW_SAVE)
+        apps = dict()
+        for name, save in saves.items():
+            save_atom = save.save_atom
+            apps[name] = {
+                'saveable': save.saveable,
+                'restoreable': save.restoreable,
+                'running': save.running,
+                'files': save_atom.files,
+                'databases': save_atom.databases,
+                'estimate': save.estimated_duration
+            }
+            if view == Control.C_VIEW_RESTORE:
+                apps[name]['saves'] = dict(
+                    (date, atom.status.value) for date, atom in save.save_atoms.items()
+                )
+        output = io.StringIO()
+        if view == Control.C_VIEW_RESTORE:
+            CLIView.print_restoreable_apps(saves, output)
+        else:
+            CLIView.print_saveable_apps(saves, output)
+        return {'apps': apps, 'output': output.getvalue()}
+
+    def _save(self, request):
+        """
+        Run a save and wait for it
+        :return: save date and status, None status if save did not run
+        """
+        save = self._get_save(request['app'])
+        save_atom = Control._exclude(save.save_atom, request.get('exclude'))
+        save_atom = save.save(save_atom)
+        if save_atom is None:
+            return {'date': None, 'status': None}
+        return {'date': save_atom.date, 'status': save_atom.status.value}
+
+    def _restore(self, request):
+        """
+        Run a restore and wait for it
+        """
+        from snr.app.saveatom import AppSaveStatusEnum
+        save = self._get_save(request['app'])
+        date = request.get('date')
+        save_atoms = save.save_atoms
+        if date is None:
+            if len(save_atoms) == 0:
+                raise ValueError("{} has no save to restore".format(request['app']))
+            date = sorted(save_atoms.keys(), reverse=True)[0]
+        if date not in save_atoms:
+            raise ValueError("{} is not an available save date for {}. Choose one of {}".format(
+                date, request['app'], ', '.join(sorted(save_atoms.keys(), reverse=True))
+            ))
+        save_atom = Control._exclude(save_atoms[date], request.get('exclude'))
+        allow_partial = AppSaveStatusEnum.PARTIAL if request.get('allow_partial') else AppSaveStatusEnum.FULL
+        save.restore(save_atom, allow_partial=allow_partial)
+        return {'date': date}
+
+    def _cancel(self, request):
+        """
+        :return: cancelled parts, as [type, name] lists
+        """
+        self._get_save(request['app'])
+        return Progress.cancel_parts(request['app'], request.get('type'), request.get('name'))
+
+    def _progress(self, request):
+        return Progress.snapshots()
+
+
+class ControlClient:
+    """
+    Client of a running daemon control socket, see Control
+    """
+
+    def __init__(self, path):
+        """
+        :param path: control socket path
+        :type path: str
+        :raise IOError: if daemon can't be reached
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile('rwb')
+
+    @staticmethod
+    def connect(conf):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :return: client of running daemon, None if no daemon listens to control socket
+        :rtype: Union[ControlClient|None]
+        """
+        try:
+            return ControlClient(Control.get_path(conf))
+        except OSError:
+            return None
+
+    def request(self, command, **params):
+        """
+        :param command: one of Control.C_COMMANDS
+        :type command: str
+        :param params: command parameters
+        :return: command result
+        :raise IOError: if daemon can't be reached or command failed
+        """
+        params[Control.R_COMMAND] = command
+        self._file.write((json.dumps(params) + '\n').encode())
+        self._file.flush()
+        line = self._file.readline()
+        if len(line) == 0:
+            raise IOError("snr daemon closed control connection")
+        response = json.loads(line.decode())
+        if Control.R_ERROR in response:
+            raise IOError(response[Control.R_ERROR])
+        return response[Control.R_RESULT]
+
+    def settimeout(self, timeout):
+        """
+        :param timeout: seconds to wait for a response, forever if None
+        :type timeout: Union[float|None]
+        """
+        self._socket.settimeout(timeout)
+
+    def close(self):
+        try:
+            self._file.close()
+        except OSError:
+            # request left unsent to a daemon gone
+            pass
+        self._socket.close()
@@ -33,8 +33,14 @@ import logging
 import subprocess
 import os
 
-from snr.yamlhelper.yamlhelper import YAMLHelper
+from snr.config.config import Config
 from snr.compression.compression import Compression, CMode
+from snr.units import Units
+from snr.throttle import Throttle
+from snr.tracing import Tracer
+from snr.progress import Progress
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import DatabaseConf
 
 logger = logging.getLogger(__name__)
 
@@ -161,8 +167,9 @@ databases:
 
     """
 
+    cache = dict()
     HELPERS = 'database_helpers'
-    HELPERS_KEYS = {'postgres', 'mysql'}
+    HELPERS_KEYS = {'postgres', 'mysql', 'sqlite'}
 
     H_ENV = 'env'
     H_DUMP = 'dump_command'
@@ -206,62 +213,111 @@ databases:
         self._env = env
         self._dump_process = None
         self._databases = list()
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """
+        :return: configuration fingerprint of this instance, including credentials and compression
+        :rtype: str
+        """
+        return self._fingerprint
 
     @staticmethod
-    def get_instances(conf):
+    def compile_conf(config):
+        """
+        Validate database helpers and instances sections, along with instances credentials files
+        :param config: configuration being compiled
+        :type config: Config
+        :return: DatabaseConf by instance name
+        :rtype: dict
+        :raise: TypeError on configuration error
+        """
+        databases = dict()
         try:
-            data = YAMLHelper.load(conf)
-
+            helpers = Config.get_section(config.data, Database.HELPERS)
             # validate *helpers* keys
-            YAMLHelper.analyse_keys(
-                Database.HELPERS,
-                data[Database.HELPERS],
-                optional_key_set=Database.HELPERS_KEYS
-            )
-
-            helpers = dict()
-            for db_type in data[Database.HELPERS]:
+            YAMLHelper.analyse_keys(Database.HELPERS, helpers, optional_key_set=Database.HELPERS_KEYS)
+            for db_type in helpers:
                 # Validate helper configuration keys
                 YAMLHelper.analyse_keys(
-                    Database.HELPERS,
-                    data[Database.HELPERS][db_type],
-                    Database.HELPER_KEYS,
-                    Database.HELPER_OPTIONAL_KEYS
+                    Database.HELPERS, helpers[db_type], Database.HELPER_KEYS, Database.HELPER_OPTIONAL_KEYS
                 )
 
-                helpers[db_type] = data[Database.HELPERS][db_type]
-
-            databases = dict()
-            for db in data[Database.DBS]:
+            for db in Config.get_section(config.data, Database.DBS):
                 YAMLHelper.analyse_keys(Database.DBS, db, Database.D_INSTANCE_KEYS)
+                if db[Database.D_TYPE] not in helpers:
+                    raise TypeError(
+                        "Unknown {} type {}. Should be one of {}".format(
+                            Database.DBS, db[Database.D_TYPE], set(helpers)
+                        )
+                    )
+                helper = helpers[db[Database.D_TYPE]]
 
-                env = None
-                if Database.H_ENV in helpers[db[Database.D_TYPE]].keys():
-                    env = helpers[db[Database.D_TYPE]][Database.H_ENV]
-
-                creds = YAMLHelper.load(db[Database.D_CREDS])
+                creds = config.load_yaml(db[Database.D_CREDS])
                 YAMLHelper.analyse_keys(db[Database.D_CREDS], creds, Database.C_KEYS)
 
-                username = creds[Database.C_USER]
-                password = creds[Database.C_PASS]
-
-                databases[db[Database.D_INSTANCE]] = Database(
+                database = DatabaseConf(
                     db[Database.D_INSTANCE],
                     db[Database.D_TYPE],
                     db[Database.D_HOST],
                     db[Database.D_PORT],
                     db[Database.D_CREDS],
-                    helpers[db[Database.D_TYPE]][Database.H_DUMP],
-                    helpers[db[Database.D_TYPE]][Database.H_RESTORE],
-                    helpers[db[Database.D_TYPE]][Database.H_LIST_DB],
-                    helpers[db[Database.D_TYPE]][Database.H_CREATE_DB],
-                    helpers[db[Database.D_TYPE]][Database.H_CREATE_USER],
-                    username,
-                    password,
-                    Compression.get_instance(conf),
-                    env
+                    creds[Database.C_USER],
+                    creds[Database.C_PASS],
+                    helper[Database.H_DUMP],
+                    helper[Database.H_RESTORE],
+                    helper[Database.H_LIST_DB],
+                    helper[Database.H_CREATE_DB],
+                    helper[Database.H_CREATE_USER],
+                    helper.get(Database.H_ENV)
+                )
+                databases[database.instance] = database
+        except TypeError as e:
+            raise TypeError("Database configuration error : {}".format(e))
+        return databases
+
+    @staticmethod
+    def get_instances(conf):
+        """
+        Database class Factory. Instances are cached by 'conf' parameter and instance name, and are only rebuilt
+        when their configuration, credentials or compression configuration change.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :return: dict of Database instances
+        :rtype: dict
+        """
+        try:
+            config = Config.get_instance(conf)
+            compression = Compression.get_instance(conf)
+
+            databases = dict()
+            for name, db in config.databases.items():
+                fingerprint = config.get_fingerprint(Config.F_DATABASE, name)
+                cached = Database.cache.get(conf, dict()).get(name)
+                if cached is not None and cached.fingerprint == fingerprint:
+                    databases[name] = cached
+                    continue
+
+                databases[name] = Database(
+                    db.instance,
+                    db.type,
+                    db.host,
+                    db.port,
+                    db.credentials,
+                    db.dump_command,
+                    db.restore_command,
+                    db.list_databases_command,
+                    db.create_database_command,
+                    db.create_user_and_assign_command,
+                    db.username,
+                    db.password,
+                    compression,
+                    db.env
                 )
+                databases[name]._fingerprint = fingerprint
 
+            Database.cache[conf] = databases
             return databases
         except TypeError as e:
             logger.error("Database configuration error : {}".format(e))
@@ -314,13 +370,18 @@ databases:
                 if env in os.environ:
                     del os.environ[env]
 
-    def save(self, dbname, file, save_atom, db_prefix=""):
+    @Tracer.traced('database.save')
+    def save(self, dbname, file, save_atom, db_prefix="", storage=None, throttle=None):
         """
         Launch db dump command and pipe it to compression helper
         :param dbname:
         :param file:
         :param save_atom:
         :param db_prefix:
+        :param storage: Optional. Storage to write to, local filesystem per default
+        :type storage: Union[snr.storage.Storage|None]
+        :param throttle: Optional. Limits of started processes, unlimited per default
+        :type throttle: Union[snr.throttle.PartThrottle|None]
         """
         if '{}{}'.format(db_prefix, dbname) not in self.databases:
             logger.error(
@@ -340,9 +401,12 @@ databases:
         logger.info("{}.save(): Dump database with {}".format(save_atom.db_log_prefix(db_prefix, dbname), cmd))
 
         try:
-            self._dump_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._dump_process = Throttle.popen(
+                cmd, throttle, read_limit=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            Progress.add_source(self._dump_process, Progress.C_WRITTEN)
             compressed_filename = self._compression.compress_from_pipe(
-                self._dump_process.stdout, file, save_atom, db_prefix, dbname
+                self._dump_process.stdout, file, save_atom, db_prefix, dbname, storage, throttle
             )
             if not self._dump_process.stdout.closed:
                 self._dump_process.stdout.close()
@@ -350,8 +414,20 @@ databases:
             # remove env var
             self._restore_env()
 
-            self._dump_process.wait()
-            if self._dump_process.returncode == 0:
+            with Tracer.span('database.dump', command=cmd[0]):
+                self._dump_process.wait()
+            if self._dump_process.returncode == 0 and compressed_filename is not None \
+                    and self._compression.is_streamed(storage):
+                # compressed file can't be inspected in place, its size is known from upload or encryption
+                seconds = time.time() - start
+                save_atom.set_stats(compressed_filename, duration=seconds)
+                logger.info(
+                    "{}.save(): Dumped {} of {} in {}s".format(
+                        save_atom.db_log_prefix(db_prefix, dbname), compressed_filename,
+                        Units.convert_bytes(save_atom.get_stats(compressed_filename).get('bytes', 0)) or '0B', seconds
+                    )
+                )
+            elif self._dump_process.returncode == 0:
                 logger.info(
                     "{}.save(): {}".format(
                         save_atom.db_log_prefix(db_prefix, dbname),
@@ -380,7 +456,8 @@ databases:
                 "{}.save(): Caught KeyboardInterrupt !".format(save_atom.db_log_prefix(db_prefix, dbname))
             )
 
-    def restore(self, dbname, backup, save_atom, db_prefix='', credentials=None):
+    @Tracer.traced('database.restore')
+    def restore(self, dbname, backup, save_atom, db_prefix='', credentials=None, storage=None, throttle=None):
         """
         restore a database
         :param dbname:
@@ -388,6 +465,12 @@ databases:
         :param save_atom:
         :param db_prefix:
         :param credentials:
+        :param storage: Optional. Storage holding backup, local filesystem per default. Backups of remote storages
+        are read ahead in parallel and piped into restoration, without local copy. Encrypted backups are decrypted on
+        the fly.
+        :type storage: Union[snr.storage.Storage|None]
+        :param throttle: Optional. Limits of started processes, unlimited per default
+        :type throttle: Union[snr.throttle.PartThrottle|None]
         :return:
         """
         if '{}{}'.format(db_prefix, dbname) not in self.databases:
@@ -413,18 +496,36 @@ databases:
 
         self._prepare_env()
         cmd = self._prepare_command(self._restore_command, dbname, db_prefix)
+        stream = None
         try:
-            extract_process = self._compression.decompress_to_pipe(backup, save_atom, dbname, db_prefix)
+            stream = self._compression.open_stream(backup, storage)
+            extract_process = self._compression.decompress_to_pipe(
+                backup, save_atom, dbname, db_prefix, stream, throttle
+            )
             with extract_process.stdout as f:
                 logger.info("{}.restore(): Pipe dump extraction to {}".format(
                     save_atom.db_log_prefix(db_prefix, dbname), cmd
                 ))
-                restore_process = subprocess.Popen(cmd, stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            _, err = restore_process.communicate()
+                restore_process = Throttle.popen(
+                    cmd, throttle, stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+            with Tracer.span('database.process', command=cmd[0]):
+                _, err = restore_process.communicate()
 
             self._restore_env()
 
-            if restore_process.returncode == 0:
+            if stream is not None:
+                extract_process.wait()
+                stream.close()
+
+            if restore_process.returncode == 0 and stream is not None:
+                logger.info(
+                    "{}.restore(): Restored {} of {} in {}s".format(
+                        save_atom.db_log_prefix(db_prefix, dbname), backup,
+                        Units.convert_bytes(stream.size) or '0B', time.time() - start
+                    )
+                )
+            elif restore_process.returncode == 0:
                 if len(err) != 0:
                     logger.warning(
                         "{}.restore(): {}".format(
@@ -446,6 +547,9 @@ databases:
                 logger.error("{}.restore(): {}".format(save_atom.db_log_prefix(db_prefix, dbname), err.decode()))
         except KeyboardInterrupt:
             logger.warning("{}.restore(): Caught KeyboardInterrupt".format(save_atom.db_log_prefix(db_prefix, dbname)))
+        except IOError as e:
+            # read error from remote storage or decryption error
+            logger.error("{}.restore(): {}".format(save_atom.db_log_prefix(db_prefix, dbname), e))
 
     def create_database(self, save_atom, dbname, db_prefix=''):
         if '{}{}'.format(db_prefix, dbname) in self.databases:
@@ -0,0 +1,724 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        encryption
+# Purpose:     Streaming authenticated encryption of saves
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import sys
+import base64
+import struct
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Thread, Lock
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:
+    InvalidTag = None
+    AESGCM = None
+    ChaCha20Poly1305 = None
+
+from snr.config import Config
+from snr.yamlhelper import YAMLHelper
+from snr.units import Units
+from snr.config.model import EncryptionConf
+
+logger = logging.getLogger(__name__)
+
+
+def _read_full(source, size):
+    """
+    Read size bytes from source unless end of stream is reached
+    :param source: file like object
+    :param size: number of bytes to read
+    :type size: int
+    :rtype: bytes
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = source.read(size - len(data))
+        if not chunk:
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _write_full(fd, data):
+    view = memoryview(data)
+    while len(view) > 0:
+        view = view[os.write(fd, view):]
+
+
+# AEAD ciphers of pool processes, by algorithm and key
+_aeads = dict()
+
+
+def _process_chunk(decrypt, algorithm, key, header, nonce_prefix, counter, chunk, last):
+    """
+    Encrypt or decrypt a chunk in a pool process, see Encryption.C_PROCESS
+    :param decrypt: True to decrypt chunk, False to encrypt it
+    :type decrypt: bool
+    :rtype: bytes
+    """
+    aead = _aeads.get((algorithm, key))
+    if aead is None:
+        aead = _aeads[(algorithm, key)] = Encryption.get_aead(algorithm, key)
+    if decrypt:
+        return Encryption.decrypt_chunk(aead, header, nonce_prefix, counter, chunk, last)
+    return Encryption.encrypt_chunk(aead, header, nonce_prefix, counter, chunk, last)
+
+
+class EncryptingWriter:
+    """
+    Streaming encryption stage, with the same interface as StorageWriter.
+    Data written into fileno() is cut into chunks encrypted by at most workers threads or processes, and written in
+    order to the underlying writer. Memory is bounded to about (workers + 1) * chunk_size bytes.
+    """
+
+    def __init__(self, encryption, writer):
+        """
+        :param encryption: encryption settings
+        :type encryption: Encryption
+        :param writer: writer receiving encrypted stream, see Storage.open_write()
+        :type writer: Union[snr.storage.StorageWriter|snr.storage.local.LocalWriter]
+        """
+        self._encryption = encryption
+        self._writer = writer
+        self._header, self._nonce_prefix = encryption.new_header()
+        self._read_fd, self._write_fd = os.pipe()
+        self._executor = encryption.open_executor()
+        self._error = None
+        self._closed = False
+        # a writer left open must not keep the process alive
+        self._pump = Thread(target=self._run, name="encrypt {}".format(writer.path), daemon=True)
+        self._pump.start()
+
+    @property
+    def path(self):
+        return self._writer.path
+
+    @property
+    def size(self):
+        """
+        :return: encrypted bytes written so far
+        :rtype: int
+        """
+        return self._writer.size
+
+    def fileno(self):
+        """
+        :return: file descriptor to write to, to be given to subprocesses as stdout
+        :rtype: int
+        """
+        return self._write_fd
+
+    def write(self, data):
+        """
+        Write data from current process
+        :param data: data to write
+        :type data: bytes
+        """
+        _write_full(self._write_fd, data)
+
+    def _read_chunk(self):
+        chunk = bytearray()
+        while len(chunk) < self._encryption.chunk_size:
+            data = os.read(self._read_fd, self._encryption.chunk_size - len(chunk))
+            if not data:
+                break
+            chunk.extend(data)
+        return bytes(chunk)
+
+    def _run(self):
+        futures = deque()
+        counter = 0
+        try:
+            self._writer.write(self._header)
+            last = False
+            while not last or len(futures) > 0:
+                while not last and len(futures) < self._encryption.workers:
+                    chunk = self._read_chunk()
+                    # a short chunk ends the stream, an empty one if stream length is a multiple of chunk_size
+                    last = len(chunk) < self._encryption.chunk_size
+                    futures.append(self._encryption.submit(
+                        self._executor, False, self._encryption.algorithm, self._header, self._nonce_prefix, counter,
+                        chunk, last
+                    ))
+                    counter += 1
+                self._writer.write(futures.popleft().result())
+        except Exception as e:
+            self._error = e
+        finally:
+            for future in futures:
+                future.cancel()
+            # writing processes fail on broken pipe instead of producing data nobody reads
+            os.close(self._read_fd)
+            self._encryption.close_executor(self._executor)
+
+    def close(self):
+        """
+        Close writer once writing processes exited and wait for encrypted stream completion
+        :return: written bytes
+        :rtype: int
+        :raise: IOError on encryption or write error
+        """
+        self._closed = True
+        os.close(self._write_fd)
+        self._pump.join()
+        if self._error is not None:
+            self._writer.abort()
+            raise IOError("Cannot encrypt {} : {}".format(self.path, self._error))
+        return self._writer.close()
+
+    def abort(self):
+        """
+        Abort writing, once writing processes exited. Partial data is discarded. Does nothing once writer is closed.
+        """
+        if self._closed:
+            return
+        self._error = self._error or IOError("aborted")
+        try:
+            self.close()
+        except IOError:
+            pass
+
+
+class DecryptingReader:
+    """
+    Streaming decryption stage. Chunks read from source are decrypted by at most workers threads or processes and
+    written in order into a pipe whose read end, fileno(), is given to subprocesses as stdin.
+    Sources without encryption header are passed through, so that saves made before encryption was enabled can still
+    be restored.
+    """
+
+    def __init__(self, encryption, source):
+        """
+        :param encryption: encryption settings
+        :type encryption: Encryption
+        :param source: encrypted stream, see Storage.open_stream()
+        :type source: Union[snr.storage.StorageReader|io.BufferedReader]
+        """
+        self._encryption = encryption
+        self._source = source
+        self._read_fd, self._write_fd = os.pipe()
+        self._executor = encryption.open_executor()
+        self._read = 0
+        self._error = None
+        self._pump = Thread(target=self._run, name="decrypt", daemon=True)
+        self._pump.start()
+
+    @property
+    def size(self):
+        """
+        :return: decrypted bytes handed to the reading side so far
+        :rtype: int
+        """
+        return self._read
+
+    def fileno(self):
+        """
+        :return: file descriptor to read from, to be given to subprocesses as stdin
+        :rtype: int
+        """
+        return self._read_fd
+
+    def read(self, size=-1):
+        """
+        Read data from current process
+        :param size: maximum number of bytes to read
+        :type size: int
+        :rtype: bytes
+        """
+        return os.read(self._read_fd, size if size > 0 else self._encryption.chunk_size)
+
+    def _write(self, data):
+        _write_full(self._write_fd, data)
+        self._read += len(data)
+
+    def _passthrough(self, data):
+        while data:
+            self._write(data)
+            data = self._source.read(self._encryption.chunk_size)
+
+    def _run(self):
+        futures = deque()
+        try:
+            header = _read_full(self._source, Encryption.C_HEADER.size)
+            if not header.startswith(Encryption.C_MAGIC):
+                self._passthrough(header)
+                return
+            algorithm, chunk_size, nonce_prefix = self._encryption.parse_header(header)
+            counter = 0
+            last = False
+            while not last or len(futures) > 0:
+                while not last and len(futures) < self._encryption.workers:
+                    chunk = _read_full(self._source, chunk_size + Encryption.C_TAG_SIZE)
+                    if len(chunk) < Encryption.C_TAG_SIZE:
+                        raise IOError("truncated encrypted stream")
+                    last = len(chunk) < chunk_size + Encryption.C_TAG_SIZE
+                    futures.append(self._encryption.submit(
+                        self._executor, True, algorithm, header, nonce_prefix, counter, chunk, last
+                    ))
+                    counter += 1
+                self._write(futures.popleft().result())
+        except BrokenPipeError:
+            # reading side is gone, it reports its own error
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            for future in futures:
+                future.cancel()
+            os.close(self._write_fd)
+            self._encryption.close_executor(self._executor)
+
+    def close(self):
+        """
+        Close reader once reading processes exited
+        :raise: IOError on read or authentication error
+        """
+        os.close(self._read_fd)
+        self._pump.join()
+        self._source.close()
+        if self._error is not None:
+            raise IOError("Cannot decrypt : {}".format(self._error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Encryption:
+    """
+    Authenticated encryption of saves, configured through yaml config file via encryption key. Requires cryptography.
+    Compressed streams are cut into chunks encrypted in parallel with AES-256-GCM or ChaCha20-Poly1305.
+
+    Encrypted files start with a header: magic, format version, algorithm, chunk size, key id and a random nonce
+    prefix. Chunks follow, each one being chunk_size bytes of data followed by its authentication tag, except the
+    last one which is shorter. Chunk nonce is made of nonce prefix, chunk counter and last chunk flag, so that
+    reordered, truncated or extended streams fail authentication. Header is authenticated with each chunk.
+
+    Chunks are encrypted by threads of each stream per default. With the process executor, they are sent to a pool
+    of workers processes shared by streams, so that encryption is not serialized by the Python interpreter lock
+    when many parts are saved at the same time.
+    """
+
+    C_YAML = """
+# authenticated encryption of saves, requires cryptography. Saves made before enabling it remain restorable
+#encryption:
+#  # aes-256-gcm or chacha20-poly1305
+#  algorithm: aes-256-gcm
+#  # file holding a base64 encoded 256 bits key. Generate one with: head -c 32 /dev/urandom | base64
+#  key_file: /root/.snr/save.key
+#  # or key itself
+#  #key: base64 encoded key
+#  # data bytes per encrypted chunk and number of chunks encrypted at the same time
+#  chunk_size: 1MB
+#  workers: 4
+#  # thread: chunks are encrypted by threads of each part. process: by a pool of workers processes shared by parts,
+#  # for hosts saving many parts at the same time
+#  executor: thread
+"""
+
+    cache = dict()
+
+    C_ENCRYPTION = 'encryption'
+    C_ALGORITHM = 'algorithm'
+    C_KEY = 'key'
+    C_KEY_FILE = 'key_file'
+    C_CHUNK_SIZE = 'chunk_size'
+    C_WORKERS = 'workers'
+    C_EXECUTOR = 'executor'
+    C_KEYS = set()
+    C_OPT_KEYS = {C_ALGORITHM, C_KEY, C_KEY_FILE, C_CHUNK_SIZE, C_WORKERS, C_EXECUTOR}
+    C_AES_GCM = 'aes-256-gcm'
+    C_CHACHA20_POLY1305 = 'chacha20-poly1305'
+    C_ALGORITHMS = {C_AES_GCM: 1, C_CHACHA20_POLY1305: 2}
+    C_DEFAULT_ALGORITHM = C_AES_GCM
+    C_DEFAULT_CHUNK_SIZE = 1024 * 1024
+    C_DEFAULT_WORKERS = 4
+    C_THREAD = 'thread'
+    C_PROCESS = 'process'
+    C_EXECUTORS = (C_THREAD, C_PROCESS)
+    C_DEFAULT_EXECUTOR = C_THREAD
+    C_KEY_SIZE = 32
+    C_TAG_SIZE = 16
+
+    C_MAGIC = b'SNRENC'
+    C_VERSION = 1
+    # magic, version, algorithm, chunk size, key id, nonce prefix
+    C_HEADER = struct.Struct('>6sBBI4s7s')
+    C_NONCE_PREFIX_SIZE = 7
+    # nonce prefix, chunk counter, last chunk flag
+    C_NONCE = struct.Struct('>7sIB')
+
+    def __init__(self, algorithm, key, chunk_size=C_DEFAULT_CHUNK_SIZE, workers=C_DEFAULT_WORKERS,
+                 executor=C_DEFAULT_EXECUTOR):
+        """
+        Should not be used directly. See get_instance().
+        :param algorithm: one of C_ALGORITHMS
+        :type algorithm: str
+        :param key: 256 bits key
+        :type key: bytes
+        :param chunk_size: data bytes per chunk
+        :type chunk_size: int
+        :param workers: number of chunks encrypted or decrypted at the same time
+        :type workers: int
+        :param executor: one of C_EXECUTORS
+        :type executor: str
+        """
+        self._algorithm = algorithm
+        self._key = key
+        self._key_id = Encryption.get_key_id(key)
+        self._chunk_size = chunk_size
+        self._workers = workers
+        self._executor = executor
+        self._aead = Encryption.get_aead(algorithm, key)
+        self._pool = None
+        # streams using process pool, which is shut down once instance is stopped and they are all closed
+        self._pool_users = 0
+        self._stopped = False
+        self._lock = Lock()
+        self._fingerprint = None
+
+    @property
+    def algorithm(self):
+        return self._algorithm
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def executor(self):
+        return self._executor
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate encryption section, along with key file
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, None if encryption is not configured
+        :rtype: Union[EncryptionConf|None]
+        :raise: TypeError on configuration error
+        """
+        if Encryption.C_ENCRYPTION not in config.data.keys() or not config.data[Encryption.C_ENCRYPTION]:
+            return None
+        encryption = config.data[Encryption.C_ENCRYPTION]
+        try:
+            YAMLHelper.analyse_keys(Encryption.C_ENCRYPTION, encryption, Encryption.C_KEYS, Encryption.C_OPT_KEYS)
+            Encryption.check_available()
+            algorithm = encryption.get(Encryption.C_ALGORITHM, Encryption.C_DEFAULT_ALGORITHM)
+            YAMLHelper.check_key_values(Encryption.C_ALGORITHM, algorithm, Encryption.C_ALGORITHMS.keys())
+            key = Encryption.load_key(
+                config.load_secret(Encryption.C_ENCRYPTION, encryption, Encryption.C_KEY, Encryption.C_KEY_FILE)
+            )
+            try:
+                chunk_size = Units.parse_size(encryption.get(Encryption.C_CHUNK_SIZE, Encryption.C_DEFAULT_CHUNK_SIZE))
+            except ValueError as e:
+                raise TypeError("Invalid {} : {}".format(Encryption.C_CHUNK_SIZE, e))
+            if chunk_size < 1 or chunk_size > 2 ** 31:
+                raise TypeError("{} should be between 1B and 2GB".format(Encryption.C_CHUNK_SIZE))
+            workers = encryption.get(Encryption.C_WORKERS, Encryption.C_DEFAULT_WORKERS)
+            if not isinstance(workers, int) or workers < 1:
+                raise TypeError("{} should be a positive integer".format(Encryption.C_WORKERS))
+            executor = encryption.get(Encryption.C_EXECUTOR, Encryption.C_DEFAULT_EXECUTOR)
+            Encryption.check_executor(executor)
+        except TypeError as e:
+            raise TypeError("Encryption configuration error : {}".format(e))
+        return EncryptionConf(algorithm, key, chunk_size, workers, executor)
+
+    @staticmethod
+    def get_instance(conf):
+        """
+        Encryption class Factory. Instances are cached by 'conf' parameter and rebuilt when configuration changes.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :return: Encryption instance, None if encryption is not configured
+        :rtype: Union[Encryption|None]
+        """
+        config = Config.get_instance(conf)
+        if config.encryption is None:
+            Encryption.stop_instance(conf)
+            return None
+        fingerprint = config.get_fingerprint(Config.F_ENCRYPTION)
+        cached = Encryption.cache.get(conf)
+        if cached is None or cached.fingerprint != fingerprint:
+            Encryption.stop_instance(conf)
+            cached = Encryption(
+                config.encryption.algorithm, config.encryption.key, config.encryption.chunk_size,
+                config.encryption.workers, config.encryption.executor
+            )
+            cached._fingerprint = fingerprint
+            Encryption.cache[conf] = cached
+        return cached
+
+    @staticmethod
+    def stop_instance(conf):
+        """
+        Forget instance of conf and shut its process pool down, once streams using it are closed
+        :param conf: path to Yaml configuration
+        :type conf: str
+        """
+        encryption = Encryption.cache.pop(conf, None)
+        if encryption is not None:
+            encryption.stop()
+
+    def stop(self):
+        """
+        Shut process pool down once streams using it are closed. Next streams get a new pool.
+        """
+        with self._lock:
+            self._stopped = True
+            pool = self._pool if self._pool_users == 0 else None
+            if pool is not None:
+                self._pool = None
+        if pool is not None:
+            pool.shutdown()
+
+    @staticmethod
+    def check_available():
+        """
+        :raise: TypeError if cryptography is not installed
+        """
+        if AESGCM is None:
+            raise TypeError("{} requires cryptography, please install it".format(Encryption.C_ENCRYPTION))
+
+    @staticmethod
+    def check_executor(executor):
+        """
+        :param executor: one of C_EXECUTORS
+        :type executor: str
+        :raise: TypeError if executor is unknown or not supported by this Python version
+        """
+        YAMLHelper.check_key_values(Encryption.C_EXECUTOR, executor, Encryption.C_EXECUTORS)
+        if executor == Encryption.C_PROCESS and sys.version_info < (3, 7):
+            raise TypeError("{} {} requires Python 3.7 or later".format(Encryption.C_EXECUTOR, executor))
+
+    @staticmethod
+    def load_key(value):
+        """
+        :param value: base64 encoded key
+        :type value: str
+        :return: key
+        :rtype: bytes
+        :raise: TypeError on invalid key
+        """
+        try:
+            key = base64.b64decode(value.strip(), validate=True)
+        except ValueError as e:
+            raise TypeError("Invalid key, base64 expected : {}".format(e))
+        if len(key) != Encryption.C_KEY_SIZE:
+            raise TypeError("Invalid key, {} bits expected, got {}".format(Encryption.C_KEY_SIZE * 8, len(key) * 8))
+        return key
+
+    @staticmethod
+    def get_key_id(key):
+        return hashlib.sha256(key).digest()[:4]
+
+    @staticmethod
+    def get_aead(algorithm, key):
+        Encryption.check_available()
+        if algorithm == Encryption.C_CHACHA20_POLY1305:
+            return ChaCha20Poly1305(key)
+        return AESGCM(key)
+
+    @staticmethod
+    def is_encrypted(file):
+        """
+        :param file: local file path
+        :type file: str
+        :return: True if file starts with encryption header
+        :rtype: bool
+        """
+        try:
+            with open(file, 'rb') as f:
+                return f.read(len(Encryption.C_MAGIC)) == Encryption.C_MAGIC
+        except OSError:
+            return False
+
+    def new_header(self):
+        """
+        :return: header of a new encrypted stream, nonce prefix
+        :rtype: tuple
+        """
+        nonce_prefix = os.urandom(Encryption.C_NONCE_PREFIX_SIZE)
+        header = Encryption.C_HEADER.pack(
+            Encryption.C_MAGIC, Encryption.C_VERSION, Encryption.C_ALGORITHMS[self._algorithm], self._chunk_size,
+            self._key_id, nonce_prefix
+        )
+        return header, nonce_prefix
+
+    def parse_header(self, header):
+        """
+        :param header: header of an encrypted stream
+        :type header: bytes
+        :return: algorithm, chunk size, nonce prefix
+        :rtype: tuple
+        :raise: IOError on unsupported header or key mismatch
+        """
+        if len(header) != Encryption.C_HEADER.size:
+            raise IOError("truncated encryption header")
+        _, version, algorithm_id, chunk_size, key_id, nonce_prefix = Encryption.C_HEADER.unpack(header)
+        if version != Encryption.C_VERSION:
+            raise IOError("unsupported encryption format version {}".format(version))
+        if key_id != self._key_id:
+            raise IOError("encrypted with another key")
+        algorithms = dict((value, name) for name, value in Encryption.C_ALGORITHMS.items())
+        if algorithm_id not in algorithms:
+            raise IOError("unsupported encryption algorithm {}".format(algorithm_id))
+        return algorithms[algorithm_id], chunk_size, nonce_prefix
+
+    def open_executor(self):
+        """
+        :return: executor of a stream chunks, to be released with close_executor()
+        :rtype: concurrent.futures.Executor
+        """
+        if self._executor != Encryption.C_PROCESS:
+            return ThreadPoolExecutor(max_workers=self._workers)
+        with self._lock:
+            if self._pool is None:
+                # forked processes would inherit pipes of streams in progress, and keep them open
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            self._pool_users += 1
+            return self._pool
+
+    def close_executor(self, executor):
+        """
+        Shutdown a stream executor. Process pool is kept for next streams, unless instance is stopped
+        :param executor: executor given by open_executor()
+        :type executor: concurrent.futures.Executor
+        """
+        if not isinstance(executor, ProcessPoolExecutor):
+            executor.shutdown()
+            return
+        with self._lock:
+            self._pool_users -= 1
+            shutdown = self._stopped and self._pool_users == 0 and executor is self._pool
+            if shutdown:
+                self._pool = None
+        if shutdown:
+            executor.shutdown()
+
+    def _discard_broken_pool(self, pool):
+        """
+        Replace a pool whose process died, next streams get a new one
+        :param pool: broken pool
+        :type pool: ProcessPoolExecutor
+        """
+        with self._lock:
+            if pool is not self._pool:
+                return
+            self._pool = None
+        logger.error("Encryption process pool is broken, starting a new one for next streams")
+        pool.shutdown(wait=False)
+
+    def _check_pool(self, pool, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard_broken_pool(pool)
+
+    def submit(self, executor, decrypt, algorithm, header, nonce_prefix, counter, chunk, last):
+        """
+        Submit encryption or decryption of a chunk. Process pools receive key and algorithm, as ciphers can't be sent
+        to other processes
+        :param executor: executor given by open_executor()
+        :type executor: concurrent.futures.Executor
+        :param decrypt: True to decrypt chunk, False to encrypt it
+        :type decrypt: bool
+        :param algorithm: one of C_ALGORITHMS
+        :type algorithm: str
+        :return: future of encrypted or decrypted chunk
+        :rtype: concurrent.futures.Future
+        """
+        if isinstance(executor, ProcessPoolExecutor):
+            try:
+                future = executor.submit(
+                    _process_chunk, decrypt, algorithm, self._key, header, nonce_prefix, counter, chunk, last
+                )
+            except BrokenProcessPool:
+                self._discard_broken_pool(executor)
+                raise
+            future.add_done_callback(lambda f: self._check_pool(executor, f))
+            return future
+        aead = self._aead if algorithm == self._algorithm else Encryption.get_aead(algorithm, self._key)
+        if decrypt:
+            return executor.submit(Encryption.decrypt_chunk, aead, header, nonce_prefix, counter, chunk, last)
+        return executor.submit(Encryption.encrypt_chunk, aead, header, nonce_prefix, counter, chunk, last)
+
+    @staticmethod
+    def encrypt_chunk(aead, header, nonce_prefix, counter, chunk, last):
+        """
+        :return: encrypted chunk followed by its authentication tag
+        :rtype: bytes
+        """
+        return aead.encrypt(Encryption.C_NONCE.pack(nonce_prefix, counter, int(last)), chunk, header)
+
+    @staticmethod
+    def decrypt_chunk(aead, header, nonce_prefix, counter, chunk, last):
+        """
+        :return: decrypted chunk
+        :rtype: bytes
+        :raise: IOError on authentication failure
+        """
+        try:
+            return aead.decrypt(Encryption.C_NONCE.pack(nonce_prefix, counter, int(last)), chunk, header)
+        except InvalidTag:
+            raise IOError("authentication failed on chunk {}, save is corrupted or tampered with".format(counter))
+
+    def open_write(self, writer):
+        """
+        :param writer: writer receiving encrypted stream, see Storage.open_write()
+        :return: encrypting writer
+        :rtype: EncryptingWriter
+        """
+        return EncryptingWriter(self, writer)
+
+    def open_read(self, source):
+        """
+        :param source: stream to decrypt, see Storage.open_stream()
+        :return: decrypting reader
+        :rtype: DecryptingReader
+        """
+        return DecryptingReader(self, source)
@@ -0,0 +1,305 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        agent
+# Purpose:     Agent pushing saves to an ingestion server
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import json
+import time
+import hashlib
+import logging
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from urllib.parse import urlparse, quote
+
+from snr.config import Config
+from snr.ingest.ingest import Ingest
+
+logger = logging.getLogger(__name__)
+
+
+class Agent:
+    """
+    `snr agent` : dumps and compresses parts of an app next to its data, and pushes them to an ingestion server, see
+    Ingest. Compressed parts are spooled in staging path and uploaded while they are written, so that uploads resume
+    from the bytes the server staged after a connection loss.
+    """
+
+    # consecutive failed requests before a part upload is given up, and seconds between them
+    C_RETRIES = 10
+    C_RETRY = 3
+    # seconds between checks of spooled part growth
+    C_POLL = 0.5
+    C_TIMEOUT = 60
+
+    def __init__(self, conf, url, token, staging_path, chunk_size):
+        """
+        Should not be used directly. See get_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param url: ingestion server url
+        :type url: str
+        :param token: secret shared with server
+        :type token: str
+        :param staging_path: spool folder of compressed parts
+        :type staging_path: str
+        :param chunk_size: bytes sent per request
+        :type chunk_size: int
+        """
+        self._conf = conf
+        self._url = urlparse(url)
+        self._token = token
+        self._staging_path = staging_path
+        self._chunk_size = chunk_size
+
+    @staticmethod
+    def get_instance(conf, url=None):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :param url: Optional. ingestion server url, ingest section url per default
+        :type url: Union[str|None]
+        :rtype: Agent
+        :raise TypeError: if ingest is not configured or no server url is given
+        """
+        ingest = Config.get_instance(conf).ingest
+        if ingest is None:
+            raise TypeError("{} section is not configured in {}".format(Ingest.C_INGEST, conf))
+        url = url or ingest.url
+        if not url or urlparse(url).scheme not in ('http', 'https'):
+            raise TypeError("Ingestion server url should be http://host:port, got {}".format(url))
+        return Agent(conf, url, ingest.token, ingest.staging_path, ingest.chunk_size)
+
+    def _request(self, method, path, body=b''):
+        """
+        Send a signed request
+        :return: HTTP status, JSON response
+        :rtype: tuple
+        :raise IOError: if server is unreachable or failed
+        :raise ValueError: if server refused request
+        """
+        path = self._url.path.rstrip('/') + path
+        timestamp = int(time.time())
+        headers = {
+            Ingest.H_TIME: str(timestamp),
+            Ingest.H_SIGNATURE: Ingest.sign(self._token, method, path, timestamp, body),
+            'Content-Length': str(len(body))
+        }
+        if self._url.scheme == 'https':
+            connection = http.client.HTTPSConnection(self._url.hostname, self._url.port, timeout=Agent.C_TIMEOUT)
+        else:
+            connection = http.client.HTTPConnection(self._url.hostname, self._url.port, timeout=Agent.C_TIMEOUT)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            status, data = response.status, response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise IOError("{} {} : {}".format(method, path, e))
+        finally:
+            connection.close()
+        try:
+            data = json.loads(data.decode())
+        except ValueError:
+            raise IOError("{} {} : unexpected response {}".format(method, path, data[:100]))
+        if status >= 500:
+            raise IOError("{} {} : {}".format(method, path, data.get('error')))
+        if status >= 400 and status != 409:
+            raise ValueError("{} {} refused : {}".format(method, path, data.get('error')))
+        return status, data
+
+    def _retry(self, method, path, body=b''):
+        """
+        Send a signed request, retried C_RETRIES times on failure
+        :return: JSON response
+        :rtype: dict
+        """
+        for attempt in range(Agent.C_RETRIES):
+            try:
+                return self._request(method, path, body)[1]
+            except IOError as e:
+                if attempt == Agent.C_RETRIES - 1:
+                    raise
+                logger.warning("{}. Retrying in {}s".format(e, Agent.C_RETRY))
+                time.sleep(Agent.C_RETRY)
+
+    def save(self, app, excludes=None):
+        """
+        Save app parts and push them to server
+        :param app: app name
+        :type app: str
+        :param excludes: Optional. parts to exclude, as part:name strings
+        :type excludes: Union[list|None]
+        :return: save date and status, as recorded by server
+        :rtype: dict
+        :raise ValueError: if app or an excluded part is unknown, or server refused save
+        :raise IOError: if server is unreachable
+        """
+        from snr.app import App, SaveAtom
+        from snr.throttle import Throttle
+        apps = App.get_instances(self._conf)
+        if apps is None or app not in apps:
+            raise ValueError("{} is not a registered app".format(app))
+        save_atom = apps[app].save_atom
+        for exclude in excludes or list():
+            part_type, name = exclude.split(':')
+            if not save_atom.part_exists(part_type, name):
+                raise ValueError("Unrecognized {}".format(exclude))
+            save_atom.del_part(part_type, name)
+        parts = [(SaveAtom.DATABASE, name) for name in save_atom.databases]
+        parts += [(SaveAtom.FILE, name) for name in save_atom.files]
+        if len(parts) == 0:
+            raise ValueError("Nothing to save for {}".format(app))
+        session = self._retry('POST', '/saves', json.dumps({'app': app, 'parts': parts}).encode())
+        logger.info("{}.save(): Pushing {} save, session {}".format(
+            save_atom.app_log_prefix(), session['date'], session['id']
+        ))
+        max_parallel = Config.get_instance(self._conf).saves.get(app)
+        max_parallel = max_parallel.max_parallel if max_parallel is not None else None
+        throttle = Throttle.get_instance(self._conf, app)
+        with ThreadPoolExecutor(max_workers=min(max_parallel or len(parts), len(parts))) as executor:
+            futures = [
+                executor.submit(self._push_part, apps[app], session, part, throttle) for part in session['parts']
+            ]
+            for future in futures:
+                future.result()
+        result = self._retry('POST', '/saves/{}'.format(quote(session['id'])))
+        logger.info("{}.save(): Server recorded {} save {}".format(
+            save_atom.app_log_prefix(), result['status'], result['date']
+        ))
+        return result
+
+    def _push_part(self, app, session, part, throttle=None):
+        """
+        Save a part to spool folder while uploading it, then complete it on server
+        :param app: App instance
+        :type app: snr.app.App
+        :param session: server session, see Ingest._create()
+        :type session: dict
+        :param part: part type, name and destination path on server
+        :type part: dict
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[snr.throttle.Throttle|None]
+        """
+        from snr.app import SaveAtom
+        url = '/saves/{}/{}/{}'.format(quote(session['id']), quote(part['type']), quote(part['name']))
+        destination = os.path.join(self._staging_path, session['id'], '$app/$type/$name/$name-$date')
+        save_atom = SaveAtom(
+            app.name,
+            [part['name']] if part['type'] == SaveAtom.DATABASE else None,
+            [part['name']] if part['type'] == SaveAtom.FILE else None
+        )
+        save_atom.date = session['date']
+        save_atom, _ = app.project_save(destination, save_atom)
+        spool = save_atom.get_database(part['name']) if part['type'] == SaveAtom.DATABASE \
+            else save_atom.get_file(part['name'])
+        if os.path.basename(spool) != os.path.basename(part['path']):
+            self._retry('POST', url, json.dumps({'error': "agent compression differs from server one"}).encode())
+            logger.error("{}.save(): {} {} would be saved as {} on agent and {} on server, check compression".format(
+                save_atom.app_log_prefix(), part['type'], part['name'], spool, part['path']
+            ))
+            return
+
+        result = dict()
+
+        def save_part():
+            try:
+                result.update(app.save_part(destination, session['date'], part['type'], part['name'], None, throttle))
+            except Exception as e:
+                result['error'] = "{}: {}".format(type(e).__name__, e)
+
+        thread = Thread(target=save_part, name="{}-{}".format(app.name, part['name']))
+        thread.start()
+        try:
+            offset = self._upload(url, spool, thread)
+        finally:
+            thread.join()
+        if result.get('error') is None and not os.path.exists(spool):
+            result['error'] = "{} is missing".format(spool)
+        if result.get('error') is not None:
+            self._retry('POST', url, json.dumps({
+                'error': result['error'], 'duration': result.get('duration', 0)
+            }).encode())
+        else:
+            # parts written at once, without streaming, may still be growing when thread is seen alive
+            offset = self._upload(url, spool, thread, offset)
+            digest = hashlib.sha256()
+            with open(spool, 'rb') as f:
+                for data in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(data)
+            response = self._retry('POST', url, json.dumps({
+                'size': offset, 'sha256': digest.hexdigest(), 'duration': result['duration'],
+                'stats': result['stats'], 'usage': result['usage']
+            }).encode())
+            logger.info("{}.save(): {} {} pushed to {}".format(
+                save_atom.app_log_prefix(), part['type'], part['name'], response['path']
+            ))
+        if os.path.exists(spool):
+            os.remove(spool)
+
+    def _upload(self, url, spool, thread, offset=None):
+        """
+        Upload a spooled part while it is written, from the bytes server already staged
+        :param url: part url
+        :type url: str
+        :param spool: spooled part path
+        :type spool: str
+        :param thread: thread writing spooled part
+        :type thread: Thread
+        :param offset: Optional. bytes server staged, asked to server per default
+        :type offset: Union[int|None]
+        :return: uploaded bytes
+        :rtype: int
+        :raise IOError: after C_RETRIES consecutive failed requests
+        """
+        if offset is None:
+            offset = self._retry('GET', url)['offset']
+        failures = 0
+        while True:
+            written = not thread.is_alive()
+            try:
+                size = os.path.getsize(spool)
+            except FileNotFoundError:
+                size = 0
+            if offset >= size:
+                if written:
+                    return offset
+                time.sleep(Agent.C_POLL)
+                continue
+            with open(spool, 'rb') as f:
+                f.seek(offset)
+                data = f.read(min(self._chunk_size, size - offset))
+            try:
+                offset = self._request('PUT', '{}?offset={}'.format(url, offset), data)[1]['offset']
+                failures = 0
+            except IOError as e:
+                failures += 1
+                if failures == Agent.C_RETRIES:
+                    raise
+                logger.warning("{}. Resuming in {}s".format(e, Agent.C_RETRY))
+                time.sleep(Agent.C_RETRY)
+                offset = self._retry('GET', url)['offset']
@@ -0,0 +1,600 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        ingest
+# Purpose:     Push ingestion of saves made by remote agents
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import hmac
+import json
+import time
+import shutil
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock
+from urllib.parse import urlparse, parse_qs, unquote
+
+from snr.config import Config
+from snr.yamlhelper import YAMLHelper
+from snr.units import Units
+from snr.config.model import IngestConf
+
+logger = logging.getLogger(__name__)
+
+
+class IngestServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    """
+    Passes GET, PUT and POST requests to Ingest.handle() and sends its JSON response
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self, method):
+        # unsigned, expired or oversized requests are refused before their body is read
+        status, response = self.server.ingest.check(method, self.path, self.headers)
+        if status is None:
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length > 0 else b''
+            status, response = self.server.ingest.handle(method, self.path, self.headers, body)
+        else:
+            # unread body would be taken for the next request
+            self.close_connection = True
+        data = json.dumps(response, sort_keys=True).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        logger.debug("{} - {}".format(self.address_string(), format % args))
+
+
+class IngestSession:
+    """
+    Save pushed by an agent, persisted in its staging folder so that it survives server restarts
+    """
+
+    C_SESSION = 'session.json'
+
+    def __init__(self, folder, id, app, date, parts, start):
+        """
+        :param folder: staging folder of session
+        :type folder: str
+        :param id: session id
+        :type id: str
+        :param app: app name
+        :type app: str
+        :param date: save date
+        :type date: str
+        :param parts: part key -> {type, name, done, stats}
+        :type parts: dict
+        :param start: save start timestamp
+        :type start: float
+        """
+        self.folder = folder
+        self.id = id
+        self.app = app
+        self.date = date
+        self.parts = parts
+        self.start = start
+        self.lock = Lock()
+        self.save_atom = None
+
+    @staticmethod
+    def load(folder):
+        """
+        :return: session persisted in folder
+        :rtype: IngestSession
+        :raise: IOError if session does not exist
+        """
+        with open(os.path.join(folder, IngestSession.C_SESSION)) as f:
+            data = json.load(f)
+        return IngestSession(folder, data['id'], data['app'], data['date'], data['parts'], data['start'])
+
+    def persist(self):
+        path = os.path.join(self.folder, IngestSession.C_SESSION)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(
+                {'id': self.id, 'app': self.app, 'date': self.date, 'parts': self.parts, 'start': self.start}, f
+            )
+        os.replace(path + '.tmp', path)
+
+    def get_part(self, part_type, name):
+        """
+        :return: part of this session
+        :rtype: dict
+        :raise: LookupError if part is not part of this session
+        """
+        key = "{}:{}".format(part_type, name)
+        if key not in self.parts:
+            raise LookupError("{} is not a part of {}".format(key, self.id))
+        return self.parts[key]
+
+    def get_staged(self, part):
+        """
+        :return: path of staged part file
+        :rtype: str
+        """
+        return os.path.join(self.folder, "{}-{}".format(part['type'], part['name']))
+
+
+class Ingest:
+    """
+    `snr serve` ingestion server, configured through yaml config file via ingest key. Agents push the parts they dumped
+    and compressed, see Agent. A part is staged chunk by chunk, each chunk appended at the offset the agent resumes
+    from, then checked, stored to save destination and recorded in run journal once complete. Requests are signed
+    with a token shared with agents, see sign().
+
+    Requests :
+    - POST /saves : start a save of app parts, returns session id, save date and destination files
+    - GET /saves/<id>/<type>/<name> : staged bytes of a part, where its upload resumes
+    - PUT /saves/<id>/<type>/<name>?offset=<offset> : append a chunk to a part. 409 with staged bytes on offset mismatch
+    - POST /saves/<id>/<type>/<name> : complete a part with its size, sha256 and statistics, or its error
+    - POST /saves/<id> : finish save. Parts not completed are recorded as missing
+    """
+
+    C_YAML = """
+# Push ingestion of saves made next to the data. `snr agent` dumps and compresses parts of an app on its host, then
+# pushes compressed streams to `snr serve`, which writes them to the app save destination and run journal as a local
+# save would. Uploads resume where they stopped after a connection loss. Requests are signed with a token shared by
+# server and agents, traffic is not encrypted : use encryption section on agents to send encrypted saves.
+# Agents use their own configuration file, with the same apps and compression.
+#ingest:
+#  # snr serve listen address and port
+#  address: 127.0.0.1
+#  port: 9715
+#  # snr agent server url, and bytes sent per request. snr serve refuses requests larger than its own chunk_size
+#  url: http://127.0.0.1:9715
+#  chunk_size: 4MB
+#  # parts staged until complete, by server and agent
+#  staging_path: /var/lib/snr/ingest
+#  # file holding a secret shared by server and agents. Generate one with: head -c 32 /dev/urandom | base64
+#  token_file: /root/.snr/ingest.token
+#  # or token itself
+#  #token: shared secret
+"""
+
+    C_INGEST = 'ingest'
+    C_ADDRESS = 'address'
+    C_PORT = 'port'
+    C_URL = 'url'
+    C_CHUNK_SIZE = 'chunk_size'
+    C_STAGING_PATH = 'staging_path'
+    C_TOKEN = 'token'
+    C_TOKEN_FILE = 'token_file'
+    C_KEYS = set()
+    C_OPT_KEYS = {C_ADDRESS, C_PORT, C_URL, C_CHUNK_SIZE, C_STAGING_PATH, C_TOKEN, C_TOKEN_FILE}
+    C_DEFAULT_ADDRESS = '127.0.0.1'
+    C_DEFAULT_PORT = 9715
+    C_DEFAULT_CHUNK_SIZE = '4MB'
+    C_DEFAULT_STAGING_PATH = '/var/lib/snr/ingest'
+    # seconds a signed request is valid
+    C_MAX_SKEW = 300
+    # bytes of JSON requests accepted on top of chunk_size
+    C_MAX_BODY_MARGIN = 1024 * 1024
+    # finished sessions remembered
+    C_FINISHED = 100
+
+    H_TIME = 'X-Snr-Time'
+    H_SIGNATURE = 'X-Snr-Signature'
+
+    def __init__(self, conf, address, port, token, staging_path, chunk_size):
+        """
+        Should not be used directly. See get_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param address: listen address
+        :type address: str
+        :param port: listen port
+        :type port: int
+        :param token: secret shared with agents
+        :type token: str
+        :param staging_path: folder of staged parts
+        :type staging_path: str
+        :param chunk_size: largest chunk accepted
+        :type chunk_size: int
+        """
+        self._conf = conf
+        self._token = token
+        self._staging_path = staging_path
+        self._max_body = chunk_size + Ingest.C_MAX_BODY_MARGIN
+        self._lock = Lock()
+        self._sessions = dict()
+        # responses of finished sessions, for agents retrying after a lost response
+        self._finished = OrderedDict()
+        self._server = IngestServer((address, port), IngestHandler)
+        self._server.ingest = self
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate ingest section, along with token file
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, None if ingestion is not configured
+        :rtype: Union[IngestConf|None]
+        :raise: TypeError on configuration error
+        """
+        if Ingest.C_INGEST not in config.data.keys() or not config.data[Ingest.C_INGEST]:
+            return None
+        ingest = config.data[Ingest.C_INGEST]
+        try:
+            YAMLHelper.analyse_keys(Ingest.C_INGEST, ingest, Ingest.C_KEYS, Ingest.C_OPT_KEYS)
+            port = ingest.get(Ingest.C_PORT, Ingest.C_DEFAULT_PORT)
+            if not isinstance(port, int) or not 0 < port < 65536:
+                raise TypeError("{} should be an integer between 1 and 65535".format(Ingest.C_PORT))
+            try:
+                chunk_size = Units.parse_size(ingest.get(Ingest.C_CHUNK_SIZE, Ingest.C_DEFAULT_CHUNK_SIZE))
+            except ValueError as e:
+                raise TypeError("Invalid {} : {}".format(Ingest.C_CHUNK_SIZE, e))
+            if chunk_size < 1:
+                raise TypeError("{} should be a positive size".format(Ingest.C_CHUNK_SIZE))
+            token = config.load_secret(Ingest.C_INGEST, ingest, Ingest.C_TOKEN, Ingest.C_TOKEN_FILE)
+        except TypeError as e:
+            raise TypeError("Ingest configuration error : {}".format(e))
+        url = ingest.get(Ingest.C_URL)
+        return IngestConf(
+            str(ingest.get(Ingest.C_ADDRESS, Ingest.C_DEFAULT_ADDRESS)), port, str(url) if url else None,
+            str(ingest.get(Ingest.C_STAGING_PATH, Ingest.C_DEFAULT_STAGING_PATH)), chunk_size, token
+        )
+
+    @staticmethod
+    def get_instance(conf):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :rtype: Ingest
+        :raise TypeError: if ingest is not configured
+        :raise OSError: if address can't be listened to
+        """
+        ingest = Config.get_instance(conf).ingest
+        if ingest is None:
+            raise TypeError("{} section is not configured in {}".format(Ingest.C_INGEST, conf))
+        return Ingest(conf, ingest.address, ingest.port, ingest.token, ingest.staging_path, ingest.chunk_size)
+
+    def serve(self):
+        """
+        Serve agents until interrupted
+        """
+        address, port = self._server.server_address[:2]
+        logger.info("Listening to agents on http://{}:{}, staging parts in {}".format(
+            address, port, self._staging_path
+        ))
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            logger.warning("Caught KeyboardInterrupt")
+        finally:
+            self._server.server_close()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    @staticmethod
+    def sign(token, method, path, timestamp, body):
+        """
+        :param token: shared secret
+        :type token: str
+        :param method: HTTP method
+        :type method: str
+        :param path: request path, with query string
+        :type path: str
+        :param timestamp: request time
+        :type timestamp: int
+        :param body: request body
+        :type body: bytes
+        :return: request signature
+        :rtype: str
+        """
+        message = "\n".join((method, path, str(timestamp), hashlib.sha256(body).hexdigest()))
+        return hmac.new(token.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _get_timestamp(headers):
+        """
+        :return: request time
+        :rtype: int
+        :raise PermissionError: if request is not signed, or is too old
+        """
+        try:
+            timestamp = int(headers.get(Ingest.H_TIME, ''))
+        except ValueError:
+            raise PermissionError("unsigned request")
+        if not headers.get(Ingest.H_SIGNATURE):
+            raise PermissionError("unsigned request")
+        if abs(time.time() - timestamp) > Ingest.C_MAX_SKEW:
+            raise PermissionError("request expired")
+        return timestamp
+
+    def check(self, method, path, headers):
+        """
+        Check request headers before its body is read
+        :return: HTTP status and JSON response of a refused request, None, None otherwise
+        :rtype: tuple
+        """
+        try:
+            Ingest._get_timestamp(headers)
+            length = int(headers.get('Content-Length', 0))
+        except PermissionError as e:
+            logger.warning("Refused {} {} : {}".format(method, path, e))
+            return 401, {'error': str(e)}
+        except ValueError as e:
+            return 400, {'error': "Invalid Content-Length : {}".format(e)}
+        if length < 0:
+            return 400, {'error': "Invalid Content-Length {}".format(length)}
+        if length > self._max_body:
+            logger.warning("Refused {} {} : {} bytes body, {} at most".format(method, path, length, self._max_body))
+            return 413, {'error': "request body larger than {} bytes".format(self._max_body)}
+        return None, None
+
+    def authenticate(self, method, path, headers, body):
+        """
+        :raise PermissionError: if request is not signed with shared token, or is too old
+        """
+        timestamp = Ingest._get_timestamp(headers)
+        signature = Ingest.sign(self._token, method, path, timestamp, body)
+        if not hmac.compare_digest(signature, headers.get(Ingest.H_SIGNATURE, '')):
+            raise PermissionError("bad signature")
+
+    def handle(self, method, path, headers, body):
+        """
+        :return: HTTP status, JSON response
+        :rtype: tuple
+        """
+        try:
+            self.authenticate(method, path, headers, body)
+            url = urlparse(path)
+            segments = [unquote(segment) for segment in url.path.strip('/').split('/')]
+            if segments[0] != 'saves':
+                raise LookupError("Unknown request {}".format(url.path))
+            if method == 'POST' and len(segments) == 1:
+                return 200, self._create(json.loads(body.decode()))
+            if method == 'POST' and len(segments) == 2:
+                return 200, self._finish(segments[1])
+            if len(segments) == 4:
+                session = self._get_session(segments[1])
+                part = session.get_part(segments[2], segments[3])
+                if method == 'GET':
+                    return 200, {'offset': self._get_offset(session, part)}
+                if method == 'PUT':
+                    return self._append(session, part, int(parse_qs(url.query)['offset'][0]), body)
+                if method == 'POST':
+                    return 200, self._complete(session, part, json.loads(body.decode()))
+            raise LookupError("Unknown request {} {}".format(method, url.path))
+        except PermissionError as e:
+            logger.warning("Refused {} {} : {}".format(method, path, e))
+            return 401, {'error': str(e)}
+        except BlockingIOError as e:
+            # agent retries later
+            return 503, {'error': str(e)}
+        except LookupError as e:
+            return 404, {'error': str(e)}
+        except (ValueError, TypeError, KeyError) as e:
+            return 400, {'error': "{}: {}".format(type(e).__name__, e)}
+        except Exception as e:
+            logger.error("{} {} failed : {}".format(method, path, e))
+            return 500, {'error': "{}: {}".format(type(e).__name__, e)}
+
+    def _get_save(self, app):
+        """
+        :rtype: snr.save.Save
+        :raise LookupError: if app is not a registered app
+        """
+        from snr.save import Save
+        with self._lock:
+            Config.get_instance(self._conf, reload=True)
+            saves = Save.get_instances(self._conf)
+        if saves is None or app not in saves:
+            raise LookupError("{} is not a registered app".format(app))
+        return saves[app]
+
+    @staticmethod
+    def _get_path(save_atom, part):
+        from snr.app.saveatom import SaveAtom
+        if part['type'] == SaveAtom.DATABASE:
+            return save_atom.get_database(part['name'])
+        return save_atom.get_file(part['name'])
+
+    def _create(self, request):
+        """
+        :param request: app and its [type, name] parts
+        :type request: dict
+        :return: session id, save date and destination file of each part
+        :rtype: dict
+        """
+        save = self._get_save(request['app'])
+        save_atom = save.prepare_ingest(request['parts'])
+        id = "{}-{}-{}".format(request['app'], save_atom.date, secrets.token_hex(4))
+        parts = dict(
+            ("{}:{}".format(part_type, name), {'type': part_type, 'name': name, 'done': False, 'stats': None})
+            for part_type, name in request['parts']
+        )
+        session = IngestSession(
+            os.path.join(self._staging_path, id), id, request['app'], save_atom.date, parts, time.time()
+        )
+        session.save_atom = save_atom
+        os.makedirs(session.folder)
+        session.persist()
+        with self._lock:
+            self._sessions[id] = session
+        logger.info("{}.save(): Starting {} save pushed by agent, session {}".format(
+            save_atom.app_log_prefix(), save_atom.date, id
+        ))
+        return {
+            'id': id,
+            'date': save_atom.date,
+            'parts': [dict(type=part['type'], name=part['name'], path=Ingest._get_path(save_atom, part))
+                      for part in parts.values()]
+        }
+
+    def _get_session(self, id):
+        """
+        :return: running session, loaded from staging path after a server restart
+        :rtype: IngestSession
+        :raise LookupError: if session does not exist
+        """
+        with self._lock:
+            session = self._sessions.get(id)
+        if session is not None:
+            return session
+        from snr.app.saveatom import SaveAtom
+        folder = os.path.join(self._staging_path, os.path.basename(id))
+        try:
+            session = IngestSession.load(folder)
+        except (OSError, ValueError, KeyError):
+            raise LookupError("Unknown save session {}".format(id))
+        save_atom = self._get_save(session.app).prepare_ingest(
+            [(part['type'], part['name']) for part in session.parts.values()], session.date
+        )
+        for part in session.parts.values():
+            if part['done'] and part['stats'] is not None:
+                save_atom.set_stats(Ingest._get_path(save_atom, part), **part['stats'])
+            elif part['done']:
+                if part['type'] == SaveAtom.DATABASE:
+                    save_atom.set_database(part['name'], None)
+                else:
+                    save_atom.set_file(part['name'], None)
+        session.save_atom = save_atom
+        with self._lock:
+            session = self._sessions.setdefault(id, session)
+        logger.info("Resuming save session {}".format(id))
+        return session
+
+    @staticmethod
+    def _get_offset(session, part):
+        try:
+            return os.path.getsize(session.get_staged(part))
+        except FileNotFoundError:
+            return 0
+
+    def _append(self, session, part, offset, data):
+        """
+        Append a chunk to a staged part
+        :return: HTTP status, staged bytes
+        :rtype: tuple
+        """
+        with session.lock:
+            if part['done']:
+                raise ValueError("{} {} is already complete".format(part['type'], part['name']))
+            staged = Ingest._get_offset(session, part)
+            if offset != staged:
+                return 409, {'offset': staged}
+            with open(session.get_staged(part), 'ab') as f:
+                f.write(data)
+            return 200, {'offset': staged + len(data)}
+
+    def _complete(self, session, part, request):
+        """
+        Check a staged part against the size and sha256 sent by agent, store it to save destination and record it.
+        A part the agent failed to save is recorded as missing.
+        :param request: size, sha256, duration, stats and usage of part, or error
+        :type request: dict
+        :return: destination file and its size
+        :rtype: dict
+        """
+        save = self._get_save(session.app)
+        save_atom = session.save_atom
+        path = Ingest._get_path(save_atom, part)
+        with session.lock:
+            if part['done']:
+                return {'path': path, 'bytes': (part['stats'] or dict()).get('bytes')}
+            staged = session.get_staged(part)
+            if request.get('error') is not None:
+                logger.error("{}.save(): {} {} failed on agent : {}".format(
+                    save_atom.app_log_prefix(), part['type'], part['name'], request['error']
+                ))
+                if os.path.exists(staged):
+                    os.remove(staged)
+                save.ingest_part(save_atom, part['type'], part['name'], None, request.get('duration', 0))
+            else:
+                size = Ingest._get_offset(session, part)
+                if size != request['size']:
+                    raise ValueError("{} bytes staged, {} sent".format(size, request['size']))
+                digest = hashlib.sha256()
+                with open(staged, 'rb') as f:
+                    for data in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(data)
+                if digest.hexdigest() != request['sha256']:
+                    os.remove(staged)
+                    raise ValueError("sha256 mismatch, staged part discarded")
+                save.ingest_part(
+                    save_atom, part['type'], part['name'], staged, request['duration'], request.get('stats'),
+                    request.get('usage')
+                )
+            path = Ingest._get_path(save_atom, part)
+            part['done'] = True
+            part['stats'] = save_atom.get_stats(path) if path is not None else None
+            session.persist()
+        return {'path': path, 'bytes': (part['stats'] or dict()).get('bytes')}
+
+    def _finish(self, id):
+        """
+        Record a save once its parts are complete. Parts not completed are recorded as missing.
+        :return: save date and status
+        :rtype: dict
+        """
+        with self._lock:
+            if id in self._finished:
+                return self._finished[id]
+        session = self._get_session(id)
+        from snr.app.saveatom import AppSaveStatusEnum
+        save = self._get_save(session.app)
+        with session.lock:
+            for part in session.parts.values():
+                if not part['done']:
+                    logger.error("{}.save(): {} {} was not pushed by agent".format(
+                        session.save_atom.app_log_prefix(), part['type'], part['name']
+                    ))
+                    save.ingest_part(session.save_atom, part['type'], part['name'], None, 0)
+                    part['done'] = True
+            save_atom = save.finish_ingest(session.save_atom, AppSaveStatusEnum.FULL, session.start)
+            shutil.rmtree(session.folder, ignore_errors=True)
+        response = {'date': save_atom.date, 'status': save_atom.status.value}
+        with self._lock:
+            self._sessions.pop(id, None)
+            self._finished[id] = response
+            while len(self._finished) > Ingest.C_FINISHED:
+                self._finished.popitem(last=False)
+        return response
@@ -0,0 +1,470 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        journal
+# Purpose:     Persistent run journal
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import json
+import time
+import logging
+from collections import deque
+from threading import Lock
+
+from snr.config import Config
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import JournalConf
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Persistent run journal. Each save part (database dump or file archive) is recorded with its duration, size and
+    throughput in a JSON lines file configured through yaml config file via journal key.
+    Recent history is kept in memory to estimate part durations.
+    """
+
+    C_YAML = """
+journal:
+  path: /var/lib/snr/journal.jsonl
+  # number of runs per part used to estimate durations
+  history: 10
+"""
+
+    cache = dict()
+    C_JOURNAL = 'journal'
+    C_PATH = 'path'
+    C_HISTORY = 'history'
+    C_OPT_KEYS = {C_PATH, C_HISTORY}
+    C_DEFAULT_PATH = '/var/lib/snr/journal.jsonl'
+    C_DEFAULT_HISTORY = 10
+
+    E_EVENT = 'event'
+    E_PART = 'part'
+    E_SAVE = 'save'
+    E_OVERLAP = 'overlap'
+    E_RETENTION = 'retention'
+    E_TIERING = 'tiering'
+
+    R_APP = 'app'
+    R_TYPE = 'type'
+    R_NAME = 'name'
+    R_DATE = 'date'
+    R_TIME = 'time'
+    R_DURATION = 'duration'
+    R_BYTES = 'bytes'
+    R_ORIGINAL_BYTES = 'original_bytes'
+    R_THROUGHPUT = 'throughput'
+    R_STATUS = 'status'
+    R_POLICY = 'policy'
+    R_ACTION = 'action'
+    R_PATH = 'path'
+    R_FILES = 'files'
+    R_DESTINATION = 'destination'
+
+    def __init__(self, path=None, history=C_DEFAULT_HISTORY):
+        """
+        Should not be used directly. See get_instance().
+        :param path: journal file path. Journal is kept in memory only if None
+        :type path: Union[str|None]
+        :param history: number of records per part kept in memory
+        :type history: int
+        """
+        self._path = path
+        self._history = history
+        self._lock = Lock()
+        self._parts = dict()
+        self._saves = dict()
+        self._listeners = list()
+        if self._path:
+            self._load()
+
+    @property
+    def path(self):
+        return self._path
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate journal section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, defaults if section is missing
+        :rtype: JournalConf
+        :raise: TypeError on configuration error
+        """
+        path = Journal.C_DEFAULT_PATH
+        history = Journal.C_DEFAULT_HISTORY
+        if Journal.C_JOURNAL in config.data.keys() and config.data[Journal.C_JOURNAL]:
+            try:
+                YAMLHelper.analyse_keys(
+                    Journal.C_JOURNAL, config.data[Journal.C_JOURNAL], optional_key_set=Journal.C_OPT_KEYS
+                )
+            except TypeError as e:
+                raise TypeError("Journal configuration error : {}".format(e))
+            path = config.data[Journal.C_JOURNAL].get(Journal.C_PATH, path)
+            history = config.data[Journal.C_JOURNAL].get(Journal.C_HISTORY, history)
+        return JournalConf(path, history)
+
+    @staticmethod
+    def get_instance(conf):
+        """
+        Journal class Factory. Instances are cached by 'conf' parameter.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :return: instance of Journal
+        :rtype: Journal
+        """
+        if conf not in Journal.cache.keys():
+            path = Journal.C_DEFAULT_PATH
+            history = Journal.C_DEFAULT_HISTORY
+            try:
+                journal = Config.get_instance(conf).journal
+                path = journal.path
+                history = journal.history
+            except TypeError as e:
+                logger.error("Journal configuration error : {}".format(e))
+            except IOError:
+                logger.error("{} does not exist".format(conf))
+            Journal.cache[conf] = Journal(path, history)
+        return Journal.cache[conf]
+
+    @staticmethod
+    def _part_key(app, part_type, name):
+        return app, part_type, name
+
+    def _index(self, record):
+        """
+        Keep record in memory history
+        :param record: journal record
+        :type record: dict
+        """
+        if record.get(Journal.E_EVENT) == Journal.E_PART:
+            key = Journal._part_key(record[Journal.R_APP], record[Journal.R_TYPE], record[Journal.R_NAME])
+            if key not in self._parts:
+                self._parts[key] = deque(maxlen=self._history)
+            self._parts[key].append(record)
+        elif record.get(Journal.E_EVENT) == Journal.E_SAVE:
+            if record[Journal.R_APP] not in self._saves:
+                self._saves[record[Journal.R_APP]] = deque(maxlen=self._history)
+            self._saves[record[Journal.R_APP]].append(record)
+
+    def _load(self):
+        """
+        Load journal file in memory
+        """
+        if not os.path.exists(self._path):
+            return
+        try:
+            for record in Journal.read(self._path):
+                self._index(record)
+        except PermissionError as e:
+            logger.warning("Cannot read journal {} : {}".format(self._path, e))
+
+    @staticmethod
+    def read(path):
+        """
+        Iterate over journal records. Corrupted lines are skipped.
+        :param path: journal file path
+        :type path: str
+        :rtype: generator
+        """
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping corrupted journal line {}".format(line))
+
+    def _write(self, record):
+        if not self._path:
+            return
+        try:
+            folder = os.path.split(self._path)[0]
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(self._path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        except (PermissionError, IOError) as e:
+            logger.warning("Cannot write journal {}, keeping it in memory only : {}".format(self._path, e))
+            self._path = None
+
+    def append(self, record):
+        """
+        Append a raw record to journal
+        :param record: journal record. Must contain an 'event' key
+        :type record: dict
+        """
+        record.setdefault(Journal.R_TIME, time.time())
+        with self._lock:
+            self._index(record)
+            self._write(record)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                logger.error("Journal listener {} failed : {}".format(listener, e))
+
+    def add_listener(self, listener):
+        """
+        Register a callable called with every record appended to journal
+        :param listener: callable taking a record dict
+        :type listener: callable
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Unregister a listener registered with add_listener()
+        :param listener: registered callable
+        :type listener: callable
+        """
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def record_part(self, app, part_type, name, date, duration, size, original_size=None, status=True, **extra):
+        """
+        Record a save part run
+        :param app: app name
+        :type app: str
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :param date: save date, see App.C_DATE_FORMAT
+        :type date: str
+        :param duration: part duration in seconds
+        :type duration: float
+        :param size: compressed size in bytes
+        :type size: Union[int|None]
+        :param original_size: Optional. Uncompressed size in bytes
+        :type original_size: Union[int|None]
+        :param status: True if part succeeded
+        :type status: bool
+        :param extra: any additional value to record
+        """
+        throughput = None
+        if duration and duration > 0:
+            throughput = round((original_size if original_size else size or 0) / duration)
+        record = {
+            Journal.E_EVENT: Journal.E_PART,
+            Journal.R_APP: app,
+            Journal.R_TYPE: part_type,
+            Journal.R_NAME: name,
+            Journal.R_DATE: date,
+            Journal.R_DURATION: duration,
+            Journal.R_BYTES: size,
+            Journal.R_ORIGINAL_BYTES: original_size,
+            Journal.R_THROUGHPUT: throughput,
+            Journal.R_STATUS: status
+        }
+        record.update(extra)
+        self.append(record)
+
+    def record_save(self, app, date, duration, status, **extra):
+        """
+        Record a whole app save run
+        :param app: app name
+        :type app: str
+        :param date: save date, see App.C_DATE_FORMAT
+        :type date: str
+        :param duration: save duration in seconds
+        :type duration: float
+        :param status: AppSaveStatusEnum value
+        :type status: str
+        :param extra: any additional value to record
+        """
+        record = {
+            Journal.E_EVENT: Journal.E_SAVE,
+            Journal.R_APP: app,
+            Journal.R_DATE: date,
+            Journal.R_DURATION: duration,
+            Journal.R_STATUS: status
+        }
+        record.update(extra)
+        self.append(record)
+
+    def record_overlap(self, app, policy, action):
+        """
+        Record a save trigger fired while a save of the same app was running
+        :param app: app name
+        :type app: str
+        :param policy: overlap policy applied
+        :type policy: str
+        :param action: what has been done with the trigger (skipped, queued, coalesced)
+        :type action: str
+        """
+        self.append(
+            {
+                Journal.E_EVENT: Journal.E_OVERLAP,
+                Journal.R_APP: app,
+                Journal.R_POLICY: policy,
+                Journal.R_ACTION: action
+            }
+        )
+
+    def record_retention(self, app, path, files, size, duration):
+        """
+        Record a retention run
+        :param app: app name
+        :type app: str
+        :param path: root path retention ran on
+        :type path: str
+        :param files: number of deleted files
+        :type files: int
+        :param size: reclaimed bytes
+        :type size: int
+        :param duration: retention duration in seconds
+        :type duration: float
+        """
+        self.append(
+            {
+                Journal.E_EVENT: Journal.E_RETENTION,
+                Journal.R_APP: app,
+                Journal.R_PATH: path,
+                Journal.R_FILES: files,
+                Journal.R_BYTES: size,
+                Journal.R_DURATION: duration
+            }
+        )
+
+    def record_tiering(self, path, destination, original_size, size, duration):
+        """
+        Record a save moved to another storage tier
+        :param path: save file path on first tier
+        :type path: str
+        :param destination: save file path on second tier
+        :type destination: str
+        :param original_size: save file size before recompression, in bytes
+        :type original_size: int
+        :param size: recompressed save file size, in bytes
+        :type size: int
+        :param duration: move duration in seconds
+        :type duration: float
+        """
+        self.append(
+            {
+                Journal.E_EVENT: Journal.E_TIERING,
+                Journal.R_PATH: path,
+                Journal.R_DESTINATION: destination,
+                Journal.R_ORIGINAL_BYTES: original_size,
+                Journal.R_BYTES: size,
+                Journal.R_DURATION: duration
+            }
+        )
+
+    @staticmethod
+    def _median(values):
+        values = sorted(values)
+        if len(values) == 0:
+            return None
+        middle = len(values) // 2
+        if len(values) % 2:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2
+
+    def _estimate(self, app, part_type, name, field):
+        with self._lock:
+            records = list(self._parts.get(Journal._part_key(app, part_type, name), list()))
+        return Journal._median(
+            [r[field] for r in records if r.get(Journal.R_STATUS) and r.get(field) is not None]
+        )
+
+    def estimate_duration(self, app, part_type, name):
+        """
+        Estimate part duration from successful runs history
+        :return: median duration in seconds, None if part never ran
+        :rtype: Union[float|None]
+        """
+        return self._estimate(app, part_type, name, Journal.R_DURATION)
+
+    def estimate_size(self, app, part_type, name):
+        """
+        Estimate part compressed size from successful runs history
+        :return: median size in bytes, None if part never ran
+        :rtype: Union[float|None]
+        """
+        return self._estimate(app, part_type, name, Journal.R_BYTES)
+
+    def estimate_original_size(self, app, part_type, name):
+        """
+        Estimate part source size from successful runs history
+        :return: median uncompressed size in bytes, None if unknown
+        :rtype: Union[float|None]
+        """
+        return self._estimate(app, part_type, name, Journal.R_ORIGINAL_BYTES)
+
+    def get_part_history(self, app, part_type, name):
+        """
+        :return: in memory history of a part, oldest first
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._parts.get(Journal._part_key(app, part_type, name), list()))
+
+    def get_save_history(self, app):
+        """
+        :return: in memory history of app saves, oldest first
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._saves.get(app, list()))
+
+    def get_save_histories(self):
+        """
+        :return: in memory history of saves by app name, oldest first
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((app, list(records)) for app, records in self._saves.items())
+
+    @staticmethod
+    def schedule_makespan(durations, workers=None):
+        """
+        Simulate longest processing time first scheduling of durations on workers.
+        :param durations: list of durations in seconds
+        :type durations: list
+        :param workers: number of parallel workers. Unlimited if None or 0
+        :type workers: Union[int|None]
+        :return: time needed to run all durations
+        :rtype: float
+        """
+        if len(durations) == 0:
+            return 0
+        if not workers or workers >= len(durations):
+            return max(durations)
+        loads = [0] * workers
+        for duration in sorted(durations, reverse=True):
+            i = loads.index(min(loads))
+            loads[i] += duration
+        return max(loads)
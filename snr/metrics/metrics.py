@@ -0,0 +1,330 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        metrics
+# Purpose:     Prometheus metrics endpoint
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread, Lock
+
+from snr.config import Config
+from snr.journal import Journal
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import MetricsConf
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves metrics in Prometheus text format on any GET request
+    """
+
+    def do_GET(self):
+        body = Metrics.instance.render().encode() if Metrics.instance is not None else b''
+        self.send_response(200)
+        self.send_header('Content-Type', Metrics.C_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("{} - {}".format(self.address_string(), format % args))
+
+
+class Metrics:
+    """
+    Prometheus metrics endpoint of the daemon, configured through yaml config file via metrics key.
+    Histograms and counters are fed by run journal records, see Journal.add_listener(). Running and queued jobs are
+    read from saves when metrics are scraped.
+    """
+
+    C_YAML = """
+# Prometheus metrics HTTP endpoint, in daemon mode
+#metrics:
+#  address: 127.0.0.1
+#  port: 9713
+"""
+
+    instance = None
+
+    C_METRICS = 'metrics'
+    C_ADDRESS = 'address'
+    C_PORT = 'port'
+    C_KEYS = {C_PORT}
+    C_OPT_KEYS = {C_ADDRESS}
+    C_DEFAULT_ADDRESS = '127.0.0.1'
+    C_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    C_PREFIX = 'snr'
+
+    C_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400, 28800, 86400)
+    C_SIZE_BUCKETS = tuple(1024 ** 2 * 4 ** i for i in range(11))
+    C_THROUGHPUT_BUCKETS = tuple(1024 ** 2 * 2 ** i for i in range(12))
+    C_RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
+
+    # name -> (type, help, buckets)
+    C_FAMILIES = {
+        'part_duration_seconds': ('histogram', 'Save part duration', C_DURATION_BUCKETS),
+        'part_input_bytes': ('histogram', 'Save part uncompressed size', C_SIZE_BUCKETS),
+        'part_output_bytes': ('histogram', 'Save part compressed size', C_SIZE_BUCKETS),
+        'part_throughput_bytes_per_second': ('histogram', 'Save part uncompressed bytes per second',
+                                             C_THROUGHPUT_BUCKETS),
+        'part_compression_ratio': ('histogram', 'Save part compressed size / uncompressed size', C_RATIO_BUCKETS),
+        'part_runs_total': ('counter', 'Save part runs', None),
+        'save_duration_seconds': ('histogram', 'App save duration', C_DURATION_BUCKETS),
+        'save_runs_total': ('counter', 'App save runs', None),
+        'save_last_success_timestamp_seconds': ('gauge', 'End time of last full save', None),
+        'save_last_run_timestamp_seconds': ('gauge', 'End time of last save', None),
+        'save_overlaps_total': ('counter', 'Save triggers fired while a save was running', None),
+        'retention_deleted_files_total': ('counter', 'Save files deleted by retention', None),
+        'retention_deleted_bytes_total': ('counter', 'Bytes reclaimed by retention', None),
+        'tiering_moved_files_total': ('counter', 'Save files moved to second storage tier', None),
+        'tiering_reclaimed_bytes_total': ('counter', 'Bytes reclaimed by recompression of tiered saves', None),
+        'saves_running': ('gauge', 'Running app saves', None),
+        'saves_queued': ('gauge', 'App saves queued by overlap policy', None),
+        'parts_running': ('gauge', 'Running save parts', None),
+        'parts_queued': ('gauge', 'Save parts waiting for a worker', None),
+        'retention_queued': ('gauge', 'Retention requests waiting for the background sweeper', None),
+    }
+
+    def __init__(self, conf, address, port):
+        """
+        Should not be used directly. See start_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param address: listen address
+        :type address: str
+        :param port: listen port
+        :type port: int
+        """
+        self._conf = conf
+        self._lock = Lock()
+        # name -> {labels: value} for counters and gauges, {labels: [bucket counts, sum, count]} for histograms
+        self._values = dict((name, dict()) for name in Metrics.C_FAMILIES)
+        self._server = MetricsServer((address, port), MetricsHandler)
+        self._thread = Thread(target=self._server.serve_forever, name=Metrics.C_METRICS, daemon=True)
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate metrics section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, None if metrics are not configured
+        :rtype: Union[MetricsConf|None]
+        :raise: TypeError on configuration error
+        """
+        if Metrics.C_METRICS not in config.data.keys() or not config.data[Metrics.C_METRICS]:
+            return None
+        metrics = config.data[Metrics.C_METRICS]
+        try:
+            YAMLHelper.analyse_keys(Metrics.C_METRICS, metrics, Metrics.C_KEYS, Metrics.C_OPT_KEYS)
+            port = metrics[Metrics.C_PORT]
+            if not isinstance(port, int) or not 0 < port < 65536:
+                raise TypeError("{} should be an integer between 1 and 65535".format(Metrics.C_PORT))
+        except TypeError as e:
+            raise TypeError("Metrics configuration error : {}".format(e))
+        return MetricsConf(str(metrics.get(Metrics.C_ADDRESS, Metrics.C_DEFAULT_ADDRESS)), port)
+
+    @staticmethod
+    def start_instance(conf):
+        """
+        Start metrics endpoint if configured. Journal records are then turned into metrics.
+        :param conf: yaml file path
+        :type conf: str
+        :return: started instance, None if metrics are not configured or endpoint can't be started
+        :rtype: Union[Metrics|None]
+        """
+        metrics = Config.get_instance(conf).metrics
+        if metrics is None:
+            return None
+        try:
+            Metrics.instance = Metrics(conf, metrics.address, metrics.port)
+        except OSError as e:
+            logger.error("Cannot start metrics endpoint on {}:{} : {}".format(metrics.address, metrics.port, e))
+            return None
+        journal = Journal.get_instance(conf)
+        Metrics.instance.load(journal)
+        journal.add_listener(Metrics.instance.observe)
+        Metrics.instance._thread.start()
+        logger.info("Serving metrics on http://{}:{}/metrics".format(metrics.address, metrics.port))
+        return Metrics.instance
+
+    @staticmethod
+    def stop_instance():
+        """
+        Stop metrics endpoint
+        """
+        if Metrics.instance is not None:
+            metrics = Metrics.instance
+            Metrics.instance = None
+            Journal.get_instance(metrics._conf).remove_listener(metrics.observe)
+            metrics._server.shutdown()
+            metrics._server.server_close()
+
+    def load(self, journal):
+        """
+        Restore last save timestamps from journal history, so that they survive daemon restarts
+        :param journal: run journal
+        :type journal: Journal
+        """
+        from snr.app.saveatom import AppSaveStatusEnum
+        for app, records in journal.get_save_histories().items():
+            for record in records:
+                self._set('save_last_run_timestamp_seconds', {'app': app}, record[Journal.R_TIME])
+                if record.get(Journal.R_STATUS) == AppSaveStatusEnum.FULL.value:
+                    self._set('save_last_success_timestamp_seconds', {'app': app}, record[Journal.R_TIME])
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def _set(self, name, labels, value):
+        with self._lock:
+            self._values[name][Metrics._key(labels)] = value
+
+    def _inc(self, name, labels, value=1):
+        with self._lock:
+            key = Metrics._key(labels)
+            self._values[name][key] = self._values[name].get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        if value is None:
+            return
+        buckets = Metrics.C_FAMILIES[name][2]
+        with self._lock:
+            key = Metrics._key(labels)
+            if key not in self._values[name]:
+                self._values[name][key] = [[0] * len(buckets), 0, 0]
+            histogram = self._values[name][key]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def observe(self, record):
+        """
+        Update metrics from a journal record
+        :param record: journal record
+        :type record: dict
+        """
+        from snr.app.saveatom import AppSaveStatusEnum
+        event = record.get(Journal.E_EVENT)
+        app = {'app': record.get(Journal.R_APP) or ''}
+        if event == Journal.E_PART:
+            labels = dict(app, type=record[Journal.R_TYPE], part=record[Journal.R_NAME])
+            status = 'success' if record.get(Journal.R_STATUS) else 'failure'
+            self._inc('part_runs_total', dict(labels, status=status))
+            if not record.get(Journal.R_STATUS):
+                return
+            size = record.get(Journal.R_BYTES)
+            original_size = record.get(Journal.R_ORIGINAL_BYTES)
+            self._observe('part_duration_seconds', labels, record.get(Journal.R_DURATION))
+            self._observe('part_output_bytes', labels, size)
+            self._observe('part_input_bytes', labels, original_size)
+            self._observe('part_throughput_bytes_per_second', labels, record.get(Journal.R_THROUGHPUT))
+            if size is not None and original_size:
+                self._observe('part_compression_ratio', labels, size / original_size)
+        elif event == Journal.E_SAVE:
+            self._inc('save_runs_total', dict(app, status=record.get(Journal.R_STATUS)))
+            self._observe('save_duration_seconds', app, record.get(Journal.R_DURATION))
+            self._set('save_last_run_timestamp_seconds', app, record[Journal.R_TIME])
+            if record.get(Journal.R_STATUS) == AppSaveStatusEnum.FULL.value:
+                self._set('save_last_success_timestamp_seconds', app, record[Journal.R_TIME])
+        elif event == Journal.E_OVERLAP:
+            self._inc('save_overlaps_total', dict(app, action=record.get(Journal.R_ACTION)))
+        elif event == Journal.E_RETENTION:
+            self._inc('retention_deleted_files_total', app, record.get(Journal.R_FILES) or 0)
+            self._inc('retention_deleted_bytes_total', app, record.get(Journal.R_BYTES) or 0)
+        elif event == Journal.E_TIERING:
+            self._inc('tiering_moved_files_total', {})
+            self._inc(
+                'tiering_reclaimed_bytes_total', {},
+                (record.get(Journal.R_ORIGINAL_BYTES) or 0) - (record.get(Journal.R_BYTES) or 0)
+            )
+
+    def _collect(self):
+        """
+        Read running and queued jobs from saves
+        """
+        from snr.save import Save
+        from snr.retention import RetentionSweeper
+        for name, save in Save.cache.get(self._conf, dict()).items():
+            app = {'app': name}
+            self._set('saves_running', app, int(save.running))
+            self._set('saves_queued', app, int(save.pending))
+            self._set('parts_running', app, save.app.running_parts)
+            self._set('parts_queued', app, save.app.queued_parts)
+        sweeper = RetentionSweeper.instance
+        self._set('retention_queued', {}, sweeper.pending if sweeper is not None else 0)
+
+    @staticmethod
+    def _format_labels(labels, extra=None):
+        labels = list(labels) + ([extra] if extra is not None else [])
+        if len(labels) == 0:
+            return ''
+        return '{' + ','.join(
+            '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in labels
+        ) + '}'
+
+    def render(self):
+        """
+        :return: metrics in Prometheus text format
+        :rtype: str
+        """
+        self._collect()
+        lines = list()
+        with self._lock:
+            for name, (kind, description, buckets) in Metrics.C_FAMILIES.items():
+                full_name = '{}_{}'.format(Metrics.C_PREFIX, name)
+                lines.append('# HELP {} {}'.format(full_name, description))
+                lines.append('# TYPE {} {}'.format(full_name, kind))
+                for labels, value in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append('{}{} {}'.format(full_name, Metrics._format_labels(labels), value))
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket in zip(buckets, counts):
+                        cumulative += bucket
+                        lines.append('{}_bucket{} {}'.format(
+                            full_name, Metrics._format_labels(labels, ('le', bound)), cumulative
+                        ))
+                    lines.append('{}_bucket{} {}'.format(
+                        full_name, Metrics._format_labels(labels, ('le', '+Inf')), count
+                    ))
+                    lines.append('{}_sum{} {}'.format(full_name, Metrics._format_labels(labels), total))
+                    lines.append('{}_count{} {}'.format(full_name, Metrics._format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,187 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        profiler
+# Purpose:     cProfile based profiling of runs
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import io
+import os
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from datetime import datetime
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """
+    Profiles a run with cProfile: the calling thread and every thread started while profiling get their own profile.
+    On stop, profiles are merged in a pstats dump, which can be read with python -m pstats or snakeviz, and a per
+    thread wall-clock summary is written next to it.
+    Threads started before profiling are not profiled. Threads still running on stop keep profiling until they end,
+    only what they did until stop is reported.
+    """
+
+    C_EXTENSION = '.prof'
+    C_SUMMARY_EXTENSION = '.txt'
+    C_TOP_FUNCTIONS = 5
+    C_TOP_CUMULATIVE = 40
+
+    def __init__(self, path):
+        """
+        :param path: pstats dump path. Summary is written in path + C_SUMMARY_EXTENSION
+        :type path: str
+        """
+        self._path = path
+        self._lock = Lock()
+        # (thread name, profile, start time)
+        self._threads = list()
+        self._start = None
+        self._end = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @staticmethod
+    def get_default_path(folder=None, name='snr'):
+        """
+        :param folder: Optional. dump folder, current directory per default
+        :type folder: Union[str|None]
+        :param name: Optional. dump name prefix
+        :type name: str
+        :return: dated pstats dump path
+        :rtype: str
+        """
+        return os.path.join(folder or os.getcwd(), "{}-{}-{}{}".format(
+            name, datetime.today().strftime('%Y-%m-%d-%H%M%S'), os.getpid(), Profiler.C_EXTENSION
+        ))
+
+    def _profile_thread(self, frame, event, arg):
+        # called once per new thread by threading.setprofile(), cProfile then replaces this hook
+        profile = cProfile.Profile()
+        with self._lock:
+            if self._end is not None:
+                return
+            self._threads.append((threading.current_thread().name, profile, time.time()))
+        try:
+            profile.enable()
+        except ValueError as e:
+            # single profiler per process on some python versions
+            logger.debug("Cannot profile thread {} : {}".format(threading.current_thread().name, e))
+
+    def start(self):
+        """
+        Start profiling calling thread and threads started from now on
+        :rtype: Profiler
+        """
+        self._start = time.time()
+        profile = cProfile.Profile()
+        self._threads.append((threading.current_thread().name, profile, self._start))
+        threading.setprofile(self._profile_thread)
+        profile.enable()
+        logger.info("Profiling started, dump will be written in {}".format(self._path))
+        return self
+
+    def stop(self):
+        """
+        Stop profiling, write pstats dump and per thread summary
+        :return: per thread summary
+        :rtype: str
+        """
+        threading.setprofile(None)
+        with self._lock:
+            self._end = time.time()
+            threads = list(self._threads)
+        # calling thread profile
+        threads[0][1].disable()
+        merged = pstats.Stats(stream=io.StringIO())
+        rows = list()
+        for name, profile, start in threads:
+            try:
+                stats = pstats.Stats(profile, stream=io.StringIO())
+            except TypeError:
+                # thread did not run anything profiled
+                continue
+            # thread wall-clock is the cumulative time of its outermost call
+            wall = self._end - start if profile is threads[0][1] else max(
+                (cumulative for _, _, _, cumulative, _ in stats.stats.values()), default=0
+            )
+            rows.append((name, wall, stats))
+            merged.add(stats)
+
+        summary = self._format_summary(rows, merged)
+        try:
+            folder = os.path.split(self._path)[0]
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            merged.dump_stats(self._path)
+            with open(self._path + Profiler.C_SUMMARY_EXTENSION, 'w') as f:
+                f.write(summary)
+            logger.info("Profile written in {}, summary in {}{}".format(
+                self._path, self._path, Profiler.C_SUMMARY_EXTENSION
+            ))
+        except (PermissionError, IOError) as e:
+            logger.error("Cannot write profile {} : {}".format(self._path, e))
+        return summary
+
+    @staticmethod
+    def _format_function(function):
+        file, line, name = function
+        return "{}:{}({})".format(os.path.basename(file), line, name) if line else name
+
+    def _format_summary(self, rows, merged):
+        """
+        :param rows: (thread name, wall-clock seconds, pstats.Stats) tuples
+        :type rows: list
+        :param merged: merged stats of all threads
+        :type merged: pstats.Stats
+        :rtype: str
+        """
+        lines = [
+            "Profiled {}s wall-clock, {} thread(s)".format(round(self._end - self._start, 3), len(rows)),
+            "",
+            "{:<32} {:>12} {:>12} {:>10}  {}".format(
+                'thread', 'wall-clock', 'profiled', 'calls', 'top functions by own time'
+            )
+        ]
+        for name, wall, stats in sorted(rows, key=lambda row: row[1], reverse=True):
+            top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:Profiler.C_TOP_FUNCTIONS]
+            lines.append("{:<32} {:>11.3f}s {:>11.3f}s {:>10}  {}".format(
+                name[:32], wall, stats.total_tt, stats.total_calls, ", ".join(
+                    "{} {}s".format(Profiler._format_function(function), round(values[2], 3))
+                    for function, values in top
+                )
+            ))
+        out = io.StringIO()
+        merged.stream = out
+        merged.sort_stats('cumulative').print_stats(Profiler.C_TOP_CUMULATIVE)
+        lines.extend(["", out.getvalue()])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,461 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        progress
+# Purpose:     Live progress of save parts
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import json
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from threading import Thread, Event, Lock, local
+
+from snr.units import Units
+
+logger = logging.getLogger(__name__)
+
+
+class Progress:
+    """
+    Live progress of a save part : bytes read from source, bytes written to destination, current rate and ETA.
+    Source bytes are read from /proc/<pid>/io counters of source processes : bytes read by file archivers, bytes
+    produced by database dumps. ETA comes from expected source size, or from estimated duration when size is unknown.
+    Parts are listed while being tracked, see track() and snapshots(), and can be cancelled, see cancel().
+    """
+
+    _context = local()
+    _running = list()
+    _lock = Lock()
+
+    # source process counters, see /proc/<pid>/io
+    C_READ = 'rchar'
+    C_WRITTEN = 'wchar'
+    # seconds of samples current rate is computed from
+    C_RATE_WINDOW = 10
+
+    def __init__(self, app, part_type, name, expected_bytes=None, estimate=None):
+        """
+        Should not be used directly. See track().
+        :param app: app name
+        :type app: str
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :param expected_bytes: Optional. expected source bytes, unknown per default
+        :type expected_bytes: Union[int|None]
+        :param estimate: Optional. estimated duration in seconds, unknown per default
+        :type estimate: Union[float|None]
+        """
+        self._app = app
+        self._part_type = part_type
+        self._name = name
+        self._expected_bytes = expected_bytes
+        self._estimate = estimate
+        self._start = time.time()
+        self._lock = Lock()
+        # [process, counter, last known value]
+        self._sources = list()
+        self._processes = list()
+        self._cancelled = False
+        self._destination = None
+        # bytes read and written reported by a worker, see report()
+        self._reported = (0, None)
+        self._samples = deque()
+
+    @staticmethod
+    def current():
+        """
+        :return: progress of part saved by this thread, None if none
+        :rtype: Union[Progress|None]
+        """
+        return getattr(Progress._context, 'progress', None)
+
+    @staticmethod
+    @contextmanager
+    def track(app, part_type, name, expected_bytes=None, estimate=None):
+        """
+        Track progress of a part saved by this thread until exit
+        :rtype: Progress
+        """
+        progress = Progress(app, part_type, name, expected_bytes, estimate)
+        Progress._context.progress = progress
+        with Progress._lock:
+            Progress._running.append(progress)
+        try:
+            yield progress
+        finally:
+            with Progress._lock:
+                Progress._running.remove(progress)
+            Progress._context.progress = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @staticmethod
+    def add_process(process):
+        """
+        Attach a process to part saved by this thread, if tracked, so that it is terminated when part is cancelled
+        :param process: started process
+        :type process: subprocess.Popen
+        """
+        progress = Progress.current()
+        if progress is not None:
+            with progress._lock:
+                progress._processes.append(process)
+                cancelled = progress._cancelled
+            if cancelled:
+                process.terminate()
+
+    def cancel(self):
+        """
+        Terminate processes of this part. Processes started afterwards are terminated at once.
+        """
+        with self._lock:
+            self._cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            if process.returncode is None:
+                try:
+                    process.terminate()
+                except ProcessLookupError:
+                    pass
+
+    @staticmethod
+    def cancel_parts(app, part_type=None, name=None):
+        """
+        Cancel parts being saved
+        :param app: app name
+        :type app: str
+        :param part_type: Optional. SaveAtom.DATABASE or SaveAtom.FILE, any per default
+        :type part_type: Union[str|None]
+        :param name: Optional. part name, all parts of app per default
+        :type name: Union[str|None]
+        :return: cancelled parts, as (type, name) tuples
+        :rtype: list
+        """
+        with Progress._lock:
+            running = [
+                progress for progress in Progress._running if progress._app == app
+                and (part_type is None or progress._part_type == part_type) and (name is None or progress._name == name)
+            ]
+        for progress in running:
+            logger.warning("{}: cancelling {} {}".format(app, progress._part_type, progress._name))
+            progress.cancel()
+        return [(progress._part_type, progress._name) for progress in running]
+
+    @staticmethod
+    def add_source(process, counter=C_READ):
+        """
+        Count bytes of a source process in progress of part saved by this thread, if tracked
+        :param process: started process
+        :type process: subprocess.Popen
+        :param counter: C_READ for processes reading source, C_WRITTEN for processes producing it (dumps)
+        :type counter: str
+        """
+        progress = Progress.current()
+        if progress is not None:
+            with progress._lock:
+                progress._sources.append([process, counter, 0])
+
+    @staticmethod
+    def set_destination(destination):
+        """
+        Set destination of part saved by this thread, if tracked
+        :param destination: writer with a size property, or path of a local file
+        :type destination: Union[snr.storage.StorageWriter|str]
+        """
+        progress = Progress.current()
+        if progress is not None:
+            progress._destination = destination
+
+    def report(self, read_bytes, written_bytes):
+        """
+        Set bytes read and written so far by a worker saving this part, see snr.worker.Coordinator
+        :type read_bytes: int
+        :type written_bytes: Union[int|None]
+        """
+        with self._lock:
+            self._reported = (read_bytes or 0, written_bytes)
+
+    @staticmethod
+    def _read_counter(pid, counter):
+        """
+        :return: counter value of /proc/<pid>/io, None if process is gone or counter is unreadable
+        :rtype: Union[int|None]
+        """
+        try:
+            with open('/proc/{}/io'.format(pid)) as f:
+                for line in f:
+                    if line.startswith(counter + ':'):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def read_bytes(self):
+        """
+        :return: source bytes processed so far. Exited processes count for their last known value.
+        :rtype: int
+        """
+        with self._lock:
+            for source in self._sources:
+                if source[0].returncode is None:
+                    value = Progress._read_counter(source[0].pid, source[1])
+                    if value is not None:
+                        source[2] = value
+            return sum(source[2] for source in self._sources) + self._reported[0]
+
+    @property
+    def written_bytes(self):
+        """
+        :return: bytes written to destination so far, None if unknown
+        :rtype: Union[int|None]
+        """
+        destination = self._destination
+        if destination is None:
+            return self._reported[1]
+        if isinstance(destination, str):
+            try:
+                return os.stat(destination).st_size
+            except OSError:
+                return None
+        try:
+            return destination.size
+        except (AttributeError, ValueError):
+            return None
+
+    def snapshot(self):
+        """
+        :return: part progress : app, type, name, elapsed seconds, read and written bytes, expected bytes, current
+        rate in bytes per second, done ratio and ETA in seconds. Unknown values are None.
+        :rtype: dict
+        """
+        now = time.time()
+        read = self.read_bytes
+        with self._lock:
+            self._samples.append((now, read))
+            while len(self._samples) > 2 and now - self._samples[0][0] > Progress.C_RATE_WINDOW:
+                self._samples.popleft()
+            first_time, first_read = self._samples[0]
+        rate = (read - first_read) / (now - first_time) if now > first_time else None
+        elapsed = now - self._start
+        done = None
+        eta = None
+        if self._expected_bytes:
+            done = min(read / self._expected_bytes, 1.0)
+            if rate:
+                eta = max(self._expected_bytes - read, 0) / rate
+        if eta is None and self._estimate is not None:
+            eta = max(self._estimate - elapsed, 0)
+        return {
+            'app': self._app,
+            'type': self._part_type,
+            'name': self._name,
+            'elapsed': elapsed,
+            'read_bytes': read,
+            'written_bytes': self.written_bytes,
+            'expected_bytes': self._expected_bytes,
+            'rate': rate,
+            'done': done,
+            'eta': eta
+        }
+
+    @staticmethod
+    def snapshots():
+        """
+        :return: progress of all parts being saved, see snapshot()
+        :rtype: list
+        """
+        with Progress._lock:
+            running = list(Progress._running)
+        return [progress.snapshot() for progress in running]
+
+    @staticmethod
+    def format(snapshot):
+        """
+        :param snapshot: part progress, see snapshot()
+        :type snapshot: dict
+        :return: human readable part progress
+        :rtype: str
+        """
+        read = Units.convert_bytes(snapshot['read_bytes']) or '0B'
+        if snapshot['expected_bytes']:
+            read = "{}/{} ({}%)".format(
+                read, Units.convert_bytes(snapshot['expected_bytes']) or '0B', int(snapshot['done'] * 100)
+            )
+        return "{}: {} {} read {}, wrote {}, {}/s, ETA {}".format(
+            snapshot['app'], snapshot['type'], snapshot['name'], read,
+            Units.convert_bytes(snapshot['written_bytes'] or 0) or '0B',
+            Units.convert_bytes(snapshot['rate'] or 0) or '0B',
+            'unknown' if snapshot['eta'] is None else Units.convert_seconds(round(snapshot['eta']))
+        )
+
+
+class ProgressDisplay:
+    """
+    Live terminal display of parts progress. On a terminal, progress lines are redrawn in place and cleared before
+    each log record of root logger handlers. Otherwise, they are printed every interval.
+    """
+
+    C_INTERVAL = 1
+    C_CLEAR_LINE = '\x1b[2K'
+    C_LINE_UP = '\x1b[1A'
+
+    def __init__(self, stream, interval=C_INTERVAL, source=Progress.snapshots):
+        """
+        :param stream: stream to display progress to
+        :type stream: io.TextIOBase
+        :param interval: seconds between refreshes
+        :type interval: float
+        :param source: Optional. callable returning parts progress, see Progress.snapshot(). Parts being saved by
+        this process per default
+        :type source: callable
+        """
+        self._stream = stream
+        self._interval = interval
+        self._source = source
+        self._tty = stream.isatty()
+        self._lines = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="progress", daemon=True)
+
+    def _clear(self):
+        if self._lines > 0:
+            self._stream.write((ProgressDisplay.C_LINE_UP + ProgressDisplay.C_CLEAR_LINE) * self._lines)
+            self._stream.flush()
+            self._lines = 0
+
+    def filter(self, record):
+        """
+        logging.Filter interface, clearing progress lines before a record is emitted
+        """
+        with self._lock:
+            self._clear()
+        return True
+
+    def _draw(self):
+        try:
+            lines = [Progress.format(snapshot) for snapshot in self._source()]
+        except IOError as e:
+            logger.debug("Cannot get progress : {}".format(e))
+            return
+        with self._lock:
+            if self._tty:
+                self._clear()
+            for line in lines:
+                self._stream.write(line + '\n')
+            self._stream.flush()
+            if self._tty:
+                self._lines = len(lines)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._draw()
+
+    def start(self):
+        if self._tty:
+            for handler in logging.getLogger().handlers:
+                handler.addFilter(self)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if self._tty:
+            for handler in logging.getLogger().handlers:
+                handler.removeFilter(self)
+            with self._lock:
+                self._clear()
+
+
+class ProgressState:
+    """
+    Parts progress written as JSON to a state file every interval, so that it can be queried from another process
+    """
+
+    C_INTERVAL = 1
+
+    def __init__(self, path, interval=C_INTERVAL):
+        """
+        :param path: state file path
+        :type path: str
+        :param interval: seconds between writes
+        :type interval: float
+        """
+        self._path = path
+        self._interval = interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="progress-state", daemon=True)
+
+    @staticmethod
+    def read(path):
+        """
+        :param path: state file path
+        :type path: str
+        :return: state written by a running ProgressState : update time and parts progress
+        :rtype: dict
+        """
+        with open(path) as f:
+            return json.load(f)
+
+    def _write(self, parts):
+        tmp = self._path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'time': time.time(), 'pid': os.getpid(), 'parts': parts}, f, sort_keys=True)
+            os.replace(tmp, self._path)
+        except OSError as e:
+            logger.warning("Cannot write progress state {} : {}".format(self._path, e))
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._write(Progress.snapshots())
+
+    def start(self):
+        try:
+            folder = os.path.dirname(self._path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+        except OSError as e:
+            logger.warning("Cannot write progress state {}, snr progress won't work : {}".format(self._path, e))
+            return
+        self._write(list())
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.ident is None:
+            return
+        self._thread.join()
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
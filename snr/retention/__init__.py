@@ -28,5 +28,7 @@
 #    along with snr.  If not, see <http://www.gnu.org/licenses/>.
 # ------------------------------------------------------------------------------
 from snr.retention.retention import Retention
+from snr.retention.sweeper import RetentionSweeper
+from snr.retention.capacity import Capacity
 
-__all__ = ["Retention"]
+__all__ = ["Retention", "RetentionSweeper", "Capacity"]
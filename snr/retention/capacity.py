@@ -0,0 +1,223 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        capacity
+# Purpose:     Size budgets of save destinations
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import time
+import logging
+
+from snr.retention.retention import Retention
+from snr.units import Units
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import CapacityConf
+
+logger = logging.getLogger(__name__)
+
+
+class Capacity:
+    """
+    Size budget enforcement. A budget applies either to a retention policy (see Retention max_size) or to a
+    destination folder holding saves of several apps (capacity section).
+    Before a save, when saves under a budget plus the projected save size would exceed the budget or the filesystem
+    free space, least valuable saves are evicted following the retention period hierarchy.
+    """
+
+    C_YAML = """
+# size budgets of destination folders shared by several apps. Least valuable saves are evicted before a save
+#capacity:
+#  # size budget of all saves under path, in bytes, with unit (2TB) or as a share of the filesystem (80%)
+#  - path: /data/saves
+#    max_size: 80%
+"""
+
+    C_CAPACITY = 'capacity'
+    C_PATH = 'path'
+    C_MAX_SIZE = 'max_size'
+    C_KEYS = {C_PATH, C_MAX_SIZE}
+    C_PERCENT = '%'
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate capacity section
+        :param config: configuration being compiled
+        :type config: snr.config.Config
+        :return: CapacityConf list, empty if section is missing
+        :rtype: list
+        :raise: TypeError on configuration error
+        """
+        capacity = list()
+        if Capacity.C_CAPACITY not in config.data.keys() or not config.data[Capacity.C_CAPACITY]:
+            return capacity
+        try:
+            for budget in config.data[Capacity.C_CAPACITY]:
+                YAMLHelper.analyse_keys(Capacity.C_CAPACITY, budget, Capacity.C_KEYS)
+                Capacity.check_max_size(budget[Capacity.C_MAX_SIZE])
+                capacity.append(CapacityConf(os.path.abspath(budget[Capacity.C_PATH]), budget[Capacity.C_MAX_SIZE]))
+        except (TypeError, AttributeError) as e:
+            raise TypeError("Capacity configuration error : {}".format(e))
+        return capacity
+
+    @staticmethod
+    def check_max_size(max_size):
+        """
+        :param max_size: size budget, in bytes, with unit (500GB) or as a share of the filesystem (20%)
+        :type max_size: Union[int|str]
+        :raise: TypeError if max_size is invalid
+        """
+        try:
+            if isinstance(max_size, str) and max_size.strip().endswith(Capacity.C_PERCENT):
+                share = float(max_size.strip()[:-1])
+                if not 0 < share <= 100:
+                    raise ValueError("share should be in ]0, 100]")
+            elif Units.parse_size(max_size) <= 0:
+                raise ValueError("size should be positive")
+        except ValueError as e:
+            raise TypeError("Invalid max_size {} : {}".format(max_size, e))
+
+    @staticmethod
+    def _get_statvfs(path):
+        # path may not exist yet before the first save
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return os.statvfs(path)
+
+    @staticmethod
+    def get_limit(path, max_size):
+        """
+        :param path: path budget applies to
+        :type path: str
+        :param max_size: size budget, see check_max_size()
+        :type max_size: Union[int|str]
+        :return: budget in bytes
+        :rtype: int
+        """
+        if isinstance(max_size, str) and max_size.strip().endswith(Capacity.C_PERCENT):
+            stat = Capacity._get_statvfs(path)
+            return int(stat.f_blocks * stat.f_frsize * float(max_size.strip()[:-1]) / 100)
+        return Units.parse_size(max_size)
+
+    @staticmethod
+    def get_free(path):
+        """
+        :param path: path on filesystem
+        :type path: str
+        :return: bytes available to unprivileged users on path filesystem
+        :rtype: int
+        """
+        stat = Capacity._get_statvfs(path)
+        return stat.f_bavail * stat.f_frsize
+
+    @staticmethod
+    def enforce(path, max_size, scopes, needed, log_prefix, locks=None):
+        """
+        Evict saves until needed bytes fit in budget and filesystem free space. Saves of a root path whose lock is
+        taken, by a save, a restore or a tiering move of another app, are counted but not evicted.
+        :param path: path budget applies to
+        :type path: str
+        :param max_size: size budget, see check_max_size()
+        :type max_size: Union[int|str]
+        :param scopes: list of (Retention, root path) holding saves under budget
+        :type scopes: list
+        :param needed: projected size of next save under path, in bytes
+        :type needed: int
+        :param log_prefix: log message prefix
+        :type log_prefix: str
+        :param locks: Optional. SaveLock to take by root path, before evicting saves of other apps
+        :type locks: Union[dict|None]
+        :return: number of deleted files, reclaimed bytes
+        :rtype: tuple
+        """
+        locks = locks or dict()
+        # SaveLock -> True once acquired, False if busy
+        acquired = dict()
+        try:
+            return Capacity._enforce(path, max_size, scopes, needed, log_prefix, locks, acquired)
+        finally:
+            for lock, held in acquired.items():
+                if held:
+                    lock.release()
+
+    @staticmethod
+    def _enforce(path, max_size, scopes, needed, log_prefix, locks, acquired):
+        """
+        See enforce(). Locks acquired are added to acquired.
+        """
+        start = time.time()
+        used = 0
+        candidates = list()
+        for retention, root in scopes:
+            scope_used, scope_candidates = retention.get_eviction_candidates(root)
+            used += scope_used
+            lock = locks.get(root)
+            if lock is not None:
+                if lock not in acquired:
+                    acquired[lock] = lock.acquire()
+                if not acquired[lock]:
+                    logger.info("{}: {} saves are in use, they are not evicted".format(log_prefix, root))
+                    continue
+            candidates.extend(scope_candidates)
+
+        limit = min(Capacity.get_limit(path, max_size), used + Capacity.get_free(path))
+        if used + needed <= limit:
+            logger.debug(
+                "{}: {} budget ok, {} used, {} needed, {} allowed".format(log_prefix, path, used, needed, limit)
+            )
+            return 0, 0
+
+        logger.warning(
+            "{}: Save would not fit in {} budget ({} used, {} needed, {} allowed). Evicting saves".format(
+                log_prefix, path,
+                Units.convert_bytes(used) or '0B', Units.convert_bytes(needed) or '0B',
+                Units.convert_bytes(limit) or '0B'
+            )
+        )
+        # least valuable first across all scopes
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        count = 0
+        reclaimed = 0
+        for _, _, index, file, _ in candidates:
+            if used + needed - reclaimed <= limit:
+                break
+            try:
+                logger.info("{}: Evicting {}".format(log_prefix, file))
+                reclaimed += Retention.remove_file(index, file)
+                count += 1
+            except OSError as e:
+                logger.error("{}: Cannot delete {} : {}".format(log_prefix, file, e))
+
+        if used + needed - reclaimed > limit:
+            logger.error(
+                "{}: Save may not fit in {} budget, nothing left to evict".format(log_prefix, path)
+            )
+        logger.info(
+            "{}: Evicted {} files, reclaimed {} in {}s".format(
+                log_prefix, count, Units.convert_bytes(reclaimed) or '0B', round(time.time() - start, 3)
+            )
+        )
+        return count, reclaimed
@@ -0,0 +1,235 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        index
+# Purpose:     Sorted save file index
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import bisect
+import logging
+from threading import Lock
+
+from snr.app import App
+
+logger = logging.getLogger(__name__)
+
+
+class SaveIndex:
+    """
+    Save files of one directory, sorted by save date. Files may live on several storage tiers, see snr.tiering.
+    Indexes are kept between retention runs and updated incrementally: only new file names are parsed.
+    """
+
+    cache = dict()
+    cache_lock = Lock()
+
+    def __init__(self, path):
+        """
+        Should not be used directly. See get().
+        :param path: directory path
+        :type path: str
+        """
+        self._path = path
+        self._lock = Lock()
+        self._entries = dict()
+        self._dates = list()
+        self._files = list()
+
+    @staticmethod
+    def get(path):
+        """
+        SaveIndex factory. Indexes are cached by path.
+        :param path: directory path
+        :type path: str
+        :rtype: SaveIndex
+        """
+        with SaveIndex.cache_lock:
+            if path not in SaveIndex.cache:
+                SaveIndex.cache[path] = SaveIndex(path)
+            return SaveIndex.cache[path]
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def dates(self):
+        """
+        :return: sorted save dates
+        :rtype: list
+        """
+        return self._dates
+
+    @property
+    def files(self):
+        """
+        :return: save file paths, in the same order as dates
+        :rtype: list
+        """
+        return self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def until(self, date):
+        """
+        Snapshot of this index without files saved after date. The snapshot is not cached nor kept up to date.
+        :param date: newest save date to keep
+        :type date: datetime
+        :rtype: SaveIndex
+        """
+        snapshot = SaveIndex(self._path)
+        with self._lock:
+            i = bisect.bisect_right(self._dates, date)
+            snapshot._dates = self._dates[:i]
+            snapshot._files = self._files[:i]
+            snapshot._entries = dict((file, self._entries[file]) for file in snapshot._files)
+        return snapshot
+
+    @staticmethod
+    def get_extension(file):
+        """
+        :param file: file name
+        :type file: str
+        :return: file extension, including tar extension if any, without leading dot
+        :rtype: str
+        """
+        name, ext = os.path.splitext(file)
+        # get tar extension if any
+        _, tar = os.path.splitext(name)
+        # rebuild full extension and remove leading dot
+        return (tar + ext)[1:]
+
+    def update(self, files, extensions):
+        """
+        Synchronize index with directory content.
+        :param files: file paths found in directory, and in its mirrors on other storage tiers if any
+        :type files: list
+        :param extensions: save file extensions to index
+        :type extensions: set
+        """
+        with self._lock:
+            files = set(file for file in files if SaveIndex.get_extension(file) in extensions)
+            known = set(self._entries.keys())
+            for file in known.difference(files):
+                self._remove(file)
+            for file in files.difference(known):
+                file_date = App.get_file_creation_date(file)
+                if file_date:
+                    try:
+                        self._insert(file, App.get_datetime(file_date))
+                    except ValueError as e:
+                        logger.warning("Ignoring {} : {}".format(file, e))
+
+    def _insert(self, file, date):
+        self._entries[file] = date
+        i = bisect.bisect_right(self._dates, date)
+        self._dates.insert(i, date)
+        self._files.insert(i, file)
+
+    def _remove(self, file):
+        date = self._entries.pop(file)
+        i = bisect.bisect_left(self._dates, date)
+        while self._files[i] != file:
+            i += 1
+        del self._dates[i]
+        del self._files[i]
+
+    def remove(self, file):
+        """
+        Remove a deleted file from index
+        :param file: file path
+        :type file: str
+        """
+        with self._lock:
+            if file in self._entries:
+                self._remove(file)
+
+    @staticmethod
+    def _walk(path, mirror=None):
+        """
+        :param path: root path
+        :type path: str
+        :param mirror: Optional. Root path holding the same tree on another storage tier
+        :type mirror: Union[str|None]
+        :return: file paths by directory under path
+        :rtype: dict
+        """
+        files = dict()
+        for root in (path, mirror):
+            if root is None:
+                continue
+            folders = [root]
+            while len(folders) > 0:
+                folder = folders.pop()
+                # index key is the directory under path
+                key = os.path.normpath(os.path.join(path, os.path.relpath(folder, root)))
+                files.setdefault(key, list())
+                try:
+                    with os.scandir(folder) as it:
+                        for entry in it:
+                            if entry.is_dir(follow_symlinks=False):
+                                folders.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                files[key].append(entry.path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning("Cannot list {} : {}".format(folder, e))
+        return files
+
+    @staticmethod
+    def scan(path, extensions, mirror=None, storage=None):
+        """
+        Walk path and update indexes of all directories containing save files.
+        Symbolic links are ignored.
+        :param path: root path
+        :type path: str
+        :param extensions: save file extensions
+        :type extensions: set
+        :param mirror: Optional. Root path holding the same tree on another storage tier. Files of mirrored
+        directories are indexed along with files of path directories.
+        :type mirror: Union[str|None]
+        :param storage: Optional. Storage holding path, local filesystem per default. Indexes of remote storages are
+        kept apart from local ones.
+        :type storage: Union[snr.storage.Storage|None]
+        :return: non empty indexes by directory
+        :rtype: dict
+        """
+        if storage is None or storage.is_local:
+            files = SaveIndex._walk(path, mirror)
+            prefix = ''
+        else:
+            files = storage.walk(path)
+            prefix = "{}:".format(storage.name)
+
+        indexes = dict()
+        for folder in files.keys():
+            index = SaveIndex.get(prefix + folder)
+            index.update(files[folder], extensions)
+            if len(index) > 0:
+                indexes[folder] = index
+        return indexes
@@ -30,6 +30,7 @@
 
 from datetime import timedelta, datetime, date
 from enum import Enum
+import bisect
 import logging
 
 logger = logging.getLogger(__name__)
@@ -70,10 +71,6 @@ class Period:
             )
         )
 
-    @staticmethod
-    def cache_reset():
-        Period.cache.clear()
-
     @property
     def start(self):
         return self._start
@@ -98,27 +95,24 @@ class Period:
             self._latest
         )
 
-    def get_matching_file(self, file_dict):
+    def get_matching_file(self, index):
         """
-        Select oldest file in the list unless self._latest is set to False
-        :type file_dict: dict
+        Select oldest file in the index unless self._latest is set to True
+        :param index: save files sorted by date
+        :type index: snr.retention.index.SaveIndex
         :rtype: str()
         """
-
-        # http://docs.python.org/3.3/faq/programming.html#is-there-an-equivalent-of-c-s-ternary-operator
-        selected_date = self._end if self._latest else self._start
+        dates = index.dates
         selected_file = ""
 
-        for file in file_dict.keys():
-            file_date = file_dict[file]
-
-            if self._start >= file_date >= self._end:
-                if self._latest and selected_date < file_date:
-                    selected_date = file_date
-                    selected_file = file
-                elif not self._latest and selected_date > file_date:
-                    selected_date = file_date
-                    selected_file = file
+        if self._latest:
+            i = bisect.bisect_right(dates, self._start) - 1
+            if i >= 0 and dates[i] > self._end:
+                selected_file = index.files[i]
+        else:
+            i = bisect.bisect_left(dates, self._end)
+            if i < len(dates) and dates[i] < self._start:
+                selected_file = index.files[i]
 
         if selected_file != "":
             logger.debug("{} Period, keeping {} ".format(self._duration, selected_file))
@@ -152,18 +146,24 @@ class Periods:
             period_start = p_instance.end
             i += 1
 
-    def get_matching_files_list(self, file_dict):
+    def get_matching_files_list(self, index):
         """
-        :param file_dict: file dictionary
-        :type file_dict: dict
+        :param index: save files sorted by date
+        :type index: snr.retention.index.SaveIndex
         :return: matching file list
         :rtype: set
         """
 
         selected_file_list = set()
+        if len(index) == 0:
+            return selected_file_list
 
+        oldest = index.dates[0]
         for p in self._period_list:
-            selected_file = p.get_matching_file(file_dict)
+            # periods go backward in time: none of the remaining ones can match
+            if p.start < oldest:
+                break
+            selected_file = p.get_matching_file(index)
             if selected_file != "":
                 selected_file_list.add(selected_file)
 
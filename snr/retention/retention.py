@@ -31,14 +31,18 @@
 import os
 import logging
 import time
-from datetime import datetime
 from enum import Enum
 
-from snr.app import App
-
 from snr.compression import Compression
-from snr.yamlhelper import YAMLHelper
+from snr.config import Config
+from snr.retention.index import SaveIndex
 from snr.retention.period import PeriodDurationEnum, Periods
+from snr.tiering.tiering import Tiering
+from snr.storage import Storage
+from snr.units import Units
+from snr.tracing import Tracer
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import RetentionConf
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +65,9 @@ retention:
     month: 1
     quarter: 1
     year: 1
+    # size budget of saves under this policy, in bytes, with unit (500GB) or as a share of the filesystem (20%).
+    # Least valuable saves are evicted before a save which would not fit.
+    # max_size: 20%
   - name: file_standard
     days: 1
     week: -1
@@ -76,14 +83,16 @@ retention:
     C_RETENTION_MONTHS = 'month'
     C_RETENTION_QUARTERS = 'quarter'
     C_RETENTION_YEARS = 'year'
+    C_RETENTION_MAX_SIZE = 'max_size'
     C_RETENTION_KEYS = {
         C_RETENTION_NAME,
         C_RETENTION_DAYS, C_RETENTION_WEEKS, C_RETENTION_MONTHS, C_RETENTION_QUARTERS, C_RETENTION_YEARS
     }
+    C_RETENTION_OPT_KEYS = {C_RETENTION_MAX_SIZE}
 
     def __init__(self, name,
                  last_days=5, last_weeks=1, last_months=-1, last_quarters=1, last_years=1,
-                 extensions=None, retention_type=None):
+                 extensions=None, retention_type=None, max_size=None, tiering=None, storage=None):
         self._name = name
         self.last_days = Periods(PeriodDurationEnum.DAY, last_days)
         self.last_weeks = Periods(PeriodDurationEnum.WEEK, last_weeks)
@@ -92,9 +101,46 @@ retention:
         self.last_years = Periods(PeriodDurationEnum.YEAR, last_years)
         self._extensions = extensions
         self._retention_type = retention_type
+        self._max_size = max_size
+        self._tiering = tiering
+        self._storage = storage if storage is not None else Storage.get_local()
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate retention section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: RetentionConf by retention name
+        :rtype: dict
+        :raise: TypeError on configuration error
+        """
+        from snr.retention.capacity import Capacity
+        retentions = dict()
+        try:
+            for retention in Config.get_section(config.data, Retention.C_RETENTION):
+                YAMLHelper.analyse_keys(
+                    Retention.C_RETENTION, retention, Retention.C_RETENTION_KEYS, Retention.C_RETENTION_OPT_KEYS
+                )
+                max_size = retention.get(Retention.C_RETENTION_MAX_SIZE)
+                if max_size is not None:
+                    Capacity.check_max_size(max_size)
+                retention_conf = RetentionConf(
+                    retention[Retention.C_RETENTION_NAME],
+                    retention[Retention.C_RETENTION_DAYS],
+                    retention[Retention.C_RETENTION_WEEKS],
+                    retention[Retention.C_RETENTION_MONTHS],
+                    retention[Retention.C_RETENTION_QUARTERS],
+                    retention[Retention.C_RETENTION_YEARS],
+                    max_size
+                )
+                retentions[retention_conf.name] = retention_conf
+        except TypeError as e:
+            raise TypeError("Cannot initialize retention : {}".format(e))
+        return retentions
 
     @staticmethod
-    def get_instance(conf, name, retention_type):
+    def get_instance(conf, name, retention_type, storage=None):
         """
         Load Retention configuration and return Retention named instance
         :param conf: file path to load
@@ -103,34 +149,31 @@ retention:
         :type name: str
         :param retention_type: indicate whether it takes SaveAtom.databases_root_path or SaveAtom.files_root_path
         :type retention_type: RetentionTypeEnum
+        :param storage: Optional. Storage holding saves, local filesystem per default
+        :type storage: Union[Storage|None]
         :return: Retention instance
         :rtype: Retention
         """
         try:
-            data = YAMLHelper.load(conf)
-            instance = None
-            names = set()
+            retentions = Config.get_instance(conf).retentions
+            if name not in retentions:
+                logger.error("Retention {} does not exist. You must select one of {}".format(name, set(retentions)))
+                return None
+            retention = retentions[name]
             compression = Compression.get_instance(conf)
-            for retention in data[Retention.C_RETENTION]:
-                YAMLHelper.analyse_keys(
-                    Retention.C_RETENTION, retention, Retention.C_RETENTION_KEYS
-                )
-                names.add(retention[Retention.C_RETENTION_NAME])
-
-                if retention[Retention.C_RETENTION_NAME] == name:
-                    instance = Retention(
-                        retention[Retention.C_RETENTION_NAME],
-                        retention[Retention.C_RETENTION_DAYS],
-                        retention[Retention.C_RETENTION_WEEKS],
-                        retention[Retention.C_RETENTION_MONTHS],
-                        retention[Retention.C_RETENTION_QUARTERS],
-                        retention[Retention.C_RETENTION_YEARS],
-                        compression.extensions,
-                        retention_type
-                    )
-            if instance is None:
-                logger.error("Retention {} does not exist. You must select one of {}".format(name, names))
-            return instance
+            return Retention(
+                retention.name,
+                retention.days,
+                retention.week,
+                retention.month,
+                retention.quarter,
+                retention.year,
+                compression.extensions,
+                retention_type,
+                retention.max_size,
+                compression.tiering,
+                storage
+            )
         except IOError:
             logger.error("{} does not exist".format(conf))
         except (TypeError, KeyError) as e:
@@ -145,20 +188,16 @@ retention:
         :rtype: dict
         """
         try:
-            data = YAMLHelper.load(conf)
-
             instances = dict()
-            for retention in data[Retention.C_RETENTION]:
-                YAMLHelper.analyse_keys(
-                    Retention.C_RETENTION, retention, Retention.C_RETENTION_KEYS
-                )
-                instances[retention[Retention.C_RETENTION_NAME]] = Retention(
-                    retention[Retention.C_RETENTION_NAME],
-                    retention[Retention.C_RETENTION_DAYS],
-                    retention[Retention.C_RETENTION_WEEKS],
-                    retention[Retention.C_RETENTION_MONTHS],
-                    retention[Retention.C_RETENTION_QUARTERS],
-                    retention[Retention.C_RETENTION_YEARS],
+            for name, retention in Config.get_instance(conf).retentions.items():
+                instances[name] = Retention(
+                    retention.name,
+                    retention.days,
+                    retention.week,
+                    retention.month,
+                    retention.quarter,
+                    retention.year,
+                    max_size=retention.max_size
                 )
             return instances
 
@@ -167,90 +206,191 @@ retention:
         except (TypeError, KeyError) as e:
             logger.error("Cannot initialize retentions : {}".format(e))
 
-    @staticmethod
-    def _make_file_dict(path, extensions):
+    def _get_file_ranks(self, indexes):
         """
-        Make save file dict along with creation time.
-        :return: wanted files dict
+        Rank files according to the longest period keeping them, from 0 (no period) to 5 (year)
+        :param indexes: save file indexes by directory
+        :type indexes: dict
+        :return: rank by file, files without any period are omitted
         :rtype: dict
         """
-        all_files = dict()
-        for root, _, files in os.walk(path):
-            for file in files:
-                file = os.path.join(root, file)
-                if os.path.isfile(file) and not os.path.islink(file):
-                    name, ext = os.path.splitext(file)
-                    # get tar extension if any
-                    _, tar = os.path.splitext(name)
-                    # rebuild full extension
-                    ext = tar + ext
-                    # remove leading dot
-                    ext = ext[1:]
-                    if ext in extensions:
-                        if root not in all_files:
-                            all_files[root] = dict()
-                        filedate = App.get_file_creation_date(file)
-                        if filedate:
-                            all_files[root][file] = datetime.strptime(filedate, App.C_DATE_FORMAT)
-        return all_files
+        ranks = dict()
+        periods = (self.last_days, self.last_weeks, self.last_months, self.last_quarters, self.last_years)
+        for index in indexes.values():
+            for rank, period in enumerate(periods, start=1):
+                for file in period.get_matching_files_list(index):
+                    ranks[file] = rank
+        return ranks
 
-    def _get_matching_files(self, all_files):
+    def _get_matching_files(self, indexes):
         """
         Make wanted file list
-        :param all_files: dictionary of wanted files
-        :type all_files: dict
+        :param indexes: save file indexes by directory
+        :type indexes: dict
         :return: list of files to keep
         :rtype: set
         """
-        all_wanted_file = set()
-        for path in all_files.keys():
-            all_wanted_file.update(self.last_years.get_matching_files_list(all_files[path]))
-            all_wanted_file.update(self.last_quarters.get_matching_files_list(all_files[path]))
-            all_wanted_file.update(self.last_months.get_matching_files_list(all_files[path]))
-            all_wanted_file.update(self.last_weeks.get_matching_files_list(all_files[path]))
-            all_wanted_file.update(self.last_days.get_matching_files_list(all_files[path]))
+        return set(self._get_file_ranks(indexes).keys())
 
-        return all_wanted_file
+    @property
+    def name(self):
+        return self._name
 
-    @staticmethod
-    def _remove_unwanted_files(files, wanted_files, save_atom):
+    @property
+    def retention_type(self):
+        return self._retention_type
+
+    @property
+    def extensions(self):
+        return self._extensions
+
+    @property
+    def storage(self):
+        return self._storage
+
+    @property
+    def max_size(self):
         """
-        Delete all files not in wanted list
-        :param files: all save files
-        :type files: dict
-        :param wanted_files: files to keep
-        :type wanted_files: set
-        :param save_atom: saveatom to retrieve app_log_prefix
+        :return: size budget, in bytes or as a share of the filesystem (ex: '20%'). None if unlimited
+        :rtype: Union[int|str|None]
+        """
+        return self._max_size
+
+    def get_path(self, save_atom):
+        """
+        :param save_atom: SaveAtom to take root path from
         :type save_atom: SaveAtom
-        :return: number of deleted files
+        :return: SaveAtom.databases_root_path or SaveAtom.files_root_path according to retention_type value
+        :rtype: str
+        """
+        if self._retention_type == RetentionTypeEnum.FILES:
+            return save_atom.files_root_path
+        return save_atom.databases_root_path
+
+    def _scan(self, path):
+        """
+        :param path: root path
+        :type path: str
+        :return: save file indexes by directory, see SaveIndex.scan()
+        :rtype: dict
+        """
+        if self._storage.is_local:
+            return SaveIndex.scan(path, self._extensions, Tiering.get_mirror(self._tiering, path))
+        try:
+            return SaveIndex.scan(path, self._extensions, storage=self._storage)
+        except IOError as e:
+            logger.error("Cannot list {} on {} storage : {}".format(path, self._storage.name, e))
+            return dict()
+
+    @Tracer.traced('retention.scan')
+    def get_unwanted_files(self, path, until=None):
+        """
+        Make list of files to delete under path and its mirror on second storage tier
+        :param path: root path
+        :type path: str
+        :param until: Optional. Only consider files saved up to this date, so that running saves are left untouched
+        :type until: Union[datetime|None]
+        :return: list of (SaveIndex, file path)
+        :rtype: list
+        """
+        indexes = self._scan(path)
+        views = indexes
+        if until is not None:
+            # files of running saves must not take the place of older ones in periods
+            views = dict((key, index.until(until)) for key, index in indexes.items())
+        wanted_files = self._get_matching_files(views)
+        unwanted = list()
+        for key, view in views.items():
+            for file in list(view.files):
+                if file not in wanted_files:
+                    unwanted.append((indexes[key], file))
+        return unwanted
+
+    def get_eviction_candidates(self, path):
+        """
+        List save files under path, least valuable first: files no period keeps, then files kept by days, weeks,
+        months, quarters and years, oldest first. The latest save of each directory is never a candidate.
+        :param path: root path
+        :type path: str
+        :return: used bytes, sorted list of (rank, date, SaveIndex, file path, size). See _get_file_ranks() for rank.
+        :rtype: tuple
         """
-        count = 0
-        for path in files.keys():
-            del_files = set(files[path].keys()).difference(wanted_files)
-            for file in del_files:
-                logger.info("{}: Deleting {}".format(save_atom.app_log_prefix(), file))
-                os.remove(file)
-                count += 1
-        return count
+        indexes = self._scan(path)
+        ranks = self._get_file_ranks(indexes)
+        used = 0
+        candidates = list()
+        for index in indexes.values():
+            files = list(index.files)
+            dates = list(index.dates)
+            for i, file in enumerate(files):
+                try:
+                    size = self._storage.size(file)
+                except OSError:
+                    continue
+                if size is None:
+                    continue
+                used += size
+                if i < len(files) - 1:
+                    candidates.append((ranks.get(file, 0), dates[i], index, file, size))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        return used, candidates
 
+    @staticmethod
+    def remove_file(index, file):
+        """
+        Delete a save file and remove it from its index
+        :param index: index holding file
+        :type index: SaveIndex
+        :param file: file path
+        :type file: str
+        :return: reclaimed bytes
+        :rtype: int
+        """
+        size = os.stat(file).st_size
+        os.remove(file)
+        index.remove(file)
+        return size
+
+    @Tracer.traced('retention.delete')
+    def remove_files(self, files):
+        """
+        Delete save files, in batches when storage allows it, and remove them from their index
+        :param files: list of (SaveIndex, file path)
+        :type files: list
+        :return: reclaimed bytes by deleted file
+        :rtype: dict
+        """
+        indexes = dict((file, index) for index, file in files)
+        sizes = dict((file, self._storage.size(file) or 0) for file in indexes.keys())
+        reclaimed = dict()
+        for file in self._storage.delete(list(indexes.keys())):
+            indexes[file].remove(file)
+            reclaimed[file] = sizes[file]
+        return reclaimed
+
+    @Tracer.traced('retention.run')
     def run(self, save_atom):
         """
         runs retention on specified SaveAtom according to retention_type value
         :param save_atom:
         :type save_atom: SaveAtom
-        :return:
+        :return: number of deleted files, reclaimed bytes
+        :rtype: tuple
         """
         start = time.time()
-        path = save_atom.databases_root_path
-        if self._retention_type == RetentionTypeEnum.FILES:
-            path = save_atom.files_root_path
+        path = self.get_path(save_atom)
 
         logger.info("{}: Starting retention on {}".format(save_atom.app_log_prefix(), path))
-        files = Retention._make_file_dict(path, self._extensions)
-        wanted_files = self._get_matching_files(files)
-        count = Retention._remove_unwanted_files(files, wanted_files, save_atom)
+        unwanted = self.get_unwanted_files(path)
+        for _, file in unwanted:
+            logger.info("{}: Deleting {}".format(save_atom.app_log_prefix(), file))
+        deleted = self.remove_files(unwanted)
+        count = len(deleted)
+        reclaimed = sum(deleted.values())
+        Tracer.annotate(path=path, files=count, bytes=reclaimed)
         logger.info(
-            "{}: Finished retention on {}. Deleted {} files in {}s".format(
-                save_atom.app_log_prefix(), path, count, time.time()-start
+            "{}: Finished retention on {}. Deleted {} files ({}) in {}s".format(
+                save_atom.app_log_prefix(), path, count, Units.convert_bytes(reclaimed) or '0B', time.time()-start
             )
         )
+        return count, reclaimed
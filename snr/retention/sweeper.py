@@ -0,0 +1,362 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        sweeper
+# Purpose:     Background retention sweeper
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from threading import Thread, Lock, Event
+
+from snr.app import App
+from snr.config import Config
+from snr.units import Units
+from snr.tracing import Tracer
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import SweeperConf
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionSweeper(Thread):
+    """
+    Runs retention in background in daemon mode, so that saves are reported done as soon as their parts are written.
+    Retention requests are batched for all apps, then unwanted files are deleted by a pool of workers, with an
+    optional deletion rate limit to spare storage I/O.
+    """
+
+    C_YAML = """
+retention_sweeper:
+  # number of files deleted at the same time
+  workers: 4
+  # deletion rate limit, unlimited per default
+  max_deletes_per_second: 20
+  # seconds to wait for other retention requests before sweeping
+  batch_delay: 10
+"""
+
+    instance = None
+
+    C_SWEEPER = 'retention_sweeper'
+    C_WORKERS = 'workers'
+    C_MAX_DELETES = 'max_deletes_per_second'
+    C_BATCH_DELAY = 'batch_delay'
+    C_OPT_KEYS = {C_WORKERS, C_MAX_DELETES, C_BATCH_DELAY}
+    C_DEFAULT_WORKERS = 4
+    C_DEFAULT_BATCH_DELAY = 10
+
+    def __init__(
+            self, conf, workers=C_DEFAULT_WORKERS, max_deletes_per_second=None, batch_delay=C_DEFAULT_BATCH_DELAY
+    ):
+        """
+        Should not be used directly. See start_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param workers: number of files deleted at the same time
+        :type workers: int
+        :param max_deletes_per_second: Optional. Deletion rate limit
+        :type max_deletes_per_second: Union[float|None]
+        :param batch_delay: seconds to wait for other retention requests before sweeping
+        :type batch_delay: int
+        """
+        super(RetentionSweeper, self).__init__(name=RetentionSweeper.C_SWEEPER)
+        self._conf = conf
+        self._workers = workers
+        self._interval = 1 / max_deletes_per_second if max_deletes_per_second else 0
+        self._batch_delay = batch_delay
+        self._queue = Queue()
+        self._terminate = Event()
+        self._rate_lock = Lock()
+        self._next_delete = 0
+
+    @property
+    def pending(self):
+        """
+        :return: number of retention requests waiting to be swept
+        :rtype: int
+        """
+        return self._queue.qsize()
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate retention sweeper section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, defaults if section is missing
+        :rtype: SweeperConf
+        :raise: TypeError on configuration error
+        """
+        sweeper = dict()
+        if RetentionSweeper.C_SWEEPER in config.data.keys() and config.data[RetentionSweeper.C_SWEEPER]:
+            try:
+                YAMLHelper.analyse_keys(
+                    RetentionSweeper.C_SWEEPER, config.data[RetentionSweeper.C_SWEEPER],
+                    optional_key_set=RetentionSweeper.C_OPT_KEYS
+                )
+            except TypeError as e:
+                raise TypeError("Retention sweeper configuration error : {}".format(e))
+            sweeper = config.data[RetentionSweeper.C_SWEEPER]
+        workers = sweeper.get(RetentionSweeper.C_WORKERS, RetentionSweeper.C_DEFAULT_WORKERS)
+        if not isinstance(workers, int) or workers < 1:
+            raise TypeError(
+                "Retention sweeper configuration error : {} should be a positive integer".format(
+                    RetentionSweeper.C_WORKERS
+                )
+            )
+        return SweeperConf(
+            workers,
+            sweeper.get(RetentionSweeper.C_MAX_DELETES, None),
+            sweeper.get(RetentionSweeper.C_BATCH_DELAY, RetentionSweeper.C_DEFAULT_BATCH_DELAY)
+        )
+
+    @staticmethod
+    def start_instance(conf):
+        """
+        Start background sweeper. Retention.run() calls made through submit() are then run in background.
+        :param conf: yaml file path
+        :type conf: str
+        :rtype: RetentionSweeper
+        """
+        sweeper = Config.get_instance(conf).sweeper
+        RetentionSweeper.instance = RetentionSweeper(
+            conf, sweeper.workers, sweeper.max_deletes_per_second, sweeper.batch_delay
+        )
+        RetentionSweeper.instance.start()
+        return RetentionSweeper.instance
+
+    @staticmethod
+    def stop_instance():
+        """
+        Stop background sweeper once pending retention requests are processed
+        """
+        if RetentionSweeper.instance is not None:
+            sweeper = RetentionSweeper.instance
+            RetentionSweeper.instance = None
+            sweeper.terminate()
+            sweeper.join()
+
+    @staticmethod
+    def submit(retention, save_atom, journal=None):
+        """
+        Run retention in background if sweeper is started, synchronously otherwise
+        :param retention: retention to run
+        :type retention: snr.retention.Retention
+        :param save_atom: SaveAtom retention runs on
+        :type save_atom: SaveAtom
+        :param journal: Optional. Journal recording reclaimed space
+        :type journal: Union[snr.journal.Journal|None]
+        """
+        sweeper = RetentionSweeper.instance
+        if sweeper is None or not sweeper.is_alive():
+            start = time.time()
+            count, reclaimed = retention.run(save_atom)
+            if journal is not None:
+                journal.record_retention(
+                    save_atom.appname, retention.get_path(save_atom), count, reclaimed, time.time() - start
+                )
+            return
+        logger.info(
+            "{}: Retention on {} queued".format(save_atom.app_log_prefix(), retention.get_path(save_atom))
+        )
+        sweeper._queue.put((retention, save_atom, journal))
+
+    def terminate(self):
+        self._terminate.set()
+
+    def _throttle(self):
+        if self._interval == 0:
+            return
+        with self._rate_lock:
+            now = time.time()
+            wait = self._next_delete - now
+            self._next_delete = max(now, self._next_delete) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _delete_file(self, retention, index, file, save_atom):
+        self._throttle()
+        try:
+            logger.info("{}: Deleting {}".format(save_atom.app_log_prefix(), file))
+            return retention.remove_file(index, file)
+        except OSError as e:
+            logger.error("{}: Cannot delete {} : {}".format(save_atom.app_log_prefix(), file, e))
+            return None
+
+    def _get_batch(self):
+        """
+        Wait for a retention request and collect the ones coming in next batch_delay seconds.
+        Only the latest request is kept per retention and root path.
+        :return: retention requests by (retention name, root path)
+        :rtype: dict
+        """
+        batch = dict()
+        deadline = None
+        while True:
+            timeout = 1 if deadline is None else deadline - time.time()
+            if self._terminate.is_set():
+                timeout = 0
+            try:
+                retention, save_atom, journal = self._queue.get(timeout=max(timeout, 0))
+                batch[(retention.name, retention.get_path(save_atom))] = (retention, save_atom, journal)
+                if deadline is None:
+                    deadline = time.time() + self._batch_delay
+            except Empty:
+                if deadline is not None or self._terminate.is_set():
+                    return batch
+
+    def _defer(self, retention, save_atom, journal):
+        """
+        Queue again a request whose app is busy, it is retried in next batch
+        """
+        if self._terminate.is_set():
+            logger.warning(
+                "{}: App is busy, retention on {} skipped until next save".format(
+                    save_atom.app_log_prefix(), retention.get_path(save_atom)
+                )
+            )
+            return
+        logger.info(
+            "{}: App is busy, retention on {} deferred".format(
+                save_atom.app_log_prefix(), retention.get_path(save_atom)
+            )
+        )
+        self._queue.put((retention, save_atom, journal))
+
+    def sweep(self, batch):
+        """
+        Delete unwanted files of all requests at once. The save lock of each app is held while its files are deleted,
+        requests of apps being saved, restored or moved are deferred.
+        :param batch: retention requests by (retention name, root path)
+        :type batch: dict
+        :return: number of deleted files, reclaimed bytes
+        :rtype: tuple
+        """
+        # lazy imports, snr.save imports this module
+        from snr.save import Save
+        from snr.save.lock import SaveLock
+        run_path = Save.get_run_path(self._conf)
+        # app name -> acquired SaveLock, None if busy
+        locks = dict()
+        try:
+            for key, (retention, save_atom, journal) in list(batch.items()):
+                if save_atom.appname not in locks:
+                    lock = SaveLock.get(save_atom.appname, run_path)
+                    locks[save_atom.appname] = lock if lock.acquire() else None
+                if locks[save_atom.appname] is None:
+                    del batch[key]
+                    self._defer(retention, save_atom, journal)
+            if len(batch) == 0:
+                return 0, 0
+            return self._sweep(batch)
+        finally:
+            for lock in locks.values():
+                if lock is not None:
+                    lock.release()
+
+    def _sweep(self, batch):
+        """
+        See sweep(). Save locks of batch apps are held.
+        """
+        start = time.time()
+        jobs = list()
+        remote = list()
+        for (_, path), (retention, save_atom, journal) in batch.items():
+            # leave saves started after this request alone
+            until = App.get_datetime(save_atom.date) if save_atom.date else None
+            unwanted = retention.get_unwanted_files(path, until)
+            if retention.storage.is_local:
+                for index, file in unwanted:
+                    jobs.append((path, retention, index, file, save_atom))
+            elif len(unwanted) > 0:
+                # remote storages delete files in batches
+                remote.append((path, retention, unwanted, save_atom))
+
+        logger.info(
+            "Retention sweep: {} path(s), {} file(s) to delete".format(
+                len(batch), len(jobs) + sum(len(unwanted) for _, _, unwanted, _ in remote)
+            )
+        )
+        stats = dict()
+        for path, retention, unwanted, save_atom in remote:
+            logger.info(
+                "{}: Deleting {} files from {} storage".format(
+                    save_atom.app_log_prefix(), len(unwanted), retention.storage.name
+                )
+            )
+            try:
+                deleted = retention.remove_files(unwanted)
+            except IOError as e:
+                logger.error("{}: Cannot delete files : {}".format(save_atom.app_log_prefix(), e))
+                continue
+            stats[path] = (len(deleted), sum(deleted.values()))
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = [
+                (path, executor.submit(self._delete_file, retention, index, file, save_atom))
+                for path, retention, index, file, save_atom in jobs
+            ]
+            for path, future in futures:
+                size = future.result()
+                if size is not None:
+                    count, reclaimed = stats.get(path, (0, 0))
+                    stats[path] = (count + 1, reclaimed + size)
+
+        duration = time.time() - start
+        total_count = 0
+        total_reclaimed = 0
+        for (_, path), (_, save_atom, journal) in batch.items():
+            count, reclaimed = stats.get(path, (0, 0))
+            total_count += count
+            total_reclaimed += reclaimed
+            logger.info(
+                "{}: Finished retention on {}. Deleted {} files, reclaimed {}".format(
+                    save_atom.app_log_prefix(), path, count, Units.convert_bytes(reclaimed) or '0B'
+                )
+            )
+            if journal is not None:
+                journal.record_retention(save_atom.appname, path, count, reclaimed, duration)
+        logger.info(
+            "Retention sweep done in {}s. Deleted {} files, reclaimed {}".format(
+                round(duration, 3), total_count, Units.convert_bytes(total_reclaimed) or '0B'
+            )
+        )
+        return total_count, total_reclaimed
+
+    def run(self):
+        while True:
+            batch = self._get_batch()
+            if len(batch) > 0:
+                try:
+                    with Tracer.start(
+                            self._conf, RetentionSweeper.C_SWEEPER, RetentionSweeper.C_SWEEPER, requests=len(batch)
+                    ):
+                        self.sweep(batch)
+                except Exception as e:
+                    logger.exception("Retention sweep failed : {}".format(e))
+            if self._terminate.is_set() and self._queue.empty():
+                break
@@ -0,0 +1,161 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        lock
+# Purpose:     Save locking preventing overlapping saves of the same app
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import fcntl
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class SaveLock:
+    """
+    Per app save lock. Guards against concurrent saves in this process and, through a lock file in run_path,
+    against concurrent saves run by another snr process (daemon or CLI). Lock file holds the pid of its owner while
+    it is locked.
+    """
+
+    registry = dict()
+    registry_lock = Lock()
+
+    def __init__(self, name, run_path=None):
+        """
+        Should not be used directly. See get().
+        :param name: app name
+        :type name: str
+        :param run_path: Optional. Folder containing lock files. In process lock only if None
+        :type run_path: Union[str|None]
+        """
+        self._name = name
+        self._lock = Lock()
+        self._path = os.path.join(run_path, "{}.lock".format(name)) if run_path else None
+        self._fd = None
+        self._held = False
+        self._state_lock = Lock()
+
+    @staticmethod
+    def get(name, run_path=None):
+        """
+        SaveLock factory. Locks are shared by app name.
+        :param name: app name
+        :type name: str
+        :param run_path: Optional. Folder containing lock files
+        :type run_path: Union[str|None]
+        :rtype: SaveLock
+        """
+        with SaveLock.registry_lock:
+            if name not in SaveLock.registry:
+                SaveLock.registry[name] = SaveLock(name, run_path)
+            return SaveLock.registry[name]
+
+    @property
+    def held(self):
+        """
+        Check lock state without acquiring it
+        :return: True if lock is held by this process or by another one
+        :rtype: bool
+        """
+        with self._state_lock:
+            if self._held:
+                return True
+        return self._get_owner() is not None
+
+    def _get_owner(self):
+        """
+        :return: pid of another running process holding lock file, None if there is none
+        :rtype: Union[int|None]
+        """
+        if not self._path:
+            return None
+        try:
+            with open(self._path) as f:
+                pid = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+        if pid <= 0 or pid == os.getpid():
+            return None
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return pid
+
+    def _lock_file(self):
+        """
+        :return: False if lock file is held by another process
+        :rtype: bool
+        """
+        try:
+            folder = os.path.split(self._path)[0]
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, str(os.getpid()).encode())
+        except BlockingIOError:
+            os.close(self._fd)
+            self._fd = None
+            return False
+        except OSError as e:
+            logger.warning("Cannot use lock file {}, locking {} in this process only : {}".format(
+                self._path, self._name, e
+            ))
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = None
+        return True
+
+    def acquire(self):
+        """
+        Non blocking lock acquisition
+        :return: True if lock is acquired
+        :rtype: bool
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        if self._path and not self._lock_file():
+            self._lock.release()
+            return False
+        with self._state_lock:
+            self._held = True
+        return True
+
+    def release(self):
+        with self._state_lock:
+            self._held = False
+        if self._fd is not None:
+            os.ftruncate(self._fd, 0)
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
@@ -27,19 +27,36 @@
 #    You should have received a copy of the GNU Lesser General Public License
 #    along with snr.  If not, see <http://www.gnu.org/licenses/>.
 # ------------------------------------------------------------------------------
+import os
+import signal
 import logging
 import time
 from string import Template
-from threading import Thread
+from threading import Thread, Lock
 from datetime import datetime
 
 import schedule
 
 from snr.app import App
 from snr.app.saveatom import AppSaveStatusEnum, SaveAtom
-from snr.retention import Retention
+from snr.retention import Retention, RetentionSweeper
+from snr.retention.capacity import Capacity
+from snr.metrics import Metrics
+from snr.worker import Coordinator
+from snr.progress import ProgressState
+from snr.control import Control
+from snr.tiering import Tiering
 from snr.retention.retention import RetentionTypeEnum
+from snr.save.lock import SaveLock
+from snr.storage import Storage
+from snr.encryption import Encryption
+from snr.throttle import Throttle
+from snr.tracing import Tracer
+from snr.profiler import Profiler
+from snr.units import Units
+from snr.config import Config
 from snr.yamlhelper import YAMLHelper
+from snr.config.model import DaemonConf, SaveConf, ScheduleConf
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +82,37 @@ saves:
     retention:
       databases: database_standard
       files: file_standard
+    # number of parts (databases and files) saved at the same time, longest first. Unlimited per default
+    max_parallel_parts: 2
+    # what to do when a schedule fires while a save is running: skip (default), queue (one run,
+    # extra triggers dropped) or coalesce (one run merging all triggers)
+    overlap: queue
+    # storage backend as per storages section. Local filesystem per default
+    # storage: offsite
+    # CPU and I/O limits of save commands, adjustable while a save is running by reloading configuration
+    throttle:
+      # scheduling priority, from -20 (highest) to 19 (lowest)
+      nice: 10
+      # I/O scheduling class: idle, best-effort or realtime, and level from 0 (highest) to 7 (lowest)
+      ionice_class: best-effort
+      ionice_level: 7
+      # bytes per second read from save source by tar or database dump commands
+      read_rate: 50MB
+      # number of CPUs save commands may run on
+      threads: 2
+      # cgroup v2 limits of each part processes, requires cgroup delegation (systemd Delegate=yes)
+      # CPU time in number of CPUs, memory and I/O on each disk
+      cpu_max: 1.5
+      memory_max: 2GB
+      io_max:
+        read_bps: 100MB
+        write_bps: 50MB
+        # read_iops: 1000
+        # write_iops: 1000
+      # limits by part, as per app files or databases name, overriding save limits
+      parts:
+        gitlab:
+          ionice_class: idle
     schedules:
       - every: 1
         interval: day
@@ -79,16 +127,41 @@ saves:
     allowed_actions:
       - restore
       #  save
+
+daemon:
+  # pid file and lock files preventing overlapping saves. Changing it requires a daemon restart, while other
+  # sections are applied on reload
+  run_path: /var/run/snr
 """
 
+    cache = dict()
+    reload_requested = False
+    profile_requested = False
+
     C_SAVES = 'saves'
     C_SAVE_APP_NAME = 'app_name'
     C_SAVE_DEST = 'destination'
     C_SAVE_SCHEDS = 'schedules'
     C_SAVE_RETENTION = 'retention'
     C_SAVE_ALLOWED_ACTIONS = 'allowed_actions'
+    C_SAVE_MAX_PARALLEL = 'max_parallel_parts'
+    C_SAVE_OVERLAP = 'overlap'
+    C_SAVE_STORAGE = 'storage'
+    C_SAVE_THROTTLE = 'throttle'
     C_SAVE_KEYS = {C_SAVE_APP_NAME}
-    C_SAVE_OPT_KEYS = {C_SAVE_DEST, C_SAVE_SCHEDS, C_SAVE_RETENTION, C_SAVE_ALLOWED_ACTIONS}
+    C_SAVE_OPT_KEYS = {
+        C_SAVE_DEST, C_SAVE_SCHEDS, C_SAVE_RETENTION, C_SAVE_ALLOWED_ACTIONS, C_SAVE_MAX_PARALLEL, C_SAVE_OVERLAP,
+        C_SAVE_STORAGE, C_SAVE_THROTTLE
+    }
+    C_OVERLAP_SKIP = 'skip'
+    C_OVERLAP_QUEUE = 'queue'
+    C_OVERLAP_COALESCE = 'coalesce'
+    C_OVERLAP_POLICIES = {C_OVERLAP_SKIP, C_OVERLAP_QUEUE, C_OVERLAP_COALESCE}
+    C_OVERLAP_SKIPPED = 'skipped'
+    C_OVERLAP_QUEUED = 'queued'
+    C_OVERLAP_COALESCED = 'coalesced'
+    # consecutive runs exceeding schedule interval before reporting
+    C_OVERRUN_REPORT = 3
     C_SAVE_SCHEDS_EVERY = 'every'
     C_SAVE_SCHEDS_INTERVAL = 'interval'
     C_SAVE_SCHEDS_INTERVAL_VALUES = {
@@ -117,6 +190,13 @@ saves:
         'sunday',
         'sundays'
     }
+    C_SAVE_SCHEDS_INTERVAL_SECONDS = {
+        'second': 1,
+        'minute': 60,
+        'hour': 3600,
+        'day': 86400,
+        'week': 604800
+    }
     C_SAVE_SCHEDS_AT = 'at'
     C_SAVE_SCHEDS_KEYS = {C_SAVE_SCHEDS_EVERY, C_SAVE_SCHEDS_INTERVAL}
     C_SAVE_SCHEDS_KEYS_OPT = {C_SAVE_SCHEDS_AT}
@@ -126,8 +206,19 @@ saves:
     C_SAVE_ACTION_SAVE = 'save'
     C_SAVE_ACTION_RESTORE = 'restore'
     C_SAVE_ACTIONS = {C_SAVE_ACTION_SAVE, C_SAVE_ACTION_RESTORE}
+    C_DAEMON = 'daemon'
+    C_DAEMON_RUN_PATH = 'run_path'
+    C_DAEMON_OPT_KEYS = {C_DAEMON_RUN_PATH}
+    C_DAEMON_DEFAULT_RUN_PATH = '/var/run/snr'
+    C_DAEMON_PID_FILE = 'snr.pid'
+    C_DAEMON_PROFILE_SIGNAL = signal.SIGUSR2
+    C_DAEMON_PROFILE = 'profile'
+    C_DAEMON_PROGRESS = 'progress.json'
 
-    def __init__(self, name, destination, retentions, schedules, allowed_actions, app, conf):
+    def __init__(
+            self, name, destination, retentions, schedules, allowed_actions, app, conf,
+            max_parallel=None, overlap=C_OVERLAP_SKIP, run_path=None, storage=None, throttle=None
+    ):
         """
 
         :param name: App name
@@ -137,13 +228,23 @@ saves:
         :param retentions:
         :type retentions: dict
         :param schedules:
-        :type schedules: dict
+        :type schedules: list
         :param allowed_action:
         :type allowed_action: list
         :param app: App
         :type app: App
         :param conf: conf file
         :type conf: str
+        :param max_parallel: Optional. Number of parts saved at the same time. Unlimited per default
+        :type max_parallel: Union[int|None]
+        :param overlap: Optional. Overlap policy, one of C_OVERLAP_POLICIES. C_OVERLAP_SKIP per default
+        :type overlap: str
+        :param run_path: Optional. Folder holding lock files. Overlapping saves are only checked in process if None
+        :type run_path: Union[str|None]
+        :param storage: Optional. Storage backend, local filesystem per default
+        :type storage: Union[snr.storage.Storage|None]
+        :param throttle: Optional. Limits of save commands, unlimited per default
+        :type throttle: Union[Throttle|None]
         """
         super(Save, self).__init__()
         self._name = name
@@ -154,30 +255,48 @@ saves:
         self._allowed_actions = allowed_actions
         self._app = app
         self._conf = conf
+        self._max_parallel = max_parallel
+        self._overlap = overlap
+        self._storage = storage if storage is not None else Storage.get_local()
+        self._throttle = throttle
+        self._lock = SaveLock.get(name, run_path)
+        self._trigger_lock = Lock()
+        self._save_thread = None
+        self._pending = False
         self._run = True
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """
+        :return: configuration fingerprint of this instance, including app configuration
+        :rtype: str
+        """
+        return self._fingerprint
 
     def run(self) -> None:
         if len(self._schedules) == 0:
             logger.info("No schedule defined for {}".format(self._name))
         else:
             logger.info("Starting schedule threads for {}...".format(self._name))
+            s = schedule.Scheduler()
             for sched in self._schedules:
-                s = schedule.Scheduler()
-                job = s.every(sched[Save.C_SAVE_SCHEDS_EVERY])
-                job = job.__getattribute__(sched[Save.C_SAVE_SCHEDS_INTERVAL])
+                job = s.every(sched.every)
+                job = job.__getattribute__(sched.interval)
                 at = ""
-                if Save.C_SAVE_SCHEDS_AT in sched.keys():
-                    job = job.at(sched[Save.C_SAVE_SCHEDS_AT])
-                    at = sched[Save.C_SAVE_SCHEDS_AT]
-                job.do(self.save)
+                if sched.at is not None:
+                    job = job.at(sched.at)
+                    at = sched.at
+                job.do(self.trigger)
                 logger.info(
                     "setting up {} save every {} {} at {}".format(
                         self._name,
-                        sched[Save.C_SAVE_SCHEDS_EVERY],
-                        sched[Save.C_SAVE_SCHEDS_INTERVAL],
+                        sched.every,
+                        sched.interval,
                         at
                     )
                 )
+            self.check_schedules()
 
             try:
                 while self._run:
@@ -188,49 +307,438 @@ saves:
             except KeyboardInterrupt:
                 logger.warning("Caught KeyboardInterrupt")
 
+            save_thread = self._save_thread
+            if save_thread is not None:
+                logger.info("Waiting for running {} save to finish".format(self._name))
+                save_thread.join()
             logger.info("Terminating schedule thread")
 
     def terminate(self):
         self._run = False
 
+    @property
+    def app(self):
+        return self._app
+
+    @property
+    def pending(self):
+        """
+        :return: True if a save is queued by overlap policy
+        :rtype: bool
+        """
+        return self._pending
+
+    @property
+    def running(self):
+        """
+        :return: True if a save or a restore of this app is running, in this process or in another one
+        :rtype: bool
+        """
+        return self._lock.held
+
+    @staticmethod
+    def get_lock_of(conf, file):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :param file: save file path on local storage
+        :type file: str
+        :return: save lock of the app owning file, None if no app owns it
+        :rtype: Union[SaveLock|None]
+        """
+        for save in list(Save.cache.get(conf, dict()).values()):
+            if save._destination is None or not save._storage.is_local:
+                continue
+            save_atom, _ = save._app.project_save(save._destination)
+            for path in (save_atom.databases_root_path, save_atom.files_root_path):
+                if path and file.startswith(path + os.sep):
+                    return save._lock
+        return None
+
+    def trigger(self):
+        """
+        Scheduler entry point. Start a save in background unless a save is already running, in which case the overlap
+        policy applies:
+        - skip: trigger is dropped,
+        - queue: one save is queued and starts as soon as the running one finishes. Extra triggers are dropped,
+        - coalesce: all triggers fired while the save runs are merged into a single save, started as soon as the
+          running one finishes.
+        Queued, dropped and merged triggers are recorded in journal. Saves running in another process can't be
+        followed by queued or merged ones, triggers are then dropped.
+        :return: True if a save has been started, queued or merged into a pending one
+        :rtype: bool
+        """
+        with self._trigger_lock:
+            if self._save_thread is None and not self.running:
+                self._save_thread = Thread(target=self._scheduled_save, name="{}-save".format(self._name))
+                self._save_thread.start()
+                return True
+
+            if self._overlap == Save.C_OVERLAP_QUEUE and not self._pending and self._save_thread is not None:
+                self._pending = True
+                action = Save.C_OVERLAP_QUEUED
+            elif self._overlap == Save.C_OVERLAP_COALESCE and self._save_thread is not None:
+                # first trigger sets the follow-up save, next ones are merged into it
+                self._pending = True
+                action = Save.C_OVERLAP_COALESCED
+            else:
+                action = Save.C_OVERLAP_SKIPPED
+
+        self._app.journal.record_overlap(self._name, self._overlap, action)
+        log = logger.info if action == Save.C_OVERLAP_COALESCED else logger.warning
+        log(
+            "{}: Save triggered while previous save is still running. Overlap policy {}: trigger {}".format(
+                Template(SaveAtom.C_LOG_MESSAGE_PREFIX_APP).safe_substitute(appname=self._name), self._overlap, action
+            )
+        )
+        return action != Save.C_OVERLAP_SKIPPED
+
+    def _scheduled_save(self):
+        """
+        Run save, then queued save if any
+        """
+        try:
+            while True:
+                start = time.time()
+                self.save()
+                self.check_overruns(time.time() - start)
+                with self._trigger_lock:
+                    if not self._pending or not self._run:
+                        self._pending = False
+                        return
+                    self._pending = False
+        finally:
+            with self._trigger_lock:
+                self._save_thread = None
+
+    @property
+    def overruns(self):
+        """
+        :return: number of latest consecutive saves exceeding schedule interval, from journal
+        :rtype: int
+        """
+        interval = self.schedule_interval
+        if interval is None:
+            return 0
+        count = 0
+        for record in reversed(self._app.journal.get_save_history(self._name)):
+            if record.get('duration', 0) <= interval:
+                break
+            count += 1
+        return count
+
+    def check_overruns(self, duration):
+        """
+        Report save if its duration keeps exceeding its schedule interval
+        :param duration: last save duration in seconds
+        :type duration: float
+        """
+        interval = self.schedule_interval
+        if interval is None or duration <= interval:
+            return
+        overruns = self.overruns
+        if overruns >= Save.C_OVERRUN_REPORT:
+            logger.error(
+                "{} save lasted longer than its {} schedule interval for {} consecutive runs. "
+                "Please review its schedules, max_parallel_parts or overlap policy.".format(
+                    self._name, Units.convert_seconds(interval), overruns
+                )
+            )
+        else:
+            logger.warning(
+                "{} save lasted {}, longer than its {} schedule interval.".format(
+                    self._name, Units.convert_seconds(round(duration)), Units.convert_seconds(interval)
+                )
+            )
+
+    @staticmethod
+    def get_schedule_interval(sched):
+        """
+        :param sched: schedule configuration
+        :type sched: snr.config.model.ScheduleConf
+        :return: time between two scheduled runs in seconds
+        :rtype: int
+        """
+        interval = sched.interval
+        if interval.endswith('s'):
+            interval = interval[:-1]
+        # week days
+        seconds = Save.C_SAVE_SCHEDS_INTERVAL_SECONDS.get(interval, Save.C_SAVE_SCHEDS_INTERVAL_SECONDS['week'])
+        return seconds * sched.every
+
+    @property
+    def schedule_interval(self):
+        """
+        :return: shortest time between two scheduled runs in seconds, None if not scheduled
+        :rtype: Union[int|None]
+        """
+        if len(self._schedules) == 0:
+            return None
+        return min(Save.get_schedule_interval(sched) for sched in self._schedules)
+
+    @property
+    def estimated_duration(self):
+        """
+        :return: estimated full save duration in seconds from journal, None if unknown
+        :rtype: Union[float|None]
+        """
+        return self._app.estimate_save(max_parallel=self._max_parallel)
+
+    def check_schedules(self, estimate=None):
+        """
+        Warn if estimated save duration exceeds schedule interval
+        :param estimate: Optional. Estimated duration in seconds. Computed from journal per default
+        :type estimate: Union[float|None]
+        :return: False if save can't finish before its next run
+        :rtype: bool
+        """
+        if estimate is None:
+            estimate = self.estimated_duration
+        interval = self.schedule_interval
+        if estimate is not None and interval is not None and estimate > interval:
+            logger.warning(
+                "{} save is estimated to last {} but is scheduled every {}: "
+                "it can't finish before its next run !".format(
+                    self._name, Units.convert_seconds(round(estimate)), Units.convert_seconds(interval)
+                )
+            )
+            return False
+        return True
+
     @staticmethod
     def run_as_daemon(conf):
+        """
+        Start save schedule threads and wait for termination. Configuration is reloaded on SIGHUP.
+        Profiling is started and stopped on SIGUSR2, profiles are written in run path, see Profiler.
+        Retention runs in background, see RetentionSweeper. Aged saves are moved during idle time, see Tiering.
+        Metrics are served over HTTP if configured, see Metrics.
+        Progress of running save parts is written in run path, see ProgressState.
+        Apps, saves, restores, running parts and their progress can be controlled through a socket, see Control.
+        Save parts are sent to registered workers if configured, see Coordinator.
+        :param conf: yaml file path
+        :type conf: str
+        """
         saves = Save.get_instances(conf)
+        retired = list()
+        pid_file = os.path.join(Save.get_run_path(conf), Save.C_DAEMON_PID_FILE)
+        signal.signal(signal.SIGHUP, Save._request_reload)
+        signal.signal(Save.C_DAEMON_PROFILE_SIGNAL, Save._request_profile)
+        profiler = None
+        progress = ProgressState(os.path.join(Save.get_run_path(conf), Save.C_DAEMON_PROGRESS))
         try:
+            Save._write_pid_file(pid_file)
+            progress.start()
+            Control.start_instance(conf)
+            RetentionSweeper.start_instance(conf)
+            Metrics.start_instance(conf)
+            Coordinator.start_instance(conf)
+            Tiering.start_instance(
+                conf, lambda: any(save.running for save in Save.cache.get(conf, dict()).values()),
+                lambda file: Save.get_lock_of(conf, file)
+            )
             for name in saves.keys():
                 saves[name].start()
             while True:
-                time.sleep(10)
+                time.sleep(2)
+                if Save.reload_requested:
+                    Save.reload_requested = False
+                    logger.info("Caught SIGHUP, configuration reload requested")
+                    previous = Config.get_instance(conf)
+                    saves, terminated = Save.reload(conf, saves)
+                    Save._restart_services(conf, previous)
+                    # keep replaced saves until their running save finishes
+                    retired = [save for save in retired + terminated if save.is_alive()]
+                if Save.profile_requested:
+                    Save.profile_requested = False
+                    logger.info("Caught SIGUSR2, profiling toggle requested")
+                    if profiler is None:
+                        profiler = Profiler(
+                            Profiler.get_default_path(Save.get_run_path(conf), Save.C_DAEMON_PROFILE)
+                        ).start()
+                    else:
+                        profiler.stop()
+                        profiler = None
         except KeyboardInterrupt:
             logger.warning("Caught KeyboardInterrupt")
         finally:
+            Control.stop_instance()
             for name in saves:
                 saves[name].terminate()
             for name in saves:
                 saves[name].join()
+            # wait for running saves of replaced configuration
+            for save in retired:
+                save.join()
+            if profiler is not None:
+                profiler.stop()
+            Tiering.stop_instance()
+            Coordinator.stop_instance()
+            Metrics.stop_instance()
+            RetentionSweeper.stop_instance()
+            Encryption.stop_instance(conf)
+            progress.stop()
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
 
     @staticmethod
-    def get_instances(conf):
+    def _restart_services(conf, previous):
         """
-        Instanciate Save instances
+        Restart daemon services whose configuration changed on reload. Tiering reads its configuration before each
+        run and needs no restart.
         :param conf: yaml file path
         :type conf: str
-        :return: dictionary of apps
-        :rtype: dict
+        :param previous: configuration before reload
+        :type previous: Config
         """
+        config = Config.get_instance(conf)
+        for section, service in (('sweeper', RetentionSweeper), ('metrics', Metrics), ('workers', Coordinator)):
+            if getattr(previous, section) != getattr(config, section):
+                logger.info("{} configuration changed, restarting it".format(service.__name__))
+                service.stop_instance()
+                service.start_instance(conf)
+        if previous.daemon != config.daemon:
+            logger.warning("daemon configuration changed, it will be applied once daemon is restarted")
+
+    @staticmethod
+    def _request_reload(signum, frame):
+        # logging is not reentrant, it is done by daemon main loop
+        Save.reload_requested = True
+
+    @staticmethod
+    def _request_profile(signum, frame):
+        Save.profile_requested = True
+
+    @staticmethod
+    def _write_pid_file(pid_file):
         try:
-            data = YAMLHelper.load(conf)
-            app = App.get_instances(conf)
-            if app is None:
-                raise TypeError("Error getting apps")
+            folder = os.path.split(pid_file)[0]
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(pid_file, 'w') as f:
+                f.write(str(os.getpid()))
+        except (PermissionError, IOError) as e:
+            logger.warning("Cannot write pid file {}, snr reload won't work : {}".format(pid_file, e))
 
-            saves = dict()
-            for save in data[Save.C_SAVES]:
+    @staticmethod
+    def get_run_path(conf):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :return: folder holding pid and lock files
+        :rtype: str
+        """
+        return Config.get_instance(conf).daemon.run_path
+
+    @staticmethod
+    def get_daemon_pid(conf):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :return: running daemon pid, None if no daemon is running
+        :rtype: Union[int|None]
+        """
+        pid_file = os.path.join(Save.get_run_path(conf), Save.C_DAEMON_PID_FILE)
+        try:
+            with open(pid_file, 'r') as f:
+                pid = int(f.read().strip())
+            # check process existence
+            os.kill(pid, 0)
+            return pid
+        except (IOError, ValueError, ProcessLookupError):
+            return None
+        except PermissionError:
+            return pid
+
+    @staticmethod
+    def reload(conf, saves):
+        """
+        Reload configuration and restart schedule threads of saves whose configuration changed.
+        App, Database and Compression objects are only rebuilt when their configuration changed.
+        Running saves of replaced or removed configurations keep running until they finish.
+        Running configuration is kept if new one is invalid.
+        :param conf: yaml file path
+        :type conf: str
+        :param saves: running Save instances
+        :type saves: dict
+        :return: running Save instances, terminated Save instances
+        :rtype: tuple
+        """
+        logger.info("Reloading configuration {}".format(conf))
+        try:
+            Config.get_instance(conf, reload=True)
+            new_saves = Save.get_instances(conf)
+        except Exception as e:
+            new_saves = None
+            logger.error("Cannot reload configuration : {}".format(e))
+        if new_saves is None:
+            logger.error("Configuration reload failed, keeping running configuration")
+            return saves, list()
+
+        terminated = list()
+        for name in saves:
+            if name not in new_saves:
+                logger.info("{} save removed from configuration".format(name))
+            elif new_saves[name] is not saves[name]:
+                logger.info("{} save configuration changed".format(name))
+            else:
+                continue
+            if saves[name].running:
+                logger.info("{} save is running, it will finish with its previous configuration".format(name))
+            saves[name].terminate()
+            terminated.append(saves[name])
+
+        for name in new_saves:
+            if name not in saves or new_saves[name] is not saves[name]:
+                logger.info("Starting {} save schedules".format(name))
+                new_saves[name].start()
+
+        logger.info(
+            "Configuration reloaded: {} save(s) restarted, {} unchanged".format(
+                len([x for x in new_saves if x not in saves or new_saves[x] is not saves[x]]),
+                len([x for x in new_saves if x in saves and new_saves[x] is saves[x]])
+            )
+        )
+        return new_saves, terminated
+
+    @staticmethod
+    def compile_daemon_conf(config):
+        """
+        Validate daemon section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, defaults if section is missing
+        :rtype: DaemonConf
+        :raise: TypeError on configuration error
+        """
+        run_path = Save.C_DAEMON_DEFAULT_RUN_PATH
+        if Save.C_DAEMON in config.data.keys() and config.data[Save.C_DAEMON]:
+            try:
+                YAMLHelper.analyse_keys(
+                    Save.C_DAEMON, config.data[Save.C_DAEMON], optional_key_set=Save.C_DAEMON_OPT_KEYS
+                )
+            except TypeError as e:
+                raise TypeError("Daemon configuration error : {}".format(e))
+            run_path = config.data[Save.C_DAEMON].get(Save.C_DAEMON_RUN_PATH, run_path)
+        return DaemonConf(run_path)
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate saves section. Apps and storages must be compiled first.
+        :param config: configuration being compiled
+        :type config: Config
+        :return: SaveConf by app name
+        :rtype: dict
+        :raise: TypeError on configuration error
+        """
+        saves = dict()
+        try:
+            for save in Config.get_section(config.data, Save.C_SAVES):
                 YAMLHelper.analyse_keys(Save.C_SAVES, save, Save.C_SAVE_KEYS, Save.C_SAVE_OPT_KEYS)
                 name = save[Save.C_SAVE_APP_NAME]
-                destination = None
-                if Save.C_SAVE_DEST in save.keys():
-                    destination = save[Save.C_SAVE_DEST]
+                if name not in config.apps:
+                    raise TypeError("Unknown app {}. Should be one of {}".format(name, set(config.apps)))
+
                 retentions = dict()
                 if Save.C_SAVE_RETENTION in save.keys():
                     YAMLHelper.analyse_keys(
@@ -239,7 +747,8 @@ saves:
                         optional_key_set=Save.C_SAVE_RETENTION_OPT_KEYS
                     )
                     retentions = save[Save.C_SAVE_RETENTION]
-                schedules = dict()
+
+                schedules = list()
                 if Save.C_SAVE_SCHEDS in save.keys():
                     for sched in save[Save.C_SAVE_SCHEDS]:
                         YAMLHelper.analyse_keys(
@@ -253,7 +762,13 @@ saves:
                             sched[Save.C_SAVE_SCHEDS_INTERVAL],
                             Save.C_SAVE_SCHEDS_INTERVAL_VALUES
                         )
-                    schedules = save[Save.C_SAVE_SCHEDS]
+                        schedules.append(
+                            ScheduleConf(
+                                sched[Save.C_SAVE_SCHEDS_EVERY],
+                                sched[Save.C_SAVE_SCHEDS_INTERVAL],
+                                sched.get(Save.C_SAVE_SCHEDS_AT)
+                            )
+                        )
 
                 allowed_actions = Save.C_SAVE_ACTIONS
                 if Save.C_SAVE_ALLOWED_ACTIONS in save.keys():
@@ -262,11 +777,67 @@ saves:
                         save[Save.C_SAVE_ALLOWED_ACTIONS],
                         Save.C_SAVE_ACTIONS
                     )
-                    allowed_actions = list()
-                    for action in save[Save.C_SAVE_ALLOWED_ACTIONS]:
-                        allowed_actions.append(action)
-                saves[name] = Save(name, destination, retentions, schedules, allowed_actions, app[name], conf)
+                    allowed_actions = list(save[Save.C_SAVE_ALLOWED_ACTIONS])
 
+                max_parallel = save.get(Save.C_SAVE_MAX_PARALLEL)
+                if max_parallel is not None and (not isinstance(max_parallel, int) or max_parallel < 1):
+                    raise TypeError(
+                        "{} should be a positive integer, got {}".format(Save.C_SAVE_MAX_PARALLEL, max_parallel)
+                    )
+
+                overlap = save.get(Save.C_SAVE_OVERLAP, Save.C_OVERLAP_SKIP)
+                YAMLHelper.check_key_values(Save.C_SAVE_OVERLAP, overlap, Save.C_OVERLAP_POLICIES)
+
+                storage = save.get(Save.C_SAVE_STORAGE)
+                if storage is not None and storage not in config.storages:
+                    raise TypeError("Unknown storage {}. Should be one of {}".format(storage, set(config.storages)))
+
+                throttle = None
+                if save.get(Save.C_SAVE_THROTTLE):
+                    throttle = Throttle.compile_conf(save[Save.C_SAVE_THROTTLE], config.apps[name])
+
+                saves[name] = SaveConf(
+                    name, save.get(Save.C_SAVE_DEST), retentions, schedules, allowed_actions, max_parallel, overlap,
+                    storage, throttle
+                )
+        except TypeError as e:
+            raise TypeError("Save configuration error : {}".format(e))
+        return saves
+
+    @staticmethod
+    def get_instances(conf):
+        """
+        Instanciate Save instances. Instances are cached by 'conf' parameter and app name, and are only rebuilt
+        when their configuration or their app configuration change.
+        :param conf: yaml file path
+        :type conf: str
+        :return: dictionary of apps
+        :rtype: dict
+        """
+        try:
+            config = Config.get_instance(conf)
+            app = App.get_instances(conf)
+            if app is None:
+                raise TypeError("Error getting apps")
+
+            saves = dict()
+            for name, save in config.saves.items():
+                # applies new limits to running saves
+                throttle = Throttle.get_instance(conf, name)
+                fingerprint = config.get_fingerprint(Config.F_SAVE, name)
+                cached = Save.cache.get(conf, dict()).get(name)
+                if cached is not None and cached.fingerprint == fingerprint:
+                    saves[name] = cached
+                    continue
+
+                saves[name] = Save(
+                    name, save.destination, save.retentions, save.schedules, save.allowed_actions, app[name], conf,
+                    save.max_parallel, save.overlap, config.daemon.run_path, Storage.get_instance(conf, save.storage),
+                    throttle
+                )
+                saves[name]._fingerprint = fingerprint
+
+            Save.cache[conf] = saves
             return saves
         except TypeError as e:
             logger.error("Save configuration error : {}".format(e))
@@ -274,6 +845,65 @@ saves:
         except IOError:
             logger.error("{} does not exist".format(conf))
 
+    def get_retention_scopes(self, save_atom=None):
+        """
+        :param save_atom: Optional. Projected save, see App.project_save(). Projected from all parts per default
+        :type save_atom: Union[SaveAtom|None]
+        :return: list of (Retention, root path) this save is subject to
+        :rtype: list
+        """
+        if save_atom is None:
+            save_atom, _ = self._app.project_save(self._destination)
+        scopes = list()
+        for key, retention_type, path in (
+                (Save.C_SAVE_RETENTION_DBS, RetentionTypeEnum.DBS, save_atom.databases_root_path),
+                (Save.C_SAVE_RETENTION_FILES, RetentionTypeEnum.FILES, save_atom.files_root_path)
+        ):
+            if key in self._retentions.keys() and path:
+                retention = Retention.get_instance(self._conf, self._retentions[key], retention_type, self._storage)
+                if retention is not None:
+                    scopes.append((retention, path))
+        return scopes
+
+    @Tracer.traced('save.check_capacity')
+    def check_capacity(self, save_atom):
+        """
+        Evict least valuable saves when projected save would not fit in retention or destination budgets
+        :param save_atom: save about to run
+        :type save_atom: SaveAtom
+        """
+        # budgets are measured on local filesystems only
+        if self._destination is None or not self._storage.is_local:
+            return
+        projected, sizes = self._app.project_save(self._destination, save_atom)
+        for retention, path in self.get_retention_scopes(projected):
+            if retention.max_size is not None:
+                needed = sum(size for file, size in sizes.items() if file.startswith(path + os.sep))
+                Capacity.enforce(
+                    path, retention.max_size, [(retention, path)], needed,
+                    "{} {} retention".format(save_atom.app_log_prefix(), retention.name)
+                )
+
+        for budget in Config.get_instance(self._conf).capacity:
+            needed = [size for file, size in sizes.items() if file.startswith(budget.path + os.sep)]
+            if len(needed) == 0:
+                continue
+            # saves of every app sharing this destination, once per root path
+            scopes = dict()
+            # this app's lock is held by the current save, other apps ones are taken while evicting
+            locks = dict()
+            for save in Save.cache.get(self._conf, {self._name: self}).values():
+                if save._destination is not None and save._storage.is_local:
+                    for retention, path in save.get_retention_scopes():
+                        if path.startswith(budget.path + os.sep) and path not in scopes:
+                            scopes[path] = retention
+                            if save is not self:
+                                locks[path] = save._lock
+            Capacity.enforce(
+                budget.path, budget.max_size, [(retention, path) for path, retention in scopes.items()], sum(needed),
+                "{} capacity".format(save_atom.app_log_prefix()), locks
+            )
+
     def save(self, save_atom=None):
         """
         Save.
@@ -290,31 +920,199 @@ saves:
             logger.error("{}.save(): {} has no save right !".format(save_atom.app_log_prefix(), self._name))
             return
 
+        if not self._lock.acquire():
+            logger.error(
+                "{}.save(): {} save is already running, skipping this one !".format(
+                    Template(SaveAtom.C_LOG_MESSAGE_PREFIX_APP).safe_substitute(appname=self._name), self._name
+                )
+            )
+            self._app.journal.record_overlap(self._name, self._overlap, Save.C_OVERLAP_SKIPPED)
+            return
+        try:
+            with Tracer.start(self._conf, Save.C_SAVE_ACTION_SAVE, self._name, app=self._name):
+                return self._save(save_atom, save_intent)
+        finally:
+            self._lock.release()
+
+    def save_part(self, date, part_type, name):
+        """
+        Save a single part of a save run by a coordinator daemon, see snr.worker.Worker
+        :param date: save date
+        :type date: str
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :return: part result, see App.save_part()
+        :rtype: dict
+        """
+        return self._app.save_part(self._destination, date, part_type, name, self._storage, self._throttle)
+
+    def prepare_ingest(self, parts, date=None):
+        """
+        Prepare a save whose parts are pushed by an agent, see snr.ingest.Ingest
+        :param parts: (type, name) tuples of parts to save
+        :type parts: list
+        :param date: Optional. save date, now per default
+        :type date: Union[str|None]
+        :return: save_atom filled with destination files
+        :rtype: snr.app.SaveAtom
+        :raise ValueError: if app has no save right or a part is unknown
+        """
+        if not self.saveable:
+            raise ValueError("{} has no save right".format(self._name))
+        parts = [tuple(part) for part in parts]
+        save_atom = self._app.save_atom
+        for part_type, name in parts:
+            if part_type not in SaveAtom.PART_TYPES or not save_atom.part_exists(part_type, name):
+                raise ValueError("Unrecognized {}:{} part of {}".format(part_type, name, self._name))
+        for part_type, names in ((SaveAtom.DATABASE, save_atom.databases), (SaveAtom.FILE, save_atom.files)):
+            for name in list(names):
+                if (part_type, name) not in parts:
+                    save_atom.del_part(part_type, name)
+        save_atom.date = date or datetime.today().strftime(App.C_DATE_FORMAT)
+        save_atom, _ = self._app.project_save(self._destination, save_atom)
+        if date is None:
+            try:
+                self.check_capacity(save_atom)
+            except OSError as e:
+                logger.error("{}.save(): Cannot check capacity : {}".format(save_atom.app_log_prefix(), e))
+        return save_atom
+
+    def ingest_part(self, save_atom, part_type, name, source, duration, stats=None, usage=None):
+        """
+        Store a part pushed by an agent to save destination and record it
+        :param save_atom: save_atom returned by prepare_ingest()
+        :type save_atom: snr.app.SaveAtom
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :param source: local file holding part, moved to storage. None if agent did not save it
+        :type source: Union[str|None]
+        :param duration: part duration in seconds, on agent
+        :type duration: float
+        :param stats: Optional. save file statistics from agent
+        :type stats: Union[dict|None]
+        :param usage: Optional. resource usage of agent part processes
+        :type usage: Union[dict|None]
+        :raise BlockingIOError: if a save, a restore or a tiering move of this app is running
+        """
+        path = save_atom.get_database(name) if part_type == SaveAtom.DATABASE else save_atom.get_file(name)
+        self._acquire_ingest()
+        try:
+            if source is not None:
+                self._storage.put(source, path)
+            self._app.ingest_part(save_atom, part_type, name, duration, self._storage, stats, usage)
+        finally:
+            self._lock.release()
+
+    def _acquire_ingest(self):
+        """
+        Acquire app save lock for a pushed part
+        :raise BlockingIOError: if a save, a restore or a tiering move of this app is running
+        """
+        if not self._lock.acquire():
+            raise BlockingIOError("{} save or restore is running".format(self._name))
+
+    def finish_ingest(self, save_atom, save_intent, start):
+        """
+        Apply retention and record a save pushed by an agent, once its parts are stored
+        :param save_atom: save_atom returned by prepare_ingest()
+        :type save_atom: snr.app.SaveAtom
+        :param save_intent: expected save status
+        :type save_intent: AppSaveStatusEnum
+        :param start: save start timestamp
+        :type start: float
+        :rtype: snr.app.SaveAtom
+        :raise BlockingIOError: if a save, a restore or a tiering move of this app is running
+        """
+        self._acquire_ingest()
+        try:
+            return self._finish_save(save_atom, save_intent, save_atom.date, start)
+        finally:
+            self._lock.release()
+
+    def _save(self, save_atom, save_intent):
+        """
+        Save, once app save lock is acquired
+        :param save_atom: Optional. Used to make partial save.
+        :type save_atom: Union[snr.app.SaveAtom|None]
+        :param save_intent: expected save status
+        :type save_intent: AppSaveStatusEnum
+        :return: filled save_atom
+        :rtype: snr.app.SaveAtom
+        """
         start = time.time()
         # Get default save_atom if none set
         if save_atom is None:
             save_atom = self._app.save_atom
 
         save_atom.date = datetime.today().strftime(App.C_DATE_FORMAT)
+        Tracer.annotate(date=save_atom.date, intent=save_intent.value)
         logger.info(
             "{}.save(): Starting {} {} save".format(save_atom.app_log_prefix(), save_atom.date, save_intent.value))
 
-        save_atom = self._app.save(self._destination, save_atom)
+        estimate = self._app.estimate_save(save_atom, self._max_parallel)
+        if estimate is not None:
+            logger.info(
+                "{}.save(): Estimated duration {}, ETA {}".format(
+                    save_atom.app_log_prefix(),
+                    Units.convert_seconds(round(estimate)),
+                    datetime.fromtimestamp(start + estimate).strftime('%Y-%m-%d %H:%M:%S')
+                )
+            )
+            self.check_schedules(estimate)
+
+        try:
+            self.check_capacity(save_atom)
+        except OSError as e:
+            logger.error("{}.save(): Cannot check capacity : {}".format(save_atom.app_log_prefix(), e))
+
+        date = save_atom.date
+        save_atom = self._app.save(self._destination, save_atom, self._max_parallel, self._storage, self._throttle)
+        if save_atom is None:
+            return
+        return self._finish_save(save_atom, save_intent, date, start, estimate)
 
+    def _finish_save(self, save_atom, save_intent, date, start, estimate=None):
+        """
+        Apply retention and record a save whose parts are done
+        :param save_atom: saved SaveAtom
+        :type save_atom: snr.app.SaveAtom
+        :param save_intent: expected save status
+        :type save_intent: AppSaveStatusEnum
+        :param date: save date
+        :type date: str
+        :param start: save start timestamp
+        :type start: float
+        :param estimate: Optional. estimated duration in seconds
+        :type estimate: Union[float|None]
+        :return: save_atom
+        :rtype: snr.app.SaveAtom
+        """
         if len(self._retentions) > 0:
+            # runs in background in daemon mode, see RetentionSweeper
             if Save.C_SAVE_RETENTION_DBS in self._retentions.keys() and save_atom.databases_root_path:
                 dbs_retention = Retention.get_instance(
-                    self._conf, self._retentions[Save.C_SAVE_RETENTION_DBS], RetentionTypeEnum.DBS
+                    self._conf, self._retentions[Save.C_SAVE_RETENTION_DBS], RetentionTypeEnum.DBS, self._storage
                 )
-                dbs_retention.run(save_atom)
+                RetentionSweeper.submit(dbs_retention, save_atom, self._app.journal)
 
             if Save.C_SAVE_RETENTION_FILES in self._retentions.keys() and save_atom.files_root_path:
                 files_retention = Retention.get_instance(
-                    self._conf, self._retentions[Save.C_SAVE_RETENTION_FILES], RetentionTypeEnum.FILES
+                    self._conf, self._retentions[Save.C_SAVE_RETENTION_FILES], RetentionTypeEnum.FILES, self._storage
                 )
-                files_retention.run(save_atom)
+                RetentionSweeper.submit(files_retention, save_atom, self._app.journal)
 
-        logger.info("{}.save(): {} save done in {}s".format(save_atom.app_log_prefix(), self._name, time.time()-start))
+        duration = time.time() - start
+        Tracer.annotate(status=save_atom.status.value, estimate=estimate)
+        if save_atom.status != save_intent:
+            Tracer.set_error("{} save".format(save_atom.status.value))
+        self._app.journal.record_save(
+            self._name, date, duration, save_atom.status.value, estimate=estimate, **App.get_usage(save_atom)
+        )
+        logger.info("{}.save(): {} save done in {}s".format(save_atom.app_log_prefix(), self._name, duration))
         if save_atom.status != save_intent:
             logger.error("{}.save(): Finished {} save".format(save_atom.app_log_prefix(), save_atom.status.value))
         else:
@@ -328,7 +1126,7 @@ saves:
         :return: save dict
         :rtype: dict
         """
-        return self._app.get_saves(self._destination)
+        return self._app.get_saves(self._destination, self._storage)
 
     @property
     def save_atom(self):
@@ -392,6 +1190,14 @@ saves:
                 return
             else:
                 save_atom = self.save_atoms[date]
+
+        if not self._lock.acquire():
+            logger.error(
+                "{}: {} save or restore is already running, skipping restore !".format(
+                    save_atom.app_log_prefix(), self._name
+                )
+            )
+            return
         try:
             logger.info(
                 "{}: Starting {} restore of {} backup".format(
@@ -400,12 +1206,17 @@ saves:
                     save_atom.date
                 )
             )
-            self._app.restore(save_atom, allow_partial)
+            with Tracer.start(
+                    self._conf, Save.C_SAVE_ACTION_RESTORE, self._name, app=self._name, date=save_atom.date
+            ):
+                self._app.restore(save_atom, allow_partial, self._storage, self._throttle)
         except KeyboardInterrupt:
             logger.warning(
                 "{}.restore(): Interrupted".format(save_atom.app_log_prefix())
             )
             raise
+        finally:
+            self._lock.release()
         logger.info("{}: Finished {} restore".format(save_atom.app_log_prefix(), allow_partial.value))
 
     @property
@@ -0,0 +1,279 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        stats
+# Purpose:     Throughput, ratio and size analytics from run journal
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import time
+import logging
+
+from snr.journal import Journal
+
+logger = logging.getLogger(__name__)
+
+
+class Stats:
+    """
+    Per app and per part time series built from run journal history, with duration, throughput and compression
+    ratio percentiles and size growth. Last run of each part is compared to its rolling baseline, the median of the
+    previous runs, to flag throughput drops and size growths beyond thresholds.
+    """
+
+    C_PERCENTILES = (50, 90, 99)
+    C_DEFAULT_WINDOW = 10
+    C_DEFAULT_THROUGHPUT_DROP = 0.3
+    C_DEFAULT_SIZE_GROWTH = 0.3
+
+    A_THROUGHPUT_DROP = 'throughput_drop'
+    A_SIZE_GROWTH = 'size_growth'
+
+    def __init__(self, path, window=C_DEFAULT_WINDOW, throughput_drop=C_DEFAULT_THROUGHPUT_DROP,
+                 size_growth=C_DEFAULT_SIZE_GROWTH):
+        """
+        :param path: run journal file path
+        :type path: str
+        :param window: number of runs before the last one the baseline is computed from
+        :type window: int
+        :param throughput_drop: last run throughput drop, from 0 to 1, compared to baseline flagged as an alert
+        :type throughput_drop: float
+        :param size_growth: last run size growth, as a ratio, compared to baseline flagged as an alert
+        :type size_growth: float
+        """
+        self._path = path
+        self._window = window
+        self._throughput_drop = throughput_drop
+        self._size_growth = size_growth
+
+    @staticmethod
+    def get_instance(conf, window=C_DEFAULT_WINDOW, throughput_drop=C_DEFAULT_THROUGHPUT_DROP,
+                     size_growth=C_DEFAULT_SIZE_GROWTH):
+        """
+        :param conf: path to Yaml configuration. Its journal is analysed
+        :type conf: str
+        :rtype: Stats
+        """
+        return Stats(Journal.get_instance(conf).path, window, throughput_drop, size_growth)
+
+    @staticmethod
+    def percentile(values, percent):
+        """
+        :param values: values
+        :type values: list
+        :param percent: percentile, from 0 to 100
+        :type percent: float
+        :return: percentile of values, linearly interpolated. None if values is empty
+        :rtype: Union[float|None]
+        """
+        if len(values) == 0:
+            return None
+        values = sorted(values)
+        rank = (len(values) - 1) * percent / 100
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (rank - low)
+
+    @staticmethod
+    def _percentiles(values):
+        return dict(
+            ("p{}".format(percent), Stats.percentile(values, percent)) for percent in Stats.C_PERCENTILES
+        )
+
+    @staticmethod
+    def _growth(last, baseline):
+        """
+        :return: relative change from baseline to last, None if unknown
+        :rtype: Union[float|None]
+        """
+        if last is None or not baseline:
+            return None
+        return last / baseline - 1
+
+    def _read(self, apps=None, since=None):
+        """
+        :param apps: Optional. app names to keep, all per default
+        :type apps: Union[list|None]
+        :param since: Optional. epoch time of oldest record to keep, all per default
+        :type since: Union[float|None]
+        :return: part records by (app, type, name), save records by app, ordered by time
+        :rtype: tuple
+        """
+        parts = dict()
+        saves = dict()
+        if not self._path:
+            logger.warning("Run journal is kept in memory only, no history to analyse")
+            return parts, saves
+        try:
+            records = list(Journal.read(self._path))
+        except FileNotFoundError:
+            logger.warning("Run journal {} does not exist yet".format(self._path))
+            return parts, saves
+        for record in records:
+            app = record.get(Journal.R_APP)
+            if apps and app not in apps:
+                continue
+            if since is not None and record.get(Journal.R_TIME, 0) < since:
+                continue
+            if record.get(Journal.E_EVENT) == Journal.E_PART:
+                key = (app, record[Journal.R_TYPE], record[Journal.R_NAME])
+                parts.setdefault(key, list()).append(record)
+            elif record.get(Journal.E_EVENT) == Journal.E_SAVE:
+                saves.setdefault(app, list()).append(record)
+        for series in list(parts.values()) + list(saves.values()):
+            series.sort(key=lambda r: r.get(Journal.R_TIME, 0))
+        return parts, saves
+
+    def _part(self, app, part_type, name, records):
+        """
+        :param records: part records, ordered by time
+        :type records: list
+        :return: part series, percentiles, baseline comparison and alerts
+        :rtype: dict
+        """
+        series = list()
+        for record in records:
+            if not record.get(Journal.R_STATUS):
+                continue
+            size = record.get(Journal.R_BYTES)
+            original_size = record.get(Journal.R_ORIGINAL_BYTES)
+            series.append({
+                Journal.R_DATE: record.get(Journal.R_DATE),
+                Journal.R_TIME: record.get(Journal.R_TIME),
+                Journal.R_DURATION: record.get(Journal.R_DURATION),
+                Journal.R_BYTES: size,
+                Journal.R_ORIGINAL_BYTES: original_size,
+                Journal.R_THROUGHPUT: record.get(Journal.R_THROUGHPUT),
+                'ratio': size / original_size if size is not None and original_size else None
+            })
+        stats = {
+            Journal.R_APP: app,
+            Journal.R_TYPE: part_type,
+            Journal.R_NAME: name,
+            'runs': len(records),
+            'failures': len(records) - len(series),
+            'series': series,
+            'alerts': list()
+        }
+        for key in (Journal.R_DURATION, Journal.R_THROUGHPUT, 'ratio'):
+            stats[key] = Stats._percentiles([run[key] for run in series if run[key] is not None])
+        if len(series) == 0:
+            return stats
+        last = series[-1]
+        previous = series[-self._window - 1:-1]
+        first_size = next((run[Journal.R_BYTES] for run in series if run[Journal.R_BYTES] is not None), None)
+        stats['last'] = last
+        stats['size_growth'] = Stats._growth(last[Journal.R_BYTES], first_size)
+        baseline = {
+            Journal.R_THROUGHPUT: Stats.percentile(
+                [run[Journal.R_THROUGHPUT] for run in previous if run[Journal.R_THROUGHPUT] is not None], 50
+            ),
+            Journal.R_BYTES: Stats.percentile(
+                [run[Journal.R_BYTES] for run in previous if run[Journal.R_BYTES] is not None], 50
+            ),
+            'runs': len(previous)
+        }
+        stats['baseline'] = baseline
+        throughput_change = Stats._growth(last[Journal.R_THROUGHPUT], baseline[Journal.R_THROUGHPUT])
+        size_change = Stats._growth(last[Journal.R_BYTES], baseline[Journal.R_BYTES])
+        stats['throughput_change'] = throughput_change
+        stats['size_change'] = size_change
+        if throughput_change is not None and -throughput_change > self._throughput_drop:
+            stats['alerts'].append(Stats.A_THROUGHPUT_DROP)
+        if size_change is not None and size_change > self._size_growth:
+            stats['alerts'].append(Stats.A_SIZE_GROWTH)
+        return stats
+
+    @staticmethod
+    def _app(app, records, parts):
+        """
+        :param records: save records of app, ordered by time
+        :type records: list
+        :param parts: part stats of app, see _part()
+        :type parts: list
+        :return: app series and duration percentiles. Save size is the sum of its part sizes.
+        :rtype: dict
+        """
+        sizes = dict()
+        for part in parts:
+            # last run of a part wins when it ran several times for a save date
+            part_sizes = dict((run[Journal.R_DATE], run[Journal.R_BYTES]) for run in part['series'])
+            for date, size in part_sizes.items():
+                if size is not None:
+                    sizes[date] = sizes.get(date, 0) + size
+        series = [
+            {
+                Journal.R_DATE: record.get(Journal.R_DATE),
+                Journal.R_TIME: record.get(Journal.R_TIME),
+                Journal.R_DURATION: record.get(Journal.R_DURATION),
+                Journal.R_STATUS: record.get(Journal.R_STATUS),
+                Journal.R_BYTES: sizes.get(record.get(Journal.R_DATE))
+            }
+            for record in records
+        ]
+        known_sizes = [run[Journal.R_BYTES] for run in series if run[Journal.R_BYTES] is not None]
+        return {
+            Journal.R_APP: app,
+            'runs': len(series),
+            'series': series,
+            Journal.R_DURATION: Stats._percentiles(
+                [run[Journal.R_DURATION] for run in series if run[Journal.R_DURATION] is not None]
+            ),
+            Journal.R_BYTES: known_sizes[-1] if len(known_sizes) > 0 else None,
+            'size_growth': Stats._growth(known_sizes[-1], known_sizes[0]) if len(known_sizes) > 0 else None,
+            'alerts': sorted(set(alert for part in parts for alert in part['alerts']))
+        }
+
+    def analyse(self, apps=None, days=None):
+        """
+        :param apps: Optional. app names to analyse, all per default
+        :type apps: Union[list|None]
+        :param days: Optional. number of days of history to analyse, whole journal per default
+        :type days: Union[int|None]
+        :return: report with apps and parts statistics
+        :rtype: dict
+        """
+        since = time.time() - days * 86400 if days else None
+        parts, saves = self._read(apps, since)
+        part_stats = [self._part(app, part_type, name, parts[(app, part_type, name)])
+                      for app, part_type, name in sorted(parts.keys())]
+        app_names = sorted(set(saves.keys()).union(part[Journal.R_APP] for part in part_stats))
+        app_stats = [
+            Stats._app(app, saves.get(app, list()), [part for part in part_stats if part[Journal.R_APP] == app])
+            for app in app_names
+        ]
+        for part in part_stats:
+            for alert in part['alerts']:
+                logger.warning("{} {} {}: {} against baseline of {} runs".format(
+                    part[Journal.R_APP], part[Journal.R_TYPE], part[Journal.R_NAME], alert.replace('_', ' '),
+                    part['baseline']['runs']
+                ))
+        return {
+            'journal': self._path,
+            'since': since,
+            'window': self._window,
+            'thresholds': {Stats.A_THROUGHPUT_DROP: self._throughput_drop, Stats.A_SIZE_GROWTH: self._size_growth},
+            'apps': app_stats,
+            'parts': part_stats
+        }
@@ -0,0 +1,136 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        local
+# Purpose:     Local filesystem storage
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import shutil
+import logging
+
+from snr.storage.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class LocalWriter:
+    """
+    Local file writer, with the same interface as StorageWriter
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._path = path
+        self._file = open(path, 'wb')
+        self._closed = False
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def size(self):
+        return self._file.tell()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._closed = True
+        self._file.close()
+        return os.stat(self._path).st_size
+
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._file.close()
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+
+class LocalStorage(Storage):
+    """
+    Local filesystem storage
+    """
+
+    @property
+    def is_local(self):
+        return True
+
+    def open_write(self, path):
+        return LocalWriter(path)
+
+    def open_read(self, path):
+        return open(path, 'rb')
+
+    def put(self, source, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        shutil.move(source, path)
+        return os.stat(path).st_size
+
+    def open_stream(self, path):
+        return open(path, 'rb')
+
+    def listdir(self, folder):
+        files = dict()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        files[entry.name] = entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            pass
+        return files
+
+    def walk(self, root):
+        files = dict()
+        for folder, _, names in os.walk(root):
+            files[folder] = [os.path.join(folder, name) for name in names]
+        return files
+
+    def size(self, path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+    def delete(self, paths):
+        deleted = list()
+        for path in paths:
+            try:
+                os.remove(path)
+                deleted.append(path)
+            except OSError as e:
+                logger.error("Cannot delete {} : {}".format(path, e))
+        return deleted
@@ -0,0 +1,353 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        s3
+# Purpose:     S3 compatible object storage
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import hmac
+import base64
+import hashlib
+import logging
+import http.client
+from datetime import datetime, timezone
+from threading import local
+from urllib.parse import urlsplit, quote
+from xml.etree import ElementTree
+
+from snr.storage.storage import Storage, StorageWriter
+
+logger = logging.getLogger(__name__)
+
+
+class S3Reader:
+    """
+    Object content stream, closing its dedicated connection when closed
+    """
+
+    def __init__(self, connection, response):
+        self._connection = connection
+        self._response = response
+
+    def read(self, size=-1):
+        return self._response.read(size)
+
+    def close(self):
+        self._response.close()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class S3Writer(StorageWriter):
+    """
+    S3 multipart upload
+    """
+
+    def __init__(self, storage, path, part_size, max_concurrency):
+        self._storage = storage
+        self._upload_id = None
+        super(S3Writer, self).__init__(path, part_size, max_concurrency, S3Storage.C_MAX_PARTS)
+
+    def _start(self):
+        _, _, body = self._storage.request('POST', self._path, {'uploads': ''})
+        self._upload_id = S3Storage.find_text(ElementTree.fromstring(body), 'UploadId')
+
+    def _write_part(self, number, data):
+        _, headers, _ = self._storage.request(
+            'PUT', self._path, {'partNumber': str(number), 'uploadId': self._upload_id}, data
+        )
+        return number, headers.get('etag')
+
+    def _write_single(self, data):
+        self._storage.request('PUT', self._path, body=data)
+        self._storage._remember(self._path, len(data))
+
+    def _complete(self, parts):
+        root = ElementTree.Element('CompleteMultipartUpload')
+        for number, etag in parts:
+            part = ElementTree.SubElement(root, 'Part')
+            ElementTree.SubElement(part, 'PartNumber').text = str(number)
+            ElementTree.SubElement(part, 'ETag').text = etag
+        _, _, body = self._storage.request(
+            'POST', self._path, {'uploadId': self._upload_id}, ElementTree.tostring(root)
+        )
+        # errors may be reported with a 200 status code
+        if S3Storage.strip_namespace(ElementTree.fromstring(body).tag) == 'Error':
+            raise IOError("Cannot complete upload of {} : {}".format(self._path, body.decode()))
+        self._storage._remember(self._path, self._size)
+
+    def _abort(self):
+        if self._upload_id is not None:
+            try:
+                self._storage.request('DELETE', self._path, {'uploadId': self._upload_id}, expected=(204, 200))
+            except IOError as e:
+                logger.error("Cannot abort upload of {} : {}".format(self._path, e))
+
+
+class S3Storage(Storage):
+    """
+    S3 compatible object storage, using path style requests signed with AWS signature version 4.
+    Files are objects whose keys are paths without leading slash.
+    """
+
+    C_SERVICE = 's3'
+    C_ALGORITHM = 'AWS4-HMAC-SHA256'
+    C_MAX_DELETE = 1000
+    # parts of a multipart upload
+    C_MAX_PARTS = 10000
+    C_RETRIES = 3
+
+    def __init__(self, storage):
+        """
+        :param storage: storage configuration
+        :type storage: snr.config.model.StorageConf
+        """
+        super(S3Storage, self).__init__(storage.name, storage.part_size, storage.max_concurrency)
+        endpoint = urlsplit(storage.endpoint)
+        self._https = endpoint.scheme == 'https'
+        self._host = endpoint.netloc
+        self._base_path = endpoint.path.rstrip('/')
+        self._region = storage.region
+        self._bucket = storage.bucket
+        self._access_key = storage.username or os.environ.get('AWS_ACCESS_KEY_ID', '')
+        self._secret_key = storage.password or os.environ.get('AWS_SECRET_ACCESS_KEY', '')
+        self._local = local()
+
+    @staticmethod
+    def strip_namespace(tag):
+        return tag.split('}')[-1]
+
+    @staticmethod
+    def find_all(element, name):
+        return [e for e in element.iter() if S3Storage.strip_namespace(e.tag) == name]
+
+    @staticmethod
+    def find_text(element, name):
+        for e in element.iter():
+            if S3Storage.strip_namespace(e.tag) == name:
+                return e.text
+        return None
+
+    def _connect(self):
+        if self._https:
+            return http.client.HTTPSConnection(self._host, timeout=300)
+        return http.client.HTTPConnection(self._host, timeout=300)
+
+    def _get_connection(self):
+        # one keep alive connection per thread
+        if getattr(self._local, 'connection', None) is None:
+            self._local.connection = self._connect()
+        return self._local.connection
+
+    def _reset_connection(self):
+        if getattr(self._local, 'connection', None) is not None:
+            self._local.connection.close()
+        self._local.connection = None
+
+    @staticmethod
+    def _hmac(key, msg):
+        return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+    def _sign(self, method, uri, query, headers, payload_hash):
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = now.strftime('%Y%m%d')
+        headers['host'] = self._host
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        signed_headers = sorted(headers.keys())
+        canonical_request = '\n'.join([
+            method,
+            uri,
+            query,
+            ''.join('{}:{}\n'.format(k, str(headers[k]).strip()) for k in signed_headers),
+            ';'.join(signed_headers),
+            payload_hash
+        ])
+        scope = '{}/{}/{}/aws4_request'.format(date, self._region, S3Storage.C_SERVICE)
+        string_to_sign = '\n'.join([
+            S3Storage.C_ALGORITHM, amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        key = self._hmac(('AWS4' + self._secret_key).encode(), date)
+        for msg in (self._region, S3Storage.C_SERVICE, 'aws4_request'):
+            key = self._hmac(key, msg)
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['authorization'] = '{} Credential={}/{}, SignedHeaders={}, Signature={}'.format(
+            S3Storage.C_ALGORITHM, self._access_key, scope, ';'.join(signed_headers), signature
+        )
+
+    def _prepare(self, method, path, query, body, headers):
+        uri = '{}/{}'.format(self._base_path, self._bucket)
+        if path:
+            uri += '/' + quote(path.lstrip('/'), safe='/~')
+        query = '&'.join(
+            '{}={}'.format(quote(k, safe='~'), quote(v, safe='~')) for k, v in sorted((query or dict()).items())
+        )
+        headers = dict((k.lower(), v) for k, v in (headers or dict()).items())
+        headers['content-length'] = str(len(body))
+        self._sign(method, uri, query, headers, hashlib.sha256(body).hexdigest())
+        return uri + ('?' + query if query else ''), headers
+
+    def request(self, method, path=None, query=None, body=b'', headers=None, expected=(200,)):
+        """
+        Signed request, retried on connection errors
+        :param method: HTTP method
+        :type method: str
+        :param path: file path, bucket if None
+        :type path: Union[str|None]
+        :param query: query parameters
+        :type query: Union[dict|None]
+        :param body: request body
+        :type body: bytes
+        :param headers: additional headers
+        :type headers: Union[dict|None]
+        :param expected: expected status codes
+        :type expected: tuple
+        :return: status, lower case response headers, response body
+        :rtype: tuple
+        :raise: IOError on unexpected status
+        """
+        for attempt in range(S3Storage.C_RETRIES):
+            url, signed_headers = self._prepare(method, path, query, body, headers)
+            try:
+                connection = self._get_connection()
+                connection.request(method, url, body=body, headers=signed_headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self._reset_connection()
+                if attempt == S3Storage.C_RETRIES - 1:
+                    raise IOError("{} {} failed : {}".format(method, url, e))
+                logger.warning("{} {} failed, retrying : {}".format(method, url, e))
+        if response.status not in expected:
+            raise IOError(
+                "{} {} returned {} : {}".format(method, url, response.status, data[:500].decode(errors='replace'))
+            )
+        return response.status, dict((k.lower(), v) for k, v in response.getheaders()), data
+
+    def open_write(self, path):
+        return S3Writer(self, path, self._part_size, self._max_concurrency)
+
+    def open_read(self, path, start=None, end=None):
+        """
+        :param path: file path
+        :type path: str
+        :param start: Optional. First byte to read
+        :type start: Union[int|None]
+        :param end: Optional. Last byte to read, included
+        :type end: Union[int|None]
+        :return: binary file like object
+        :rtype: S3Reader
+        """
+        headers = dict()
+        if start is not None:
+            headers['range'] = 'bytes={}-{}'.format(start, '' if end is None else end)
+        url, signed_headers = self._prepare('GET', path, None, b'', headers)
+        connection = self._connect()
+        connection.request('GET', url, headers=signed_headers)
+        response = connection.getresponse()
+        if response.status not in (200, 206):
+            data = response.read()
+            connection.close()
+            raise IOError("GET {} returned {} : {}".format(url, response.status, data[:500].decode(errors='replace')))
+        return S3Reader(connection, response)
+
+    def _list(self, prefix, delimiter=None):
+        """
+        :return: list of (path, size)
+        :rtype: list
+        """
+        files = list()
+        query = {'list-type': '2', 'prefix': prefix}
+        if delimiter:
+            query['delimiter'] = delimiter
+        self._forget_folder('/' + prefix, not delimiter)
+        while True:
+            _, _, body = self.request('GET', None, query)
+            root = ElementTree.fromstring(body)
+            for content in S3Storage.find_all(root, 'Contents'):
+                path = '/' + S3Storage.find_text(content, 'Key')
+                size = int(S3Storage.find_text(content, 'Size'))
+                self._remember(path, size)
+                files.append((path, size))
+            token = S3Storage.find_text(root, 'NextContinuationToken')
+            if S3Storage.find_text(root, 'IsTruncated') != 'true' or not token:
+                return files
+            query['continuation-token'] = token
+
+    def listdir(self, folder):
+        prefix = folder.strip('/') + '/'
+        return dict((os.path.basename(path), size) for path, size in self._list(prefix, '/'))
+
+    def walk(self, root):
+        files = dict()
+        for path, _ in self._list(root.strip('/') + '/'):
+            files.setdefault(os.path.dirname(path), list()).append(path)
+        return files
+
+    def size(self, path):
+        if path in self._sizes.keys():
+            return self._sizes[path]
+        status, headers, _ = self.request('HEAD', path, expected=(200, 404))
+        if status == 404:
+            return None
+        size = int(headers.get('content-length', 0))
+        self._remember(path, size)
+        return size
+
+    def delete(self, paths):
+        deleted = list()
+        for i in range(0, len(paths), S3Storage.C_MAX_DELETE):
+            batch = paths[i:i + S3Storage.C_MAX_DELETE]
+            root = ElementTree.Element('Delete')
+            ElementTree.SubElement(root, 'Quiet').text = 'true'
+            for path in batch:
+                ElementTree.SubElement(ElementTree.SubElement(root, 'Object'), 'Key').text = path.lstrip('/')
+            body = ElementTree.tostring(root)
+            md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+            # files are gone, or in an unknown state
+            for path in batch:
+                self._forget(path)
+            try:
+                _, _, response = self.request('POST', None, {'delete': ''}, body, {'content-md5': md5})
+            except IOError as e:
+                logger.error("Cannot delete {} files : {}".format(len(batch), e))
+                continue
+            failed = set()
+            for error in S3Storage.find_all(ElementTree.fromstring(response), 'Error'):
+                key = S3Storage.find_text(error, 'Key')
+                failed.add('/' + key)
+                logger.error("Cannot delete /{} : {}".format(key, S3Storage.find_text(error, 'Message')))
+            for path in batch:
+                if path not in failed:
+                    deleted.append(path)
+        return deleted
@@ -0,0 +1,306 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        sftp
+# Purpose:     SFTP storage
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import stat
+import logging
+from contextlib import contextmanager
+from threading import Lock
+
+from snr.storage.storage import Storage, StorageWriter
+
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+
+logger = logging.getLogger(__name__)
+
+
+class SFTPWriter(StorageWriter):
+    """
+    SFTP streaming upload. Parts are written in order by a single worker, SFTP writes being pipelined.
+    """
+
+    def __init__(self, storage, path, part_size):
+        self._storage = storage
+        self._client = None
+        self._file = None
+        super(SFTPWriter, self).__init__(path, part_size, 1)
+
+    def _open(self):
+        self._client = self._storage.acquire_client()
+        self._storage.makedirs(os.path.dirname(self._path), self._client)
+        self._file = self._client.open(self._path + Storage.C_TMP_SUFFIX, 'wb')
+        self._file.set_pipelined(True)
+
+    def _release(self):
+        if self._client is not None:
+            self._storage.release_client(self._client)
+            self._client = None
+
+    def _start(self):
+        self._open()
+
+    def _write_part(self, number, data):
+        self._file.write(data)
+        return number
+
+    def _write_single(self, data):
+        self._open()
+        self._write_part(1, data)
+        self._complete([1])
+
+    def _complete(self, parts):
+        try:
+            self._file.close()
+            self._client.posix_rename(self._path + Storage.C_TMP_SUFFIX, self._path)
+            self._storage._remember(self._path, self._size)
+        finally:
+            self._release()
+
+    def _abort(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+                with self._storage.client() as sftp:
+                    sftp.remove(self._path + Storage.C_TMP_SUFFIX)
+            except IOError:
+                pass
+        self._release()
+
+
+class SFTPReader:
+    """
+    File opened for reading, giving its SFTP client back to the pool once closed
+    """
+
+    def __init__(self, storage, client, file):
+        self._storage = storage
+        self._client = client
+        self._file = file
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def close(self):
+        if self._client is not None:
+            try:
+                self._file.close()
+            finally:
+                self._storage.release_client(self._client)
+                self._client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SFTPStorage(Storage):
+    """
+    SFTP storage, requires paramiko. SSH connections are shared by threads through a pool, keeping up to
+    max_concurrency idle connections.
+    """
+
+    C_DEFAULT_PORT = 22
+
+    def __init__(self, storage):
+        """
+        :param storage: storage configuration
+        :type storage: snr.config.model.StorageConf
+        :raise: TypeError if paramiko is not installed
+        """
+        if paramiko is None:
+            raise TypeError("SFTP storage {} requires paramiko, please install it".format(storage.name))
+        super(SFTPStorage, self).__init__(storage.name, storage.part_size, storage.max_concurrency)
+        self._host = storage.host
+        self._port = storage.port or SFTPStorage.C_DEFAULT_PORT
+        self._username = storage.username
+        self._password = storage.password
+        self._key_file = storage.key_file
+        self._idle = list()
+        self._pool_lock = Lock()
+        self._closed = False
+
+    def _connect(self):
+        transport = paramiko.Transport((self._host, self._port))
+        try:
+            pkey = None
+            if self._key_file and hasattr(paramiko.PKey, 'from_path'):
+                pkey = paramiko.PKey.from_path(self._key_file)
+            elif self._key_file:
+                pkey = paramiko.RSAKey.from_private_key_file(self._key_file)
+            transport.connect(username=self._username, password=self._password, pkey=pkey)
+            return paramiko.SFTPClient.from_transport(transport)
+        except Exception:
+            transport.close()
+            raise
+
+    @staticmethod
+    def _disconnect(client):
+        transport = client.get_channel().get_transport()
+        client.close()
+        transport.close()
+
+    def acquire_client(self):
+        """
+        :return: idle SFTP client of the pool, a new one if none is. Give it back with release_client()
+        :rtype: paramiko.SFTPClient
+        """
+        with self._pool_lock:
+            while len(self._idle) > 0:
+                client = self._idle.pop()
+                if client.get_channel().get_transport().is_active():
+                    return client
+                SFTPStorage._disconnect(client)
+        return self._connect()
+
+    def release_client(self, client):
+        """
+        Give a client back to the pool, disconnect it if enough clients are idle
+        :param client: client from acquire_client()
+        :type client: paramiko.SFTPClient
+        """
+        with self._pool_lock:
+            if not self._closed and len(self._idle) < self._max_concurrency:
+                self._idle.append(client)
+                return
+        SFTPStorage._disconnect(client)
+
+    @contextmanager
+    def client(self):
+        """
+        SFTP client of the pool, for the duration of a with statement
+        """
+        client = self.acquire_client()
+        try:
+            yield client
+        finally:
+            self.release_client(client)
+
+    def close(self):
+        with self._pool_lock:
+            self._closed = True
+            idle = self._idle
+            self._idle = list()
+        for client in idle:
+            SFTPStorage._disconnect(client)
+
+    def makedirs(self, folder, sftp=None):
+        """
+        :param folder: folder path
+        :type folder: str
+        :param sftp: Optional. client to use, one of the pool per default
+        :type sftp: Union[paramiko.SFTPClient|None]
+        """
+        if sftp is None:
+            with self.client() as sftp:
+                return self.makedirs(folder, sftp)
+        path = ''
+        for part in folder.strip('/').split('/'):
+            path += '/' + part
+            try:
+                sftp.stat(path)
+            except IOError:
+                sftp.mkdir(path)
+
+    def open_write(self, path):
+        return SFTPWriter(self, path, self._part_size)
+
+    def open_read(self, path, start=None, end=None):
+        client = self.acquire_client()
+        try:
+            f = client.open(path, 'rb')
+        except Exception:
+            self.release_client(client)
+            raise
+        # prefetch reads ahead from current position, up to the last byte of the range
+        if start is not None:
+            f.seek(start)
+        f.prefetch(None if end is None else end + 1)
+        return SFTPReader(self, client, f)
+
+    def listdir(self, folder):
+        files = dict()
+        self._forget_folder(folder, False)
+        try:
+            with self.client() as sftp:
+                attrs = sftp.listdir_attr(folder)
+        except IOError:
+            return files
+        for attr in attrs:
+            if stat.S_ISREG(attr.st_mode):
+                files[attr.filename] = attr.st_size
+                self._remember(os.path.join(folder, attr.filename), attr.st_size)
+        return files
+
+    def walk(self, root):
+        files = dict()
+        folders = [root]
+        self._forget_folder(root)
+        with self.client() as sftp:
+            while len(folders) > 0:
+                folder = folders.pop()
+                try:
+                    attrs = sftp.listdir_attr(folder)
+                except IOError:
+                    continue
+                for attr in attrs:
+                    path = os.path.join(folder, attr.filename)
+                    if stat.S_ISDIR(attr.st_mode):
+                        folders.append(path)
+                    elif stat.S_ISREG(attr.st_mode):
+                        self._remember(path, attr.st_size)
+                        files.setdefault(folder, list()).append(path)
+        return files
+
+    def size(self, path):
+        if path in self._sizes.keys():
+            return self._sizes[path]
+        try:
+            with self.client() as sftp:
+                size = sftp.stat(path).st_size
+        except FileNotFoundError:
+            return None
+        self._remember(path, size)
+        return size
+
+    def delete(self, paths):
+        deleted = list()
+        with self.client() as sftp:
+            for path in paths:
+                self._forget(path)
+                try:
+                    sftp.remove(path)
+                    deleted.append(path)
+                except IOError as e:
+                    logger.error("Cannot delete {} : {}".format(path, e))
+        return deleted
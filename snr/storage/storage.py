@@ -0,0 +1,712 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        storage
+# Purpose:     Save storage backends
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Semaphore, Lock
+
+from snr.config import Config
+from snr.yamlhelper import YAMLHelper
+from snr.units import Units
+from snr.config.model import StorageConf
+
+logger = logging.getLogger(__name__)
+
+
+class StorageWriter:
+    """
+    Streaming writer. Subprocesses write into fileno(), a pipe drained by a pump thread which cuts the stream into
+    parts of part_size bytes uploaded by at most max_concurrency threads. Memory is bounded to
+    (max_concurrency + 1) * part_size bytes.
+    When the number of parts is limited, part size doubles every tenth of max_parts parts, so that streams of unknown
+    size fit in max_parts parts.
+    """
+
+    def __init__(self, path, part_size, max_concurrency, max_parts=None):
+        """
+        :param path: destination path in storage
+        :type path: str
+        :param part_size: bytes per uploaded part
+        :type part_size: int
+        :param max_concurrency: number of parts uploaded at the same time
+        :type max_concurrency: int
+        :param max_parts: Optional. maximum number of parts, unlimited per default
+        :type max_parts: Union[int|None]
+        """
+        self._path = path
+        self._part_size = part_size
+        self._max_parts = max_parts
+        self._read_fd, self._write_fd = os.pipe()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._slots = Semaphore(max_concurrency)
+        self._futures = list()
+        self._size = 0
+        self._error = None
+        self._closed = False
+        # a writer left open must not keep the process alive
+        self._pump = Thread(target=self._run, name="writer {}".format(path), daemon=True)
+        self._pump.start()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def size(self):
+        """
+        :return: bytes written so far
+        :rtype: int
+        """
+        return self._size
+
+    def fileno(self):
+        """
+        :return: file descriptor to write to, to be given to subprocesses as stdout
+        :rtype: int
+        """
+        return self._write_fd
+
+    def write(self, data):
+        """
+        Write data from current process
+        :param data: data to write
+        :type data: bytes
+        """
+        view = memoryview(data)
+        while len(view) > 0:
+            view = view[os.write(self._write_fd, view):]
+
+    def _get_part_size(self, number):
+        """
+        :param number: part number, starting at 1
+        :type number: int
+        :return: size of part
+        :rtype: int
+        """
+        if self._max_parts is None:
+            return self._part_size
+        return self._part_size << ((number - 1) // max(self._max_parts // 10, 1))
+
+    def _read_part(self, size):
+        part = bytearray()
+        while len(part) < size:
+            data = os.read(self._read_fd, min(size - len(part), 1024 * 1024))
+            if not data:
+                break
+            part.extend(data)
+        return bytes(part)
+
+    def _upload(self, number, data):
+        try:
+            return self._write_part(number, data)
+        finally:
+            self._slots.release()
+
+    def _run(self):
+        number = 0
+        try:
+            while True:
+                part = self._read_part(self._get_part_size(number + 1))
+                # an empty stream is written as an empty object
+                if not part and number > 0:
+                    break
+                number += 1
+                if self._max_parts is not None and number > self._max_parts:
+                    raise IOError("stream exceeds {} parts".format(self._max_parts))
+                if number == 1 and len(part) < self._part_size:
+                    # small stream, no need for multipart upload
+                    self._write_single(part)
+                    self._size += len(part)
+                    break
+                if number == 1:
+                    self._start()
+                self._slots.acquire()
+                if self._error is not None:
+                    self._slots.release()
+                    break
+                self._futures.append(self._executor.submit(self._upload, number, part))
+                self._size += len(part)
+                # fail fast on upload error
+                self._check_futures()
+        except Exception as e:
+            self._error = e
+        finally:
+            # writing processes fail on broken pipe instead of producing data nobody reads
+            os.close(self._read_fd)
+
+    def _check_futures(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def close(self):
+        """
+        Close writer once writing processes exited and wait for upload completion
+        :return: written bytes
+        :rtype: int
+        :raise: IOError on upload error
+        """
+        self._closed = True
+        os.close(self._write_fd)
+        self._pump.join()
+        parts = list()
+        try:
+            for future in self._futures:
+                parts.append(future.result())
+        except Exception as e:
+            self._error = self._error or e
+        self._executor.shutdown()
+        if self._error is not None:
+            self._abort()
+            raise IOError("Cannot write {} : {}".format(self._path, self._error))
+        if len(self._futures) > 0:
+            self._complete(parts)
+        return self._size
+
+    def abort(self):
+        """
+        Abort writing, once writing processes exited. Partial data is discarded. Does nothing once writer is closed.
+        """
+        if self._closed:
+            return
+        self._error = self._error or IOError("aborted")
+        try:
+            self.close()
+        except IOError:
+            pass
+
+    def _start(self):
+        """
+        Start multipart upload
+        """
+        raise NotImplementedError
+
+    def _write_part(self, number, data):
+        """
+        Upload a part
+        :param number: part number, starting at 1
+        :type number: int
+        :param data: part content
+        :type data: bytes
+        :return: part reference given to _complete()
+        """
+        raise NotImplementedError
+
+    def _write_single(self, data):
+        """
+        Write a stream smaller than part_size at once
+        :param data: whole content
+        :type data: bytes
+        """
+        raise NotImplementedError
+
+    def _complete(self, parts):
+        """
+        Complete multipart upload
+        :param parts: part references, in order
+        :type parts: list
+        """
+        raise NotImplementedError
+
+    def _abort(self):
+        """
+        Discard partial upload
+        """
+        raise NotImplementedError
+
+
+class StorageReader:
+    """
+    Streaming reader. Byte ranges of part_size bytes are read ahead by at most max_concurrency threads and written
+    in order into a pipe whose read end, fileno(), is given to subprocesses as stdin. Download and restore overlap,
+    nothing is staged locally and memory is bounded to (max_concurrency + 1) * part_size bytes.
+    """
+
+    C_RETRIES = 3
+
+    def __init__(self, storage, path, size, part_size, max_concurrency):
+        """
+        :param storage: storage to read from
+        :type storage: Storage
+        :param path: file path in storage
+        :type path: str
+        :param size: file size in bytes
+        :type size: int
+        :param part_size: bytes per range request
+        :type part_size: int
+        :param max_concurrency: number of ranges read at the same time
+        :type max_concurrency: int
+        """
+        self._storage = storage
+        self._path = path
+        self._size = size
+        self._part_size = part_size
+        self._max_concurrency = max_concurrency
+        self._read_fd, self._write_fd = os.pipe()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._read = 0
+        self._error = None
+        self._pump = Thread(target=self._run, name="reader {}".format(path), daemon=True)
+        self._pump.start()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def size(self):
+        """
+        :return: bytes handed to the reading side so far
+        :rtype: int
+        """
+        return self._read
+
+    def fileno(self):
+        """
+        :return: file descriptor to read from, to be given to subprocesses as stdin
+        :rtype: int
+        """
+        return self._read_fd
+
+    def read(self, size=-1):
+        """
+        Read data from current process
+        :param size: maximum number of bytes to read
+        :type size: int
+        :rtype: bytes
+        """
+        return os.read(self._read_fd, size if size > 0 else Storage.C_BUFFER_SIZE)
+
+    def _read_range(self, start, end):
+        length = end - start + 1
+        for attempt in range(StorageReader.C_RETRIES):
+            try:
+                data = bytearray()
+                with self._storage.open_read(self._path, start, end) as f:
+                    while len(data) < length:
+                        chunk = f.read(length - len(data))
+                        if not chunk:
+                            break
+                        data.extend(chunk)
+                if len(data) != length:
+                    raise IOError("got {} bytes out of {} at offset {}".format(len(data), length, start))
+                return bytes(data)
+            except IOError as e:
+                if attempt == StorageReader.C_RETRIES - 1:
+                    raise
+                logger.warning("Reading {} at offset {} failed, retrying : {}".format(self._path, start, e))
+
+    def _run(self):
+        futures = deque()
+        offset = 0
+        try:
+            while offset < self._size or len(futures) > 0:
+                # keep max_concurrency ranges in flight
+                while offset < self._size and len(futures) < self._max_concurrency:
+                    end = min(offset + self._part_size, self._size) - 1
+                    futures.append(self._executor.submit(self._read_range, offset, end))
+                    offset = end + 1
+                view = memoryview(futures.popleft().result())
+                while len(view) > 0:
+                    written = os.write(self._write_fd, view)
+                    self._read += written
+                    view = view[written:]
+        except BrokenPipeError:
+            # reading side is gone, it reports its own error
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            for future in futures:
+                future.cancel()
+            os.close(self._write_fd)
+            self._executor.shutdown()
+
+    def close(self):
+        """
+        Close reader once reading processes exited
+        :raise: IOError on read error
+        """
+        os.close(self._read_fd)
+        self._pump.join()
+        if self._error is not None:
+            raise IOError("Cannot read {} : {}".format(self._path, self._error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Storage:
+    """
+    Save storage backend factory. Saves are written to local filesystem unless their storage key refers to one of
+    the storages configured through yaml config file via storages key.
+    Paths are absolute, as produced from save destination templates.
+    """
+
+    C_YAML = """
+# remote storages referenced by saves storage key
+#storages:
+#  # S3 compatible object storage. Credentials file holds access key as username and secret key as password
+#  - name: offsite
+#    type: s3
+#    endpoint: https://s3.eu-west-3.amazonaws.com
+#    region: eu-west-3
+#    bucket: my-saves
+#    credentials: /root/.snr/s3
+#    # multipart upload part size, at least 5MB, and number of parts uploaded at the same time. Part size doubles
+#    # every 1000 parts so that saves fit in the 10000 parts of a multipart upload
+#    part_size: 16MB
+#    max_concurrency: 4
+#  # SFTP server, requires paramiko. Credentials file holds username and password, or key_file is used
+#  - name: backup-host
+#    type: sftp
+#    host: backup.example.com
+#    port: 22
+#    credentials: /root/.snr/sftp
+#    # key_file: /root/.ssh/id_ed25519
+"""
+
+    cache = dict()
+    local = None
+
+    C_STORAGES = 'storages'
+    C_NAME = 'name'
+    C_TYPE = 'type'
+    C_ENDPOINT = 'endpoint'
+    C_REGION = 'region'
+    C_BUCKET = 'bucket'
+    C_HOST = 'host'
+    C_PORT = 'port'
+    C_CREDENTIALS = 'credentials'
+    C_KEY_FILE = 'key_file'
+    C_PART_SIZE = 'part_size'
+    C_MAX_CONCURRENCY = 'max_concurrency'
+    C_TYPE_LOCAL = 'local'
+    C_TYPE_S3 = 's3'
+    C_TYPE_SFTP = 'sftp'
+    C_TYPES = {C_TYPE_LOCAL, C_TYPE_S3, C_TYPE_SFTP}
+    C_KEYS = {C_NAME, C_TYPE}
+    C_TYPE_KEYS = {
+        C_TYPE_LOCAL: set(),
+        C_TYPE_S3: {C_ENDPOINT, C_BUCKET},
+        C_TYPE_SFTP: {C_HOST},
+    }
+    C_OPT_KEYS = {C_REGION, C_PORT, C_CREDENTIALS, C_KEY_FILE, C_PART_SIZE, C_MAX_CONCURRENCY}
+    C_DEFAULT_REGION = 'us-east-1'
+    C_DEFAULT_PART_SIZE = 16 * 1024 * 1024
+    # smallest part of S3 multipart uploads, but the last one
+    C_S3_MIN_PART_SIZE = 5 * 1024 * 1024
+    C_DEFAULT_MAX_CONCURRENCY = 4
+    # bytes per read when copying streams
+    C_BUFFER_SIZE = 1024 * 1024
+    # suffix of files being written, when storage can't write them atomically
+    C_TMP_SUFFIX = '.part'
+
+    def __init__(self, name, part_size=C_DEFAULT_PART_SIZE, max_concurrency=C_DEFAULT_MAX_CONCURRENCY):
+        """
+        Should not be used directly. See get_instance().
+        :param name: storage name as per config
+        :type name: str
+        :param part_size: Optional. bytes per uploaded part or range request
+        :type part_size: int
+        :param max_concurrency: Optional. number of parts transferred at the same time
+        :type max_concurrency: int
+        """
+        self._name = name
+        self._part_size = part_size
+        self._max_concurrency = max_concurrency
+        self._fingerprint = None
+        self._sizes = dict()
+        self._sizes_lock = Lock()
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def is_local(self):
+        """
+        :return: True if paths are local filesystem paths
+        :rtype: bool
+        """
+        return False
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate storages section, along with storages credentials files
+        :param config: configuration being compiled
+        :type config: Config
+        :return: StorageConf by storage name
+        :rtype: dict
+        :raise: TypeError on configuration error
+        """
+        from snr.database.database import Database
+        storages = dict()
+        if Storage.C_STORAGES not in config.data.keys() or not config.data[Storage.C_STORAGES]:
+            return storages
+        try:
+            for storage in config.data[Storage.C_STORAGES]:
+                YAMLHelper.analyse_keys(Storage.C_STORAGES, storage, Storage.C_KEYS, Storage.C_OPT_KEYS.union(
+                    *Storage.C_TYPE_KEYS.values()
+                ))
+                YAMLHelper.check_key_values(Storage.C_TYPE, storage[Storage.C_TYPE], Storage.C_TYPES)
+                missing = Storage.C_TYPE_KEYS[storage[Storage.C_TYPE]].difference(storage.keys())
+                if len(missing) > 0:
+                    raise TypeError("Missing {} key(s) for {} storage {}".format(
+                        missing, storage[Storage.C_TYPE], storage[Storage.C_NAME]
+                    ))
+                username = None
+                password = None
+                if Storage.C_CREDENTIALS in storage.keys():
+                    credentials = config.load_yaml(storage[Storage.C_CREDENTIALS])
+                    YAMLHelper.analyse_keys(storage[Storage.C_CREDENTIALS], credentials, Database.C_KEYS)
+                    username = credentials[Database.C_USER]
+                    password = credentials[Database.C_PASS]
+                try:
+                    part_size = Units.parse_size(storage.get(Storage.C_PART_SIZE, Storage.C_DEFAULT_PART_SIZE))
+                except ValueError as e:
+                    raise TypeError("Invalid {} : {}".format(Storage.C_PART_SIZE, e))
+                if part_size < 1:
+                    raise TypeError("{} should be a positive size".format(Storage.C_PART_SIZE))
+                if storage[Storage.C_TYPE] == Storage.C_TYPE_S3 and part_size < Storage.C_S3_MIN_PART_SIZE:
+                    raise TypeError(
+                        "{} of s3 storage {} should be at least 5MB, the smallest multipart upload part".format(
+                            Storage.C_PART_SIZE, storage[Storage.C_NAME]
+                        )
+                    )
+                max_concurrency = storage.get(Storage.C_MAX_CONCURRENCY, Storage.C_DEFAULT_MAX_CONCURRENCY)
+                if not isinstance(max_concurrency, int) or max_concurrency < 1:
+                    raise TypeError("{} should be a positive integer".format(Storage.C_MAX_CONCURRENCY))
+                storage_conf = StorageConf(
+                    storage[Storage.C_NAME],
+                    storage[Storage.C_TYPE],
+                    storage.get(Storage.C_ENDPOINT),
+                    storage.get(Storage.C_REGION, Storage.C_DEFAULT_REGION),
+                    storage.get(Storage.C_BUCKET),
+                    storage.get(Storage.C_HOST),
+                    storage.get(Storage.C_PORT),
+                    username,
+                    password,
+                    storage.get(Storage.C_KEY_FILE),
+                    part_size,
+                    max_concurrency
+                )
+                storages[storage_conf.name] = storage_conf
+        except TypeError as e:
+            raise TypeError("Storage configuration error : {}".format(e))
+        return storages
+
+    @staticmethod
+    def get_local():
+        """
+        :return: local filesystem storage
+        :rtype: Storage
+        """
+        if Storage.local is None:
+            from snr.storage.local import LocalStorage
+            Storage.local = LocalStorage(Storage.C_TYPE_LOCAL)
+        return Storage.local
+
+    @staticmethod
+    def get_instance(conf, name=None):
+        """
+        Storage class Factory. Instances are cached by 'conf' parameter and name and rebuilt when their configuration
+        change.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :param name: Optional. storage name as per config, local filesystem per default
+        :type name: Union[str|None]
+        :rtype: Storage
+        """
+        if name is None:
+            return Storage.get_local()
+        config = Config.get_instance(conf)
+        storage = config.storages[name]
+        fingerprint = config.get_fingerprint(Config.F_STORAGE, name)
+        cached = Storage.cache.get(conf, dict()).get(name)
+        if cached is not None and cached.fingerprint == fingerprint:
+            return cached
+        if cached is not None:
+            cached.close()
+
+        if storage.type == Storage.C_TYPE_S3:
+            from snr.storage.s3 import S3Storage
+            instance = S3Storage(storage)
+        elif storage.type == Storage.C_TYPE_SFTP:
+            from snr.storage.sftp import SFTPStorage
+            instance = SFTPStorage(storage)
+        else:
+            from snr.storage.local import LocalStorage
+            instance = LocalStorage(name)
+        instance._fingerprint = fingerprint
+        if conf not in Storage.cache.keys():
+            Storage.cache[conf] = dict()
+        Storage.cache[conf][name] = instance
+        return instance
+
+    def close(self):
+        """
+        Release connections kept open by this storage. Transfers in progress complete.
+        """
+        pass
+
+    def _remember(self, path, size):
+        with self._sizes_lock:
+            self._sizes[path] = size
+
+    def _forget(self, path):
+        with self._sizes_lock:
+            self._sizes.pop(path, None)
+
+    def _forget_folder(self, folder, recursive=True):
+        """
+        Forget sizes of files under folder before listing it, so that files deleted meanwhile are not reported
+        :param folder: folder path
+        :type folder: str
+        :param recursive: Optional. Forget files of sub folders too
+        :type recursive: bool
+        """
+        folder = folder.rstrip('/') + '/'
+        with self._sizes_lock:
+            for path in list(self._sizes.keys()):
+                if path.startswith(folder) and (recursive or '/' not in path[len(folder):]):
+                    del self._sizes[path]
+
+    def open_write(self, path):
+        """
+        :param path: file path
+        :type path: str
+        :return: streaming writer
+        :rtype: StorageWriter
+        """
+        raise NotImplementedError
+
+    def open_read(self, path):
+        """
+        :param path: file path
+        :type path: str
+        :return: binary file like object
+        """
+        raise NotImplementedError
+
+    def put(self, source, path):
+        """
+        Move a local file to storage
+        :param source: local file path, removed once stored
+        :type source: str
+        :param path: file path
+        :type path: str
+        :return: stored bytes
+        :rtype: int
+        :raise: IOError on write error
+        """
+        writer = self.open_write(path)
+        try:
+            with open(source, 'rb') as f:
+                while True:
+                    data = f.read(self._part_size)
+                    if not data:
+                        break
+                    writer.write(data)
+        except Exception:
+            writer.abort()
+            raise
+        size = writer.close()
+        os.remove(source)
+        return size
+
+    def open_stream(self, path):
+        """
+        :param path: file path
+        :type path: str
+        :return: streaming reader, reading byte ranges ahead in parallel
+        :rtype: StorageReader
+        :raise: IOError if file does not exist
+        """
+        size = self.size(path)
+        if size is None:
+            raise IOError("{} does not exist".format(path))
+        return StorageReader(self, path, size, self._part_size, self._max_concurrency)
+
+    def listdir(self, folder):
+        """
+        :param folder: folder path
+        :type folder: str
+        :return: size by file name, empty if folder does not exist
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def walk(self, root):
+        """
+        List all files under root, with as few requests as possible
+        :param root: root path
+        :type root: str
+        :return: file paths by folder
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def exists(self, path):
+        """
+        :param path: file path
+        :type path: str
+        :rtype: bool
+        """
+        return self.size(path) is not None
+
+    def size(self, path):
+        """
+        :param path: file path
+        :type path: str
+        :return: file size in bytes, None if file does not exist
+        :rtype: Union[int|None]
+        :raise: IOError if size cannot be read
+        """
+        raise NotImplementedError
+
+    def delete(self, paths):
+        """
+        Delete files, in batches when storage allows it
+        :param paths: file paths
+        :type paths: list
+        :return: deleted paths
+        :rtype: list
+        """
+        raise NotImplementedError
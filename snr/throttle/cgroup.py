@@ -0,0 +1,251 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        cgroup
+# Purpose:     Per job cgroup v2 resource limits and accounting
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class Cgroup:
+    """
+    cgroup v2 group of one save job. Groups are created under a jobs group next to snr own cgroup, which must be
+    delegated to snr (systemd Delegate=yes). snr moves itself to a leaf group on first use, as cgroup v2 forbids
+    processes in groups distributing resources to children.
+    Commands join their group before exec, see wrap(), so that their whole process tree is accounted and limited.
+    """
+
+    C_MOUNT = '/sys/fs/cgroup'
+    C_CONTROLLERS = ('cpu', 'io', 'memory')
+    C_LEAF = 'snr'
+    C_JOBS = 'jobs'
+    C_CPU_PERIOD = 100000
+    # io_max configuration keys -> io.max keys
+    C_IO_MAX_KEYS = {'read_bps': 'rbps', 'write_bps': 'wbps', 'read_iops': 'riops', 'write_iops': 'wiops'}
+    C_SHELL = '/bin/sh'
+
+    _root = None
+    _available = None
+    _lock = Lock()
+
+    def __init__(self, path):
+        """
+        Should not be used directly. See create().
+        :param path: group folder
+        :type path: str
+        """
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    @staticmethod
+    def _write(path, value):
+        with open(path, 'w') as f:
+            f.write(value)
+
+    @staticmethod
+    def _setup():
+        """
+        Find snr own cgroup, move snr to a leaf group and enable controllers for jobs
+        :return: jobs group folder
+        :rtype: str
+        :raise: OSError if cgroup v2 is not available or not delegated
+        """
+        if not os.path.exists(os.path.join(Cgroup.C_MOUNT, 'cgroup.controllers')):
+            raise OSError("cgroup v2 is not mounted on {}".format(Cgroup.C_MOUNT))
+        own = None
+        with open('/proc/self/cgroup') as f:
+            for line in f:
+                if line.startswith('0::'):
+                    own = line[3:].strip()
+        if own is None:
+            raise OSError("snr does not belong to a cgroup v2 group")
+        own = os.path.join(Cgroup.C_MOUNT, own.lstrip('/'))
+        if os.path.basename(own) == Cgroup.C_LEAF:
+            # already moved, by a previous instance of snr
+            own = os.path.dirname(own)
+        with open(os.path.join(own, 'cgroup.controllers')) as f:
+            available = f.read().split()
+        missing = set(Cgroup.C_CONTROLLERS).difference(available)
+        if len(missing) > 0:
+            raise OSError("{} controller(s) not delegated to {}".format(', '.join(sorted(missing)), own))
+        leaf = os.path.join(own, Cgroup.C_LEAF)
+        os.makedirs(leaf, exist_ok=True)
+        Cgroup._write(os.path.join(leaf, 'cgroup.procs'), str(os.getpid()))
+        controllers = ' '.join('+{}'.format(c) for c in Cgroup.C_CONTROLLERS)
+        Cgroup._write(os.path.join(own, 'cgroup.subtree_control'), controllers)
+        jobs = os.path.join(own, Cgroup.C_JOBS)
+        os.makedirs(jobs, exist_ok=True)
+        Cgroup._write(os.path.join(jobs, 'cgroup.subtree_control'), controllers)
+        logger.info("Save jobs run in cgroups under {}".format(jobs))
+        return jobs
+
+    @staticmethod
+    def is_available():
+        """
+        :return: True if job groups can be created. Checked once, a warning is logged if not.
+        :rtype: bool
+        """
+        with Cgroup._lock:
+            if Cgroup._available is None:
+                try:
+                    Cgroup._root = Cgroup._setup()
+                    Cgroup._available = True
+                except OSError as e:
+                    logger.warning("cgroup limits disabled, save jobs run without them : {}".format(e))
+                    Cgroup._available = False
+            return Cgroup._available
+
+    @staticmethod
+    def create(name, limits):
+        """
+        :param name: job name
+        :type name: str
+        :param limits: job limits
+        :type limits: snr.config.model.ThrottleConf
+        :return: job group, None if cgroups are not available
+        :rtype: Union[Cgroup|None]
+        """
+        if not Cgroup.is_available():
+            return None
+        path = os.path.join(Cgroup._root, "{}-{}".format(name.replace(os.sep, '_'), os.getpid()))
+        try:
+            os.makedirs(path, exist_ok=True)
+            cgroup = Cgroup(path)
+            cgroup.set_limits(limits)
+            return cgroup
+        except OSError as e:
+            logger.warning("Cannot create cgroup {}, {} runs without cgroup limits : {}".format(path, name, e))
+            return None
+
+    @staticmethod
+    def get_disks():
+        """
+        :return: major:minor numbers of block devices io.max applies to. Partitions, loop and ram devices are left
+        out, as io limits apply to whole disks.
+        :rtype: list
+        """
+        disks = list()
+        for disk in sorted(os.listdir('/sys/block')):
+            if disk.startswith(('loop', 'ram', 'zram')):
+                continue
+            try:
+                with open(os.path.join('/sys/block', disk, 'dev')) as f:
+                    disks.append(f.read().strip())
+            except OSError:
+                continue
+        return disks
+
+    def set_limits(self, limits):
+        """
+        Write cpu.max, io.max and memory.max. Unset limits are reset to max.
+        :param limits: job limits
+        :type limits: snr.config.model.ThrottleConf
+        :raise: OSError on write error
+        """
+        cpu_max = 'max' if limits.cpu_max is None else str(round(limits.cpu_max * Cgroup.C_CPU_PERIOD))
+        Cgroup._write(os.path.join(self._path, 'cpu.max'), '{} {}'.format(cpu_max, Cgroup.C_CPU_PERIOD))
+        memory_max = 'max' if limits.memory_max is None else str(limits.memory_max)
+        Cgroup._write(os.path.join(self._path, 'memory.max'), memory_max)
+        io_max = limits.io_max or dict()
+        settings = ' '.join(
+            '{}={}'.format(key, io_max.get(name) or 'max') for name, key in Cgroup.C_IO_MAX_KEYS.items()
+        )
+        for disk in Cgroup.get_disks():
+            try:
+                Cgroup._write(os.path.join(self._path, 'io.max'), '{} {}'.format(disk, settings))
+            except OSError as e:
+                logger.debug("Cannot set io.max of {} on {} : {}".format(self._path, disk, e))
+
+    def wrap(self, cmd):
+        """
+        :param cmd: command
+        :type cmd: list
+        :return: command joining this group before exec. Command still runs if it can't join.
+        :rtype: list
+        """
+        return [
+            Cgroup.C_SHELL, '-c', 'echo $$ 2>/dev/null > "$0"; exec "$@"', os.path.join(self._path, 'cgroup.procs')
+        ] + list(cmd)
+
+    @staticmethod
+    def _read_keys(path):
+        values = dict()
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, value = line.split()
+                    values[key] = int(value)
+        except (OSError, ValueError):
+            pass
+        return values
+
+    def get_usage(self):
+        """
+        :return: resource usage of job processes from cgroup stat files: cpu_seconds, cpu_user_seconds,
+        cpu_system_seconds, cpu_throttled_seconds, memory_peak_bytes, io_read_bytes, io_write_bytes. Unknown values
+        are left out.
+        :rtype: dict
+        """
+        usage = dict()
+        cpu = Cgroup._read_keys(os.path.join(self._path, 'cpu.stat'))
+        for key, name in (
+                ('usage_usec', 'cpu_seconds'), ('user_usec', 'cpu_user_seconds'),
+                ('system_usec', 'cpu_system_seconds'), ('throttled_usec', 'cpu_throttled_seconds')
+        ):
+            if key in cpu:
+                usage[name] = round(cpu[key] / 1000000, 3)
+        try:
+            with open(os.path.join(self._path, 'memory.peak')) as f:
+                usage['memory_peak_bytes'] = int(f.read())
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(os.path.join(self._path, 'io.stat')) as f:
+                read = written = 0
+                for line in f:
+                    fields = dict(field.split('=') for field in line.split()[1:])
+                    read += int(fields.get('rbytes', 0))
+                    written += int(fields.get('wbytes', 0))
+                usage.update(io_read_bytes=read, io_write_bytes=written)
+        except (OSError, ValueError):
+            pass
+        return usage
+
+    def remove(self):
+        """
+        Remove group once its processes exited
+        """
+        try:
+            os.rmdir(self._path)
+        except OSError as e:
+            logger.warning("Cannot remove cgroup {} : {}".format(self._path, e))
@@ -0,0 +1,226 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        rusage
+# Purpose:     Resource usage accounting of child processes
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import time
+import logging
+import subprocess
+from contextlib import contextmanager
+from threading import Lock, local
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceUsage:
+    """
+    Resource usage of child processes, from the rusage returned by wait4() when they are reaped.
+    Processes started with AccountedPopen add their usage to the ResourceUsage collecting in the thread that started
+    them, see collect().
+    """
+
+    _context = local()
+
+    C_PREFIX = 'rusage_'
+    C_USER_SECONDS = 'rusage_user_seconds'
+    C_SYSTEM_SECONDS = 'rusage_system_seconds'
+    C_MAX_RSS_BYTES = 'rusage_max_rss_bytes'
+    C_BLOCK_READ_BYTES = 'rusage_block_read_bytes'
+    C_BLOCK_WRITE_BYTES = 'rusage_block_write_bytes'
+    C_PROCESSES = 'rusage_processes'
+    # ru_inblock and ru_oublock count 512 bytes blocks
+    C_BLOCK_SIZE = 512
+    # ru_maxrss is in kilobytes on Linux
+    C_RSS_UNIT = 1024
+    # usage values rolled up by maximum instead of sum, see rollup()
+    C_MAX_KEYS = {C_MAX_RSS_BYTES, 'memory_peak_bytes'}
+    # usage values rolled up by sum, cgroup ones included, see snr.throttle.Cgroup.get_usage()
+    C_SUM_KEYS = {
+        C_USER_SECONDS, C_SYSTEM_SECONDS, C_BLOCK_READ_BYTES, C_BLOCK_WRITE_BYTES, C_PROCESSES, 'cpu_seconds',
+        'cpu_user_seconds', 'cpu_system_seconds', 'cpu_throttled_seconds', 'io_read_bytes', 'io_write_bytes'
+    }
+
+    def __init__(self):
+        self._lock = Lock()
+        self._user_seconds = 0.0
+        self._system_seconds = 0.0
+        self._max_rss_bytes = 0
+        self._block_read_bytes = 0
+        self._block_write_bytes = 0
+        self._processes = 0
+
+    def add(self, rusage):
+        """
+        :param rusage: usage of a reaped process
+        :type rusage: resource.struct_rusage
+        """
+        with self._lock:
+            self._user_seconds += rusage.ru_utime
+            self._system_seconds += rusage.ru_stime
+            self._max_rss_bytes = max(self._max_rss_bytes, rusage.ru_maxrss * ResourceUsage.C_RSS_UNIT)
+            self._block_read_bytes += rusage.ru_inblock * ResourceUsage.C_BLOCK_SIZE
+            self._block_write_bytes += rusage.ru_oublock * ResourceUsage.C_BLOCK_SIZE
+            self._processes += 1
+
+    def as_dict(self):
+        """
+        :return: usage of reaped processes, empty if none was reaped. User and system CPU time, block I/O and process
+        count are summed, max_rss is the largest resident set size of a single process.
+        :rtype: dict
+        """
+        with self._lock:
+            if self._processes == 0:
+                return dict()
+            return {
+                ResourceUsage.C_USER_SECONDS: round(self._user_seconds, 3),
+                ResourceUsage.C_SYSTEM_SECONDS: round(self._system_seconds, 3),
+                ResourceUsage.C_MAX_RSS_BYTES: self._max_rss_bytes,
+                ResourceUsage.C_BLOCK_READ_BYTES: self._block_read_bytes,
+                ResourceUsage.C_BLOCK_WRITE_BYTES: self._block_write_bytes,
+                ResourceUsage.C_PROCESSES: self._processes
+            }
+
+    @staticmethod
+    def current():
+        """
+        :return: usage collecting in this thread, None if none
+        :rtype: Union[ResourceUsage|None]
+        """
+        return getattr(ResourceUsage._context, 'usage', None)
+
+    @staticmethod
+    @contextmanager
+    def collect():
+        """
+        Collect usage of processes started by this thread with AccountedPopen until exit
+        :rtype: ResourceUsage
+        """
+        usage = ResourceUsage()
+        previous = ResourceUsage.current()
+        ResourceUsage._context.usage = usage
+        try:
+            yield usage
+        finally:
+            ResourceUsage._context.usage = previous
+
+    @staticmethod
+    def rollup(usages):
+        """
+        :param usages: usages or part statistics, see as_dict() and snr.throttle.Cgroup.get_usage()
+        :type usages: iterable
+        :return: usage values summed, or maxed for peak memory values. Empty if usages hold no usage value.
+        :rtype: dict
+        """
+        rollup = dict()
+        for usage in usages:
+            for key, value in usage.items():
+                if value is None:
+                    continue
+                if key in ResourceUsage.C_SUM_KEYS:
+                    rollup[key] = rollup.get(key, 0) + value
+                elif key in ResourceUsage.C_MAX_KEYS:
+                    rollup[key] = max(rollup.get(key, 0), value)
+        for key, value in rollup.items():
+            if isinstance(value, float):
+                rollup[key] = round(value, 3)
+        return rollup
+
+
+class AccountedPopen(subprocess.Popen):
+    """
+    subprocess.Popen reaping its process with wait4(), so that its resource usage is added to the ResourceUsage
+    collecting in the thread which started it. Process usage includes the usage of its own reaped children.
+    Only public wait() and poll() are overridden: communicate() and context manager exit go through wait(). A process
+    reaped by garbage collection while still running is not accounted.
+    """
+
+    # seconds between checks of wait() with a timeout
+    C_POLL_INTERVAL = 0.05
+
+    def __init__(self, *args, **kwargs):
+        self._usage = ResourceUsage.current()
+        self._reap_lock = Lock()
+        super().__init__(*args, **kwargs)
+
+    def _reap(self, options):
+        """
+        Reap process if it exited, and record its return code and resource usage
+        :param options: os.wait4() options, os.WNOHANG not to block
+        :type options: int
+        """
+        try:
+            pid, status, rusage = os.wait4(self.pid, options)
+        except ChildProcessError:
+            # reaped by someone else, its status is lost as with Popen
+            if self.returncode is None:
+                self.returncode = 0
+            return
+        if pid == 0:
+            return
+        if self._usage is not None:
+            self._usage.add(rusage)
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        elif os.WIFEXITED(status):
+            self.returncode = os.WEXITSTATUS(status)
+        else:
+            self.returncode = status
+
+    def poll(self):
+        """
+        :return: return code, None if process is still running
+        :rtype: Union[int|None]
+        """
+        if self.returncode is None and self._reap_lock.acquire(blocking=False):
+            try:
+                if self.returncode is None:
+                    self._reap(os.WNOHANG)
+            finally:
+                self._reap_lock.release()
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Optional. seconds to wait for, forever per default
+        :type timeout: Union[float|None]
+        :return: return code
+        :rtype: int
+        :raise: subprocess.TimeoutExpired if process is still running after timeout seconds
+        """
+        if timeout is None:
+            with self._reap_lock:
+                if self.returncode is None:
+                    self._reap(0)
+            return self.returncode
+        deadline = time.monotonic() + timeout
+        while self.poll() is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(min(remaining, AccountedPopen.C_POLL_INTERVAL))
+        return self.returncode
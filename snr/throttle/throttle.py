@@ -0,0 +1,507 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        throttle
+# Purpose:     Limit CPU and I/O used by save helpers
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import time
+import signal
+import logging
+import subprocess
+from threading import Thread, Lock
+
+from snr.config import Config
+from snr.config.model import ThrottleConf
+from snr.throttle.cgroup import Cgroup
+from snr.throttle.rusage import AccountedPopen
+from snr.progress import Progress
+from snr.units import Units
+from snr.yamlhelper import YAMLHelper
+
+logger = logging.getLogger(__name__)
+
+
+class PartThrottle:
+    """
+    Limits of one save part, read from its Throttle each time they are used so that they follow configuration reloads
+    """
+
+    def __init__(self, throttle, name):
+        """
+        Should not be used directly. See Throttle.part().
+        :param throttle: save throttle
+        :type throttle: Throttle
+        :param name: part name, as per app files or databases name
+        :type name: str
+        """
+        self._throttle = throttle
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def limits(self):
+        """
+        :return: current limits of this part
+        :rtype: snr.config.model.ThrottleConf
+        """
+        return self._throttle.get_limits(self._name)
+
+    def wrap(self, cmd):
+        """
+        :param cmd: command
+        :type cmd: list
+        :return: command run through nice, ionice and taskset as per current limits, inherited by its children
+        :rtype: list
+        """
+        limits = self.limits
+        wrapped = list()
+        if limits.nice is not None:
+            wrapped += [Throttle.C_NICE_COMMAND, '-n', str(limits.nice)]
+        if limits.ionice_class is not None:
+            wrapped += [Throttle.C_IONICE_COMMAND, '-c', str(Throttle.C_IONICE_CLASSES[limits.ionice_class])]
+            if limits.ionice_level is not None and limits.ionice_class != Throttle.C_IONICE_IDLE:
+                wrapped += ['-n', str(limits.ionice_level)]
+        cpus = Throttle.get_cpus(limits.threads)
+        if cpus is not None:
+            wrapped += [Throttle.C_TASKSET_COMMAND, '--cpu-list', ','.join(str(cpu) for cpu in cpus)]
+        return wrapped + list(cmd)
+
+    def popen(self, cmd, read_limit=False, **kwargs):
+        """
+        Start a throttled process
+        :param cmd: command
+        :type cmd: list
+        :param read_limit: Optional. Apply read_rate to this process, which reads save source. False per default
+        :type read_limit: bool
+        :param kwargs: subprocess.Popen() arguments
+        :rtype: subprocess.Popen
+        """
+        cmd = self.wrap(cmd)
+        cgroup = self._throttle.get_cgroup(self._name)
+        if cgroup is not None:
+            cmd = cgroup.wrap(cmd)
+        process = AccountedPopen(cmd, **kwargs)
+        self._throttle.register(process, self._name, read_limit)
+        return process
+
+
+class Throttle:
+    """
+    CPU and I/O limits of save helpers, configured per save through the throttle key, and per part with parts key.
+    Processes started by Compression and Database get nice level, ionice class and CPU set from their command
+    line, and the process reading save source is paused whenever it reads faster than read_rate bytes per second.
+    When cpu_max, io_max or memory_max are set, processes of each part run in their own cgroup v2 group, whose
+    resource usage is reported once the part is done, see release().
+    Instances are updated in place on configuration reload, so that running saves follow new limits.
+    """
+
+    cache = dict()
+    _monitor = None
+    _monitor_lock = Lock()
+
+    C_THROTTLE = 'throttle'
+    C_NICE = 'nice'
+    C_IONICE_CLASS = 'ionice_class'
+    C_IONICE_LEVEL = 'ionice_level'
+    C_READ_RATE = 'read_rate'
+    C_THREADS = 'threads'
+    C_CPU_MAX = 'cpu_max'
+    C_IO_MAX = 'io_max'
+    C_MEMORY_MAX = 'memory_max'
+    C_IO_MAX_KEYS = {'read_bps', 'write_bps', 'read_iops', 'write_iops'}
+    C_IO_MAX_SIZE_KEYS = {'read_bps', 'write_bps'}
+    C_PARTS = 'parts'
+    C_LIMIT_KEYS = {C_NICE, C_IONICE_CLASS, C_IONICE_LEVEL, C_READ_RATE, C_THREADS, C_CPU_MAX, C_IO_MAX, C_MEMORY_MAX}
+    C_OPT_KEYS = C_LIMIT_KEYS.union({C_PARTS})
+    C_IONICE_REALTIME = 'realtime'
+    C_IONICE_BEST_EFFORT = 'best-effort'
+    C_IONICE_IDLE = 'idle'
+    C_IONICE_CLASSES = {C_IONICE_REALTIME: 1, C_IONICE_BEST_EFFORT: 2, C_IONICE_IDLE: 3}
+    C_NICE_COMMAND = 'nice'
+    C_IONICE_COMMAND = 'ionice'
+    C_TASKSET_COMMAND = 'taskset'
+    # read rate check interval, in seconds
+    C_TICK = 0.1
+    # seconds of read_rate a process may read ahead
+    C_BURST = 1
+
+    def __init__(self, name, limits=None):
+        """
+        Should not be used directly. See get_instance().
+        :param name: app name
+        :type name: str
+        :param limits: Optional. Save limits, unlimited per default
+        :type limits: Union[snr.config.model.ThrottleConf|None]
+        """
+        self._name = name
+        self._limits = limits
+        self._lock = Lock()
+        # process -> [part name, read limited, last read bytes, read budget, paused]
+        self._processes = dict()
+        # part name -> Cgroup
+        self._cgroups = dict()
+
+    @staticmethod
+    def compile_conf(throttle, app, part=None):
+        """
+        Validate throttle section of a save, or of one of its parts
+        :param throttle: throttle section of a save, or of one of its parts
+        :type throttle: dict
+        :param app: app configuration
+        :type app: snr.config.model.AppConf
+        :param part: Optional. Part name when compiling part limits
+        :type part: Union[str|None]
+        :rtype: ThrottleConf
+        :raise: TypeError on configuration error
+        """
+        key = Throttle.C_THROTTLE if part is None else "{} {}".format(Throttle.C_PARTS, part)
+        YAMLHelper.analyse_keys(
+            key, throttle, optional_key_set=Throttle.C_OPT_KEYS if part is None else Throttle.C_LIMIT_KEYS
+        )
+        nice = throttle.get(Throttle.C_NICE)
+        if nice is not None and (not isinstance(nice, int) or not -20 <= nice <= 19):
+            raise TypeError("{} should be an integer between -20 and 19, got {}".format(Throttle.C_NICE, nice))
+        ionice_class = throttle.get(Throttle.C_IONICE_CLASS)
+        if ionice_class is not None:
+            YAMLHelper.check_key_values(Throttle.C_IONICE_CLASS, ionice_class, Throttle.C_IONICE_CLASSES.keys())
+        ionice_level = throttle.get(Throttle.C_IONICE_LEVEL)
+        if ionice_level is not None and (not isinstance(ionice_level, int) or not 0 <= ionice_level <= 7):
+            raise TypeError(
+                "{} should be an integer between 0 and 7, got {}".format(Throttle.C_IONICE_LEVEL, ionice_level)
+            )
+        read_rate = throttle.get(Throttle.C_READ_RATE)
+        if read_rate is not None:
+            try:
+                read_rate = Units.parse_size(read_rate)
+            except ValueError as e:
+                raise TypeError("Invalid {} : {}".format(Throttle.C_READ_RATE, e))
+            if read_rate < 1:
+                raise TypeError("{} should be positive".format(Throttle.C_READ_RATE))
+        threads = throttle.get(Throttle.C_THREADS)
+        if threads is not None and (not isinstance(threads, int) or threads < 1):
+            raise TypeError("{} should be a positive integer, got {}".format(Throttle.C_THREADS, threads))
+        cpu_max = throttle.get(Throttle.C_CPU_MAX)
+        if cpu_max is not None and (isinstance(cpu_max, bool) or not isinstance(cpu_max, (int, float)) or cpu_max <= 0):
+            raise TypeError("{} should be a positive number of CPUs, got {}".format(Throttle.C_CPU_MAX, cpu_max))
+        io_max = throttle.get(Throttle.C_IO_MAX)
+        if io_max is not None:
+            YAMLHelper.analyse_keys(Throttle.C_IO_MAX, io_max, optional_key_set=Throttle.C_IO_MAX_KEYS)
+            try:
+                io_max = dict(
+                    (key, Units.parse_size(value) if key in Throttle.C_IO_MAX_SIZE_KEYS else int(value))
+                    for key, value in io_max.items()
+                )
+            except ValueError as e:
+                raise TypeError("Invalid {} : {}".format(Throttle.C_IO_MAX, e))
+        memory_max = throttle.get(Throttle.C_MEMORY_MAX)
+        if memory_max is not None:
+            try:
+                memory_max = Units.parse_size(memory_max)
+            except ValueError as e:
+                raise TypeError("Invalid {} : {}".format(Throttle.C_MEMORY_MAX, e))
+        parts = dict()
+        for name, limits in (throttle.get(Throttle.C_PARTS) or dict()).items():
+            if name not in app.files and name not in [db.name for db in app.databases]:
+                raise TypeError("Unknown part {} in {} {}".format(name, Throttle.C_THROTTLE, Throttle.C_PARTS))
+            parts[name] = Throttle.compile_conf(limits or dict(), app, name)
+        return ThrottleConf(
+            nice, ionice_class, ionice_level, read_rate, threads, cpu_max, io_max, memory_max, parts
+        )
+
+    @staticmethod
+    def get_instance(conf, name):
+        """
+        Throttle class Factory. Instances are cached by 'conf' parameter and app name. Cached instances are updated
+        with current configuration, and new limits are applied to running processes.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :param name: app name
+        :type name: str
+        :rtype: Throttle
+        """
+        config = Config.get_instance(conf)
+        save = config.saves.get(name)
+        limits = save.throttle if save is not None else None
+        cached = Throttle.cache.setdefault(conf, dict()).get(name)
+        if cached is None:
+            cached = Throttle(name, limits)
+            Throttle.cache[conf][name] = cached
+        elif cached._limits != limits:
+            cached.update(limits)
+        return cached
+
+    @staticmethod
+    def get_cpus(threads):
+        """
+        :param threads: number of CPUs
+        :type threads: Union[int|None]
+        :return: last threads CPUs current process may run on, None if unlimited
+        :rtype: Union[list|None]
+        """
+        if threads is None:
+            return None
+        cpus = sorted(os.sched_getaffinity(0))
+        if threads >= len(cpus):
+            return None
+        return cpus[-threads:]
+
+    @staticmethod
+    def popen(cmd, throttle=None, read_limit=False, **kwargs):
+        """
+        Start a process, throttled if throttle is set. Its resource usage is collected on exit, see ResourceUsage.
+        It is terminated if its part is cancelled, see Progress.cancel().
+        :param cmd: command
+        :type cmd: list
+        :param throttle: Optional. Part limits, unlimited per default
+        :type throttle: Union[PartThrottle|None]
+        :param read_limit: Optional. Apply read_rate to this process, which reads save source. False per default
+        :type read_limit: bool
+        :param kwargs: subprocess.Popen() arguments
+        :rtype: subprocess.Popen
+        """
+        if throttle is None:
+            process = AccountedPopen(cmd, **kwargs)
+        else:
+            process = throttle.popen(cmd, read_limit, **kwargs)
+        Progress.add_process(process)
+        return process
+
+    def part(self, name):
+        """
+        :param name: part name, as per app files or databases name
+        :type name: str
+        :rtype: PartThrottle
+        """
+        return PartThrottle(self, name)
+
+    def get_limits(self, part):
+        """
+        :param part: part name
+        :type part: str
+        :return: save limits overridden by part limits
+        :rtype: snr.config.model.ThrottleConf
+        """
+        limits = self._limits
+        if limits is None:
+            return ThrottleConf(None, None, None, None, None, None, None, None, dict())
+        overrides = limits.parts.get(part)
+        if overrides is None:
+            return limits
+        return limits._replace(**dict(
+            (key, value) for key, value in overrides._asdict().items() if value is not None and key != Throttle.C_PARTS
+        ))
+
+    def get_cgroup(self, part):
+        """
+        :param part: part name
+        :type part: str
+        :return: cgroup of part, created on first call. None if part has no cgroup limit or cgroups are not available
+        :rtype: Union[Cgroup|None]
+        """
+        limits = self.get_limits(part)
+        with self._lock:
+            if part not in self._cgroups:
+                if limits.cpu_max is None and limits.io_max is None and limits.memory_max is None:
+                    return None
+                self._cgroups[part] = Cgroup.create("{}-{}".format(self._name, part), limits)
+            return self._cgroups[part]
+
+    def release(self, part):
+        """
+        Remove cgroup of a part once its processes exited
+        :param part: part name
+        :type part: str
+        :return: resource usage of part processes, see Cgroup.get_usage(). Empty if part had no cgroup.
+        :rtype: dict
+        """
+        with self._lock:
+            cgroup = self._cgroups.pop(part, None)
+        if cgroup is None:
+            return dict()
+        usage = cgroup.get_usage()
+        cgroup.remove()
+        return usage
+
+    def update(self, limits):
+        """
+        Apply new limits to running processes, their children and their cgroups
+        :param limits: save limits, None for unlimited
+        :type limits: Union[snr.config.model.ThrottleConf|None]
+        """
+        self._limits = limits
+        with self._lock:
+            processes = list(self._processes.items())
+            cgroups = [(part, cgroup) for part, cgroup in self._cgroups.items() if cgroup is not None]
+        for part, cgroup in cgroups:
+            try:
+                cgroup.set_limits(self.get_limits(part))
+            except OSError as e:
+                logger.warning("Cannot apply new limits to cgroup {} : {}".format(cgroup.path, e))
+        if len(processes) > 0:
+            logger.info("Applying new limits to {} running {} save process(es)".format(len(processes), self._name))
+        for process, state in processes:
+            if process.poll() is not None:
+                continue
+            limits = self.get_limits(state[0])
+            # removed limits fall back to snr own priority and CPU set
+            nice = limits.nice if limits.nice is not None else os.getpriority(os.PRIO_PROCESS, 0)
+            cpus = Throttle.get_cpus(limits.threads) or os.sched_getaffinity(0)
+            tids = Throttle._get_tids(process.pid)
+            for tid in tids:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, nice)
+                    os.sched_setaffinity(tid, cpus)
+                except OSError as e:
+                    logger.warning("Cannot apply new limits to {} process {} : {}".format(self._name, tid, e))
+            if limits.ionice_class is not None and len(tids) > 0:
+                cmd = [Throttle.C_IONICE_COMMAND, '-c', str(Throttle.C_IONICE_CLASSES[limits.ionice_class])]
+                if limits.ionice_level is not None and limits.ionice_class != Throttle.C_IONICE_IDLE:
+                    cmd += ['-n', str(limits.ionice_level)]
+                p = subprocess.run(cmd + ['-p'] + [str(tid) for tid in tids], stderr=subprocess.PIPE)
+                if p.returncode != 0:
+                    logger.warning("Cannot apply new I/O class to {} processes : {}".format(
+                        self._name, p.stderr.decode().strip()
+                    ))
+
+    @staticmethod
+    def _get_tids(pid):
+        """
+        :param pid: process id
+        :type pid: int
+        :return: thread ids of process and of its descendants
+        :rtype: list
+        """
+        tids = list()
+        pids = [pid]
+        while len(pids) > 0:
+            pid = pids.pop()
+            try:
+                for tid in os.listdir('/proc/{}/task'.format(pid)):
+                    tids.append(int(tid))
+                    with open('/proc/{}/task/{}/children'.format(pid, tid)) as f:
+                        pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return tids
+
+    @staticmethod
+    def _get_read_bytes(pid):
+        """
+        :param pid: process id
+        :type pid: int
+        :return: bytes read by process, None if unknown
+        :rtype: Union[int|None]
+        """
+        try:
+            with open('/proc/{}/io'.format(pid)) as f:
+                for line in f:
+                    if line.startswith('rchar:'):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            return None
+
+    def register(self, process, part, read_limit=False):
+        """
+        Track a running process, to apply new limits and read rate
+        :param process: process started with part limits
+        :type process: subprocess.Popen
+        :param part: part name
+        :type part: str
+        :param read_limit: Optional. Apply read_rate to this process. False per default
+        :type read_limit: bool
+        """
+        with self._lock:
+            self._processes[process] = [part, read_limit, Throttle._get_read_bytes(process.pid) or 0, 0, False]
+        limits = self.get_limits(part)
+        if read_limit and limits.read_rate is not None:
+            logger.info("Limiting {} {} source read to {}/s".format(
+                self._name, part, Units.convert_bytes(limits.read_rate)
+            ))
+        Throttle._start_monitor()
+
+    @staticmethod
+    def _start_monitor():
+        with Throttle._monitor_lock:
+            if Throttle._monitor is None or not Throttle._monitor.is_alive():
+                Throttle._monitor = Thread(target=Throttle._run_monitor, name="throttle", daemon=True)
+                Throttle._monitor.start()
+
+    @staticmethod
+    def _run_monitor():
+        """
+        Pause processes reading faster than their read_rate, until their budget is back. Exits once no process is
+        tracked anymore.
+        """
+        last = time.time()
+        while True:
+            time.sleep(Throttle.C_TICK)
+            now = time.time()
+            elapsed = now - last
+            last = now
+            running = 0
+            with Throttle._monitor_lock:
+                throttles = [t for throttles in Throttle.cache.values() for t in throttles.values()]
+                for throttle in throttles:
+                    running += throttle._check_read_rates(elapsed)
+                if running == 0:
+                    Throttle._monitor = None
+                    return
+
+    def _check_read_rates(self, elapsed):
+        """
+        :param elapsed: seconds since last check
+        :type elapsed: float
+        :return: number of tracked processes still running
+        :rtype: int
+        """
+        with self._lock:
+            for process, state in list(self._processes.items()):
+                part, read_limit, last_read, budget, paused = state
+                if process.poll() is not None:
+                    del self._processes[process]
+                    continue
+                if not read_limit:
+                    continue
+                read_rate = self.get_limits(part).read_rate
+                read = Throttle._get_read_bytes(process.pid)
+                if read is None:
+                    continue
+                if read_rate is None:
+                    budget = 0
+                else:
+                    budget = min(budget + read_rate * elapsed, read_rate * Throttle.C_BURST) - (read - last_read)
+                pause = budget < 0
+                if pause != paused:
+                    try:
+                        process.send_signal(signal.SIGSTOP if pause else signal.SIGCONT)
+                    except OSError:
+                        pass
+                state[2:] = [read, budget, pause]
+            return len(self._processes)
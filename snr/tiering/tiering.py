@@ -0,0 +1,386 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        tiering
+# Purpose:     Storage tiering of aged saves
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import time
+import shutil
+import logging
+import subprocess
+from datetime import datetime, timedelta
+from string import Template
+from threading import Thread, Event
+
+from snr.compression import Compression
+from snr.config import Config
+from snr.journal import Journal
+from snr.storage import Storage
+from snr.units import Units
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import TieringConf
+
+logger = logging.getLogger(__name__)
+
+
+class Tiering(Thread):
+    """
+    Storage tiering. In daemon mode, saves under source older than min_age days are moved during idle time to
+    destination, keeping the same tree, and recompressed on the way with a high ratio codec.
+    Saves are looked for on both tiers by App.get_saves(), restore and retention.
+    """
+
+    C_YAML = """
+# archiving of old saves to another destination, recompressed, in daemon mode
+#tiering:
+#  # saves under source older than min_age days are moved to destination, keeping the same tree
+#  source: /data/saves
+#  destination: /mnt/archive/saves
+#  min_age: 30
+#  # seconds without any running save before moving saves. A file is moved holding its app save lock: saves,
+#  # restores and pushed parts of this app starting meanwhile are handled as overlapping saves
+#  idle_time: 600
+#  # extensions of recompressed saves
+#  compressed_extention: tar.xz
+#  compressed_from_pipe_ext: xz
+#  # recompression command, reading stdin and writing stdout
+#  compress_to_pipe: ['/usr/bin/xz', '-9', '--threads=0']
+#  # commands writing decompressed $file to stdout, by extension
+#  decompress_to_pipe:
+#    lzo: ['/usr/bin/lzop', '-dc', '$file']
+#    xz: ['/usr/bin/xzcat', '$file']
+"""
+
+    instance = None
+
+    C_TIERING = 'tiering'
+    C_SOURCE = 'source'
+    C_DESTINATION = 'destination'
+    C_MIN_AGE = 'min_age'
+    C_IDLE_TIME = 'idle_time'
+    C_COMPRESSED_EXTENTION = 'compressed_extention'
+    C_COMPRESSED_FROM_PIPE_EXT = 'compressed_from_pipe_ext'
+    C_COMPRESS_TO_PIPE = 'compress_to_pipe'
+    C_DECOMPRESS_TO_PIPE = 'decompress_to_pipe'
+    C_KEYS = {
+        C_SOURCE, C_DESTINATION, C_MIN_AGE, C_COMPRESSED_EXTENTION, C_COMPRESSED_FROM_PIPE_EXT,
+        C_COMPRESS_TO_PIPE, C_DECOMPRESS_TO_PIPE
+    }
+    C_OPT_KEYS = {C_IDLE_TIME}
+    C_DEFAULT_IDLE_TIME = 600
+    # seconds between idle checks
+    C_CHECK_INTERVAL = 30
+    C_TMP_SUFFIX = '.part'
+    C_TAR = 'tar'
+
+    def __init__(self, conf, busy, get_lock=None):
+        """
+        Should not be used directly. See start_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param busy: callable returning True while saves are running
+        :type busy: callable
+        :param get_lock: Optional. callable returning the SaveLock of the app owning a save file, None if none
+        :type get_lock: Union[callable|None]
+        """
+        super(Tiering, self).__init__(name=Tiering.C_TIERING)
+        self._conf = conf
+        self._busy = busy
+        self._get_lock = get_lock
+        self._terminate = Event()
+        self._failed = set()
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate tiering section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, None if tiering is not configured
+        :rtype: Union[TieringConf|None]
+        :raise: TypeError on configuration error
+        """
+        if Tiering.C_TIERING not in config.data.keys() or not config.data[Tiering.C_TIERING]:
+            return None
+        tiering = config.data[Tiering.C_TIERING]
+        try:
+            YAMLHelper.analyse_keys(Tiering.C_TIERING, tiering, Tiering.C_KEYS, Tiering.C_OPT_KEYS)
+            for key in (Tiering.C_MIN_AGE, Tiering.C_IDLE_TIME):
+                value = tiering.get(key, 0)
+                if not isinstance(value, int) or value < 0:
+                    raise TypeError("{} should be a positive integer, got {}".format(key, value))
+            if not isinstance(tiering[Tiering.C_DECOMPRESS_TO_PIPE], dict):
+                raise TypeError("{} should be a dictionary of commands by extension".format(
+                    Tiering.C_DECOMPRESS_TO_PIPE
+                ))
+        except TypeError as e:
+            raise TypeError("Tiering configuration error : {}".format(e))
+        return TieringConf(
+            os.path.abspath(tiering[Tiering.C_SOURCE]),
+            os.path.abspath(tiering[Tiering.C_DESTINATION]),
+            tiering[Tiering.C_MIN_AGE],
+            tiering.get(Tiering.C_IDLE_TIME, Tiering.C_DEFAULT_IDLE_TIME),
+            tiering[Tiering.C_COMPRESSED_EXTENTION],
+            tiering[Tiering.C_COMPRESSED_FROM_PIPE_EXT],
+            list(tiering[Tiering.C_COMPRESS_TO_PIPE]),
+            dict((str(ext), list(cmd)) for ext, cmd in tiering[Tiering.C_DECOMPRESS_TO_PIPE].items())
+        )
+
+    @staticmethod
+    def start_instance(conf, busy, get_lock=None):
+        """
+        Start background tiering. Configuration is read again before each run, tiering is idle if not configured.
+        :param conf: yaml file path
+        :type conf: str
+        :param busy: callable returning True while saves are running
+        :type busy: callable
+        :param get_lock: Optional. callable returning the SaveLock of the app owning a save file, None if none
+        :type get_lock: Union[callable|None]
+        :rtype: Tiering
+        """
+        Tiering.instance = Tiering(conf, busy, get_lock)
+        Tiering.instance.start()
+        return Tiering.instance
+
+    @staticmethod
+    def stop_instance():
+        """
+        Stop background tiering, once current move is finished
+        """
+        if Tiering.instance is not None:
+            tiering = Tiering.instance
+            Tiering.instance = None
+            tiering.terminate()
+            tiering.join()
+
+    def terminate(self):
+        self._terminate.set()
+
+    @staticmethod
+    def get_mirror(tiering, path):
+        """
+        :param tiering: tiering configuration
+        :type tiering: Union[snr.config.model.TieringConf|None]
+        :param path: path on first tier
+        :type path: str
+        :return: same path on second tier, None if tiering is disabled or path is not under tiering source
+        :rtype: Union[str|None]
+        """
+        if tiering is None or path is None:
+            return None
+        path = os.path.abspath(path)
+        if path != tiering.source and not path.startswith(tiering.source + os.sep):
+            return None
+        return os.path.normpath(os.path.join(tiering.destination, os.path.relpath(path, tiering.source)))
+
+    @staticmethod
+    def get_tiered_file(tiering, file):
+        """
+        :param tiering: tiering configuration
+        :type tiering: snr.config.model.TieringConf
+        :param file: save file path on first tier
+        :type file: str
+        :return: save file path on second tier, with recompressed file extension
+        :rtype: str
+        """
+        from snr.retention.index import SaveIndex
+        extension = SaveIndex.get_extension(file)
+        new_extension = tiering.compressed_from_pipe_ext
+        if extension.split('.')[0] == Tiering.C_TAR:
+            new_extension = tiering.compressed_extention
+        return Tiering.get_mirror(tiering, file[:-len(extension)] + new_extension)
+
+    def _get_candidates(self, tiering):
+        """
+        :param tiering: tiering configuration
+        :type tiering: snr.config.model.TieringConf
+        :return: save files of first tier older than min_age, oldest first
+        :rtype: list
+        """
+        from snr.retention.index import SaveIndex
+        compression = Compression.get_instance(self._conf)
+        until = datetime.today() - timedelta(days=tiering.min_age)
+        candidates = list()
+        for index in SaveIndex.scan(tiering.source, compression.extensions, tiering.destination).values():
+            for date, file in zip(list(index.dates), list(index.files)):
+                if date > until:
+                    break
+                if not file.startswith(tiering.destination + os.sep) and file not in self._failed:
+                    candidates.append((date, index, file))
+        candidates.sort(key=lambda c: c[0])
+        return [(index, file) for _, index, file in candidates]
+
+    def _recompress(self, tiering, file, destination):
+        """
+        Decompress file to a pipe feeding recompression command writing destination.
+        Encrypted saves are decrypted on the way in and encrypted again on the way out.
+        :return: True on success
+        :rtype: bool
+        :raise: IOError on decryption or encryption error
+        """
+        decompress_to_pipe = tiering.decompress_to_pipe.get(file.split('.')[-1])
+        if decompress_to_pipe is None:
+            logger.error(
+                "Cannot move {} : no decompression command for .{} files in {} {}".format(
+                    file, file.split('.')[-1], Tiering.C_TIERING, Tiering.C_DECOMPRESS_TO_PIPE
+                )
+            )
+            return False
+        compression = Compression.get_instance(self._conf)
+        stream = compression.open_stream(file)
+        cmd = [Template(arg).safe_substitute(file=file if stream is None else '-') for arg in decompress_to_pipe]
+        if compression.encryption is None:
+            out = open(destination, 'wb')
+        else:
+            out = compression.open_write(destination, Storage.get_local())
+        try:
+            decompress = subprocess.Popen(cmd, stdin=stream, stdout=subprocess.PIPE)
+            compress = subprocess.Popen(tiering.compress_to_pipe, stdin=decompress.stdout, stdout=out)
+            # let decompress receive SIGPIPE if compress exits
+            decompress.stdout.close()
+            compress.wait()
+            decompress.wait()
+        finally:
+            if stream is not None:
+                stream.close()
+            out.close()
+        with open(destination, 'rb') as f:
+            os.fsync(f.fileno())
+        if decompress.returncode != 0 or compress.returncode != 0:
+            logger.error(
+                "Cannot move {} : {} returned {}, {} returned {}".format(
+                    file, cmd, decompress.returncode, tiering.compress_to_pipe, compress.returncode
+                )
+            )
+            return False
+        return True
+
+    def move(self, tiering, index, file):
+        """
+        Move a save file to second tier. File is skipped while a save, a restore or a pushed part of its app runs.
+        :param tiering: tiering configuration
+        :type tiering: snr.config.model.TieringConf
+        :param index: index holding file
+        :type index: SaveIndex
+        :param file: save file path
+        :type file: str
+        :return: True on success
+        :rtype: bool
+        """
+        lock = self._get_lock(file) if self._get_lock is not None else None
+        if lock is not None and not lock.acquire():
+            logger.info("Skipping {} : its app is saving or restoring".format(file))
+            return False
+        try:
+            return self._move(tiering, index, file)
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _move(self, tiering, index, file):
+        """
+        Move a save file to second tier, recompressing it unless it already has recompressed file extension
+        :param tiering: tiering configuration
+        :type tiering: snr.config.model.TieringConf
+        :param index: index holding file
+        :type index: SaveIndex
+        :param file: save file path
+        :type file: str
+        :return: True on success
+        :rtype: bool
+        """
+        from snr.retention.index import SaveIndex
+        start = time.time()
+        destination = Tiering.get_tiered_file(tiering, file)
+        tmp = destination + Tiering.C_TMP_SUFFIX
+        logger.info("Moving {} to {}".format(file, destination))
+        try:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            original_size = os.stat(file).st_size
+            if SaveIndex.get_extension(file) == SaveIndex.get_extension(destination):
+                shutil.copyfile(file, tmp)
+            elif not self._recompress(tiering, file, tmp):
+                self._failed.add(file)
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return False
+            os.rename(tmp, destination)
+            os.remove(file)
+            index.remove(file)
+        except OSError as e:
+            logger.error("Cannot move {} to {} : {}".format(file, destination, e))
+            self._failed.add(file)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return False
+
+        size = os.stat(destination).st_size
+        duration = time.time() - start
+        logger.info(
+            "Moved {} in {}s, {} -> {} ({}%)".format(
+                file, round(duration, 3), Units.convert_bytes(original_size) or '0B',
+                Units.convert_bytes(size) or '0B', round(size * 100 / original_size, 2) if original_size else 100
+            )
+        )
+        Journal.get_instance(self._conf).record_tiering(file, destination, original_size, size, duration)
+        return True
+
+    def sweep(self):
+        """
+        Move aged saves to second tier, one at a time, until a save starts
+        :return: number of moved files
+        :rtype: int
+        """
+        tiering = Config.get_instance(self._conf).tiering
+        if tiering is None:
+            return 0
+        count = 0
+        for index, file in self._get_candidates(tiering):
+            if self._terminate.is_set() or self._busy():
+                logger.info("Tiering interrupted, {} save(s) moved".format(count))
+                return count
+            if self.move(tiering, index, file):
+                count += 1
+        if count > 0:
+            logger.info("Tiering done, {} save(s) moved".format(count))
+        return count
+
+    def run(self):
+        last_busy = time.time()
+        while not self._terminate.wait(Tiering.C_CHECK_INTERVAL):
+            tiering = Config.get_instance(self._conf).tiering
+            if tiering is None:
+                continue
+            if self._busy():
+                last_busy = time.time()
+            elif time.time() - last_busy >= tiering.idle_time:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.exception("Tiering failed : {}".format(e))
+                # wait for next idle period
+                last_busy = time.time()
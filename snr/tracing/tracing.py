@@ -0,0 +1,394 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        tracing
+# Purpose:     Per stage tracing spans
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import os
+import json
+import time
+import logging
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock, local
+
+from snr.config import Config
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import TracingConf
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    Timed stage of a run. Spans are nested, see Tracer.span().
+    """
+
+    C_STATUS_UNSET = 0
+    C_STATUS_ERROR = 2
+
+    def __init__(self, trace, name, parent=None, attributes=None):
+        """
+        Should not be used directly. See Tracer.span().
+        :param trace: trace this span belongs to
+        :type trace: Trace
+        :param name: span name, stage being timed
+        :type name: str
+        :param parent: Optional. Parent span, None for trace root
+        :type parent: Union[Span|None]
+        :param attributes: Optional. span attributes
+        :type attributes: Union[dict|None]
+        """
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes) if attributes else dict()
+        self.status = Span.C_STATUS_UNSET
+        self.message = None
+        self.start = time.time()
+        self.end = None
+
+    def set_error(self, message):
+        self.status = Span.C_STATUS_ERROR
+        self.message = str(message)
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, bool):
+            return {'boolValue': value}
+        if isinstance(value, int):
+            return {'intValue': str(value)}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+    def to_otlp(self):
+        """
+        :return: span in OpenTelemetry OTLP/JSON format
+        :rtype: dict
+        """
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end if self.end is not None else time.time()) * 1e9)),
+            'attributes': [
+                {'key': key, 'value': Span._format_value(value)}
+                for key, value in sorted(self.attributes.items()) if value is not None
+            ],
+            'status': {'code': self.status}
+        }
+        if self.parent_id is not None:
+            span['parentSpanId'] = self.parent_id
+        if self.message is not None:
+            span['status']['message'] = self.message
+        return span
+
+
+class Trace:
+    """
+    Spans of one run, written as an OpenTelemetry OTLP/JSON file once run is done
+    """
+
+    def __init__(self, name):
+        """
+        :param name: run name
+        :type name: str
+        """
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = list()
+        self._lock = Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_otlp(self):
+        """
+        :return: trace in OpenTelemetry OTLP/JSON format
+        :rtype: dict
+        """
+        with self._lock:
+            spans = [span.to_otlp() for span in self.spans]
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': Tracer.C_SERVICE}}]},
+                'scopeSpans': [{'scope': {'name': Tracer.C_SERVICE}, 'spans': spans}]
+            }]
+        }
+
+
+class Tracer:
+    """
+    Per stage tracing of saves, restores and retention sweeps, configured through yaml config file via tracing key.
+    Each run is written as an OpenTelemetry OTLP/JSON trace file, which can be loaded in any OpenTelemetry compatible
+    viewer. Stages are timed with nested spans, see span() and traced(). Spans are no-op unless a run is traced.
+    """
+
+    C_YAML = """
+# per stage timings of each save, restore and retention sweep, written as OpenTelemetry JSON trace files
+#tracing:
+#  path: /var/lib/snr/traces
+#  # number of trace files kept per app
+#  keep: 100
+"""
+
+    cache = dict()
+    C_TRACING = 'tracing'
+    C_PATH = 'path'
+    C_KEEP = 'keep'
+    C_OPT_KEYS = {C_PATH, C_KEEP}
+    C_DEFAULT_PATH = '/var/lib/snr/traces'
+    C_DEFAULT_KEEP = 100
+    C_SERVICE = 'snr'
+    C_EXTENSION = '.trace.json'
+
+    _context = local()
+
+    def __init__(self, path, keep=C_DEFAULT_KEEP):
+        """
+        Should not be used directly. See get_instance().
+        :param path: trace files folder
+        :type path: str
+        :param keep: number of trace files kept per app
+        :type keep: int
+        """
+        self._path = path
+        self._keep = keep
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate tracing section
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, None if tracing is not configured
+        :rtype: Union[TracingConf|None]
+        :raise: TypeError on configuration error
+        """
+        if Tracer.C_TRACING not in config.data.keys() or config.data[Tracer.C_TRACING] is None:
+            return None
+        tracing = config.data[Tracer.C_TRACING] or dict()
+        try:
+            YAMLHelper.analyse_keys(Tracer.C_TRACING, tracing, optional_key_set=Tracer.C_OPT_KEYS)
+            keep = tracing.get(Tracer.C_KEEP, Tracer.C_DEFAULT_KEEP)
+            if not isinstance(keep, int) or keep < 1:
+                raise TypeError("{} should be a positive integer".format(Tracer.C_KEEP))
+        except TypeError as e:
+            raise TypeError("Tracing configuration error : {}".format(e))
+        return TracingConf(tracing.get(Tracer.C_PATH, Tracer.C_DEFAULT_PATH), keep)
+
+    @staticmethod
+    def get_instance(conf):
+        """
+        Tracer class Factory. Instances are cached by 'conf' parameter.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :return: instance of Tracer, None if tracing is not configured
+        :rtype: Union[Tracer|None]
+        """
+        try:
+            tracing = Config.get_instance(conf).tracing
+        except (TypeError, IOError) as e:
+            logger.error("Tracing configuration error : {}".format(e))
+            return None
+        if tracing is None:
+            Tracer.cache.pop(conf, None)
+            return None
+        tracer = Tracer.cache.get(conf)
+        if tracer is None or tracer._path != tracing.path or tracer._keep != tracing.keep:
+            Tracer.cache[conf] = Tracer(tracing.path, tracing.keep)
+        return Tracer.cache[conf]
+
+    @staticmethod
+    def current():
+        """
+        :return: span of calling thread, None if no run is traced
+        :rtype: Union[Span|None]
+        """
+        return getattr(Tracer._context, 'span', None)
+
+    @staticmethod
+    @contextmanager
+    def _activate(span):
+        previous = Tracer.current()
+        Tracer._context.span = span
+        try:
+            yield span
+        finally:
+            Tracer._context.span = previous
+
+    @staticmethod
+    @contextmanager
+    def start(conf, name, folder, **attributes):
+        """
+        Trace a run. Trace file is written once run is done.
+        :param conf: path to Yaml configuration
+        :type conf: str
+        :param name: root span name
+        :type name: str
+        :param folder: trace files sub folder, usually app name
+        :type folder: str
+        :param attributes: root span attributes
+        :return: root span, None if tracing is not configured
+        :rtype: Union[Span|None]
+        """
+        tracer = Tracer.get_instance(conf)
+        if tracer is None:
+            yield None
+            return
+        trace = Trace(name)
+        span = Span(trace, name, attributes=attributes)
+        trace.add(span)
+        try:
+            with Tracer._activate(span):
+                yield span
+        except BaseException as e:
+            span.set_error(repr(e))
+            raise
+        finally:
+            span.end = time.time()
+            tracer.write(trace, folder)
+
+    @staticmethod
+    @contextmanager
+    def span(name, **attributes):
+        """
+        Time a stage as a child of calling thread span. No-op if no run is traced.
+        :param name: span name
+        :type name: str
+        :param attributes: span attributes
+        :return: span, None if no run is traced
+        :rtype: Union[Span|None]
+        """
+        parent = Tracer.current()
+        if parent is None:
+            yield None
+            return
+        span = Span(parent.trace, name, parent, attributes)
+        parent.trace.add(span)
+        try:
+            with Tracer._activate(span):
+                yield span
+        except BaseException as e:
+            span.set_error(repr(e))
+            raise
+        finally:
+            span.end = time.time()
+
+    @staticmethod
+    def traced(name):
+        """
+        Decorator timing each call of a function as a span, see span()
+        :param name: span name
+        :type name: str
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if Tracer.current() is None:
+                    return function(*args, **kwargs)
+                with Tracer.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def wrap(target, name=None, **attributes):
+        """
+        Propagate calling thread span to a function run in another thread
+        :param target: thread target
+        :type target: callable
+        :param name: Optional. Time target as a span of this name
+        :type name: Union[str|None]
+        :param attributes: span attributes
+        :return: thread target running in calling thread span
+        :rtype: callable
+        """
+        parent = Tracer.current()
+        if parent is None:
+            return target
+
+        @functools.wraps(target)
+        def wrapper(*args, **kwargs):
+            with Tracer._activate(parent):
+                if name is None:
+                    return target(*args, **kwargs)
+                with Tracer.span(name, **attributes):
+                    return target(*args, **kwargs)
+        return wrapper
+
+    @staticmethod
+    def annotate(**attributes):
+        """
+        Add attributes to calling thread span
+        """
+        span = Tracer.current()
+        if span is not None:
+            span.attributes.update(attributes)
+
+    @staticmethod
+    def set_error(message):
+        """
+        Mark calling thread span as failed
+        :param message: error message
+        :type message: str
+        """
+        span = Tracer.current()
+        if span is not None:
+            span.set_error(message)
+
+    def write(self, trace, folder):
+        """
+        Write trace file and remove oldest ones beyond keep
+        :param trace: done trace
+        :type trace: Trace
+        :param folder: trace files sub folder
+        :type folder: str
+        """
+        path = os.path.join(self._path, folder)
+        file = os.path.join(path, "{}-{}-{}{}".format(
+            trace.name, datetime.today().strftime('%Y-%m-%d-%H%M%S'), trace.trace_id[:8], Tracer.C_EXTENSION
+        ))
+        try:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            with open(file, 'w') as f:
+                json.dump(trace.to_otlp(), f)
+            logger.info("Trace of {} written in {}".format(trace.name, file))
+            files = sorted(
+                (os.path.join(path, f) for f in os.listdir(path) if f.endswith(Tracer.C_EXTENSION)),
+                key=os.path.getmtime
+            )
+            for old in files[:max(0, len(files) - self._keep)]:
+                os.remove(old)
+        except (PermissionError, IOError) as e:
+            logger.warning("Cannot write trace {} : {}".format(file, e))
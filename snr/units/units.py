@@ -79,3 +79,21 @@ class Units:
         """
         byte_per_sec = round(b / s)
         return Units.convert_bytes(byte_per_sec) + '/s'
+
+    @staticmethod
+    def parse_size(size):
+        """
+        Convert human readable size to bytes
+        :param size: size in bytes, or number followed by one of SIZE_UNITS (ex: 500GB, 1.5 TB)
+        :type size: Union[int|str]
+        :return: bytes
+        :rtype: int
+        :raise: ValueError if size can't be parsed
+        """
+        if isinstance(size, int) and not isinstance(size, bool):
+            return size
+        value = str(size).strip().upper()
+        for unit in Units.SIZE_UNITS:
+            if value.endswith(unit[Units.UNIT]):
+                return int(float(value[:-len(unit[Units.UNIT])].strip()) * unit[Units.VALUE])
+        return int(value)
@@ -0,0 +1,642 @@
+# -*- coding: utf8 -*-
+# ------------------------------------------------------------------------------
+# Name:        worker
+# Purpose:     Dispatch of save parts to worker processes
+#
+#
+# Author:      Jonathan Besanceney <jonathan.besanceney@gmail.com>
+#
+#
+# Created:     19/10/2026
+# Copyright:   (c) 2026 snr
+#
+# Licence:     LGPLv3 2016.
+#
+# This file is a part of snr.
+#
+#    snr is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    snr is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public License
+#    along with snr.  If not, see <http://www.gnu.org/licenses/>.
+# ------------------------------------------------------------------------------
+import hmac
+import json
+import time
+import select
+import socket
+import hashlib
+import logging
+import secrets
+from queue import Queue, Empty
+from socketserver import ThreadingMixIn, TCPServer, StreamRequestHandler
+from threading import Thread, Lock, Event
+
+from snr.config import Config
+from snr.progress import Progress
+from snr.yamlhelper import YAMLHelper
+from snr.config.model import WorkersConf
+
+logger = logging.getLogger(__name__)
+
+
+class CoordinatorServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class CoordinatorHandler(StreamRequestHandler):
+    """
+    Connection of a worker slot : authentication, then save parts sent one at a time, see Coordinator.serve()
+    """
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        self.connection.settimeout(coordinator.timeout)
+        try:
+            name = coordinator.authenticate(self.rfile, self.wfile, self.client_address[0])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Worker registration from {} refused : {}".format(self.client_address[0], e))
+            return
+        coordinator.serve(name, self.connection, self.rfile, self.wfile)
+
+
+class RemoteJob:
+    """
+    Save part waiting for, or running on, a worker
+    """
+
+    C_QUEUED = 'queued'
+    C_RUNNING = 'running'
+    C_DONE = 'done'
+    C_WITHDRAWN = 'withdrawn'
+
+    def __init__(self, request, progress=None):
+        """
+        :param request: part to save, see Coordinator.run()
+        :type request: dict
+        :param progress: Optional. Progress of part in coordinator, fed with worker progress
+        :type progress: Union[snr.progress.Progress|None]
+        """
+        self.request = request
+        self.progress = progress
+        self.worker = None
+        self.result = None
+        self.error = None
+        self._lock = Lock()
+        self._state = RemoteJob.C_QUEUED
+        self._done = Event()
+
+    def __str__(self):
+        return "{} {} {}".format(self.request[Coordinator.R_APP], self.request[Coordinator.R_TYPE],
+                                 self.request[Coordinator.R_NAME])
+
+    def start(self, worker):
+        """
+        :param worker: worker name
+        :type worker: str
+        :return: True if job is still queued, and is now running on worker
+        :rtype: bool
+        """
+        with self._lock:
+            if self._state != RemoteJob.C_QUEUED:
+                return False
+            self._state = RemoteJob.C_RUNNING
+            self.worker = worker
+            return True
+
+    def requeue(self):
+        """
+        Give job back to queue, after its worker was lost
+        """
+        with self._lock:
+            self._state = RemoteJob.C_QUEUED
+            self.worker = None
+
+    def withdraw(self):
+        """
+        :return: True if job was still queued, and won't be run by a worker
+        :rtype: bool
+        """
+        with self._lock:
+            if self._state != RemoteJob.C_QUEUED:
+                return False
+            self._state = RemoteJob.C_WITHDRAWN
+            return True
+
+    def finish(self, result=None, error=None):
+        with self._lock:
+            self._state = RemoteJob.C_DONE
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+
+class Coordinator:
+    """
+    Daemon side of distributed saves, configured through yaml config file via workers key.
+    Workers - `snr worker` processes, on this host or others - connect to the coordinator and register one connection
+    per slot, after a challenge-response authentication with a shared token. Save parts are then queued and sent to
+    free slots instead of being run by the daemon, see run(). Parts run locally while no worker is registered.
+    """
+
+    C_YAML = """
+# Distributed saves, in daemon mode. Save parts are sent to `snr worker` processes connected to this address, which
+# dump, compress and store them with their own copy of this configuration file. Save destinations must be reachable
+# from workers with the same paths : shared filesystem or remote storage. Parts run in daemon while no worker is
+# connected. Traffic is not encrypted : keep it on a trusted network or tunnel it.
+#workers:
+#  address: 127.0.0.1
+#  port: 9714
+#  # file holding a secret shared by daemon and workers. Generate one with: head -c 32 /dev/urandom | base64
+#  token_file: /root/.snr/worker.token
+#  # or token itself
+#  #token: shared secret
+#  # seconds without news from a worker before its part is given to another one
+#  timeout: 30
+"""
+
+    instance = None
+
+    C_WORKERS = 'workers'
+    C_ADDRESS = 'address'
+    C_PORT = 'port'
+    C_TOKEN = 'token'
+    C_TOKEN_FILE = 'token_file'
+    C_TIMEOUT = 'timeout'
+    C_KEYS = {C_PORT}
+    C_OPT_KEYS = {C_ADDRESS, C_TOKEN, C_TOKEN_FILE, C_TIMEOUT}
+    C_DEFAULT_ADDRESS = '127.0.0.1'
+    C_DEFAULT_TIMEOUT = 30
+
+    # JSON lines protocol messages
+    R_CHALLENGE = 'challenge'
+    R_RESPONSE = 'response'
+    R_NAME = 'name'
+    R_RESULT = 'result'
+    R_ERROR = 'error'
+    R_JOB = 'job'
+    R_CANCEL = 'cancel'
+    R_PROGRESS = 'progress'
+    R_APP = 'app'
+    R_FINGERPRINT = 'fingerprint'
+    R_DATE = 'date'
+    R_TYPE = 'type'
+    R_PATH = 'path'
+
+    def __init__(self, conf, address, port, token, timeout=C_DEFAULT_TIMEOUT):
+        """
+        Should not be used directly. See start_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param address: listen address
+        :type address: str
+        :param port: listen port
+        :type port: int
+        :param token: secret shared with workers
+        :type token: str
+        :param timeout: Optional. seconds without news from a worker before it is considered lost
+        :type timeout: int
+        """
+        self._conf = conf
+        self._token = token
+        self.timeout = timeout
+        self._lock = Lock()
+        self._running = True
+        # worker name -> registered slots
+        self._workers = dict()
+        self._jobs = Queue()
+        self._server = CoordinatorServer((address, port), CoordinatorHandler, bind_and_activate=False)
+        self._server.coordinator = self
+        try:
+            self._server.server_bind()
+            self._server.server_activate()
+        except OSError:
+            self._server.server_close()
+            raise
+        self._thread = Thread(target=self._server.serve_forever, name=Coordinator.C_WORKERS, daemon=True)
+
+    @staticmethod
+    def compile_conf(config):
+        """
+        Validate workers section, along with token file
+        :param config: configuration being compiled
+        :type config: Config
+        :return: compiled section, None if workers are not configured
+        :rtype: Union[WorkersConf|None]
+        :raise: TypeError on configuration error
+        """
+        if Coordinator.C_WORKERS not in config.data.keys() or not config.data[Coordinator.C_WORKERS]:
+            return None
+        workers = config.data[Coordinator.C_WORKERS]
+        try:
+            YAMLHelper.analyse_keys(Coordinator.C_WORKERS, workers, Coordinator.C_KEYS, Coordinator.C_OPT_KEYS)
+            port = workers[Coordinator.C_PORT]
+            if not isinstance(port, int) or not 0 < port < 65536:
+                raise TypeError("{} should be an integer between 1 and 65535".format(Coordinator.C_PORT))
+            timeout = workers.get(Coordinator.C_TIMEOUT, Coordinator.C_DEFAULT_TIMEOUT)
+            if not isinstance(timeout, int) or timeout < 1:
+                raise TypeError("{} should be a positive integer".format(Coordinator.C_TIMEOUT))
+            token = config.load_secret(Coordinator.C_WORKERS, workers, Coordinator.C_TOKEN, Coordinator.C_TOKEN_FILE)
+        except TypeError as e:
+            raise TypeError("Workers configuration error : {}".format(e))
+        return WorkersConf(
+            str(workers.get(Coordinator.C_ADDRESS, Coordinator.C_DEFAULT_ADDRESS)), port, token, timeout
+        )
+
+    @staticmethod
+    def start_instance(conf):
+        """
+        Start listening to workers if configured
+        :param conf: yaml file path
+        :type conf: str
+        :return: started instance, None if workers are not configured or address can't be listened to
+        :rtype: Union[Coordinator|None]
+        """
+        workers = Config.get_instance(conf).workers
+        if workers is None:
+            return None
+        try:
+            Coordinator.instance = Coordinator(conf, workers.address, workers.port, workers.token, workers.timeout)
+        except OSError as e:
+            logger.error("Cannot listen to workers on {}:{} : {}".format(workers.address, workers.port, e))
+            return None
+        Coordinator.instance._thread.start()
+        logger.info("Listening to workers on {}:{}".format(workers.address, workers.port))
+        return Coordinator.instance
+
+    @staticmethod
+    def stop_instance():
+        """
+        Stop listening to workers. Registered workers are disconnected and try to connect again.
+        """
+        if Coordinator.instance is not None:
+            coordinator = Coordinator.instance
+            Coordinator.instance = None
+            coordinator._running = False
+            coordinator._server.shutdown()
+            coordinator._server.server_close()
+
+    @property
+    def workers(self):
+        """
+        :return: registered slots by worker name
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._workers)
+
+    @staticmethod
+    def sign(token, challenge):
+        """
+        :return: response to an authentication challenge
+        :rtype: str
+        """
+        return hmac.new(token.encode(), challenge.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def send(stream, message):
+        """
+        :param stream: writable binary file
+        :param message: JSON serializable message
+        :type message: dict
+        """
+        stream.write((json.dumps(message, sort_keys=True) + '\n').encode())
+        stream.flush()
+
+    @staticmethod
+    def receive(stream):
+        """
+        :param stream: readable binary file
+        :return: next message, None if connection was closed
+        :rtype: Union[dict|None]
+        :raise ValueError: if message is not a JSON object
+        """
+        line = stream.readline()
+        if len(line) == 0:
+            return None
+        message = json.loads(line.decode())
+        if not isinstance(message, dict):
+            raise ValueError("Unexpected message {}".format(line))
+        return message
+
+    def authenticate(self, rfile, wfile, address):
+        """
+        Challenge a connecting worker, then answer its own challenge so that it can authenticate coordinator
+        :return: worker name
+        :rtype: str
+        :raise ValueError: if worker failed authentication
+        """
+        challenge = secrets.token_hex(16)
+        Coordinator.send(wfile, {Coordinator.R_CHALLENGE: challenge})
+        request = Coordinator.receive(rfile)
+        if request is None:
+            raise ValueError("connection closed")
+        if not hmac.compare_digest(Coordinator.sign(self._token, challenge), str(request[Coordinator.R_RESPONSE])):
+            Coordinator.send(wfile, {Coordinator.R_ERROR: "authentication failed"})
+            raise ValueError("authentication failed")
+        Coordinator.send(wfile, {Coordinator.R_RESULT: {
+            Coordinator.R_RESPONSE: Coordinator.sign(self._token, str(request[Coordinator.R_CHALLENGE]))
+        }})
+        return "{}@{}".format(request[Coordinator.R_NAME], address)
+
+    def serve(self, name, connection, rfile, wfile):
+        """
+        Send queued parts to a registered worker slot until it is lost or coordinator stops
+        :param name: worker name
+        :type name: str
+        :param connection: worker connection
+        :type connection: socket.socket
+        """
+        with self._lock:
+            self._workers[name] = self._workers.get(name, 0) + 1
+            slots = self._workers[name]
+        logger.info("Worker {} registered, {} slot(s)".format(name, slots))
+        try:
+            while self._running:
+                try:
+                    job = self._jobs.get(timeout=1)
+                except Empty:
+                    # idle workers send nothing, a readable connection was closed
+                    if select.select([connection], [], [], 0)[0] and Coordinator.receive(rfile) is None:
+                        logger.warning("Worker {} disconnected".format(name))
+                        return
+                    continue
+                if not job.start(name):
+                    continue
+                try:
+                    self._run_job(job, rfile, wfile)
+                except (OSError, ValueError) as e:
+                    logger.warning("Worker {} lost while saving {} : {}".format(name, job, e))
+                    job.requeue()
+                    self._jobs.put(job)
+                    return
+        finally:
+            with self._lock:
+                self._workers[name] -= 1
+                if self._workers[name] == 0:
+                    del self._workers[name]
+            logger.info("Worker {} slot unregistered".format(name))
+
+    def _run_job(self, job, rfile, wfile):
+        """
+        Send a part to a worker slot and wait for its result, relaying cancellation and progress
+        :type job: RemoteJob
+        :raise OSError: if worker is lost
+        """
+        logger.info("Sending {} to worker {}".format(job, job.worker))
+        Coordinator.send(wfile, {Coordinator.R_JOB: job.request})
+        cancelled = False
+        while True:
+            if not cancelled and job.progress is not None and job.progress.cancelled:
+                Coordinator.send(wfile, {Coordinator.R_CANCEL: True})
+                cancelled = True
+            message = Coordinator.receive(rfile)
+            if message is None:
+                raise IOError("connection closed")
+            if Coordinator.R_PROGRESS in message:
+                progress = message[Coordinator.R_PROGRESS]
+                if job.progress is not None and progress:
+                    job.progress.report(progress['read_bytes'], progress['written_bytes'])
+                continue
+            job.finish(message.get(Coordinator.R_RESULT), message.get(Coordinator.R_ERROR))
+            return
+
+    def run(self, app, fingerprint, date, part_type, name, path):
+        """
+        Save a part on a worker and wait for it. Part progress of this thread, if tracked, is fed with worker progress,
+        and part is cancelled on worker when it is cancelled here.
+        :param app: app name
+        :type app: str
+        :param fingerprint: app configuration fingerprint, which must be the same on worker
+        :type fingerprint: str
+        :param date: save date
+        :type date: str
+        :param part_type: SaveAtom.DATABASE or SaveAtom.FILE
+        :type part_type: str
+        :param name: part name as per config
+        :type name: str
+        :param path: expected save file path
+        :type path: str
+        :return: part result, see snr.app.App.save_part(). None if no worker is registered : part should run locally
+        :rtype: Union[dict|None]
+        :raise IOError: if part failed on worker
+        """
+        if len(self.workers) == 0:
+            return None
+        job = RemoteJob({
+            Coordinator.R_APP: app,
+            Coordinator.R_FINGERPRINT: fingerprint,
+            Coordinator.R_DATE: date,
+            Coordinator.R_TYPE: part_type,
+            Coordinator.R_NAME: name,
+            Coordinator.R_PATH: path
+        }, Progress.current())
+        self._jobs.put(job)
+        while not job.wait(1):
+            if len(self.workers) == 0 and job.withdraw():
+                logger.warning("No worker left to save {}, saving it locally".format(job))
+                return None
+        if job.error is not None:
+            raise IOError("{} failed on worker {} : {}".format(job, job.worker, job.error))
+        logger.info("Worker {} saved {}".format(job.worker, job))
+        return job.result
+
+
+class Worker:
+    """
+    `snr worker` process : connects to the coordinator of a daemon and saves the parts it sends, see Coordinator.
+    Each slot keeps its own connection and saves one part at a time. Connections are retried until worker is stopped.
+    """
+
+    C_RETRY = 5
+    C_HEARTBEAT = 1
+
+    def __init__(self, conf, address, port, token, slots=1, name=None):
+        """
+        Should not be used directly. See get_instance().
+        :param conf: yaml file path
+        :type conf: str
+        :param address: coordinator address
+        :type address: str
+        :param port: coordinator port
+        :type port: int
+        :param token: secret shared with coordinator
+        :type token: str
+        :param slots: Optional. Number of parts saved at the same time
+        :type slots: int
+        :param name: Optional. Worker name, host name per default
+        :type name: Union[str|None]
+        """
+        self._conf = conf
+        self._address = address
+        self._port = port
+        self._token = token
+        self._slots = slots
+        self._name = name if name else socket.gethostname()
+        self._lock = Lock()
+
+    @staticmethod
+    def get_instance(conf, coordinator=None, slots=1, name=None):
+        """
+        :param conf: yaml file path
+        :type conf: str
+        :param coordinator: Optional. coordinator address as host:port, workers section address and port per default
+        :type coordinator: Union[str|None]
+        :param slots: Optional. Number of parts saved at the same time
+        :type slots: int
+        :param name: Optional. Worker name, host name per default
+        :type name: Union[str|None]
+        :rtype: Worker
+        :raise TypeError: if workers are not configured or coordinator address is malformed
+        """
+        workers = Config.get_instance(conf).workers
+        if workers is None:
+            raise TypeError("{} section is not configured in {}".format(Coordinator.C_WORKERS, conf))
+        address, port = workers.address, workers.port
+        if coordinator:
+            try:
+                address, port = coordinator.rsplit(':', 1)
+                port = int(port)
+            except ValueError:
+                raise TypeError("Coordinator address should be host:port, got {}".format(coordinator))
+        if slots < 1:
+            raise TypeError("Slots should be a positive integer")
+        return Worker(conf, address, port, workers.token, slots, name)
+
+    def run(self):
+        """
+        Save parts sent by coordinator until interrupted
+        """
+        logger.info("Worker {} connecting to {}:{} with {} slot(s)".format(
+            self._name, self._address, self._port, self._slots
+        ))
+        for index in range(self._slots):
+            Thread(target=self._slot, name="{}-{}".format(Coordinator.C_WORKERS, index), daemon=True).start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            logger.warning("Caught KeyboardInterrupt, cancelling running parts")
+            for snapshot in Progress.snapshots():
+                Progress.cancel_parts(snapshot['app'], snapshot['type'], snapshot['name'])
+            raise
+
+    def _slot(self):
+        while True:
+            try:
+                self._connect()
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Coordinator {}:{} unreachable : {}. Retrying in {}s".format(
+                    self._address, self._port, e, Worker.C_RETRY
+                ))
+            time.sleep(Worker.C_RETRY)
+
+    def _connect(self):
+        """
+        Register a slot to coordinator and save parts it sends until connection is lost
+        :raise OSError: if coordinator is unreachable or lost
+        :raise ValueError: if authentication failed
+        """
+        with socket.create_connection((self._address, self._port), timeout=Worker.C_RETRY * 2) as connection:
+            rfile = connection.makefile('rb')
+            wfile = connection.makefile('wb')
+            message = Coordinator.receive(rfile)
+            if message is None:
+                raise IOError("connection closed")
+            challenge = secrets.token_hex(16)
+            Coordinator.send(wfile, {
+                Coordinator.R_NAME: self._name,
+                Coordinator.R_RESPONSE: Coordinator.sign(self._token, str(message[Coordinator.R_CHALLENGE])),
+                Coordinator.R_CHALLENGE: challenge
+            })
+            message = Coordinator.receive(rfile)
+            if message is None or Coordinator.R_ERROR in message:
+                raise ValueError("coordinator refused registration : {}".format(
+                    "connection closed" if message is None else message[Coordinator.R_ERROR]
+                ))
+            if not hmac.compare_digest(
+                    Coordinator.sign(self._token, challenge), str(message[Coordinator.R_RESULT][Coordinator.R_RESPONSE])
+            ):
+                raise ValueError("coordinator failed authentication")
+            logger.info("Slot registered to coordinator {}:{}".format(self._address, self._port))
+            connection.settimeout(None)
+            while True:
+                message = Coordinator.receive(rfile)
+                if message is None:
+                    raise IOError("connection closed")
+                if Coordinator.R_JOB in message:
+                    self._run_job(message[Coordinator.R_JOB], connection, rfile, wfile)
+
+    def _save_part(self, job):
+        """
+        :param job: part to save, see Coordinator.run()
+        :type job: dict
+        :return: part result, see snr.app.App.save_part()
+        :rtype: dict
+        :raise ValueError: if app is unknown or its configuration differs from coordinator one
+        """
+        from snr.save import Save
+        with self._lock:
+            Config.get_instance(self._conf, reload=True)
+            saves = Save.get_instances(self._conf)
+        app = job[Coordinator.R_APP]
+        if saves is None or app not in saves:
+            raise ValueError("{} is not a registered app".format(app))
+        if saves[app].app.fingerprint != job[Coordinator.R_FINGERPRINT]:
+            raise ValueError("{} configuration differs from coordinator one".format(app))
+        result = saves[app].save_part(job[Coordinator.R_DATE], job[Coordinator.R_TYPE], job[Coordinator.R_NAME])
+        if result[Coordinator.R_PATH] != job[Coordinator.R_PATH]:
+            raise ValueError("{} saved to {} instead of {}".format(app, result['path'], job[Coordinator.R_PATH]))
+        return result
+
+    def _run_job(self, job, connection, rfile, wfile):
+        """
+        Save a part, sending its progress every C_HEARTBEAT seconds, and its result. Part is cancelled on coordinator
+        request, or if coordinator is lost.
+        :param job: part to save, see Coordinator.run()
+        :type job: dict
+        """
+        app, part_type, name = job[Coordinator.R_APP], job[Coordinator.R_TYPE], job[Coordinator.R_NAME]
+        logger.info("Saving {} {} {} of {}".format(app, part_type, name, job[Coordinator.R_DATE]))
+        response = dict()
+
+        def save_part():
+            try:
+                response[Coordinator.R_RESULT] = self._save_part(job)
+            except Exception as e:
+                logger.error("{} {} {} save failed : {}".format(app, part_type, name, e))
+                response[Coordinator.R_ERROR] = "{}: {}".format(type(e).__name__, e)
+
+        thread = Thread(target=save_part, name="{}-{}".format(app, name))
+        thread.start()
+        try:
+            while thread.is_alive():
+                if select.select([connection], [], [], Worker.C_HEARTBEAT)[0]:
+                    message = Coordinator.receive(rfile)
+                    if message is None:
+                        raise IOError("connection closed")
+                    if Coordinator.R_CANCEL in message:
+                        Progress.cancel_parts(app, part_type, name)
+                    continue
+                snapshots = [
+                    snapshot for snapshot in Progress.snapshots()
+                    if (snapshot['app'], snapshot['type'], snapshot['name']) == (app, part_type, name)
+                ]
+                Coordinator.send(wfile, {Coordinator.R_PROGRESS: snapshots[0] if snapshots else None})
+        except (OSError, ValueError):
+            Progress.cancel_parts(app, part_type, name)
+            thread.join()
+            raise
+        thread.join()
+        Coordinator.send(wfile, response)
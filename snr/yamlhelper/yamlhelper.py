@@ -28,6 +28,8 @@
 #    along with snr.  If not, see <http://www.gnu.org/licenses/>.
 # ------------------------------------------------------------------------------
 import sys
+import json
+import hashlib
 import logging
 from yaml import load, dump, YAMLError
 try:
@@ -68,6 +70,22 @@ class YAMLHelper:
                 raise e
         return YAMLHelper.cache[file]
 
+    @staticmethod
+    def fingerprint(*data):
+        """
+        Compute a fingerprint of configuration data, used to detect configuration changes
+        :param data: configuration parts
+        :return: hex digest
+        :rtype: str
+        """
+        return hashlib.sha1(json.dumps(data, sort_keys=True, default=YAMLHelper._serialize).encode()).hexdigest()
+
+    @staticmethod
+    def _serialize(obj):
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj)
+        return str(obj)
+
     @staticmethod
     def loads(s):
         fd = StringIO(s)